@@ -47,6 +47,11 @@
 #endif
 #include <locale.h>
 #include <string.h>
+#ifdef HAVE_SYS_INOTIFY_H
+#  include <poll.h>
+#  include <signal.h>
+#  include <sys/inotify.h>
+#endif
 
 #if defined(_WIN32)
 #  define STRICT
@@ -85,11 +90,13 @@
 const struct option longopts[] = {
     { "error-on-no-fonts", 0,                 0, 'E' },
     { "force",             0,                 0, 'f' },
+    { "jobs",              required_argument, 0, 'j' },
     { "really-force",      0,                 0, 'r' },
     { "sysroot",           required_argument, 0, 'y' },
     { "system-only",       0,                 0, 's' },
     { "version",           0,                 0, 'V' },
     { "verbose",           0,                 0, 'v' },
+    { "watch",             0,                 0, 'w' },
     { "help",	      0,		 0, 'h' },
     { NULL,		0,		 0, 0   },
 };
@@ -105,10 +112,10 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-EfrsvVh] [-y SYSROOT] [--error-on-no-fonts] [--force|--really-force] [--sysroot=SYSROOT] [--system-only] [--verbose] [--version] [--help] [dirs]\n"),
+    fprintf (file, _("usage: %s [-EfrsvwVh] [-j JOBS] [-y SYSROOT] [--error-on-no-fonts] [--force|--really-force] [--jobs=JOBS] [--sysroot=SYSROOT] [--system-only] [--verbose] [--watch] [--version] [--help] [dirs]\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-EfrsvVh] [-y SYSROOT] [dirs]\n"),
+    fprintf (file, _("usage: %s [-EfrsvwVh] [-j JOBS] [-y SYSROOT] [dirs]\n"),
                      program);
 #endif
     fprintf (file, _("Build font information caches in [dirs]\n"
@@ -117,20 +124,24 @@ usage (char *program, int error)
 #if HAVE_GETOPT_LONG
     fprintf (file, _("  -E, --error-on-no-fonts  raise an error if no fonts in a directory\n"));
     fprintf (file, _("  -f, --force              scan directories with apparently valid caches\n"));
+    fprintf (file, _("  -j, --jobs=JOBS          scan the fonts of a directory on JOBS threads\n"));
     fprintf (file, _("  -r, --really-force       erase all existing caches, then rescan\n"));
     fprintf (file, _("  -s, --system-only        scan system-wide directories only\n"));
     fprintf (file, _("  -y, --sysroot=SYSROOT    prepend SYSROOT to all paths for scanning\n"));
     fprintf (file, _("  -v, --verbose            display status information while busy\n"));
+    fprintf (file, _("  -w, --watch              keep running and update caches as fonts change\n"));
     fprintf (file, _("  -V, --version            display font config version and exit\n"));
     fprintf (file, _("  -h, --help               display this help and exit\n"));
 #else
     fprintf (file, _("  -E         (error-on-no-fonts)\n"));
     fprintf (file, _("                       raise an error if no fonts in a directory\n"));
     fprintf (file, _("  -f         (force)   scan directories with apparently valid caches\n"));
+    fprintf (file, _("  -j JOBS    (jobs)    scan the fonts of a directory on JOBS threads\n"));
     fprintf (file, _("  -r,   (really force) erase all existing caches, then rescan\n"));
     fprintf (file, _("  -s         (system)  scan system-wide directories only\n"));
     fprintf (file, _("  -y SYSROOT (sysroot) prepend SYSROOT to all paths for scanning\n"));
     fprintf (file, _("  -v         (verbose) display status information while busy\n"));
+    fprintf (file, _("  -w         (watch)   keep running and update caches as fonts change\n"));
     fprintf (file, _("  -V         (version) display font config version and exit\n"));
     fprintf (file, _("  -h         (help)    display this help and exit\n"));
 #endif
@@ -276,6 +287,258 @@ scanDirs (FcStrList *list, FcConfig *config, FcBool force, FcBool really_force,
     return ret;
 }
 
+#ifdef HAVE_SYS_INOTIFY_H
+/* How long a directory has to stay quiet before its cache is rebuilt */
+#  define WATCH_DELAY_MS 500
+#  define WATCH_EVENTS   (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | \
+                          IN_CLOSE_WRITE | IN_ATTRIB | IN_ONLYDIR)
+
+typedef struct {
+    int      wd;
+    FcChar8 *dir;
+} Watch;
+
+static Watch                *watches;
+static int                   nwatches, swatches;
+static volatile sig_atomic_t watch_done;
+
+static void
+watchStop (int sig)
+{
+    watch_done = 1;
+}
+
+static FcBool
+watchAdd (int fd, const FcChar8 *dir, FcConfig *config)
+{
+    const FcChar8 *sysroot = FcConfigGetSysRoot (config);
+    FcChar8       *rooted_dir;
+    int            wd, i;
+
+    if (sysroot)
+	rooted_dir = FcStrPlus (sysroot, dir);
+    else
+	rooted_dir = FcStrCopy (dir);
+    if (!rooted_dir)
+	return FcFalse;
+    wd = inotify_add_watch (fd, (char *)rooted_dir, WATCH_EVENTS);
+    FcStrFree (rooted_dir);
+    if (wd == -1)
+	return FcFalse;
+    for (i = 0; i < nwatches; i++)
+	if (watches[i].wd == wd)
+	    return FcTrue;
+    if (nwatches == swatches) {
+	int    s = swatches ? swatches * 2 : 64;
+	Watch *w = realloc (watches, s * sizeof (Watch));
+
+	if (!w)
+	    return FcFalse;
+	watches = w;
+	swatches = s;
+    }
+    watches[nwatches].dir = FcStrCopy (dir);
+    if (!watches[nwatches].dir)
+	return FcFalse;
+    watches[nwatches].wd = wd;
+    nwatches++;
+
+    return FcTrue;
+}
+
+static int
+watchFind (int wd)
+{
+    int i;
+
+    for (i = 0; i < nwatches; i++)
+	if (watches[i].wd == wd)
+	    return i;
+    return -1;
+}
+
+/*
+ * Bring the cache for dir up to date and start watching any
+ * subdirectory which wasn't known yet
+ */
+static int
+watchUpdate (int fd, const FcChar8 *dir, FcConfig *config, FcBool force, FcBool verbose)
+{
+    const FcChar8 *sysroot = FcConfigGetSysRoot (config);
+    FcChar8       *rooted_dir;
+    FcCache       *cache = NULL;
+    struct stat    statb;
+    int            i, ret = 0;
+
+    if (sysroot)
+	rooted_dir = FcStrPlus (sysroot, dir);
+    else
+	rooted_dir = FcStrCopy (dir);
+    if (!rooted_dir)
+	return 1;
+    i = stat ((char *)rooted_dir, &statb);
+    FcStrFree (rooted_dir);
+    /* It has gone away since; the parent directory will notice */
+    if (i == -1 || !S_ISDIR (statb.st_mode))
+	return 0;
+    if (!FcConfigAcceptFilename (config, dir))
+	return 0;
+
+    if (!force)
+	cache = FcDirCacheLoad (dir, config, NULL);
+    if (!cache) {
+	cache = FcDirCacheRead (dir, FcTrue, config);
+	if (!cache) {
+	    fprintf (stderr, _("\"%s\": scanning error\n"), dir);
+	    return 1;
+	}
+	if (verbose)
+	    printf (_("%s: caching, new cache contents: %d fonts, %d dirs\n"),
+	              dir, FcCacheNumFont (cache), FcCacheNumSubdir (cache));
+    }
+    for (i = 0; i < FcCacheNumSubdir (cache); i++) {
+	const FcChar8 *subdir = FcCacheSubdir (cache, i);
+
+	if (FcStrSetMember (processed_dirs, subdir))
+	    continue;
+	FcStrSetAdd (processed_dirs, subdir);
+	if (!watchAdd (fd, subdir, config))
+	    fprintf (stderr, _("\"%s\": unable to watch\n"), subdir);
+	ret += watchUpdate (fd, subdir, config, FcFalse, verbose);
+    }
+    FcDirCacheUnload (cache);
+
+    return ret;
+}
+
+/*
+ * Keep the caches of all processed directories up to date until
+ * interrupted.  Changes are collected per directory and only acted on
+ * once the directory has been quiet for WATCH_DELAY_MS, so copying in
+ * a whole package of fonts costs one rescan rather than one per file.
+ */
+static int
+watchDirs (FcConfig *config, FcBool verbose)
+{
+    FcStrList     *list;
+    FcStrSet      *dirty;
+    const FcChar8 *dir;
+    FcBool         pending = FcFalse;
+    int            fd, i, ret = 0;
+    union {
+	struct inotify_event event;
+	char                 buf[4096];
+    } events;
+
+    fd = inotify_init1 (IN_CLOEXEC);
+    if (fd == -1) {
+	perror ("inotify_init1");
+	return 1;
+    }
+    list = FcStrListCreate (processed_dirs);
+    while ((dir = FcStrListNext (list)))
+	if (!watchAdd (fd, dir, config))
+	    fprintf (stderr, _("\"%s\": unable to watch\n"), dir);
+    FcStrListDone (list);
+    /* Catch up with whatever changed before the watches were in place */
+    list = FcStrListCreate (processed_dirs);
+    while ((dir = FcStrListNext (list)))
+	ret += watchUpdate (fd, dir, config, FcFalse, verbose);
+    FcStrListDone (list);
+    dirty = FcStrSetCreate();
+    if (!dirty) {
+	fprintf (stderr, _("Out of Memory\n"));
+	close (fd);
+	return 1;
+    }
+
+    signal (SIGINT, watchStop);
+    signal (SIGTERM, watchStop);
+    if (verbose) {
+	printf (_("watching %d directories\n"), nwatches);
+	fflush (stdout);
+    }
+    while (!watch_done) {
+	struct pollfd pfd;
+	ssize_t       len;
+	char         *p;
+
+	pfd.fd = fd;
+	pfd.events = POLLIN;
+	i = poll (&pfd, 1, pending ? WATCH_DELAY_MS : -1);
+	if (i == -1) {
+	    if (errno == EINTR)
+		continue;
+	    perror ("poll");
+	    ret++;
+	    break;
+	}
+	if (i == 0) {
+	    list = FcStrListCreate (dirty);
+	    while ((dir = FcStrListNext (list)))
+		ret += watchUpdate (fd, dir, config, FcTrue, verbose);
+	    FcStrListDone (list);
+	    /* The caches just written make the pack out of date */
+	    if (!FcCacheCreatePackFile (config) && verbose)
+		printf (_("failed to write the cache pack\n"));
+	    FcStrSetDestroy (dirty);
+	    dirty = FcStrSetCreate();
+	    if (!dirty) {
+		fprintf (stderr, _("Out of Memory\n"));
+		ret++;
+		break;
+	    }
+	    pending = FcFalse;
+	    if (verbose)
+		fflush (stdout);
+	    continue;
+	}
+	len = read (fd, events.buf, sizeof (events.buf));
+	if (len == -1) {
+	    if (errno == EINTR)
+		continue;
+	    perror ("read");
+	    ret++;
+	    break;
+	}
+	for (p = events.buf; p < events.buf + len;) {
+	    struct inotify_event *event = (struct inotify_event *)p;
+
+	    p += sizeof (struct inotify_event) + event->len;
+	    if (event->mask & IN_Q_OVERFLOW) {
+		/* Events were lost; assume everything changed */
+		for (i = 0; i < nwatches; i++)
+		    FcStrSetAdd (dirty, watches[i].dir);
+		pending = FcTrue;
+		continue;
+	    }
+	    i = watchFind (event->wd);
+	    if (i < 0)
+		continue;
+	    if (event->mask & IN_IGNORED) {
+		/* The directory is gone; forget it so it can come back */
+		FcStrSetDel (processed_dirs, watches[i].dir);
+		FcStrFree (watches[i].dir);
+		watches[i] = watches[--nwatches];
+		continue;
+	    }
+	    /* Hidden files are never fonts */
+	    if (event->len && event->name[0] == '.')
+		continue;
+	    FcStrSetAdd (dirty, watches[i].dir);
+	    pending = FcTrue;
+	}
+    }
+    FcStrSetDestroy (dirty);
+    for (i = 0; i < nwatches; i++)
+	FcStrFree (watches[i].dir);
+    free (watches);
+    close (fd);
+
+    return ret;
+}
+#endif
+
 static FcBool
 cleanCacheDirectories (FcConfig *config, FcBool verbose)
 {
@@ -305,7 +568,9 @@ main (int argc, char **argv)
     FcBool     really_force = FcFalse;
     FcBool     systemOnly = FcFalse;
     FcBool     error_on_no_fonts = FcFalse;
+    FcBool     watch = FcFalse;
     FcConfig  *config;
+    char      *jobs = NULL;
     FcChar8   *sysroot = NULL;
     int        i;
     int        changed;
@@ -315,9 +580,9 @@ main (int argc, char **argv)
 
     setlocale (LC_ALL, "");
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "Efrsy:Vvh", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "Efj:rsy:Vvwh", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "Efrsy:Vvh")) != -1)
+    while ((c = getopt (argc, argv, "Efj:rsy:Vvwh")) != -1)
 #  endif
     {
 	switch (c) {
@@ -330,6 +595,11 @@ main (int argc, char **argv)
 	case 'f':
 	    force = FcTrue;
 	    break;
+	case 'j':
+	    if (atoi (optarg) < 1)
+		usage (argv[0], 1);
+	    jobs = optarg;
+	    break;
 	case 's':
 	    systemOnly = FcTrue;
 	    break;
@@ -343,6 +613,9 @@ main (int argc, char **argv)
 	case 'v':
 	    verbose = FcTrue;
 	    break;
+	case 'w':
+	    watch = FcTrue;
+	    break;
 	case 'h':
 	    usage (argv[0], 0);
 	default:
@@ -353,6 +626,20 @@ main (int argc, char **argv)
 #else
     i = 1;
 #endif
+    /* The library picks this up whenever it scans a directory */
+    if (jobs) {
+#ifdef _WIN32
+	_putenv_s ("FONTCONFIG_SCAN_JOBS", jobs);
+#else
+	setenv ("FONTCONFIG_SCAN_JOBS", jobs, 1);
+#endif
+    }
+#ifndef HAVE_SYS_INOTIFY_H
+    if (watch) {
+	fprintf (stderr, _("%s: --watch is not supported on this platform\n"), argv[0]);
+	return 1;
+    }
+#endif
 
     if (systemOnly)
 	FcConfigEnableHome (FcFalse);
@@ -413,10 +700,17 @@ main (int argc, char **argv)
      */
     FcCacheCreateTagFile (config);
 
-    FcStrSetDestroy (processed_dirs);
-
     cleanCacheDirectories (config, verbose);
 
+    if (!FcCacheCreatePackFile (config) && verbose)
+	printf (_("failed to write the cache pack\n"));
+
+#ifdef HAVE_SYS_INOTIFY_H
+    if (watch)
+	ret += watchDirs (config, verbose);
+#endif
+    FcStrSetDestroy (processed_dirs);
+
     FcConfigDestroy (config);
     FcFini();
     /*
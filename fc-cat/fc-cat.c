@@ -198,7 +198,13 @@ file_base_name (const FcChar8 *cache, const FcChar8 *file)
 #define FC_FONT_FILE_DIR ((FcChar8 *)".dir")
 
 static FcBool
-cache_print_set (FcFontSet *set, FcStrSet *dirs, const FcChar8 *base_name, FcBool verbose)
+cache_print_set (FcFontSet          *set,
+                 FcStrSet           *dirs,
+                 const FcChar8      *base_name,
+                 FcBool              verbose,
+                 FcPatternFormatter *formatter,
+                 FcChar8           **buf,
+                 int                *size)
 {
     FcChar8       *dir;
     const FcChar8 *base;
@@ -228,16 +234,9 @@ cache_print_set (FcFontSet *set, FcStrSet *dirs, const FcChar8 *base_name, FcBoo
     }
 
     for (n = 0; n < set->nfont; n++) {
-	FcPattern *font = set->fonts[n];
-	FcChar8   *s;
-
-	s = FcPatternFormat (font, (const FcChar8 *)"%{=fccat}\n");
-	if (s) {
-	    printf ("%s", s);
-	    FcStrFree (s);
-	} else {
+	if (FcPatternFormatterFormat (formatter, set->fonts[n], buf, size) < 0)
 	    goto bail3;
-	}
+	printf ("%s", *buf);
     }
     if (verbose && !set->nfont && !ndir)
 	printf ("<empty>\n");
@@ -267,6 +266,9 @@ main (int argc, char **argv)
     int        verbose = 0;
     int        recurse = 0;
     FcBool     first = FcTrue;
+    FcPatternFormatter *formatter;
+    FcChar8            *buf = NULL;
+    int                 size = 0;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
@@ -299,6 +301,12 @@ main (int argc, char **argv)
     i = 1;
 #endif
 
+    formatter = FcPatternFormatterCreate ((const FcChar8 *)"%{=fccat}\n");
+    if (!formatter) {
+	fprintf (stderr, _("%s: malloc failure\n"), argv[0]);
+	return 1;
+    }
+
     config = FcInitLoadConfig();
     if (!config) {
 	fprintf (stderr, _("%s: Can't initialize font config library\n"), argv[0]);
@@ -371,7 +379,7 @@ main (int argc, char **argv)
 	              FcCacheDir (cache), cache_file ? cache_file : arg);
 	    first = FcFalse;
 	}
-	cache_print_set (fs, dirs, FcCacheDir (cache), verbose);
+	cache_print_set (fs, dirs, FcCacheDir (cache), verbose, formatter, &buf, &size);
 
 	FcStrSetDestroy (dirs);
 
@@ -381,6 +389,8 @@ main (int argc, char **argv)
 	    FcStrFree (cache_file);
     }
     FcStrListDone (arglist);
+    FcPatternFormatterDestroy (formatter);
+    free (buf);
 
     FcFini();
     return ret;
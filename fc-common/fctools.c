@@ -0,0 +1,211 @@
+/* Copyright (C) 2026 fontconfig Authors */
+/* SPDX-License-Identifier: HPND */
+
+#ifdef HAVE_CONFIG_H
+#  include <config.h>
+#endif
+
+#include <fontconfig/fontconfig.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "fctools.h"
+
+#ifdef ENABLE_NLS
+#  include <libintl.h>
+#  define _(x) (dgettext (GETTEXT_PACKAGE, x))
+#else
+#  define dgettext(d, s) (s)
+#  define _(x)           (x)
+#endif
+
+static void
+batch_lock (Batch *b)
+{
+#ifdef HAVE_PTHREAD
+    pthread_mutex_lock (&b->lock);
+#endif
+}
+
+static void
+batch_unlock (Batch *b)
+{
+#ifdef HAVE_PTHREAD
+    pthread_mutex_unlock (&b->lock);
+#endif
+}
+
+static int
+batch_add (Batch *b, const char *file)
+{
+    Item *items = realloc (b->items, (b->nitems + 1) * sizeof (Item));
+
+    if (!items)
+	return 0;
+    b->items = items;
+    memset (&items[b->nitems], 0, sizeof (Item));
+    items[b->nitems].file = (const char *)FcStrCopy ((const FcChar8 *)file);
+    if (!items[b->nitems].file)
+	return 0;
+    b->nitems++;
+
+    return 1;
+}
+
+/*
+ * Read a line from file into *line, growing it as needed, without its
+ * end of line.  Returns NULL at the end of the file, and when out of
+ * memory, leaving file short of its end.
+ */
+char *
+read_line (FILE *file, char **line, size_t *size)
+{
+    size_t len = 0;
+    int    c;
+
+    while ((c = getc (file)) != EOF && c != '\n') {
+	if (len + 1 >= *size) {
+	    char *l = realloc (*line, *size = *size ? *size * 2 : 256);
+
+	    if (!l)
+		return NULL;
+	    *line = l;
+	}
+	(*line)[len++] = c;
+    }
+    if (c == EOF && !len)
+	return NULL;
+    if (len && (*line)[len - 1] == '\r')
+	len--;
+    if (!*line && !(*line = malloc (*size = 256)))
+	return NULL;
+    (*line)[len] = '\0';
+
+    return *line;
+}
+
+/*
+ * Clear the batch and add an item for each of the files
+ */
+int
+batch_init (Batch *b, char **files, int nfiles)
+{
+    int i;
+
+    memset (b, 0, sizeof (*b));
+    for (i = 0; i < nfiles; i++)
+	if (!batch_add (b, files[i]))
+	    return 0;
+
+    return 1;
+}
+
+/*
+ * Append the lines of file to the items, skipping empty ones
+ */
+int
+batch_read_files (Batch *b, const char *name)
+{
+    FILE  *f = strcmp (name, "-") ? fopen (name, "r") : stdin;
+    char  *line = NULL;
+    size_t size = 0;
+    int    ret = 1;
+
+    if (!f) {
+	fprintf (stderr, _("Can't open %s\n"), name);
+	return 0;
+    }
+    while (ret && read_line (f, &line, &size))
+	if (*line)
+	    ret = batch_add (b, line);
+    ret = ret && feof (f);
+    free (line);
+    if (f != stdin)
+	fclose (f);
+
+    return ret;
+}
+
+static void *
+batch_items (void *closure)
+{
+    Batch *b = closure;
+    void  *thread = NULL;
+    Item  *item;
+    int    i;
+
+    if (b->start && !(thread = b->start (b))) {
+	batch_lock (b);
+	b->err = 1;
+	batch_unlock (b);
+	return NULL;
+    }
+    for (;;) {
+	batch_lock (b);
+	i = b->next++;
+	batch_unlock (b);
+	if (i >= b->nitems)
+	    break;
+	item = &b->items[i];
+	b->process (b, item, thread);
+
+	batch_lock (b);
+	item->done = 1;
+	if (b->unordered)
+	    b->print (b, item);
+	else
+	    while (b->printed < b->nitems && b->items[b->printed].done)
+		b->print (b, &b->items[b->printed++]);
+	batch_unlock (b);
+    }
+    if (b->stop)
+	b->stop (b, thread);
+
+    return NULL;
+}
+
+/*
+ * Process the items on up to jobs threads, the calling thread included,
+ * printing the results of each item in order unless b->unordered is set
+ */
+void
+batch_run (Batch *b, int jobs)
+{
+#ifdef HAVE_PTHREAD
+    pthread_t *threads = NULL;
+    int        nthreads = 0, i;
+
+    pthread_mutex_init (&b->lock, NULL);
+    if (jobs > b->nitems)
+	jobs = b->nitems;
+    if (jobs > 1)
+	threads = malloc (sizeof (pthread_t) * (jobs - 1));
+    for (i = 0; threads && i < jobs - 1; i++) {
+	if (pthread_create (&threads[nthreads], NULL, batch_items, b) != 0)
+	    break;
+	nthreads++;
+    }
+    batch_items (b);
+    for (i = 0; i < nthreads; i++)
+	pthread_join (threads[i], NULL);
+    free (threads);
+    pthread_mutex_destroy (&b->lock);
+#else
+    (void)jobs;
+    batch_items (b);
+#endif
+}
+
+void
+batch_fini (Batch *b)
+{
+    int i;
+
+    for (i = 0; i < b->nitems; i++)
+	FcStrFree ((FcChar8 *)b->items[i].file);
+    free (b->items);
+    b->items = NULL;
+    b->nitems = 0;
+}
@@ -0,0 +1,69 @@
+/* Copyright (C) 2026 fontconfig Authors */
+/* SPDX-License-Identifier: HPND */
+
+/*
+ * Helpers shared by the command line tools: reading lines of input and
+ * running a batch of font files on a pool of threads while printing the
+ * results in order.
+ */
+#ifndef _FCTOOLS_H_
+#define _FCTOOLS_H_
+
+#ifdef HAVE_PTHREAD
+#  include <pthread.h>
+#endif
+#include <stdio.h>
+
+typedef struct _Item {
+    const char *file;
+    void       *data;  /* what processing the file gave */
+    int         ndata; /* the number of elements of data, for arrays */
+    int         ok;
+    int         done;
+} Item;
+
+typedef struct _Batch Batch;
+
+/*
+ * process is called on the worker threads without the batch lock, with
+ * the value start returned on that thread.  print is called with the
+ * batch lock held, and frees what process left in the item.
+ */
+typedef void *(*BatchStartFunc) (Batch *b);
+typedef void (*BatchStopFunc) (Batch *b, void *thread);
+typedef void (*BatchProcessFunc) (Batch *b, Item *item, void *thread);
+typedef void (*BatchPrintFunc) (Batch *b, Item *item);
+
+struct _Batch {
+    Item            *items;
+    int              nitems;
+    int              next;    /* next item to process */
+    int              printed; /* items printed so far, in order */
+    int              unordered;
+    BatchStartFunc   start;
+    BatchStopFunc    stop;
+    BatchProcessFunc process;
+    BatchPrintFunc   print;
+    void            *closure; /* what the tool keeps for the batch */
+    int              err;
+#ifdef HAVE_PTHREAD
+    pthread_mutex_t lock;
+#endif
+};
+
+char *
+read_line (FILE *file, char **line, size_t *size);
+
+int
+batch_init (Batch *b, char **files, int nfiles);
+
+int
+batch_read_files (Batch *b, const char *name);
+
+void
+batch_run (Batch *b, int jobs);
+
+void
+batch_fini (Batch *b);
+
+#endif /* _FCTOOLS_H_ */
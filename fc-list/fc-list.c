@@ -110,16 +110,20 @@ usage (char *program, int error)
 int
 main (int argc, char **argv)
 {
-    int            verbose = 0;
-    int            brief = 0;
-    int            quiet = 0;
-    const FcChar8 *format = NULL;
-    FcChar8       *format_optarg = NULL;
-    int            nfont = 0;
-    int            i, err = 0;
-    FcObjectSet   *os = 0;
-    FcFontSet     *fs;
-    FcPattern     *pat;
+    int                 verbose = 0;
+    int                 brief = 0;
+    int                 quiet = 0;
+    const FcChar8      *format = NULL;
+    FcChar8            *format_optarg = NULL;
+    int                 nfont = 0;
+    int                 i, err = 0;
+    FcObjectSet        *os = 0;
+    FcFontListIter     *iter;
+    FcPatternFormatter *formatter = NULL;
+    FcChar8            *buf = NULL;
+    int                 size = 0;
+    FcPattern          *pat, *font;
+    FcResult            result = FcResultNoMatch;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
@@ -179,41 +183,47 @@ main (int argc, char **argv)
 	os = FcObjectSetBuild (FC_FAMILY, FC_STYLE, FC_FILE, (char *)0);
     if (!format)
 	format = (const FcChar8 *)"%{=fclist}\n";
-    fs = FcFontList (0, pat, os);
+    if (!verbose && !brief && !quiet) {
+	formatter = FcPatternFormatterCreate (format);
+	if (!formatter)
+	    return 1;
+    }
+    /* Print each font as soon as it is found, rather than all at the end */
+    iter = FcFontListIterCreate (0, pat, os);
     if (os)
 	FcObjectSetDestroy (os);
     if (pat)
 	FcPatternDestroy (pat);
 
-    if (!quiet && fs) {
-	int j;
-
-	for (j = 0; j < fs->nfont; j++) {
-	    if (verbose || brief) {
-		if (brief) {
-		    FcPatternDel (fs->fonts[j], FC_CHARSET);
-		    FcPatternDel (fs->fonts[j], FC_LANG);
-		}
-		FcPatternPrint (fs->fonts[j]);
-	    } else {
-		FcChar8 *s;
-
-		s = FcPatternFormat (fs->fonts[j], format);
-		if (s) {
-		    printf ("%s", s);
-		    FcStrFree (s);
-		} else {
-		    err = 1;
-		    break;
-		}
+    while (iter && (font = FcFontListIterNext (iter, &result))) {
+	nfont++;
+	if (quiet) {
+	    FcPatternDestroy (font);
+	    break;
+	}
+	if (verbose || brief) {
+	    if (brief) {
+		FcPatternDel (font, FC_CHARSET);
+		FcPatternDel (font, FC_LANG);
 	    }
+	    FcPatternPrint (font);
+	} else {
+	    if (FcPatternFormatterFormat (formatter, font, &buf, &size) >= 0)
+		printf ("%s", buf);
+	    else
+		err = 1;
 	}
+	FcPatternDestroy (font);
+	if (err)
+	    break;
     }
-
-    if (fs) {
-	nfont = fs->nfont;
-	FcFontSetDestroy (fs);
+    if (result == FcResultOutOfMemory) {
+	fprintf (stderr, _("Out of Memory\n"));
+	err = 1;
     }
+    FcFontListIterDestroy (iter);
+    FcPatternFormatterDestroy (formatter);
+    free (buf);
     if (format_optarg) {
 	free ((void *)format_optarg);
     }
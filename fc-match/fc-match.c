@@ -38,6 +38,8 @@
 #include <stdlib.h>
 #include <string.h>
 
+#include "fctools.h"
+
 #ifdef HAVE_UNISTD_H
 #  include <unistd.h>
 #endif
@@ -67,6 +69,7 @@ static const struct option longopts[] = {
     { "verbose", 0, 0, 'v' },
     { "brief",   0, 0, 'b' },
     { "format",  1, 0, 'f' },
+    { "batch",   0, 0, 'B' },
     { "version", 0, 0, 'V' },
     { "help",    0, 0, 'h' },
     { NULL,      0, 0, 0   },
@@ -83,10 +86,10 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-savbVh] [-f FORMAT] [--sort] [--all] [--verbose] [--brief] [--format=FORMAT] [--version] [--help] [pattern] {element...}\n"),
+    fprintf (file, _("usage: %s [-savbBVh] [-f FORMAT] [--sort] [--all] [--verbose] [--brief] [--format=FORMAT] [--batch] [--version] [--help] [pattern] {element...}\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-savVh] [-f FORMAT] [pattern] {element...}\n"),
+    fprintf (file, _("usage: %s [-savbBVh] [-f FORMAT] [pattern] {element...}\n"),
                      program);
 #endif
     fprintf (file, _("List best font matching [pattern]\n"));
@@ -97,6 +100,7 @@ usage (char *program, int error)
     fprintf (file, _("  -v, --verbose        display entire font pattern verbosely\n"));
     fprintf (file, _("  -b, --brief          display entire font pattern briefly\n"));
     fprintf (file, _("  -f, --format=FORMAT  use the given output format\n"));
+    fprintf (file, _("  -B, --batch          match each pattern read from stdin, one per line\n"));
     fprintf (file, _("  -V, --version        display font config version and exit\n"));
     fprintf (file, _("  -h, --help           display this help and exit\n"));
 #else
@@ -105,51 +109,217 @@ usage (char *program, int error)
     fprintf (file, _("  -v         (verbose) display entire font pattern verbosely\n"));
     fprintf (file, _("  -b         (brief)   display entire font pattern briefly\n"));
     fprintf (file, _("  -f FORMAT  (format)  use the given output format\n"));
+    fprintf (file, _("  -B         (batch)   match each pattern read from stdin, one per line\n"));
     fprintf (file, _("  -V         (version) display font config version and exit\n"));
     fprintf (file, _("  -h         (help)    display this help and exit\n"));
 #endif
     exit (error);
 }
 
+typedef struct _Options {
+    int                 verbose;
+    int                 brief;
+    int                 sort, all;
+    int                 batch; /* each font is printed as one line */
+    const FcChar8      *format;
+    FcObjectSet        *os;
+    FcPatternFormatter *formatter;
+    FcChar8            *buf; /* the formatted font */
+    int                 size;
+    char               *reply; /* the fonts of a pattern, in batch sort mode */
+    size_t              reply_len, reply_size;
+} Options;
+
+/*
+ * Append len bytes of s to the reply, returning 0 when out of memory
+ */
+static int
+reply_add (Options *o, const char *s, size_t len)
+{
+    if (o->reply_len + len > o->reply_size) {
+	size_t size = (o->reply_len + len) * 2;
+	char  *reply = realloc (o->reply, size);
+
+	if (!reply)
+	    return 0;
+	o->reply = reply;
+	o->reply_size = size;
+    }
+    memcpy (o->reply + o->reply_len, s, len);
+    o->reply_len += len;
+
+    return 1;
+}
+
+/*
+ * Print the fonts matching pat, returning 0 on success, 1 when the
+ * output couldn't be formatted and -1 when there is no font at all
+ */
+static int
+match (FcPattern *pat, Options *o)
+{
+    FcFontSet *fs;
+    FcResult   result;
+    int        j, err = 0;
+    int        collect = o->batch && (o->sort || o->all);
+
+    FcConfigSubstitute (0, pat, FcMatchPattern);
+    FcConfigSetDefaultSubstitute (0, pat);
+
+    fs = FcFontSetCreate();
+    if (!fs)
+	return 1;
+
+    if (o->sort || o->all) {
+	FcFontSet *font_patterns;
+	font_patterns = FcFontSort (0, pat, o->all ? FcFalse : FcTrue, 0, &result);
+
+	if (!font_patterns || font_patterns->nfont == 0) {
+	    fprintf (stderr, _("No fonts installed on the system\n"));
+	    if (font_patterns)
+		FcFontSetSortDestroy (font_patterns);
+	    FcFontSetDestroy (fs);
+	    return -1;
+	}
+	for (j = 0; j < font_patterns->nfont; j++) {
+	    FcPattern *font_pattern;
+
+	    font_pattern = FcFontRenderPrepare (NULL, pat, font_patterns->fonts[j]);
+	    if (font_pattern)
+		FcFontSetAdd (fs, font_pattern);
+	}
+
+	FcFontSetSortDestroy (font_patterns);
+    } else {
+	FcPattern *match;
+	match = FcFontMatch (0, pat, &result);
+	if (match)
+	    FcFontSetAdd (fs, match);
+    }
+
+    for (j = 0; j < fs->nfont; j++) {
+	FcPattern *font;
+
+	font = FcPatternFilter (fs->fonts[j], o->os);
+
+	if (o->verbose || o->brief) {
+	    if (o->brief) {
+		FcPatternDel (font, FC_CHARSET);
+		FcPatternDel (font, FC_LANG);
+	    }
+	    FcPatternPrint (font);
+	} else {
+	    if (FcPatternFormatterFormat (o->formatter, font, &o->buf, &o->size) >= 0) {
+		size_t len = strlen ((const char *)o->buf);
+		int    newline = o->batch && (!len || o->buf[len - 1] != '\n');
+
+		if (!collect) {
+		    printf ("%s", o->buf);
+		    if (newline)
+			printf ("\n");
+		} else if (!reply_add (o, (const char *)o->buf, len) ||
+		           (newline && !reply_add (o, "\n", 1)))
+		    err = 1;
+	    } else {
+		if (o->batch && !collect)
+		    printf ("\n");
+		err = 1;
+	    }
+	}
+
+	FcPatternDestroy (font);
+	if (collect && err)
+	    break;
+    }
+    /*
+     * An empty line ends the fonts of a pattern in batch sort mode, so a
+     * font which can't be formatted fails the whole reply rather than
+     * being printed as one
+     */
+    if (collect && !err)
+	fwrite (o->reply, 1, o->reply_len, stdout);
+    o->reply_len = 0;
+    /* A pattern matching no font is answered with an empty line */
+    if (o->batch && !o->sort && !o->all && !fs->nfont)
+	printf ("\n");
+    FcFontSetDestroy (fs);
+
+    return err;
+}
+
+/*
+ * Match each pattern read from stdin against the configuration loaded
+ * once, flushing the output after each so that fc-match can serve as a
+ * coprocess.  Each font is printed as one line.  An empty line follows
+ * the fonts of each pattern when sorting, and stands for the font when
+ * a pattern can't be parsed, matches no font or its font can't be
+ * formatted.  When sorting, a font which can't be formatted leaves out
+ * all the fonts of the pattern.
+ */
+static int
+match_batch (Options *o)
+{
+    char  *line = NULL;
+    size_t size = 0;
+    int    err = 0;
+
+    while (read_line (stdin, &line, &size)) {
+	FcPattern *pat = FcNameParse ((FcChar8 *)line);
+
+	if (!pat) {
+	    fprintf (stderr, _("Unable to parse the pattern\n"));
+	    printf ("\n");
+	    err = 1;
+	} else {
+	    if (match (pat, o))
+		err = 1;
+	    FcPatternDestroy (pat);
+	    if (o->sort || o->all)
+		printf ("\n");
+	}
+	fflush (stdout);
+    }
+    free (line);
+
+    return err;
+}
+
 int
 main (int argc, char **argv)
 {
-    int            verbose = 0;
-    int            brief = 0;
-    int            sort = 0, all = 0;
-    const FcChar8 *format = NULL;
+    Options        o = { 0 };
     FcChar8       *format_optarg = NULL;
     int            i, err = 0;
-    FcObjectSet   *os = 0;
-    FcFontSet     *fs;
-    FcPattern     *pat;
-    FcResult       result;
+    FcPattern     *pat = NULL;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
     setlocale (LC_ALL, "");
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "asvbf:Vh", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "asvbf:BVh", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "asvbf:Vh")) != -1)
+    while ((c = getopt (argc, argv, "asvbf:BVh")) != -1)
 #  endif
     {
 	switch (c) {
 	case 'a':
-	    all = 1;
+	    o.all = 1;
 	    break;
 	case 's':
-	    sort = 1;
+	    o.sort = 1;
 	    break;
 	case 'v':
-	    verbose = 1;
+	    o.verbose = 1;
 	    break;
 	case 'b':
-	    brief = 1;
+	    o.brief = 1;
 	    break;
 	case 'f':
 	    format_optarg = FcStrCopy ((const FcChar8 *)optarg);
-	    format = (const FcChar8 *)format_optarg;
+	    o.format = (const FcChar8 *)format_optarg;
+	    break;
+	case 'B':
+	    o.batch = 1;
 	    break;
 	case 'V':
 	    fprintf (stderr, "fontconfig version %d.%d.%d\n",
@@ -166,95 +336,56 @@ main (int argc, char **argv)
     i = 1;
 #endif
 
-    if (argv[i]) {
+    if (o.batch) {
+	while (argv[i]) {
+	    if (!o.os)
+		o.os = FcObjectSetCreate();
+	    FcObjectSetAdd (o.os, argv[i++]);
+	}
+    } else if (argv[i]) {
 	pat = FcNameParse ((FcChar8 *)argv[i]);
 	if (!pat) {
 	    fprintf (stderr, _("Unable to parse the pattern\n"));
 	    return 1;
 	}
 	while (argv[++i]) {
-	    if (!os)
-		os = FcObjectSetCreate();
-	    FcObjectSetAdd (os, argv[i]);
+	    if (!o.os)
+		o.os = FcObjectSetCreate();
+	    FcObjectSetAdd (o.os, argv[i]);
 	}
     } else
 	pat = FcPatternCreate();
 
-    if (!pat)
+    if (!o.batch && !pat)
 	return 1;
 
-    FcConfigSetWarningFlags (NULL, -1, FcTrue);
-    FcConfigSubstitute (0, pat, FcMatchPattern);
-    FcConfigSetDefaultSubstitute (0, pat);
-
-    fs = FcFontSetCreate();
-
-    if (sort || all) {
-	FcFontSet *font_patterns;
-	int        j;
-	font_patterns = FcFontSort (0, pat, all ? FcFalse : FcTrue, 0, &result);
-
-	if (!font_patterns || font_patterns->nfont == 0) {
-	    fprintf (stderr, _("No fonts installed on the system\n"));
-	    return 1;
-	}
-	for (j = 0; j < font_patterns->nfont; j++) {
-	    FcPattern *font_pattern;
-
-	    font_pattern = FcFontRenderPrepare (NULL, pat, font_patterns->fonts[j]);
-	    if (font_pattern)
-		FcFontSetAdd (fs, font_pattern);
-	}
-
-	FcFontSetSortDestroy (font_patterns);
-    } else {
-	FcPattern *match;
-	match = FcFontMatch (0, pat, &result);
-	if (match)
-	    FcFontSetAdd (fs, match);
-    }
-    FcPatternDestroy (pat);
-
-    if (!format) {
-	if (os)
-	    format = (const FcChar8 *)"%{=unparse}\n";
+    if (!o.format) {
+	if (o.os)
+	    o.format = (const FcChar8 *)"%{=unparse}\n";
 	else
-	    format = (const FcChar8 *)"%{=fcmatch}\n";
+	    o.format = (const FcChar8 *)"%{=fcmatch}\n";
+    }
+    if (!o.verbose && !o.brief) {
+	o.formatter = FcPatternFormatterCreate (o.format);
+	if (!o.formatter)
+	    return 1;
     }
 
-    if (fs) {
-	int j;
-
-	for (j = 0; j < fs->nfont; j++) {
-	    FcPattern *font;
-
-	    font = FcPatternFilter (fs->fonts[j], os);
-
-	    if (verbose || brief) {
-		if (brief) {
-		    FcPatternDel (font, FC_CHARSET);
-		    FcPatternDel (font, FC_LANG);
-		}
-		FcPatternPrint (font);
-	    } else {
-		FcChar8 *s;
-
-		s = FcPatternFormat (font, format);
-		if (s) {
-		    printf ("%s", s);
-		    FcStrFree (s);
-		} else {
-		    err = 1;
-		}
-	    }
-
-	    FcPatternDestroy (font);
-	}
-	FcFontSetDestroy (fs);
+    FcConfigSetWarningFlags (NULL, -1, FcTrue);
+    if (o.batch)
+	err = match_batch (&o);
+    else {
+	err = match (pat, &o);
+	FcPatternDestroy (pat);
+	if (err < 0)
+	    return 1;
     }
 
-    if (os)
-	FcObjectSetDestroy (os);
+    if (o.os)
+	FcObjectSetDestroy (o.os);
+    FcPatternFormatterDestroy (o.formatter);
+    free (o.buf);
+    free (o.reply);
 
     FcFini();
 
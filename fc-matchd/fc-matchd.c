@@ -0,0 +1,453 @@
+/*
+ * fontconfig/fc-matchd/fc-matchd.c
+ *
+ * Copyright © 2003 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+
+#ifdef HAVE_CONFIG_H
+#  include <config.h>
+#else
+#  ifdef linux
+#    define HAVE_GETOPT_LONG 1
+#  endif
+#  define HAVE_GETOPT 1
+#endif
+
+#include "fcint.h"
+
+#include <errno.h>
+#include <locale.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef HAVE_UNISTD_H
+#  include <unistd.h>
+#endif
+
+#ifdef HAVE_SYS_UN_H
+#  include <fcntl.h>
+#  include <poll.h>
+#  include <signal.h>
+#  include <sys/socket.h>
+#  include <sys/un.h>
+#endif
+
+#ifdef ENABLE_NLS
+#  include <libintl.h>
+#  define _(x) (dgettext (GETTEXT_PACKAGE, x))
+#else
+#  define dgettext(d, s) (s)
+#  define _(x)           (x)
+#endif
+
+#ifndef HAVE_GETOPT
+#  define HAVE_GETOPT 0
+#endif
+#ifndef HAVE_GETOPT_LONG
+#  define HAVE_GETOPT_LONG 0
+#endif
+
+#if HAVE_GETOPT_LONG
+#  undef _GNU_SOURCE
+#  define _GNU_SOURCE
+#  include <getopt.h>
+static const struct option longopts[] = {
+    { "socket",  1, 0, 's' },
+    { "verbose", 0, 0, 'v' },
+    { "version", 0, 0, 'V' },
+    { "help",    0, 0, 'h' },
+    { NULL,      0, 0, 0   },
+};
+#else
+#  if HAVE_GETOPT
+extern char *optarg;
+extern int   optind, opterr, optopt;
+#  endif
+#endif
+
+static void
+usage (char *program, int error)
+{
+    FILE *file = error ? stderr : stdout;
+#if HAVE_GETOPT_LONG
+    fprintf (file, _("usage: %s [-vVh] [-s SOCKET] [--socket=SOCKET] [--verbose] [--version] [--help]\n"),
+                     program);
+#else
+    fprintf (file, _("usage: %s [-vVh] [-s SOCKET]\n"),
+                     program);
+#endif
+    fprintf (file, _("Answer font matching requests on a local socket\n"));
+    fprintf (file, "\n");
+#if HAVE_GETOPT_LONG
+    fprintf (file, _("  -s, --socket=SOCKET  listen on SOCKET\n"));
+    fprintf (file, _("  -v, --verbose        display the requests\n"));
+    fprintf (file, _("  -V, --version        display font config version and exit\n"));
+    fprintf (file, _("  -h, --help           display this help and exit\n"));
+#else
+    fprintf (file, _("  -s SOCKET  (socket)  listen on SOCKET\n"));
+    fprintf (file, _("  -v         (verbose) display the requests\n"));
+    fprintf (file, _("  -V         (version) display font config version and exit\n"));
+    fprintf (file, _("  -h         (help)    display this help and exit\n"));
+#endif
+    exit (error);
+}
+
+#ifdef HAVE_SYS_UN_H
+/* Longest request accepted, as FcServerQuery sends at most that */
+#  define LINE_MAX_LEN (1 << 20)
+
+typedef struct {
+    int    fd;
+    char  *in; /* what was received and not answered yet */
+    size_t inlen, insize;
+    char  *out; /* what is to be sent, from outpos */
+    size_t outpos, outlen;
+    int    closing;
+} Client;
+
+static volatile sig_atomic_t done;
+
+static void
+stop (int sig)
+{
+    done = 1;
+}
+
+/*
+ * Send what is queued for the client without blocking, returning 0 on
+ * error
+ */
+static int
+flush (Client *c)
+{
+    int flags = 0;
+
+#  ifdef MSG_NOSIGNAL
+    flags = MSG_NOSIGNAL;
+#  endif
+    while (c->outpos < c->outlen) {
+	ssize_t n = send (c->fd, c->out + c->outpos, c->outlen - c->outpos, flags);
+
+	if (n < 0) {
+	    if (errno == EINTR)
+		continue;
+	    return errno == EAGAIN || errno == EWOULDBLOCK;
+	}
+	c->outpos += n;
+    }
+    free (c->out);
+    c->out = NULL;
+    c->outpos = c->outlen = 0;
+
+    return 1;
+}
+
+/*
+ * Queue reply and send what can be sent of it, returning 0 on error
+ */
+static int
+queue (Client *c, char *reply)
+{
+    if (!reply)
+	return 0;
+    c->out = reply;
+    c->outpos = 0;
+    c->outlen = strlen (reply);
+
+    return flush (c);
+}
+
+/*
+ * Answer the complete request lines received from the client, one at a
+ * time: the next one waits until the reply to the previous one is sent.
+ * Returns 0 when the connection is to be closed.
+ */
+static int
+serve (Client *c, int verbose)
+{
+    char *line = c->in, *end, *reply;
+    int   ret = 1;
+
+    while (ret && !c->out && !c->closing) {
+	end = memchr (line, '\n', c->inlen - (line - c->in));
+	if (!end) {
+	    if (c->inlen - (line - c->in) > LINE_MAX_LEN) {
+		c->closing = 1;
+		ret = queue (c, strdup ("!request too long\n"));
+	    }
+	    break;
+	}
+	*end = '\0';
+	if (end > line && end[-1] == '\r')
+	    end[-1] = '\0';
+	if (verbose) {
+	    printf ("%s\n", line);
+	    fflush (stdout);
+	}
+	/* Follow the changes to the configuration and the fonts */
+	FcInitBringUptoDate();
+	reply = (char *)FcServerReply (NULL, (const FcChar8 *)line);
+	line = end + 1;
+	if (!reply)
+	    reply = strdup ("!out of memory\n");
+	ret = queue (c, reply);
+    }
+    c->inlen -= line - c->in;
+    memmove (c->in, line, c->inlen);
+
+    return ret && !(c->closing && !c->out);
+}
+
+/*
+ * Read what the client sent and answer it, returning 0 when the
+ * connection is to be closed
+ */
+static int
+receive (Client *c, int verbose)
+{
+    ssize_t n;
+
+    if (c->insize - c->inlen < 4096) {
+	char *buf = realloc (c->in, c->insize + 4096);
+
+	if (!buf)
+	    return 0;
+	c->in = buf;
+	c->insize += 4096;
+    }
+    n = recv (c->fd, c->in + c->inlen, c->insize - c->inlen, 0);
+    if (n < 0)
+	return errno == EINTR || errno == EAGAIN || errno == EWOULDBLOCK;
+    if (n == 0)
+	return 0;
+    c->inlen += n;
+
+    return serve (c, verbose);
+}
+
+static void
+drop (Client *c)
+{
+    close (c->fd);
+    free (c->in);
+    free (c->out);
+}
+
+static int
+listen_on (const char *path)
+{
+    struct sockaddr_un addr;
+    int                fd;
+
+    if (strlen (path) >= sizeof (addr.sun_path)) {
+	fprintf (stderr, _("%s: socket path too long\n"), path);
+	return -1;
+    }
+    memset (&addr, 0, sizeof (addr));
+    addr.sun_family = AF_UNIX;
+    strcpy (addr.sun_path, path);
+
+    fd = socket (AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0) {
+	perror ("socket");
+	return -1;
+    }
+    /* Take over the socket of a server which is gone, but not a live one */
+    if (connect (fd, (struct sockaddr *)&addr, sizeof (addr)) == 0) {
+	fprintf (stderr, _("%s: a server is already listening\n"), path);
+	close (fd);
+	return -1;
+    }
+    close (fd);
+    unlink (path);
+
+    fd = socket (AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0 ||
+        bind (fd, (struct sockaddr *)&addr, sizeof (addr)) < 0 ||
+        listen (fd, SOMAXCONN) < 0) {
+	perror (path);
+	if (fd >= 0)
+	    close (fd);
+	return -1;
+    }
+    return fd;
+}
+
+static int
+run (const char *path, int verbose)
+{
+    struct pollfd *pfds = NULL;
+    Client        *clients = NULL;
+    int            nclients = 0, fd, i, ret = 0;
+
+    fd = listen_on (path);
+    if (fd < 0)
+	return 1;
+
+    signal (SIGINT, stop);
+    signal (SIGTERM, stop);
+    signal (SIGPIPE, SIG_IGN);
+    if (verbose) {
+	printf (_("listening on %s\n"), path);
+	fflush (stdout);
+    }
+    while (!done) {
+	struct pollfd *p = realloc (pfds, (nclients + 1) * sizeof (struct pollfd));
+
+	if (!p) {
+	    ret = 1;
+	    break;
+	}
+	pfds = p;
+	pfds[0].fd = fd;
+	pfds[0].events = POLLIN;
+	for (i = 0; i < nclients; i++) {
+	    pfds[i + 1].fd = clients[i].fd;
+	    /* Don't read more requests until the last reply is sent */
+	    pfds[i + 1].events = clients[i].out ? POLLOUT : POLLIN;
+	}
+	if (poll (pfds, nclients + 1, -1) < 0) {
+	    if (errno == EINTR)
+		continue;
+	    perror ("poll");
+	    ret = 1;
+	    break;
+	}
+	/* Serve the clients first, new ones are appended to the list */
+	for (i = nclients - 1; i >= 0; i--) {
+	    Client *c = &clients[i];
+	    int     ok;
+
+	    if (!pfds[i + 1].revents)
+		continue;
+	    if (c->out)
+		ok = (pfds[i + 1].revents & POLLOUT) && flush (c) && (c->out || serve (c, verbose));
+	    else
+		ok = receive (c, verbose);
+	    if (!ok) {
+		drop (c);
+		clients[i] = clients[--nclients];
+	    }
+	}
+	if (pfds[0].revents & POLLIN) {
+	    int     cfd = accept (fd, NULL, NULL);
+	    Client *c;
+
+	    if (cfd < 0)
+		continue;
+	    c = realloc (clients, (nclients + 1) * sizeof (Client));
+	    if (!c || fcntl (cfd, F_SETFL, fcntl (cfd, F_GETFL) | O_NONBLOCK) < 0) {
+		if (c)
+		    clients = c;
+		close (cfd);
+		continue;
+	    }
+	    clients = c;
+	    memset (&clients[nclients], 0, sizeof (Client));
+	    clients[nclients++].fd = cfd;
+	}
+    }
+
+    for (i = 0; i < nclients; i++)
+	drop (&clients[i]);
+    free (clients);
+    free (pfds);
+    close (fd);
+    unlink (path);
+
+    return ret;
+}
+#endif
+
+int
+main (int argc, char **argv)
+{
+    const char *socket_path = NULL;
+    char       *default_path = NULL;
+    int         verbose = 0;
+    int         ret;
+#if HAVE_GETOPT_LONG || HAVE_GETOPT
+    int c;
+
+    setlocale (LC_ALL, "");
+#  if HAVE_GETOPT_LONG
+    while ((c = getopt_long (argc, argv, "s:vVh", longopts, NULL)) != -1)
+#  else
+    while ((c = getopt (argc, argv, "s:vVh")) != -1)
+#  endif
+    {
+	switch (c) {
+	case 's':
+	    socket_path = optarg;
+	    break;
+	case 'v':
+	    verbose = 1;
+	    break;
+	case 'V':
+	    fprintf (stderr, "fontconfig version %d.%d.%d\n",
+	             FC_MAJOR, FC_MINOR, FC_REVISION);
+	    exit (0);
+	case 'h':
+	    usage (argv[0], 0);
+	default:
+	    usage (argv[0], 1);
+	}
+    }
+    if (optind != argc)
+	usage (argv[0], 1);
+#endif
+
+#ifdef HAVE_SYS_UN_H
+    if (!socket_path)
+	socket_path = getenv ("FONTCONFIG_MATCHD_SOCKET");
+    if (!socket_path || !*socket_path) {
+	const char *dir = getenv ("XDG_RUNTIME_DIR");
+
+	if (!dir || !*dir) {
+	    fprintf (stderr, _("No socket given and XDG_RUNTIME_DIR not set\n"));
+	    return 1;
+	}
+	default_path = (char *)FcStrBuildFilename ((const FcChar8 *)dir,
+	                                           (const FcChar8 *)"fontconfig-matchd", NULL);
+	if (!default_path)
+	    return 1;
+	socket_path = default_path;
+    }
+
+    if (!FcInit())
+	return 1;
+    FcConfigSetWarningFlags (NULL, -1, FcTrue);
+    ret = run (socket_path, verbose);
+
+    if (default_path)
+	FcStrFree ((FcChar8 *)default_path);
+    FcFini();
+#else
+    (void)socket_path;
+    (void)default_path;
+    (void)verbose;
+    fprintf (stderr, _("Local sockets are not supported on this system\n"));
+    ret = 1;
+#endif
+
+    return ret;
+}
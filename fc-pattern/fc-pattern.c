@@ -37,6 +37,9 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <time.h>
+
+#include "fctools.h"
 
 #ifdef HAVE_UNISTD_H
 #  include <unistd.h>
@@ -65,6 +68,8 @@ static const struct option longopts[] = {
     { "config",  0, 0, 'c' },
     { "default", 0, 0, 'd' },
     { "format",  1, 0, 'f' },
+    { "batch",   0, 0, 'B' },
+    { "timing",  0, 0, 't' },
     { "version", 0, 0, 'V' },
     { "help",    0, 0, 'h' },
     { NULL,      0, 0, 0   },
@@ -81,10 +86,10 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-cdVh] [-f FORMAT] [--config] [--default] [--verbose] [--format=FORMAT] [--version] [--help] [pattern] {element...}\n"),
+    fprintf (file, _("usage: %s [-cdBtVh] [-f FORMAT] [--config] [--default] [--verbose] [--format=FORMAT] [--batch] [--timing] [--version] [--help] [pattern] {element...}\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-cdVh] [-f FORMAT] [pattern] {element...}\n"),
+    fprintf (file, _("usage: %s [-cdBtVh] [-f FORMAT] [pattern] {element...}\n"),
                      program);
 #endif
     fprintf (file, _("List best font matching [pattern]\n"));
@@ -93,46 +98,159 @@ usage (char *program, int error)
     fprintf (file, _("  -c, --config         perform config substitution on pattern\n"));
     fprintf (file, _("  -d, --default        perform default substitution on pattern\n"));
     fprintf (file, _("  -f, --format=FORMAT  use the given output format\n"));
+    fprintf (file, _("  -B, --batch          substitute each pattern read from stdin, one per line\n"));
+    fprintf (file, _("  -t, --timing         report the time spent substituting each pattern on stderr\n"));
     fprintf (file, _("  -V, --version        display font config version and exit\n"));
     fprintf (file, _("  -h, --help           display this help and exit\n"));
 #else
     fprintf (file, _("  -c,        (config)  perform config substitution on pattern\n"));
     fprintf (file, _("  -d,        (default) perform default substitution on pattern\n"));
     fprintf (file, _("  -f FORMAT  (format)  use the given output format\n"));
+    fprintf (file, _("  -B         (batch)   substitute each pattern read from stdin, one per line\n"));
+    fprintf (file, _("  -t         (timing)  report the time spent substituting each pattern on stderr\n"));
     fprintf (file, _("  -V         (version) display font config version and exit\n"));
     fprintf (file, _("  -h         (help)    display this help and exit\n"));
 #endif
     exit (error);
 }
 
+typedef struct _Options {
+    int                 do_config, do_default;
+    int                 timing;
+    double              elapsed; /* substituting the last pattern */
+    FcObjectSet        *os;
+    FcPatternFormatter *formatter;
+    FcChar8            *buf; /* the formatted pattern */
+    int                 size;
+} Options;
+
+/*
+ * A clock for timing patterns, in seconds
+ */
+static double
+now (void)
+{
+#if defined(HAVE_CLOCK_GETTIME) && defined(CLOCK_MONOTONIC)
+    struct timespec ts;
+
+    if (clock_gettime (CLOCK_MONOTONIC, &ts) == 0)
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+#endif
+    return (double)clock() / CLOCKS_PER_SEC;
+}
+
+/*
+ * Substitute pat and print it, returning non-zero when the output
+ * couldn't be formatted
+ */
+static int
+substitute (FcPattern *pat, Options *o)
+{
+    int    err = 0;
+    double start = now();
+
+    if (o->do_config)
+	FcConfigSubstitute (0, pat, FcMatchPattern);
+    if (o->do_default)
+	FcConfigSetDefaultSubstitute (0, pat);
+    o->elapsed = now() - start;
+
+    if (o->os) {
+	pat = FcPatternFilter (pat, o->os);
+	if (!pat)
+	    return 1;
+    } else
+	FcPatternReference (pat);
+
+    if (o->formatter) {
+	if (FcPatternFormatterFormat (o->formatter, pat, &o->buf, &o->size) >= 0)
+	    printf ("%s", o->buf);
+	else
+	    err = 1;
+    } else {
+	FcPatternPrint (pat);
+    }
+    FcPatternDestroy (pat);
+
+    return err;
+}
+
+/*
+ * Substitute each pattern read from stdin with the configuration loaded
+ * once, flushing the output after each so that fc-pattern can serve as
+ * a coprocess.  A pattern which can't be parsed gets an empty line.
+ * With timing, the time spent substituting each pattern and the total
+ * are reported on stderr.
+ */
+static int
+substitute_batch (Options *o)
+{
+    char  *line = NULL;
+    size_t size = 0;
+    int    err = 0, count = 0;
+    double total = 0;
+
+    while (read_line (stdin, &line, &size)) {
+	FcPattern *pat = FcNameParse ((FcChar8 *)line);
+
+	if (!pat) {
+	    fprintf (stderr, _("Unable to parse the pattern\n"));
+	    printf ("\n");
+	    fflush (stdout);
+	    err = 1;
+	    continue;
+	}
+	if (substitute (pat, o))
+	    err = 1;
+	FcPatternDestroy (pat);
+	fflush (stdout);
+	if (o->timing) {
+	    fprintf (stderr, "%10.3f ms  %s\n", o->elapsed * 1e3, line);
+	    total += o->elapsed;
+	    count++;
+	}
+    }
+    free (line);
+    if (o->timing)
+	fprintf (stderr, _("%d patterns in %.3f ms\n"), count, total * 1e3);
+
+    return err;
+}
+
 int
 main (int argc, char **argv)
 {
-    int          do_config = 0, do_default = 0;
+    Options      o = { 0 };
+    int          batch = 0;
     FcChar8     *format = NULL;
     int          i, err = 0;
-    FcObjectSet *os = 0;
-    FcPattern   *pat;
+    FcPattern   *pat = NULL;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
     setlocale (LC_ALL, "");
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "cdf:Vh", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "cdf:BtVh", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "cdf:Vh")) != -1)
+    while ((c = getopt (argc, argv, "cdf:BtVh")) != -1)
 #  endif
     {
 	switch (c) {
 	case 'c':
-	    do_config = 1;
+	    o.do_config = 1;
 	    break;
 	case 'd':
-	    do_default = 1;
+	    o.do_default = 1;
 	    break;
 	case 'f':
 	    format = FcStrCopy ((const FcChar8 *)optarg);
 	    break;
+	case 'B':
+	    batch = 1;
+	    break;
+	case 't':
+	    o.timing = 1;
+	    break;
 	case 'V':
 	    fprintf (stderr, "fontconfig version %d.%d.%d\n",
 	             FC_MAJOR, FC_MINOR, FC_REVISION);
@@ -148,54 +266,65 @@ main (int argc, char **argv)
     i = 1;
 #endif
 
-    if (argv[i]) {
+    if (batch) {
+	while (argv[i]) {
+	    if (!o.os)
+		o.os = FcObjectSetCreate();
+	    FcObjectSetAdd (o.os, argv[i++]);
+	}
+    } else if (argv[i]) {
 	pat = FcNameParse ((FcChar8 *)argv[i]);
 	if (!pat) {
 	    fprintf (stderr, _("Unable to parse the pattern\n"));
 	    return 1;
 	}
 	while (argv[++i]) {
-	    if (!os)
-		os = FcObjectSetCreate();
-	    FcObjectSetAdd (os, argv[i]);
+	    if (!o.os)
+		o.os = FcObjectSetCreate();
+	    FcObjectSetAdd (o.os, argv[i]);
 	}
     } else
 	pat = FcPatternCreate();
 
-    if (!pat)
+    if (!batch && !pat)
 	return 1;
 
-    FcConfigSetWarningFlags (NULL, -1, FcTrue);
-    if (do_config)
-	FcConfigSubstitute (0, pat, FcMatchPattern);
-    if (do_default)
-	FcConfigSetDefaultSubstitute (0, pat);
-
-    if (os) {
-	FcPattern *new;
-	new = FcPatternFilter (pat, os);
-	FcPatternDestroy (pat);
-	pat = new;
+    if (format) {
+	o.formatter = FcPatternFormatterCreate (format);
+	if (!o.formatter)
+	    return 1;
     }
 
-    if (format) {
-	FcChar8 *s;
+    FcConfigSetWarningFlags (NULL, -1, FcTrue);
+    /*
+     * Substitute an empty pattern before the clock starts, so that the
+     * first pattern timed doesn't pay for loading the configuration and
+     * the defaults it computes on first use
+     */
+    if (o.timing) {
+	FcPattern *empty = FcPatternCreate();
 
-	s = FcPatternFormat (pat, format);
-	if (s) {
-	    printf ("%s", s);
-	    FcStrFree (s);
-	} else {
-	    err = 1;
+	if (empty) {
+	    FcConfigSubstitute (NULL, empty, FcMatchPattern);
+	    FcConfigSetDefaultSubstitute (NULL, empty);
+	    FcPatternDestroy (empty);
 	}
-    } else {
-	FcPatternPrint (pat);
+    }
+    if (batch)
+	err = substitute_batch (&o);
+    else {
+	err = substitute (pat, &o);
+	if (o.timing)
+	    fprintf (stderr, "%10.3f ms\n", o.elapsed * 1e3);
+	FcPatternDestroy (pat);
     }
 
-    FcPatternDestroy (pat);
-
-    if (os)
-	FcObjectSetDestroy (os);
+    if (o.os)
+	FcObjectSetDestroy (o.os);
+    FcPatternFormatterDestroy (o.formatter);
+    free (o.buf);
+    if (format)
+	FcStrFree (format);
 
     FcFini();
 
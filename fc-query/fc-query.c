@@ -36,6 +36,8 @@
 #include <fontconfig/fontconfig.h>
 #include <fontconfig/fcfreetype.h>
 
+#include "fctools.h"
+
 #if ENABLE_FONTATIONS
 #  include <fontconfig/fcfontations.h>
 #endif
@@ -69,12 +71,16 @@
 #  define _GNU_SOURCE
 #  include <getopt.h>
 static const struct option longopts[] = {
-    { "index",   1, 0, 'i' },
-    { "brief",   0, 0, 'b' },
-    { "format",  1, 0, 'f' },
-    { "version", 0, 0, 'V' },
-    { "help",    0, 0, 'h' },
-    { NULL,      0, 0, 0   },
+    { "index",      1, 0, 'i' },
+    { "brief",      0, 0, 'b' },
+    { "format",     1, 0, 'f' },
+    { "json",       0, 0, 'J' },
+    { "files-from", 1, 0, 'F' },
+    { "jobs",       1, 0, 'j' },
+    { "unordered",  0, 0, 'u' },
+    { "version",    0, 0, 'V' },
+    { "help",       0, 0, 'h' },
+    { NULL,         0, 0, 0   },
 };
 #else
 #  if HAVE_GETOPT
@@ -88,10 +94,10 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-bVh] [-i index] [-f FORMAT] [--index index] [--brief] [--format FORMAT] [--version] [--help] font-file...\n"),
+    fprintf (file, _("usage: %s [-bJuVh] [-i index] [-f FORMAT] [-F FILE] [-j JOBS] [--index index] [--brief] [--format FORMAT] [--json] [--files-from FILE] [--jobs JOBS] [--unordered] [--version] [--help] font-file...\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-bVh] [-i index] [-f FORMAT] font-file...\n"),
+    fprintf (file, _("usage: %s [-bJuVh] [-i index] [-f FORMAT] [-F FILE] [-j JOBS] font-file...\n"),
                      program);
 #endif
     fprintf (file, _("Query font files and print resulting pattern(s)\n"));
@@ -100,35 +106,101 @@ usage (char *program, int error)
     fprintf (file, _("  -i, --index INDEX    display the INDEX face of each font file only\n"));
     fprintf (file, _("  -b, --brief          display font pattern briefly\n"));
     fprintf (file, _("  -f, --format=FORMAT  use the given output format\n"));
+    fprintf (file, _("  -J, --json           display each font pattern as a JSON object on one line\n"));
+    fprintf (file, _("  -F, --files-from=FILE  also query the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j, --jobs=JOBS      query the files on JOBS threads\n"));
+    fprintf (file, _("  -u, --unordered      display the fonts of each file as soon as it is queried\n"));
     fprintf (file, _("  -V, --version        display font config version and exit\n"));
     fprintf (file, _("  -h, --help           display this help and exit\n"));
 #else
     fprintf (file, _("  -i INDEX   (index)         display the INDEX face of each font file only\n"));
     fprintf (file, _("  -b         (brief)         display font pattern briefly\n"));
     fprintf (file, _("  -f FORMAT  (format)        use the given output format\n"));
+    fprintf (file, _("  -J         (json)          display each font pattern as a JSON object on one line\n"));
+    fprintf (file, _("  -F FILE    (files-from)    also query the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j JOBS    (jobs)          query the files on JOBS threads\n"));
+    fprintf (file, _("  -u         (unordered)     display the fonts of each file as soon as it is queried\n"));
     fprintf (file, _("  -V         (version)       display font config version and exit\n"));
     fprintf (file, _("  -h         (help)          display this help and exit\n"));
 #endif
     exit (error);
 }
 
+typedef unsigned int (*QueryFunc) (const FcChar8 *, unsigned int, FcBlanks *, int *, FcFontSet *);
+
+typedef struct _Query {
+    unsigned int        id;
+    int                 brief;
+    FcPatternFormatter *formatter;
+    FcChar8            *buf; /* the formatted font */
+    int                 size;
+    QueryFunc           query;
+} Query;
+
+static void
+print_item (Batch *b, Item *item)
+{
+    Query     *q = b->closure;
+    FcFontSet *fs = item->data;
+    int        i;
+
+    if (!item->ok) {
+	fprintf (stderr, _("Can't query face %u of font file %s\n"), q->id, item->file);
+	b->err = 1;
+    }
+    for (i = 0; fs && i < fs->nfont; i++) {
+	FcPattern *pat = fs->fonts[i];
+
+	if (q->brief) {
+	    FcPatternDel (pat, FC_CHARSET);
+	    FcPatternDel (pat, FC_LANG);
+	}
+
+	if (q->formatter) {
+	    if (FcPatternFormatterFormat (q->formatter, pat, &q->buf, &q->size) >= 0)
+		printf ("%s", q->buf);
+	    else
+		b->err = 1;
+	} else {
+	    FcPatternPrint (pat);
+	}
+    }
+    fflush (stdout);
+    if (fs)
+	FcFontSetDestroy (fs);
+    item->data = NULL;
+}
+
+static void
+query_item (Batch *b, Item *item, void *thread)
+{
+    Query     *q = b->closure;
+    FcFontSet *fs = FcFontSetCreate();
+
+    (void)thread;
+    item->data = fs;
+    item->ok = fs && q->query ((const FcChar8 *)item->file, q->id, NULL, NULL, fs);
+}
+
 int
 main (int argc, char **argv)
 {
     unsigned int id = (unsigned int)-1;
-    int          brief = 0;
-    FcFontSet   *fs;
+    int          brief = 0, json = 0, unordered = 0;
+    int          jobs = 1;
     FcChar8     *format = NULL;
-    int          err = 0;
+    const char  *files_from = NULL;
+    Query        q;
+    Batch        b;
     int          i;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
     setlocale (LC_ALL, "");
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "i:bf:Vh", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "i:bf:JF:j:uVh", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "i:bf:Vh")) != -1)
+    while ((c = getopt (argc, argv, "i:bf:JF:j:uVh")) != -1)
 #  endif
     {
 	switch (c) {
@@ -141,6 +213,20 @@ main (int argc, char **argv)
 	case 'f':
 	    format = FcStrCopy ((const FcChar8 *)optarg);
 	    break;
+	case 'J':
+	    json = 1;
+	    break;
+	case 'F':
+	    files_from = optarg;
+	    break;
+	case 'j':
+	    jobs = atoi (optarg);
+	    if (jobs < 1)
+		usage (argv[0], 1);
+	    break;
+	case 'u':
+	    unordered = 1;
+	    break;
 	case 'V':
 	    fprintf (stderr, "fontconfig version %d.%d.%d\n",
 	             FC_MAJOR, FC_MINOR, FC_REVISION);
@@ -156,52 +242,47 @@ main (int argc, char **argv)
     i = 1;
 #endif
 
-    if (i == argc)
+    if (i == argc && !files_from)
 	usage (argv[0], 1);
+    if (json) {
+	if (format)
+	    usage (argv[0], 1);
+	format = FcStrCopy ((const FcChar8 *)"%{=json}\n");
+    }
+
+    memset (&q, 0, sizeof (q));
+    if (format) {
+	q.formatter = FcPatternFormatterCreate (format);
+	if (!q.formatter)
+	    return 1;
+    }
 
-    fs = FcFontSetCreate();
+    if (!batch_init (&b, argv + i, argc - i))
+	return 1;
+    if (files_from && !batch_read_files (&b, files_from))
+	b.err = 1;
+    b.unordered = unordered;
+    b.process = query_item;
+    b.print = print_item;
+    b.closure = &q;
+    q.id = id;
+    q.brief = brief;
 
-    unsigned int (*query_function) (const FcChar8 *, unsigned int, FcBlanks *, int *, FcFontSet *) = FcFreeTypeQueryAll;
+    q.query = FcFreeTypeQueryAll;
 #if ENABLE_FONTATIONS
     if (getenv ("FC_FONTATIONS") != NULL) {
-	query_function = FcFontationsQueryAll;
+	q.query = FcFontationsQueryAll;
     }
 #endif
 
-    for (; i < argc; i++) {
-	if (!query_function ((FcChar8 *)argv[i], id, NULL, NULL, fs)) {
-	    fprintf (stderr, _("Can't query face %u of font file %s\n"), id, argv[i]);
-	    err = 1;
-	}
-    }
-
-    for (i = 0; i < fs->nfont; i++) {
-	FcPattern *pat = fs->fonts[i];
-
-	if (brief) {
-	    FcPatternDel (pat, FC_CHARSET);
-	    FcPatternDel (pat, FC_LANG);
-	}
-
-	if (format) {
-	    FcChar8 *s;
-
-	    s = FcPatternFormat (pat, format);
-	    if (s) {
-		printf ("%s", s);
-		FcStrFree (s);
-	    } else {
-		err = 1;
-	    }
-	} else {
-	    FcPatternPrint (pat);
-	}
-    }
+    batch_run (&b, jobs);
 
-    FcFontSetDestroy (fs);
+    batch_fini (&b);
+    FcPatternFormatterDestroy (q.formatter);
+    free (q.buf);
     if (format)
 	free (format);
 
     FcFini();
-    return err;
+    return b.err;
 }
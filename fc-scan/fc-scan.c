@@ -41,6 +41,8 @@
 #include <stdlib.h>
 #include <string.h>
 
+#include "fctools.h"
+
 #ifdef HAVE_UNISTD_H
 #  include <unistd.h>
 #endif
@@ -65,12 +67,16 @@
 #  define _GNU_SOURCE
 #  include <getopt.h>
 static const struct option longopts[] = {
-    { "brief",   0,                 0, 'b' },
-    { "format",  1,                 0, 'f' },
-    { "sysroot", required_argument, 0, 'y' },
-    { "version", 0,                 0, 'V' },
-    { "help",    0,		 0, 'h' },
-    { NULL,      0,		 0, 0   },
+    { "brief",      0,                 0, 'b' },
+    { "format",     1,                 0, 'f' },
+    { "json",       0,                 0, 'J' },
+    { "files-from", required_argument, 0, 'F' },
+    { "jobs",       required_argument, 0, 'j' },
+    { "unordered",  0,                 0, 'u' },
+    { "sysroot",    required_argument, 0, 'y' },
+    { "version",    0,                 0, 'V' },
+    { "help",       0,                 0, 'h' },
+    { NULL,         0,                 0, 0   },
 };
 #else
 #  if HAVE_GETOPT
@@ -84,10 +90,10 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-bcVh] [-f FORMAT] [-y SYSROOT] [--brief] [--format FORMAT] [--version] [--help] font-file...\n"),
+    fprintf (file, _("usage: %s [-bcJuVh] [-f FORMAT] [-F FILE] [-j JOBS] [-y SYSROOT] [--brief] [--format FORMAT] [--json] [--files-from FILE] [--jobs JOBS] [--unordered] [--version] [--help] font-file...\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-bcVh] [-f FORMAT] [-y SYSROOT] font-file...\n"),
+    fprintf (file, _("usage: %s [-bcJuVh] [-f FORMAT] [-F FILE] [-j JOBS] [-y SYSROOT] font-file...\n"),
                      program);
 #endif
     fprintf (file, _("Scan font files and directories, and print resulting pattern(s)\n"));
@@ -95,12 +101,20 @@ usage (char *program, int error)
 #if HAVE_GETOPT_LONG
     fprintf (file, _("  -b, --brief            display font pattern briefly\n"));
     fprintf (file, _("  -f, --format=FORMAT    use the given output format\n"));
+    fprintf (file, _("  -J, --json             display each font pattern as a JSON object on one line\n"));
+    fprintf (file, _("  -F, --files-from=FILE  also scan the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j, --jobs=JOBS        scan the files on JOBS threads\n"));
+    fprintf (file, _("  -u, --unordered        display the fonts of each file as soon as it is scanned\n"));
     fprintf (file, _("  -y, --sysroot=SYSROOT  prepend SYSROOT to all paths for scanning\n"));
     fprintf (file, _("  -V, --version          display font config version and exit\n"));
     fprintf (file, _("  -h, --help             display this help and exit\n"));
 #else
     fprintf (file, _("  -b         (brief)         display font pattern briefly\n"));
     fprintf (file, _("  -f FORMAT  (format)        use the given output format\n"));
+    fprintf (file, _("  -J         (json)          display each font pattern as a JSON object on one line\n"));
+    fprintf (file, _("  -F FILE    (files-from)    also scan the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j JOBS    (jobs)          scan the files on JOBS threads\n"));
+    fprintf (file, _("  -u         (unordered)     display the fonts of each file as soon as it is scanned\n"));
     fprintf (file, _("  -y SYSROOT (sysroot)       prepend SYSROOT to all paths for scanning\n"));
     fprintf (file, _("  -V         (version)       display font config version and exit\n"));
     fprintf (file, _("  -h         (help)          display this help and exit\n"));
@@ -108,21 +122,87 @@ usage (char *program, int error)
     exit (error);
 }
 
+typedef struct _Scan {
+    int                 brief;
+    FcPatternFormatter *formatter;
+    FcChar8            *buf; /* the formatted font */
+    int                 size;
+    int                 nfont; /* fonts printed */
+} Scan;
+
+static void
+print_item (Batch *b, Item *item)
+{
+    Scan      *s = b->closure;
+    FcFontSet *fs = item->data;
+    int        i;
+
+    for (i = 0; fs && i < fs->nfont; i++) {
+	FcPattern *pat = fs->fonts[i];
+
+	if (s->brief) {
+	    FcPatternDel (pat, FC_CHARSET);
+	    FcPatternDel (pat, FC_LANG);
+	}
+
+	if (s->formatter) {
+	    if (FcPatternFormatterFormat (s->formatter, pat, &s->buf, &s->size) >= 0)
+		printf ("%s", s->buf);
+	    else
+		b->err = 1;
+	} else {
+	    FcPatternPrint (pat);
+	}
+	s->nfont++;
+    }
+    fflush (stdout);
+    if (fs)
+	FcFontSetDestroy (fs);
+    item->data = NULL;
+}
+
+static void
+scan_item (Batch *b, Item *item, void *thread)
+{
+    const FcChar8 *file = (const FcChar8 *)item->file;
+    FcFontSet     *fs = FcFontSetCreate();
+
+    (void)b;
+    (void)thread;
+    item->data = fs;
+    if (!fs)
+	return;
+    if (!FcFileIsDir (file))
+	FcFileScan (fs, NULL, NULL, NULL, file, FcTrue);
+    else {
+	FcStrSet  *dirs = FcStrSetCreate();
+	FcStrList *strlist = FcStrListCreate (dirs);
+	do {
+	    FcDirScan (fs, dirs, NULL, NULL, file, FcTrue);
+	} while ((file = FcStrListNext (strlist)));
+	FcStrListDone (strlist);
+	FcStrSetDestroy (dirs);
+    }
+}
+
 int
 main (int argc, char **argv)
 {
-    int        brief = 0;
-    FcChar8   *format = NULL, *sysroot = NULL;
-    int        i;
-    FcFontSet *fs;
+    int         brief = 0, json = 0, unordered = 0;
+    int         jobs = 1;
+    FcChar8    *format = NULL, *sysroot = NULL;
+    const char *files_from = NULL;
+    Scan        scan;
+    Batch       b;
+    int         i;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
 
     setlocale (LC_ALL, "");
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "bf:y:Vh", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "bf:JF:j:uy:Vh", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "bf:y:Vh")) != -1)
+    while ((c = getopt (argc, argv, "bf:JF:j:uy:Vh")) != -1)
 #  endif
     {
 	switch (c) {
@@ -132,6 +212,20 @@ main (int argc, char **argv)
 	case 'f':
 	    format = FcStrCopy ((const FcChar8 *)optarg);
 	    break;
+	case 'J':
+	    json = 1;
+	    break;
+	case 'F':
+	    files_from = optarg;
+	    break;
+	case 'j':
+	    jobs = atoi (optarg);
+	    if (jobs < 1)
+		usage (argv[0], 1);
+	    break;
+	case 'u':
+	    unordered = 1;
+	    break;
 	case 'y':
 	    sysroot = FcStrCopy ((const FcChar8 *)optarg);
 	    break;
@@ -150,60 +244,44 @@ main (int argc, char **argv)
     i = 1;
 #endif
 
-    if (i == argc)
+    if (i == argc && !files_from)
 	usage (argv[0], 1);
+    if (json) {
+	if (format)
+	    usage (argv[0], 1);
+	format = FcStrCopy ((const FcChar8 *)"%{=json}\n");
+    }
+    memset (&scan, 0, sizeof (scan));
+    if (format) {
+	scan.formatter = FcPatternFormatterCreate (format);
+	if (!scan.formatter)
+	    return 1;
+    }
 
     if (sysroot) {
 	FcConfigSetSysRoot (NULL, sysroot);
 	FcStrFree (sysroot);
     }
     FcConfigSetWarningFlags (NULL, -1, FcTrue);
-    fs = FcFontSetCreate();
-
-    for (; i < argc; i++) {
-	const FcChar8 *file = (FcChar8 *)argv[i];
-
-	if (!FcFileIsDir (file))
-	    FcFileScan (fs, NULL, NULL, NULL, file, FcTrue);
-	else {
-	    FcStrSet  *dirs = FcStrSetCreate();
-	    FcStrList *strlist = FcStrListCreate (dirs);
-	    do {
-		FcDirScan (fs, dirs, NULL, NULL, file, FcTrue);
-	    } while ((file = FcStrListNext (strlist)));
-	    FcStrListDone (strlist);
-	    FcStrSetDestroy (dirs);
-	}
-    }
-
-    for (i = 0; i < fs->nfont; i++) {
-	FcPattern *pat = fs->fonts[i];
 
-	if (brief) {
-	    FcPatternDel (pat, FC_CHARSET);
-	    FcPatternDel (pat, FC_LANG);
-	}
+    if (!batch_init (&b, argv + i, argc - i))
+	return 1;
+    if (files_from && !batch_read_files (&b, files_from))
+	b.err = 1;
+    b.unordered = unordered;
+    b.process = scan_item;
+    b.print = print_item;
+    b.closure = &scan;
+    scan.brief = brief;
 
-	if (format) {
-	    FcChar8 *s;
-
-	    s = FcPatternFormat (pat, format);
-	    if (s) {
-		printf ("%s", s);
-		FcStrFree (s);
-	    } else {
-		i = 0;
-		break;
-	    }
-	} else {
-	    FcPatternPrint (pat);
-	}
-    }
+    batch_run (&b, jobs);
 
-    FcFontSetDestroy (fs);
+    batch_fini (&b);
+    FcPatternFormatterDestroy (scan.formatter);
+    free (scan.buf);
     if (format)
 	free (format);
 
     FcFini();
-    return i > 0 ? 0 : 1;
+    return scan.nfont > 0 && !b.err ? 0 : 1;
 }
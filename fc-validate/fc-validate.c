@@ -41,6 +41,8 @@
 #include <stdlib.h>
 #include <string.h>
 
+#include "fctools.h"
+
 #ifdef HAVE_UNISTD_H
 #  include <unistd.h>
 #endif
@@ -65,12 +67,15 @@
 #  define _GNU_SOURCE
 #  include <getopt.h>
 static const struct option longopts[] = {
-    { "index",   1, 0, 'i' },
-    { "lang",    1, 0, 'l' },
-    { "verbose", 0, 0, 'v' },
-    { "version", 0, 0, 'V' },
-    { "help",    0, 0, 'h' },
-    { NULL,      0, 0, 0   },
+    { "index",      1, 0, 'i' },
+    { "lang",       1, 0, 'l' },
+    { "matrix",     0, 0, 'm' },
+    { "files-from", 1, 0, 'F' },
+    { "jobs",       1, 0, 'j' },
+    { "verbose",    0, 0, 'v' },
+    { "version",    0, 0, 'V' },
+    { "help",       0, 0, 'h' },
+    { NULL,         0, 0, 0   },
 };
 #else
 #  if HAVE_GETOPT
@@ -84,23 +89,29 @@ usage (char *program, int error)
 {
     FILE *file = error ? stderr : stdout;
 #if HAVE_GETOPT_LONG
-    fprintf (file, _("usage: %s [-Vhv] [-i index] [-l LANG] [--index index] [--lang LANG] [--verbose] [--version] [--help] font-file...\n"),
+    fprintf (file, _("usage: %s [-mVhv] [-i index] [-l LANG] [-F FILE] [-j JOBS] [--index index] [--lang LANG] [--matrix] [--files-from FILE] [--jobs JOBS] [--verbose] [--version] [--help] font-file...\n"),
                      program);
 #else
-    fprintf (file, _("usage: %s [-Vhv] [-i index] [-l LANG] font-file...\n"),
+    fprintf (file, _("usage: %s [-mVhv] [-i index] [-l LANG] [-F FILE] [-j JOBS] font-file...\n"),
                      program);
 #endif
     fprintf (file, _("Validate font files and print result\n"));
     fprintf (file, "\n");
 #if HAVE_GETOPT_LONG
     fprintf (file, _("  -i, --index INDEX    display the INDEX face of each font file only\n"));
-    fprintf (file, _("  -l, --lang=LANG      set LANG instead of current locale\n"));
+    fprintf (file, _("  -l, --lang=LANG      set LANG instead of current locale; a comma-separated list or all for several\n"));
+    fprintf (file, _("  -m, --matrix         display the number of missing glyphs for each face and language as a table\n"));
+    fprintf (file, _("  -F, --files-from=FILE  also validate the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j, --jobs=JOBS      validate the files on JOBS threads\n"));
     fprintf (file, _("  -v, --verbose        show more detailed information\n"));
     fprintf (file, _("  -V, --version        display font config version and exit\n"));
     fprintf (file, _("  -h, --help           display this help and exit\n"));
 #else
     fprintf (file, _("  -i INDEX   (index)        display the INDEX face of each font file only\n"));
-    fprintf (file, _("  -l LANG    (lang)         set LANG instead of current locale\n"));
+    fprintf (file, _("  -l LANG    (lang)         set LANG instead of current locale; a comma-separated list or all for several\n"));
+    fprintf (file, _("  -m         (matrix)       display the number of missing glyphs for each face and language as a table\n"));
+    fprintf (file, _("  -F FILE    (files-from)   also validate the files listed in FILE, one per line (- for stdin)\n"));
+    fprintf (file, _("  -j JOBS    (jobs)         validate the files on JOBS threads\n"));
     fprintf (file, _("  -v         (verbose)      show more detailed information\n"));
     fprintf (file, _("  -V         (version)      display font config version and exit\n"));
     fprintf (file, _("  -h         (help)         display this help and exit\n"));
@@ -108,38 +119,282 @@ usage (char *program, int error)
     exit (error);
 }
 
+typedef struct _Face {
+    int         index;
+    FcChar32   *counts;  /* the number of chars missing for each language */
+    FcCharSet **missing; /* and the chars themselves, when listed */
+} Face;
+
+typedef struct _Validate {
+    int               index_set;
+    int               set_index;
+    FcChar8         **langs;
+    const FcCharSet **lang_charsets;
+    int               nlangs;
+    int               matrix;
+    int               verbose;
+} Validate;
+
+/*
+ * Add the languages of the comma-separated list, or all of them, to
+ * the ones to validate against
+ */
+static int
+add_langs (Validate *v, const char *list)
+{
+    FcStrSet  *set = FcStrSetCreate();
+    FcStrList *l;
+    FcChar8   *lang;
+
+    if (!set)
+	return 0;
+    if (!strcmp (list, "all")) {
+	FcStrSet *all = FcGetLangs();
+
+	l = FcStrListCreate (all);
+	FcStrSetDestroy (all);
+	while (l && (lang = FcStrListNext (l)))
+	    FcStrSetAdd (set, lang);
+	FcStrListDone (l);
+    } else {
+	const char *end;
+
+	for (; *list; list = *end ? end + 1 : end) {
+	    FcChar8 *name;
+
+	    end = strchr (list, ',');
+	    if (!end)
+		end = list + strlen (list);
+	    if (end == list)
+		continue;
+	    name = FcStrCopy ((const FcChar8 *)list);
+	    if (!name)
+		break;
+	    name[end - list] = '\0';
+	    lang = FcLangNormalize (name);
+	    FcStrFree (name);
+	    if (lang) {
+		FcStrSetAdd (set, lang);
+		FcStrFree (lang);
+	    }
+	}
+    }
+
+    l = FcStrListCreate (set);
+    FcStrSetDestroy (set);
+    while (l && (lang = FcStrListNext (l))) {
+	FcChar8         **langs = realloc (v->langs, (v->nlangs + 1) * sizeof (FcChar8 *));
+	const FcCharSet **charsets = realloc (v->lang_charsets, (v->nlangs + 1) * sizeof (FcCharSet *));
+
+	if (langs)
+	    v->langs = langs;
+	if (charsets)
+	    v->lang_charsets = charsets;
+	if (!langs || !charsets)
+	    break;
+	v->langs[v->nlangs] = FcStrCopy (lang);
+	v->lang_charsets[v->nlangs] = FcLangGetCharSet (lang);
+	v->nlangs++;
+    }
+    FcStrListDone (l);
+
+    return v->nlangs > 0;
+}
+
+/*
+ * Compute the coverage of each face of the file for every language,
+ * building the charset of the face only once
+ */
+static void
+validate_item (Batch *b, Item *item, void *thread)
+{
+    Validate  *v = b->closure;
+    FT_Library ftlib = thread;
+    Face      *faces = NULL;
+    int        nfaces = 0;
+    int        index = v->set_index;
+
+    item->ok = 1;
+    do {
+	FT_Face    face;
+	FcCharSet *fcs;
+	Face      *f;
+	int        j;
+
+	if (FT_New_Face (ftlib, item->file, index, &face)) {
+	    if (!v->index_set && index > 0)
+		break;
+	    item->ok = 0;
+	    break;
+	}
+	fcs = FcFreeTypeCharSet (face, NULL);
+	FT_Done_Face (face);
+
+	f = realloc (faces, (nfaces + 1) * sizeof (Face));
+	if (f) {
+	    faces = f;
+	    f = &f[nfaces++];
+	    f->index = index;
+	    f->counts = calloc (v->nlangs, sizeof (FcChar32));
+	    f->missing = NULL;
+	    if (f->counts && v->verbose && !v->matrix)
+		f->missing = calloc (v->nlangs, sizeof (FcCharSet *));
+	}
+	if (!f || !f->counts) {
+	    if (f)
+		nfaces--;
+	    FcCharSetDestroy (fcs);
+	    item->ok = 0;
+	    break;
+	}
+	for (j = 0; j < v->nlangs; j++) {
+	    f->counts[j] = FcCharSetSubtractCount (v->lang_charsets[j], fcs);
+	    if (f->missing && f->counts[j])
+		f->missing[j] = FcCharSetSubtract (v->lang_charsets[j], fcs);
+	}
+	FcCharSetDestroy (fcs);
+
+	index++;
+    } while (v->index_set == 0);
+    item->data = faces;
+    item->ndata = nfaces;
+}
+
+static void
+print_missing (const FcCharSet *missing)
+{
+    FcChar32 ucs4, pos, map[FC_CHARSET_MAP_SIZE];
+
+    for (ucs4 = FcCharSetFirstPage (missing, map, &pos);
+         ucs4 != FC_CHARSET_DONE;
+         ucs4 = FcCharSetNextPage (missing, map, &pos)) {
+	int j;
+
+	for (j = 0; j < FC_CHARSET_MAP_SIZE; j++) {
+	    FcChar32 bits = map[j];
+	    FcChar32 base = ucs4 + j * 32;
+	    int      b = 0;
+
+	    while (bits) {
+		if (bits & 1)
+		    printf ("  0x%04x\n", base + b);
+		bits >>= 1;
+		b++;
+	    }
+	}
+    }
+}
+
+static void
+print_item (Batch *b, Item *item)
+{
+    Validate *v = b->closure;
+    Face     *faces = item->data;
+    int       i, j;
+
+    if (!item->ok) {
+	fprintf (stderr, _("Unable to open %s\n"), item->file);
+	b->err = 1;
+    }
+    for (i = 0; i < item->ndata; i++) {
+	Face *f = &faces[i];
+
+	if (v->matrix)
+	    printf ("%s:%d", item->file, f->index);
+	for (j = 0; j < v->nlangs; j++) {
+	    FcChar32 count = f->counts[j];
+
+	    if (count > 0)
+		b->err = 1;
+	    if (v->matrix)
+		printf ("\t%d", count);
+	    else if (count > 0) {
+		printf (_("%s:%d Missing %d glyph(s) to satisfy the coverage for %s language\n"),
+		          item->file, f->index, count, v->langs[j]);
+		if (f->missing)
+		    print_missing (f->missing[j]);
+	    } else {
+		printf (_("%s:%d Satisfy the coverage for %s language\n"),
+		          item->file, f->index, v->langs[j]);
+	    }
+	    if (f->missing)
+		FcCharSetDestroy (f->missing[j]);
+	}
+	if (v->matrix)
+	    printf ("\n");
+	free (f->counts);
+	free (f->missing);
+    }
+    fflush (stdout);
+    free (faces);
+    item->data = NULL;
+    item->ndata = 0;
+}
+
+/* A FreeType library can't be shared between threads */
+static void *
+validate_start (Batch *b)
+{
+    FT_Library ftlib;
+
+    (void)b;
+    if (FT_Init_FreeType (&ftlib))
+	return NULL;
+
+    return ftlib;
+}
+
+static void
+validate_stop (Batch *b, void *thread)
+{
+    (void)b;
+    FT_Done_FreeType (thread);
+}
+
 int
 main (int argc, char **argv)
 {
-    int              index_set = 0;
-    int              set_index = 0;
-    FcChar8         *lang = NULL;
-    const FcCharSet *fcs_lang = NULL;
-    int              err = 0;
-    int              i;
-    FT_Library       ftlib;
-    FcBool           verbose = FcFalse;
+    const char *lang = NULL;
+    const char *files_from = NULL;
+    int         jobs = 1;
+    Validate    v;
+    Batch       b;
+    int         i, j;
 #if HAVE_GETOPT_LONG || HAVE_GETOPT
     int c;
+#endif
 
+    memset (&v, 0, sizeof (v));
+#if HAVE_GETOPT_LONG || HAVE_GETOPT
     setlocale (LC_ALL, "");
 
 #  if HAVE_GETOPT_LONG
-    while ((c = getopt_long (argc, argv, "i:l:mVhv", longopts, NULL)) != -1)
+    while ((c = getopt_long (argc, argv, "i:l:mF:j:Vhv", longopts, NULL)) != -1)
 #  else
-    while ((c = getopt (argc, argv, "i:l:mVhv")) != -1)
+    while ((c = getopt (argc, argv, "i:l:mF:j:Vhv")) != -1)
 #  endif
     {
 	switch (c) {
 	case 'i':
-	    index_set = 1;
-	    set_index = atoi (optarg);
+	    v.index_set = 1;
+	    v.set_index = atoi (optarg);
 	    break;
 	case 'l':
-	    lang = (FcChar8 *)FcLangNormalize ((const FcChar8 *)optarg);
+	    lang = optarg;
+	    break;
+	case 'm':
+	    v.matrix = 1;
+	    break;
+	case 'F':
+	    files_from = optarg;
+	    break;
+	case 'j':
+	    jobs = atoi (optarg);
+	    if (jobs < 1)
+		usage (argv[0], 1);
 	    break;
 	case 'v':
-	    verbose = FcTrue;
+	    v.verbose = 1;
 	    break;
 	case 'V':
 	    fprintf (stderr, "fontconfig version %d.%d.%d\n",
@@ -154,90 +409,43 @@ main (int argc, char **argv)
     i = optind;
 #else
     i = 1;
-    verbose = FcTrue;
+    v.verbose = 1;
 #endif
 
-    if (i == argc)
+    if (i == argc && !files_from)
 	usage (argv[0], 1);
 
     if (!lang)
-	lang = FcLangNormalize ((const FcChar8 *)setlocale (LC_CTYPE, NULL));
-
-    if (lang)
-	fcs_lang = FcLangGetCharSet (lang);
-
-    if (FT_Init_FreeType (&ftlib)) {
-	fprintf (stderr, _("Can't initialize FreeType library\n"));
+	lang = setlocale (LC_CTYPE, NULL);
+    if (!lang || !add_langs (&v, lang)) {
+	fprintf (stderr, _("No language to validate against\n"));
 	return 1;
     }
 
-    for (; i < argc; i++) {
-	int index;
-
-	index = set_index;
-
-	do {
-	    FT_Face    face;
-	    FcCharSet *fcs, *fcs_sub;
-
-	    if (FT_New_Face (ftlib, argv[i], index, &face)) {
-		if (!index_set && index > 0)
-		    break;
-		fprintf (stderr, _("Unable to open %s\n"), argv[i]);
-		err = 1;
-	    } else {
-		FcChar32 count;
-
-		fcs = FcFreeTypeCharSet (face, NULL);
-		fcs_sub = FcCharSetSubtract (fcs_lang, fcs);
-
-		count = FcCharSetCount (fcs_sub);
-		if (count > 0) {
-		    FcChar32 ucs4, pos, map[FC_CHARSET_MAP_SIZE];
-
-		    err = 1;
-		    printf (_("%s:%d Missing %d glyph(s) to satisfy the coverage for %s language\n"),
-		              argv[i], index, count, lang);
-
-		    if (verbose) {
-			for (ucs4 = FcCharSetFirstPage (fcs_sub, map, &pos);
-			     ucs4 != FC_CHARSET_DONE;
-			     ucs4 = FcCharSetNextPage (fcs_sub, map, &pos)) {
-			    int j;
-
-			    for (j = 0; j < FC_CHARSET_MAP_SIZE; j++) {
-				FcChar32 bits = map[j];
-				FcChar32 base = ucs4 + j * 32;
-				int      b = 0;
-
-				while (bits) {
-				    if (bits & 1)
-					printf ("  0x%04x\n", base + b);
-				    bits >>= 1;
-				    b++;
-				}
-			    }
-			}
-		    }
-		} else {
-		    printf (_("%s:%d Satisfy the coverage for %s language\n"), argv[i], index, lang);
-		}
-
-		FcCharSetDestroy (fcs);
-		FcCharSetDestroy (fcs_sub);
-
-		FT_Done_Face (face);
-	    }
+    if (!batch_init (&b, argv + i, argc - i))
+	return 1;
+    if (files_from && !batch_read_files (&b, files_from))
+	b.err = 1;
+    b.start = validate_start;
+    b.stop = validate_stop;
+    b.process = validate_item;
+    b.print = print_item;
+    b.closure = &v;
 
-	    index++;
-	} while (index_set == 0);
+    if (v.matrix) {
+	printf ("font");
+	for (j = 0; j < v.nlangs; j++)
+	    printf ("\t%s", v.langs[j]);
+	printf ("\n");
     }
+    batch_run (&b, jobs);
 
-    FT_Done_FreeType (ftlib);
-
-    if (lang)
-	FcStrFree (lang);
+    batch_fini (&b);
+    for (j = 0; j < v.nlangs; j++)
+	FcStrFree (v.langs[j]);
+    free (v.langs);
+    free (v.lang_charsets);
 
     FcFini();
-    return err;
+    return b.err;
 }
@@ -0,0 +1,94 @@
+/*
+ * fontconfig/src/fcarena.c
+ *
+ * Copyright © 2000 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+
+#include "fcint.h"
+
+#define FC_ARENA_ALIGN      16
+#define FC_ARENA_ROUND(n)   (((n) + FC_ARENA_ALIGN - 1) & ~(size_t)(FC_ARENA_ALIGN - 1))
+#define FC_ARENA_CHUNK_SIZE 4096
+
+struct _FcArenaChunk {
+    FcArenaChunk *next;
+};
+
+#define FC_ARENA_HEADER FC_ARENA_ROUND (sizeof (FcArenaChunk))
+
+void
+FcArenaInit (FcArena *arena, void *block, size_t size)
+{
+    uintptr_t start = FC_ARENA_ROUND ((uintptr_t)block);
+
+    arena->next = (char *)start;
+    arena->end = (char *)block + size;
+    if (arena->end < arena->next)
+	arena->end = arena->next;
+    arena->chunks = NULL;
+    arena->size = 0;
+    arena->nchunk = 0;
+}
+
+void *
+FcArenaAlloc (FcArena *arena, size_t size)
+{
+    FcArenaChunk *chunk;
+    size_t        csize;
+    char         *p;
+
+    size = FC_ARENA_ROUND (size);
+    if (size <= (size_t)(arena->end - arena->next)) {
+	p = arena->next;
+	arena->next += size;
+    } else {
+	/* Large blocks get a chunk of their own, leaving the current
+	 * one for the small allocations that follow */
+	csize = size > FC_ARENA_CHUNK_SIZE / 4 ? size : FC_ARENA_CHUNK_SIZE;
+	chunk = malloc (FC_ARENA_HEADER + csize);
+	if (!chunk)
+	    return NULL;
+	chunk->next = arena->chunks;
+	arena->chunks = chunk;
+	arena->nchunk++;
+	p = (char *)chunk + FC_ARENA_HEADER;
+	if (csize > size) {
+	    arena->next = p + size;
+	    arena->end = p + csize;
+	}
+    }
+    arena->size += size;
+
+    return p;
+}
+
+void
+FcArenaFini (FcArena *arena)
+{
+    FcArenaChunk *chunk, *next;
+
+    for (chunk = arena->chunks; chunk; chunk = next) {
+	next = chunk->next;
+	free (chunk);
+    }
+    arena->chunks = NULL;
+    arena->next = arena->end = NULL;
+}
@@ -48,6 +48,7 @@ typedef <type> fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           *(P)                                          // atomic acquire
 #  define fc_atomic_ptr_cmpexch(P, O, N) *(P) == (O) ? (*(P) = (N), FcTrue) : FcFalse  // atomic release
+#  define fc_atomic_barrier()                                                          // full memory barrier
 
 #elif !defined(FC_NO_MT) && defined(HAVE_STDATOMIC_PRIMITIVES)
 
@@ -63,6 +64,7 @@ static inline FcBool _fc_atomic_ptr_cmpexch (_Atomic (void *) *P, void *O, _Atom
     return atomic_compare_exchange_strong_explicit (P, &O, N, memory_order_release, memory_order_relaxed);
 }
 #  define fc_atomic_ptr_cmpexch(P, O, N) _fc_atomic_ptr_cmpexch ((_Atomic (void *) *)(P), (O), (N))
+#  define fc_atomic_barrier()            atomic_thread_fence (memory_order_seq_cst)
 
 /* Casting -1 to _Atomic(int) produces a compiler error with Clang (but not GCC)
  * so we have to override FC_REF_CONSTANT_VALUE for stdatomic.h atomics.
@@ -79,6 +81,7 @@ typedef LONG fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           (InterlockedCompareExchangePointerAcquire ((void **)(P), NULL, NULL))
 #  define fc_atomic_ptr_cmpexch(P, O, N) (InterlockedCompareExchangePointer ((void **)(P), (void *)(N), (void *)(O)) == (void *)(O))
+#  define fc_atomic_barrier()            MemoryBarrier()
 
 #elif !defined(FC_NO_MT) && defined(__APPLE__)
 
@@ -106,6 +109,7 @@ typedef int fc_atomic_int_t;
 #      define fc_atomic_ptr_cmpexch(P, O, N) OSAtomicCompareAndSwap32Barrier ((int32_t)(O), (int32_t)(N), (int32_t *)(P))
 #    endif
 #  endif
+#  define fc_atomic_barrier() OSMemoryBarrier()
 
 #elif !defined(FC_NO_MT) && defined(HAVE_INTEL_ATOMIC_PRIMITIVES)
 
@@ -115,6 +119,7 @@ typedef int fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           (void *)(__sync_fetch_and_add ((P), 0))
 #  define fc_atomic_ptr_cmpexch(P, O, N) __sync_bool_compare_and_swap ((P), (O), (N))
+#  define fc_atomic_barrier()            __sync_synchronize()
 
 #elif !defined(FC_NO_MT) && defined(HAVE_SOLARIS_ATOMIC_OPS)
 
@@ -127,6 +132,7 @@ typedef unsigned int fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           (({ __machine_rw_barrier(); }), (void *)*(P))
 #  define fc_atomic_ptr_cmpexch(P, O, N) (({ __machine_rw_barrier(); }), atomic_cas_ptr ((P), (O), (N)) == (void *)(O) ? FcTrue : FcFalse)
+#  define fc_atomic_barrier()            __machine_rw_barrier()
 
 #elif !defined(FC_NO_MT)
 
@@ -137,6 +143,7 @@ typedef volatile int fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           ((void *)*(P))
 #  define fc_atomic_ptr_cmpexch(P, O, N) (*(void *volatile *)(P) == (void *)(O) ? (*(void *volatile *)(P) = (void *)(N), FcTrue) : FcFalse)
+#  define fc_atomic_barrier()            ((void)0)
 
 #else /* FC_NO_MT */
 
@@ -146,6 +153,7 @@ typedef int fc_atomic_int_t;
 
 #  define fc_atomic_ptr_get(P)           ((void *)*(P))
 #  define fc_atomic_ptr_cmpexch(P, O, N) (*(void **)(P) == (void *)(O) ? (*(void **)(P) = (void *)(N), FcTrue) : FcFalse)
+#  define fc_atomic_barrier()            ((void)0)
 
 #endif
 
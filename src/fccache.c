@@ -503,6 +503,9 @@ free_lock (void)
     }
 }
 
+static void
+FcContentsIndexFini (void);
+
 /*
  * Generate a random level number, distributed
  * so that each level is 1/4 as likely as the one before
@@ -695,9 +698,11 @@ FcDirCacheDisposeUnlocked (FcCache *cache)
 
     switch (cache->magic) {
     case FC_CACHE_MAGIC_ALLOC:
+    case FC_CACHE_PACK_MAGIC_ALLOC:
 	free (cache);
 	break;
     case FC_CACHE_MAGIC_MMAP:
+    case FC_CACHE_PACK_MAGIC_MMAP:
 #if defined(HAVE_MMAP) || defined(__CYGWIN__)
 	munmap (cache, cache->size);
 #elif defined(_WIN32)
@@ -752,18 +757,29 @@ FcCacheAllocate (FcCache *cache, size_t len)
     return allocated;
 }
 
+static FcBool
+FcCacheIsPack (const FcCache *cache)
+{
+    return cache->magic == FC_CACHE_PACK_MAGIC_MMAP ||
+           cache->magic == FC_CACHE_PACK_MAGIC_ALLOC;
+}
+
 void
 FcCacheFini (void)
 {
     int    i;
     FcBool res = FcTrue;
 
+    FcContentsIndexFini();
     for (i = 0; i < FC_CACHE_MAX_LEVEL; i++) {
 	if (fcCacheChains[i] != NULL) {
 	    res = FcFalse;
 	    if (FcDebug() & FC_DBG_CACHE) {
 		FcCacheSkip *s = fcCacheChains[i];
-		fprintf (stderr, "Fontconfig error: not freed %p (dir: %s, refcount %" FC_ATOMIC_INT_FORMAT ")\n", s->cache, FcCacheDir (s->cache), s->ref.count);
+		if (FcCacheIsPack (s->cache))
+		    fprintf (stderr, "Fontconfig error: not freed cache pack %p (refcount %" FC_ATOMIC_INT_FORMAT ")\n", s->cache, s->ref.count);
+		else
+		    fprintf (stderr, "Fontconfig error: not freed %p (dir: %s, refcount %" FC_ATOMIC_INT_FORMAT ")\n", s->cache, FcCacheDir (s->cache), s->ref.count);
 	    }
 	}
     }
@@ -833,22 +849,30 @@ FcCacheTimeValid (FcConfig *config, FcCache *cache, struct stat *dir_stat)
     return dir_stat->st_mtime == 0 || (cache->checksum == (int)dir_stat->st_mtime && fnano);
 }
 
+/*
+ * Check that everything cache points at lies between base and end.
+ * A cache file is checked against its own [cache, cache + size) range.
+ * A cache in a pack is checked against the whole pack instead: strings,
+ * charsets and value lists shared between caches are written once, with
+ * the first cache that refers to them, so the later caches point at
+ * objects outside their own range, in the caches before them.
+ */
 static FcBool
-FcCacheOffsetsValid (FcCache *cache)
+FcCacheOffsetsValid (FcCache *cache, char *base, char *end)
 {
-    char      *base = (char *)cache;
-    char      *end = base + cache->size;
+    intptr_t   lo = base - (char *)cache;
+    intptr_t   hi = end - (char *)cache;
     intptr_t  *dirs;
     FcFontSet *fs;
     int        i, j;
 
-    if (cache->dir < 0 || cache->dir > cache->size - sizeof (intptr_t) ||
-        memchr (base + cache->dir, '\0', cache->size - cache->dir) == NULL)
+    if (cache->dir < lo || cache->dir > hi - (intptr_t)sizeof (intptr_t) ||
+        memchr ((char *)cache + cache->dir, '\0', hi - cache->dir) == NULL)
 	return FcFalse;
 
-    if (cache->dirs < 0 || cache->dirs >= cache->size ||
+    if (cache->dirs < lo || cache->dirs >= hi ||
         cache->dirs_count < 0 ||
-        cache->dirs_count > (cache->size - cache->dirs) / sizeof (intptr_t))
+        cache->dirs_count > (hi - cache->dirs) / (intptr_t)sizeof (intptr_t))
 	return FcFalse;
 
     dirs = FcCacheDirs (cache);
@@ -856,8 +880,8 @@ FcCacheOffsetsValid (FcCache *cache)
 	for (i = 0; i < cache->dirs_count; i++) {
 	    FcChar8 *dir;
 
-	    if (dirs[i] < 0 ||
-	        dirs[i] > end - (char *)dirs - sizeof (intptr_t))
+	    if (dirs[i] < base - (char *)dirs ||
+	        dirs[i] > end - (char *)dirs - (intptr_t)sizeof (intptr_t))
 		return FcFalse;
 
 	    dir = FcOffsetToPtr (dirs, dirs[i], FcChar8);
@@ -866,7 +890,7 @@ FcCacheOffsetsValid (FcCache *cache)
 	}
     }
 
-    if (cache->set < 0 || cache->set > cache->size - sizeof (FcFontSet))
+    if (cache->set < lo || cache->set > hi - (intptr_t)sizeof (FcFontSet))
 	return FcFalse;
 
     fs = FcCacheSet (cache);
@@ -899,7 +923,11 @@ FcCacheOffsetsValid (FcCache *cache)
 		return FcFalse;
 
 	    for (j = 0; j < font->num; j++) {
-		last_offset = (char *)font + font->elts_offset;
+		/* Patterns may share value lists laid out for an earlier
+		 * pattern; only require each list to run forwards and
+		 * everything it points at to lie within the cache
+		 */
+		last_offset = base;
 		for (l = FcPatternEltValues (&e[j]); l; l = FcValueListNext (l)) {
 		    if ((char *)l < last_offset || (char *)l > end - sizeof (*l) ||
 		        (l->next != NULL && !FcIsEncodedOffset (l->next)))
@@ -914,7 +942,9 @@ FcCacheOffsetsValid (FcCache *cache)
 			break; /* nop */
 		    case FcTypeString:
 			s = FcValueString (&l->value);
-			if ((intptr_t)s < (intptr_t)&e[j] ||
+			if ((intptr_t)s < (intptr_t)base ||
+			    (intptr_t)s >= (intptr_t)end ||
+			    memchr (s, '\0', end - (char *)s) == NULL ||
 			    (intptr_t)&l->value > (intptr_t)end - sizeof (*l) ||
 			    !FcIsEncodedOffset (l->value.u.s)) {
 			    if (FcDebug() & FC_DBG_CACHE) {
@@ -928,7 +958,9 @@ FcCacheOffsetsValid (FcCache *cache)
 			 * which would means a pointer might be out of Elts
 			 */
 			if ((intptr_t)&l->value > (intptr_t)end - sizeof (*l) ||
-			    !FcIsEncodedOffset (l->value.u.c)) {
+			    !FcIsEncodedOffset (l->value.u.c) ||
+			    (intptr_t)FcValueCharSet (&l->value) < (intptr_t)base ||
+			    (intptr_t)FcValueCharSet (&l->value) > (intptr_t)end - sizeof (FcCharSet)) {
 			    if (FcDebug() & FC_DBG_CACHE) {
 				fprintf (stderr, "Fontconfig warning: invalid cache: broken charset\n");
 			    }
@@ -937,7 +969,8 @@ FcCacheOffsetsValid (FcCache *cache)
 			break;
 		    case FcTypeLangSet:
 			ls = FcValueLangSet (&l->value);
-			if ((intptr_t)ls < (intptr_t)&e[j] ||
+			if ((intptr_t)ls < (intptr_t)base ||
+			    (intptr_t)ls > (intptr_t)end - sizeof (FcLangSet) ||
 			    (intptr_t)&l->value > (intptr_t)end - sizeof (*l) ||
 			    !FcIsEncodedOffset (l->value.u.l)) {
 			    if (FcDebug() & FC_DBG_CACHE) {
@@ -955,7 +988,8 @@ FcCacheOffsetsValid (FcCache *cache)
 			break;
 		    case FcTypeRange:
 			r = FcValueRange (&l->value);
-			if ((intptr_t)r < (intptr_t)&e[j] ||
+			if ((intptr_t)r < (intptr_t)base ||
+			    (intptr_t)r > (intptr_t)end - sizeof (FcRange) ||
 			    (intptr_t)&l->value > (intptr_t)end - sizeof (*l) ||
 			    !FcIsEncodedOffset (l->value.u.r)) {
 			    if (FcDebug() & FC_DBG_CACHE) {
@@ -977,89 +1011,133 @@ FcCacheOffsetsValid (FcCache *cache)
 	}
     }
 
+    if (cache->files) {
+	FcCacheFile *files;
+
+	if (cache->files < lo || cache->files >= hi ||
+	    cache->files_count < 0 ||
+	    cache->files_count > (hi - cache->files) / (intptr_t)sizeof (FcCacheFile))
+	    return FcFalse;
+
+	files = FcCacheFiles (cache);
+	for (i = 0; i < cache->files_count; i++) {
+	    FcChar8 *name;
+
+	    if (files[i].name < base - (char *)files ||
+	        files[i].name > end - (char *)files - 1 ||
+	        files[i].first < 0 || files[i].nfont < 0 ||
+	        files[i].nfont > (fs ? fs->nfont : 0) - files[i].first)
+		return FcFalse;
+
+	    name = FcOffsetToPtr (files, files[i].name, FcChar8);
+	    if (memchr (name, '\0', end - (char *)name) == NULL)
+		return FcFalse;
+	}
+    }
+
     return FcTrue;
 }
 
 /*
- * Map a cache file into memory
+ * Large cache files are mmap'ed, smaller cache files are read. This
+ * balances the system cost of mmap against per-process memory usage.
  */
-static FcCache *
-FcDirCacheMapFd (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat)
+static void *
+FcCacheFileMap (int fd, struct stat *fd_stat, FcBool *allocated)
 {
-    FcCache *cache;
-    FcBool   allocated = FcFalse;
-
-    if (fd_stat->st_size > INTPTR_MAX ||
-        fd_stat->st_size < (int)sizeof (FcCache))
-	return NULL;
-    cache = FcCacheFindByStat (fd_stat);
-    if (cache) {
-	if (FcCacheTimeValid (config, cache, dir_stat))
-	    return cache;
-	else if (FcCacheIsNewVersion (config, cache)) {
-	    /* Re-use if cache was generated by newer version of fontconfig
-	     * Do not trigger regenerating
-	     */
-	    return cache;
-	}
-	FcDirCacheUnload (cache);
-	cache = NULL;
-    }
+    void *data = NULL;
 
-    /*
-     * Large cache files are mmap'ed, smaller cache files are read. This
-     * balances the system cost of mmap against per-process memory usage.
-     */
+    *allocated = FcFalse;
     if (FcCacheIsMmapSafe (fd) && fd_stat->st_size >= FC_CACHE_MIN_MMAP) {
 #if defined(HAVE_MMAP) || defined(__CYGWIN__)
-	cache = mmap (0, fd_stat->st_size, PROT_READ, MAP_SHARED, fd, 0);
+	data = mmap (0, fd_stat->st_size, PROT_READ, MAP_SHARED, fd, 0);
 #  if defined(HAVE_POSIX_FADVISE) && defined(POSIX_FADV_WILLNEED)
 	posix_fadvise (fd, 0, fd_stat->st_size, POSIX_FADV_WILLNEED);
 #  endif
-	if (cache == MAP_FAILED)
-	    cache = NULL;
+	if (data == MAP_FAILED)
+	    data = NULL;
 #elif defined(_WIN32)
 	{
 	    HANDLE hFileMap;
 
-	    cache = NULL;
 	    hFileMap = CreateFileMapping ((HANDLE)_get_osfhandle (fd), NULL,
 	                                  PAGE_READONLY, 0, 0, NULL);
 	    if (hFileMap != NULL) {
-		cache = MapViewOfFile (hFileMap, FILE_MAP_READ, 0, 0,
-		                       fd_stat->st_size);
+		data = MapViewOfFile (hFileMap, FILE_MAP_READ, 0, 0,
+		                      fd_stat->st_size);
 		CloseHandle (hFileMap);
 	    }
 	}
 #endif
     }
-    if (!cache) {
-	cache = malloc (fd_stat->st_size);
-	if (!cache)
+    if (!data) {
+	data = malloc (fd_stat->st_size);
+	if (!data)
 	    return NULL;
 
-	if (read (fd, cache, fd_stat->st_size) != fd_stat->st_size) {
-	    free (cache);
+	if (read (fd, data, fd_stat->st_size) != fd_stat->st_size) {
+	    free (data);
 	    return NULL;
 	}
-	allocated = FcTrue;
+	*allocated = FcTrue;
+    }
+
+    return data;
+}
+
+static void
+FcCacheFileUnmap (void *data, intptr_t size, FcBool allocated)
+{
+    if (allocated)
+	free (data);
+    else {
+#if defined(HAVE_MMAP) || defined(__CYGWIN__)
+	munmap (data, size);
+#elif defined(_WIN32)
+	UnmapViewOfFile (data);
+#endif
+    }
+}
+
+/*
+ * Map a cache file into memory; unless outdated is set, only a cache
+ * which is still valid for the directory is returned
+ */
+static FcCache *
+FcDirCacheMapFd (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat, FcBool outdated)
+{
+    FcCache *cache;
+    FcBool   allocated = FcFalse;
+
+    if (fd_stat->st_size > INTPTR_MAX ||
+        fd_stat->st_size < (int)sizeof (FcCache))
+	return NULL;
+    cache = FcCacheFindByStat (fd_stat);
+    if (cache) {
+	if (outdated || FcCacheTimeValid (config, cache, dir_stat))
+	    return cache;
+	else if (FcCacheIsNewVersion (config, cache)) {
+	    /* Re-use if cache was generated by newer version of fontconfig
+	     * Do not trigger regenerating
+	     */
+	    return cache;
+	}
+	FcDirCacheUnload (cache);
+	cache = NULL;
     }
+
+    cache = FcCacheFileMap (fd, fd_stat, &allocated);
+    if (!cache)
+	return NULL;
     if (cache->magic != FC_CACHE_MAGIC_MMAP ||
         cache->version < FC_CACHE_VERSION_NUMBER ||
         cache->size != (intptr_t)fd_stat->st_size ||
-        !FcCacheOffsetsValid (cache) ||
-        (!FcCacheTimeValid (config, cache, dir_stat) &&
+        !FcCacheOffsetsValid (cache, (char *)cache, (char *)cache + cache->size) ||
+        (!outdated &&
+         !FcCacheTimeValid (config, cache, dir_stat) &&
          !FcCacheIsNewVersion (config, cache)) ||
         !FcCacheInsert (cache, fd_stat)) {
-	if (allocated)
-	    free (cache);
-	else {
-#if defined(HAVE_MMAP) || defined(__CYGWIN__)
-	    munmap (cache, fd_stat->st_size);
-#elif defined(_WIN32)
-	    UnmapViewOfFile (cache);
-#endif
-	}
+	FcCacheFileUnmap (cache, fd_stat->st_size, allocated);
 	return NULL;
     }
 
@@ -1088,7 +1166,7 @@ FcDirCacheUnload (FcCache *cache)
 static FcBool
 FcDirCacheMapHelper (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat, struct timeval *latest_cache_mtime, void *closure)
 {
-    FcCache       *cache = FcDirCacheMapFd (config, fd, fd_stat, dir_stat);
+    FcCache       *cache = FcDirCacheMapFd (config, fd, fd_stat, dir_stat, FcFalse);
     struct timeval cache_mtime, zero_mtime = { 0, 0 }, dir_mtime;
 
     if (!cache)
@@ -1145,165 +1223,1178 @@ FcDirCacheLoad (const FcChar8 *dir, FcConfig *config, FcChar8 **cache_file)
     return cache;
 }
 
-FcCache *
-FcDirCacheLoadFile (const FcChar8 *cache_file, struct stat *file_stat)
+/*
+ * Whether the fonts of cache may stand for a new scan of the files
+ * recorded along with them
+ */
+static FcBool
+FcCacheFontsReusable (FcCache *cache)
 {
-    int         fd;
-    FcCache    *cache = NULL;
-    struct stat my_file_stat;
-    FcConfig   *config;
+    /* Fonts scanned by another version may be missing some elements */
+    return cache->version == FC_CACHE_VERSION_NUMBER &&
+           cache->fc_version == (FC_VERSION_MAJOR << 24) +
+                                    (FC_VERSION_MINOR << 12) +
+                                    FC_VERSION_MICRO &&
+           cache->files;
+}
 
-    if (!file_stat)
-	file_stat = &my_file_stat;
-    config = FcConfigReference (NULL);
-    if (!config)
-	return NULL;
-    fd = FcDirCacheOpenFile (cache_file, file_stat);
-    if (fd >= 0) {
-	cache = FcDirCacheMapFd (config, fd, file_stat, NULL);
-	close (fd);
+static FcBool
+FcDirCacheMapOutdatedHelper (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat, struct timeval *latest_cache_mtime, void *closure)
+{
+    FcCache      **closure_cache = (FcCache **)closure;
+    FcCache       *cache;
+    struct timeval cache_mtime;
+
+    cache_mtime.tv_sec = fd_stat->st_mtime;
+#ifdef HAVE_STRUCT_STAT_ST_MTIM
+    cache_mtime.tv_usec = fd_stat->st_mtim.tv_nsec / 1000;
+#else
+    cache_mtime.tv_usec = 0;
+#endif
+    if (*closure_cache && !timercmp (latest_cache_mtime, &cache_mtime, <))
+	return FcFalse;
+
+    cache = FcDirCacheMapFd (config, fd, fd_stat, dir_stat, FcTrue);
+    if (!cache)
+	return FcFalse;
+    if (!FcCacheFontsReusable (cache)) {
+	FcDirCacheUnload (cache);
+	return FcFalse;
     }
-    FcConfigDestroy (config);
+    if (*closure_cache)
+	FcDirCacheUnload (*closure_cache);
+    *latest_cache_mtime = cache_mtime;
+    *closure_cache = cache;
 
-    return cache;
+    return FcTrue;
 }
 
-static int
-FcDirChecksum (struct stat *statb)
+/*
+ * Load the latest cache written for dir, even if the directory has
+ * changed since; rescans use it to skip the files which didn't change.
+ */
+FcCache *
+FcDirCacheLoadOutdated (const FcChar8 *dir, FcConfig *config)
 {
-    int                ret = (int)statb->st_mtime;
-    char              *endptr;
-    char              *source_date_epoch;
-    unsigned long long epoch;
-
-    source_date_epoch = getenv ("SOURCE_DATE_EPOCH");
-    if (source_date_epoch) {
-	errno = 0;
-	epoch = strtoull (source_date_epoch, &endptr, 10);
+    FcCache *cache = NULL;
 
-	if (endptr == source_date_epoch)
-	    fprintf (stderr,
-	             "Fontconfig: SOURCE_DATE_EPOCH invalid\n");
-	else if ((errno == ERANGE && (epoch == ULLONG_MAX || epoch == 0)) || (errno != 0 && epoch == 0))
-	    fprintf (stderr,
-	             "Fontconfig: SOURCE_DATE_EPOCH: strtoull: %s: %" FC_UINT64_FORMAT "\n",
-	             strerror (errno), epoch);
-	else if (*endptr != '\0')
-	    fprintf (stderr,
-	             "Fontconfig: SOURCE_DATE_EPOCH has trailing garbage\n");
-	else if (epoch > ULONG_MAX)
-	    fprintf (stderr,
-	             "Fontconfig: SOURCE_DATE_EPOCH must be <= %lu but saw: %" FC_UINT64_FORMAT "\n",
-	             ULONG_MAX, epoch);
-	else if (epoch < ret)
-	    /* Only override if directory is newer */
-	    ret = (int)epoch;
-    }
+    if (!FcDirCacheProcess (config, dir,
+                            FcDirCacheMapOutdatedHelper,
+                            &cache, NULL))
+	cache = NULL;
 
-    return ret;
+    return cache;
 }
 
-static int64_t
-FcDirChecksumNano (struct stat *statb)
+static void
+FcCacheFileSetStat (FcCacheFile *file, struct stat *statb)
 {
+    file->size = statb->st_size;
+    file->mtime = statb->st_mtime;
 #ifdef HAVE_STRUCT_STAT_ST_MTIM
-    /* No nanosecond component to parse */
-    if (getenv ("SOURCE_DATE_EPOCH"))
-	return 0;
-    return statb->st_mtim.tv_nsec;
+    file->mtime_nano = statb->st_mtim.tv_nsec;
 #else
-    return 0;
+    file->mtime_nano = 0;
 #endif
+    file->ino = statb->st_ino;
 }
 
 /*
- * Validate a cache file by reading the header and checking
- * the magic number and the size field
+ * Look up the named file in the file table of cache, returning it
+ * only if the file still has the same size, mtime and inode
  */
-static FcBool
-FcDirCacheValidateHelper (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat, struct timeval *latest_cache_mtime, void *closure FC_UNUSED)
+const FcCacheFile *
+FcDirCacheFindFile (FcCache *cache, const FcChar8 *name, struct stat *statb)
 {
-    FcBool  ret = FcTrue;
-    FcCache c;
+    FcCacheFile *files, now;
+    int          low, high, mid, c;
 
-    if (read (fd, &c, sizeof (FcCache)) != sizeof (FcCache))
-	ret = FcFalse;
-    else if (c.magic != FC_CACHE_MAGIC_MMAP)
-	ret = FcFalse;
-    else if (c.version < FC_CACHE_VERSION_NUMBER)
-	ret = FcFalse;
-    else if (fd_stat->st_size != c.size)
-	ret = FcFalse;
-    else if (c.checksum != FcDirChecksum (dir_stat))
-	ret = FcFalse;
-#ifdef HAVE_STRUCT_STAT_ST_MTIM
-    else if (c.checksum_nano != FcDirChecksumNano (dir_stat))
-	ret = FcFalse;
-#endif
-    return ret;
+    if (!cache->files)
+	return NULL;
+    files = FcCacheFiles (cache);
+    FcCacheFileSetStat (&now, statb);
+
+    /* files are recorded in the order of their names */
+    low = 0;
+    high = cache->files_count - 1;
+    while (low <= high) {
+	mid = (low + high) >> 1;
+	c = strcmp ((const char *)FcOffsetToPtr (files, files[mid].name, FcChar8),
+	            (const char *)name);
+	if (c == 0) {
+	    if (files[mid].size != now.size ||
+	        files[mid].mtime != now.mtime ||
+	        files[mid].mtime_nano != now.mtime_nano ||
+	        files[mid].ino != now.ino)
+		return NULL;
+	    return &files[mid];
+	}
+	if (c < 0)
+	    low = mid + 1;
+	else
+	    high = mid - 1;
+    }
+
+    return NULL;
 }
 
-static FcBool
-FcDirCacheValidConfig (const FcChar8 *dir, FcConfig *config)
+FcDirFiles *
+FcDirFilesCreate (void)
 {
-    return FcDirCacheProcess (config, dir,
-                              FcDirCacheValidateHelper,
-                              NULL, NULL);
+    FcDirFiles *files = malloc (sizeof (FcDirFiles));
+
+    if (!files)
+	return NULL;
+    files->num = 0;
+    files->size = 0;
+    files->names = NULL;
+    files->files = NULL;
+
+    return files;
 }
 
 FcBool
-FcDirCacheValid (const FcChar8 *dir)
+FcDirFilesAdd (FcDirFiles *files, const FcChar8 *name, struct stat *statb, int first, int nfont)
 {
-    FcConfig *config;
-    FcBool    ret;
+    FcCacheFile *file;
 
-    config = FcConfigReference (NULL);
-    if (!config)
+    if (files->num == files->size) {
+	int          size = files->size ? files->size * 2 : 64;
+	FcChar8    **names = realloc (files->names, size * sizeof (FcChar8 *));
+	FcCacheFile *f;
+
+	if (!names)
+	    return FcFalse;
+	files->names = names;
+	f = realloc (files->files, size * sizeof (FcCacheFile));
+	if (!f)
+	    return FcFalse;
+	files->files = f;
+	files->size = size;
+    }
+    files->names[files->num] = FcStrCopy (name);
+    if (!files->names[files->num])
 	return FcFalse;
+    file = &files->files[files->num];
+    file->name = 0;
+    file->first = first;
+    file->nfont = nfont;
+    FcCacheFileSetStat (file, statb);
+    files->num++;
 
-    ret = FcDirCacheValidConfig (dir, config);
-    FcConfigDestroy (config);
+    return FcTrue;
+}
 
-    return ret;
+void
+FcDirFilesDestroy (FcDirFiles *files)
+{
+    int i;
+
+    for (i = 0; i < files->num; i++)
+	FcStrFree (files->names[i]);
+    if (files->names)
+	free (files->names);
+    if (files->files)
+	free (files->files);
+    free (files);
 }
 
 /*
- * Build a cache structure from the given contents
+ * Every cache directory carries an index of the font files recorded in
+ * its caches, one "<size> <cache file> <font file>" line per file, so
+ * that copies of a font found in other directories needn't be scanned
+ * again.  Lines are appended as caches are written, the lines written
+ * for a cache making those written for it before stale; once more than
+ * half of the lines are stale the index is rewritten without them.
+ *
+ * The index of each cache directory is read once per process and kept
+ * up to date with the lines appended here; it is only read again when
+ * someone else changes it.
  */
-FcCache *
-FcDirCacheBuild (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs)
+#define FC_CACHE_CONTENTS "CONTENTS"
+
+typedef struct _FcContentsEntry {
+    struct _FcContentsEntry *next; /* in the same bucket */
+    long long                size;
+    FcChar8                  cache_base[CACHEBASE_LEN];
+    FcChar8                 *name;
+} FcContentsEntry;
+
+/* The latest run of lines written for a cache */
+typedef struct _FcContentsBlock {
+    int start, last;
+} FcContentsBlock;
+
+typedef struct _FcContentsIndex {
+    struct _FcContentsIndex *next;
+    FcChar8                 *cache_dir;
+    FcBool                   loaded;
+    struct stat              statb; /* of the file as last read or written */
+    FcContentsEntry        **buckets;
+    int                      nbucket;
+    int                      nline, nstale;
+    FcHashTable             *blocks; /* cache file name to FcContentsBlock */
+} FcContentsIndex;
+
+/* Protected by cache_lock */
+static FcContentsIndex *fcContentsIndexes;
+
+static FcChar8 *
+FcDirCacheReadContents (const FcChar8 *cache_dir, struct stat *statb)
 {
-    FcSerialize *serialize = FcSerializeCreate();
-    FcCache     *cache;
-    int          i;
-    FcChar8     *dir_serialize;
-    intptr_t    *dirs_serialize;
-    FcFontSet   *set_serialize;
+    FcChar8    *contents, *buf = NULL;
+    struct stat my_statb;
+    int         fd;
 
-    if (!serialize)
+    if (!statb)
+	statb = &my_statb;
+    memset (statb, 0, sizeof (*statb));
+    contents = FcStrBuildFilename (cache_dir, FC_CACHE_CONTENTS, NULL);
+    if (!contents)
 	return NULL;
-    /*
-     * Space for cache structure
-     */
-    FcSerializeReserve (serialize, sizeof (FcCache));
-    /*
-     * Directory name
-     */
-    if (!FcStrSerializeAlloc (serialize, dir))
-	goto bail1;
-    /*
-     * Subdirs
-     */
-    FcSerializeAlloc (serialize, dirs, dirs->num * sizeof (FcChar8 *));
-    for (i = 0; i < dirs->num; i++)
-	if (!FcStrSerializeAlloc (serialize, dirs->strs[i]))
-	    goto bail1;
+    fd = FcOpen ((char *)contents, O_RDONLY | O_BINARY);
+    FcStrFree (contents);
+    if (fd == -1)
+	return NULL;
+    if (fstat (fd, statb) == 0 && statb->st_size < INT_MAX) {
+	buf = malloc (statb->st_size + 1);
+	if (buf) {
+	    if (read (fd, buf, statb->st_size) == statb->st_size)
+		buf[statb->st_size] = 0;
+	    else {
+		free (buf);
+		buf = NULL;
+	    }
+	}
+    }
+    close (fd);
 
-    /*
-     * Patterns
-     */
-    if (!FcFontSetSerializeAlloc (serialize, set))
-	goto bail1;
+    return buf;
+}
+
+static FcBool
+FcDirCacheParseContents (const char  *line,
+                         long long   *size,
+                         FcChar8      cache_base[CACHEBASE_LEN],
+                         const char **name)
+{
+    char       *end;
+    const char *base;
+    size_t      len;
+
+    *size = strtoll (line, &end, 10);
+    if (end == line || *end != ' ')
+	return FcFalse;
+    base = end + 1;
+    len = strcspn (base, " /\\");
+    if (len == 0 || len >= CACHEBASE_LEN || base[len] != ' ')
+	return FcFalse;
+    memcpy (cache_base, base, len);
+    cache_base[len] = 0;
+    *name = base + len + 1;
+
+    return **name && !strpbrk (*name, "/\\");
+}
+
+static FcHashTable *
+FcContentsBlocksCreate (void)
+{
+    return FcHashTableCreate ((FcHashFunc)FcStrHashIgnoreCase,
+                              (FcCompareFunc)FcStrCmp,
+                              FcHashStrCopy, NULL,
+                              free, free);
+}
+
+/*
+ * Record that line number line was written for cache_base, returning
+ * the number of lines this makes stale, or -1 when out of memory
+ */
+static int
+FcContentsBlocksAdd (FcHashTable *blocks, const FcChar8 *cache_base, int line, FcContentsBlock **ret)
+{
+    FcContentsBlock *block;
+    int              stale = 0;
+
+    if (!FcHashTableFind (blocks, cache_base, (void **)&block)) {
+	block = malloc (sizeof (FcContentsBlock));
+	if (!block)
+	    return -1;
+	if (!FcHashTableAdd (blocks, (void *)cache_base, block)) {
+	    free (block);
+	    return -1;
+	}
+	block->start = line;
+    } else if (block->last != line - 1) {
+	stale = block->last - block->start + 1;
+	block->start = line;
+    }
+    block->last = line;
+    if (ret)
+	*ret = block;
+
+    return stale;
+}
+
+static void
+FcContentsIndexClear (FcContentsIndex *index)
+{
+    FcContentsEntry *e, *next;
+    int              i;
+
+    for (i = 0; i < index->nbucket; i++) {
+	for (e = index->buckets[i]; e; e = next) {
+	    next = e->next;
+	    free (e);
+	}
+    }
+    free (index->buckets);
+    index->buckets = NULL;
+    index->nbucket = 0;
+    index->nline = index->nstale = 0;
+    if (index->blocks)
+	FcHashTableDestroy (index->blocks);
+    index->blocks = NULL;
+    index->loaded = FcFalse;
+}
+
+static FcBool
+FcContentsIndexAdd (FcContentsIndex *index, long long size, const FcChar8 *cache_base, const char *name)
+{
+    FcContentsEntry *e;
+    size_t           len = strlen (name) + 1;
+    int              stale;
+
+    if (index->nline >= index->nbucket * 2) {
+	int               nbucket = index->nbucket ? index->nbucket * 2 : 64, i;
+	FcContentsEntry **buckets = calloc (nbucket, sizeof (FcContentsEntry *)), *next;
+
+	if (!buckets)
+	    return FcFalse;
+	for (i = 0; i < index->nbucket; i++) {
+	    for (e = index->buckets[i]; e; e = next) {
+		next = e->next;
+		e->next = buckets[(unsigned long long)e->size % nbucket];
+		buckets[(unsigned long long)e->size % nbucket] = e;
+	    }
+	}
+	free (index->buckets);
+	index->buckets = buckets;
+	index->nbucket = nbucket;
+    }
+    stale = FcContentsBlocksAdd (index->blocks, cache_base, index->nline, NULL);
+    if (stale < 0)
+	return FcFalse;
+    e = malloc (sizeof (FcContentsEntry) + len);
+    if (!e)
+	return FcFalse;
+    e->size = size;
+    strcpy ((char *)e->cache_base, (const char *)cache_base);
+    e->name = (FcChar8 *)(e + 1);
+    memcpy (e->name, name, len);
+    e->next = index->buckets[(unsigned long long)size % index->nbucket];
+    index->buckets[(unsigned long long)size % index->nbucket] = e;
+    index->nline++;
+    index->nstale += stale;
+
+    return FcTrue;
+}
+
+/*
+ * Add the lines in buf to the index, modifying buf
+ */
+static void
+FcContentsIndexParse (FcContentsIndex *index, FcChar8 *buf)
+{
+    FcChar8    *line, *next;
+    FcChar8     cache_base[CACHEBASE_LEN];
+    const char *name;
+    long long   size;
+
+    for (line = buf; *line; line = next) {
+	next = (FcChar8 *)strchr ((char *)line, '\n');
+	if (!next)
+	    break;
+	*next++ = 0;
+	if (FcDirCacheParseContents ((const char *)line, &size, cache_base, &name))
+	    FcContentsIndexAdd (index, size, cache_base, name);
+	else
+	    index->nstale++;
+    }
+}
+
+static FcBool
+FcContentsSameFile (const struct stat *a, const struct stat *b)
+{
+    return a->st_dev == b->st_dev && a->st_ino == b->st_ino &&
+           a->st_size == b->st_size && a->st_mtime == b->st_mtime
+#ifdef HAVE_STRUCT_STAT_ST_MTIM
+           && a->st_mtim.tv_nsec == b->st_mtim.tv_nsec
+#endif
+	;
+}
+
+/*
+ * Find the index of cache_dir, reading it again if the file changed.
+ * Must be called with the cache lock held.
+ */
+static FcContentsIndex *
+FcContentsIndexGet (const FcChar8 *cache_dir)
+{
+    FcContentsIndex *index;
+    FcChar8         *contents, *buf;
+    struct stat      statb;
+
+    for (index = fcContentsIndexes; index; index = index->next) {
+	if (!strcmp ((const char *)index->cache_dir, (const char *)cache_dir))
+	    break;
+    }
+    if (!index) {
+	index = calloc (1, sizeof (FcContentsIndex));
+	if (!index)
+	    return NULL;
+	index->cache_dir = FcStrCopy (cache_dir);
+	if (!index->cache_dir) {
+	    free (index);
+	    return NULL;
+	}
+	index->next = fcContentsIndexes;
+	fcContentsIndexes = index;
+    }
+    if (index->loaded) {
+	contents = FcStrBuildFilename (cache_dir, FC_CACHE_CONTENTS, NULL);
+	if (!contents)
+	    return NULL;
+	if (FcStat (contents, &statb) < 0)
+	    memset (&statb, 0, sizeof (statb));
+	FcStrFree (contents);
+	if (FcContentsSameFile (&statb, &index->statb))
+	    return index;
+    }
+    FcContentsIndexClear (index);
+    index->blocks = FcContentsBlocksCreate();
+    if (!index->blocks)
+	return NULL;
+    buf = FcDirCacheReadContents (cache_dir, &index->statb);
+    if (buf) {
+	FcContentsIndexParse (index, buf);
+	free (buf);
+    }
+    index->loaded = FcTrue;
+
+    return index;
+}
+
+static void
+FcContentsIndexFini (void)
+{
+    FcContentsIndex *index, *next;
+
+    for (index = fcContentsIndexes; index; index = next) {
+	next = index->next;
+	FcContentsIndexClear (index);
+	FcStrFree (index->cache_dir);
+	free (index);
+    }
+    fcContentsIndexes = NULL;
+}
+
+/*
+ * Rewrite the index without the lines which are stale, repeated or
+ * which refer to cache files that are gone.  Lines appended by others
+ * while this runs may be lost, which only costs a later scan.
+ */
+static void
+FcDirCacheCompactContents (const FcChar8 *cache_dir)
+{
+    FcChar8         *buf, *line, *next, *contents = NULL, *tmp = NULL;
+    FcChar8          cache_base[CACHEBASE_LEN];
+    FcHashTable     *blocks, *seen = NULL, *gone = NULL;
+    FcContentsBlock *block;
+    FcStrBuf         out;
+    FcBool           changed = FcFalse;
+    const char      *name;
+    long long        size;
+    void            *v;
+    int              fd, i;
+
+    buf = FcDirCacheReadContents (cache_dir, NULL);
+    if (!buf)
+	return;
+    FcStrBufInit (&out, NULL, 0);
+    blocks = FcContentsBlocksCreate();
+    seen = FcHashTableCreate ((FcHashFunc)FcStrHashIgnoreCase,
+                              (FcCompareFunc)FcStrCmp,
+                              NULL, NULL, NULL, NULL);
+    gone = FcHashTableCreate ((FcHashFunc)FcStrHashIgnoreCase,
+                              (FcCompareFunc)FcStrCmp,
+                              FcHashStrCopy, NULL, free, NULL);
+    if (!blocks || !seen || !gone)
+	goto bail;
+
+    /* Find where the latest lines of each cache start */
+    for (line = buf, i = 0; (next = (FcChar8 *)strchr ((char *)line, '\n')); line = next + 1, i++) {
+	*next = 0;
+	if (FcDirCacheParseContents ((const char *)line, &size, cache_base, &name) &&
+	    FcContentsBlocksAdd (blocks, cache_base, i, NULL) < 0)
+	    goto bail;
+	*next = '\n';
+    }
+
+    for (line = buf, i = 0; *line; line = next, i++) {
+	FcBool keep = FcFalse;
+
+	next = (FcChar8 *)strchr ((char *)line, '\n');
+	if (!next) {
+	    changed = FcTrue;
+	    break;
+	}
+	*next++ = 0;
+	if (FcDirCacheParseContents ((const char *)line, &size, cache_base, &name) &&
+	    FcHashTableFind (blocks, cache_base, (void **)&block) &&
+	    i >= block->start &&
+	    !FcHashTableFind (seen, line, &v) &&
+	    !FcHashTableFind (gone, cache_base, &v)) {
+	    FcChar8 *cache_file = FcStrBuildFilename (cache_dir, cache_base, NULL);
+
+	    keep = cache_file && access ((char *)cache_file, F_OK) == 0;
+	    if (cache_file)
+		FcStrFree (cache_file);
+	    if (!keep)
+		FcHashTableAdd (gone, cache_base, NULL);
+	}
+	if (keep) {
+	    FcHashTableAdd (seen, line, line);
+	    FcStrBufString (&out, line);
+	    FcStrBufChar (&out, '\n');
+	} else
+	    changed = FcTrue;
+    }
+    if (!changed || out.failed)
+	goto bail;
+
+    contents = FcStrBuildFilename (cache_dir, FC_CACHE_CONTENTS, NULL);
+    if (!contents)
+	goto bail;
+    tmp = FcStrPlus (contents, (const FcChar8 *)"-XXXXXX");
+    if (!tmp)
+	goto bail;
+    fd = FcMakeTempfile ((char *)tmp);
+    if (fd == -1)
+	goto bail;
+    if (write (fd, out.buf, out.len) != out.len) {
+	close (fd);
+	unlink ((char *)tmp);
+	goto bail;
+    }
+#ifndef _WIN32
+    fchmod (fd, 0644);
+#endif
+    close (fd);
+#ifdef _WIN32
+    unlink ((char *)contents);
+#endif
+    if (rename ((char *)tmp, (char *)contents) < 0)
+	unlink ((char *)tmp);
+bail:
+    if (tmp)
+	FcStrFree (tmp);
+    if (contents)
+	FcStrFree (contents);
+    FcStrBufDestroy (&out);
+    if (blocks)
+	FcHashTableDestroy (blocks);
+    if (seen)
+	FcHashTableDestroy (seen);
+    if (gone)
+	FcHashTableDestroy (gone);
+    free (buf);
+}
+
+static void
+FcDirCacheAddContents (const FcChar8 *cache_dir, const FcChar8 *cache_base, FcCache *cache)
+{
+    FcContentsIndex *index;
+    FcCacheFile     *files;
+    FcChar8         *contents, *name;
+    FcChar8          buf_static[8192];
+    char             size[32];
+    FcStrBuf         buf;
+    FcBool           compact = FcFalse;
+    int              i, fd, len;
+
+    if (!cache->files)
+	return;
+    files = FcCacheFiles (cache);
+    FcStrBufInit (&buf, buf_static, sizeof (buf_static));
+    for (i = 0; i < cache->files_count; i++) {
+	if (!files[i].nfont)
+	    continue;
+	name = FcOffsetToPtr (files, files[i].name, FcChar8);
+	if (strchr ((const char *)name, '\n'))
+	    continue;
+	snprintf (size, sizeof (size), "%lld ", (long long)files[i].size);
+	FcStrBufString (&buf, (const FcChar8 *)size);
+	FcStrBufString (&buf, cache_base);
+	FcStrBufChar (&buf, ' ');
+	FcStrBufString (&buf, name);
+	FcStrBufChar (&buf, '\n');
+    }
+    len = buf.len;
+    /* FcContentsIndexParse needs the lines terminated */
+    FcStrBufChar (&buf, '\0');
+    if (!len || buf.failed)
+	goto bail;
+    contents = FcStrBuildFilename (cache_dir, FC_CACHE_CONTENTS, NULL);
+    if (!contents)
+	goto bail;
+
+    lock_cache();
+    index = FcContentsIndexGet (cache_dir);
+    /* a single write keeps concurrent appends from interleaving */
+    fd = FcOpen ((char *)contents, O_WRONLY | O_APPEND | O_CREAT | O_BINARY, 0644);
+    if (fd != -1) {
+	if (write (fd, buf.buf, len) != len) {
+	    if (FcDebug() & FC_DBG_CACHE)
+		printf ("FcDirCacheAddContents: short write to %s\n", contents);
+	    index = NULL;
+	}
+	/* Keep the index in memory in step with the file */
+	if (index) {
+	    FcBool up_to_date = index->statb.st_size + len == lseek (fd, 0, SEEK_END);
+
+	    FcContentsIndexParse (index, buf.buf);
+	    if (up_to_date && fstat (fd, &index->statb) < 0)
+		index->loaded = FcFalse;
+	    compact = index->nstale > index->nline / 2;
+	}
+	close (fd);
+    }
+    if (compact) {
+	if (FcDebug() & FC_DBG_CACHE)
+	    printf ("FcDirCacheAddContents: compacting %s\n", contents);
+	FcDirCacheCompactContents (cache_dir);
+	index->loaded = FcFalse;
+    }
+    unlock_cache();
+    FcStrFree (contents);
+bail:
+    FcStrBufDestroy (&buf);
+}
+
+/*
+ * Drop the lines of the index which are stale, repeated or which refer
+ * to cache files that are gone
+ */
+static void
+FcDirCacheCleanContents (const FcChar8 *cache_dir)
+{
+    FcContentsIndex *index;
+
+    lock_cache();
+    FcDirCacheCompactContents (cache_dir);
+    for (index = fcContentsIndexes; index; index = index->next) {
+	if (!strcmp ((const char *)index->cache_dir, (const char *)cache_dir))
+	    index->loaded = FcFalse;
+    }
+    unlock_cache();
+}
+
+static FcCache *
+FcDirCacheLoadFileOutdated (FcConfig *config, const FcChar8 *cache_file)
+{
+    FcCache    *cache = NULL;
+    struct stat file_stat;
+    int         fd;
+
+    fd = FcDirCacheOpenFile (cache_file, &file_stat);
+    if (fd >= 0) {
+	cache = FcDirCacheMapFd (config, fd, &file_stat, NULL, FcTrue);
+	close (fd);
+    }
+    if (cache && !FcCacheFontsReusable (cache)) {
+	FcDirCacheUnload (cache);
+	cache = NULL;
+    }
+
+    return cache;
+}
+
+static FcBool
+FcFileSameContents (const FcChar8 *a, const FcChar8 *b)
+{
+    char    buf_a[8192], buf_b[8192];
+    ssize_t len_a, len_b;
+    int     fd_a, fd_b;
+    FcBool  ret = FcFalse;
+
+    fd_a = FcOpen ((const char *)a, O_RDONLY | O_BINARY);
+    if (fd_a == -1)
+	return FcFalse;
+    fd_b = FcOpen ((const char *)b, O_RDONLY | O_BINARY);
+    if (fd_b == -1) {
+	close (fd_a);
+	return FcFalse;
+    }
+    for (;;) {
+	len_a = read (fd_a, buf_a, sizeof (buf_a));
+	len_b = read (fd_b, buf_b, sizeof (buf_b));
+	if (len_a < 0 || len_a != len_b || memcmp (buf_a, buf_b, len_a) != 0)
+	    break;
+	if (len_a == 0) {
+	    ret = FcTrue;
+	    break;
+	}
+    }
+    close (fd_a);
+    close (fd_b);
+
+    return ret;
+}
+
+/*
+ * Copy the fonts recorded in cache_file for the font file name, if
+ * that has the same contents as file; FC_FILE is set to font_file.
+ */
+static FcFontSet *
+FcDirCacheCopyFonts (FcConfig      *config,
+                     const FcChar8 *cache_file,
+                     const FcChar8 *name,
+                     const FcChar8 *file,
+                     const FcChar8 *font_file)
+{
+    const FcChar8     *sysroot = FcConfigGetSysRoot (config);
+    const FcCacheFile *cf;
+    FcCache           *cache;
+    FcChar8           *source;
+    FcFontSet         *set = NULL;
+    struct stat        statb;
+    int                i;
+
+    cache = FcDirCacheLoadFileOutdated (config, cache_file);
+    if (!cache)
+	return NULL;
+    if (sysroot)
+	source = FcStrBuildFilename (sysroot, FcCacheDir (cache), name, NULL);
+    else
+	source = FcStrBuildFilename (FcCacheDir (cache), name, NULL);
+    if (!source)
+	goto bail;
+    /* The recorded fonts must still describe the source file */
+    if (FcStat (source, &statb) != 0 ||
+        !(cf = FcDirCacheFindFile (cache, name, &statb)) ||
+        !cf->nfont ||
+        !FcFileSameContents (source, file))
+	goto bail1;
+
+    set = FcFontSetCreate();
+    if (!set)
+	goto bail1;
+    for (i = 0; i < cf->nfont; i++) {
+	FcPattern *font = FcPatternDuplicate (FcFontSetFont (FcCacheSet (cache), cf->first + i));
+
+	if (!font ||
+	    !FcPatternObjectDel (font, FC_FILE_OBJECT) ||
+	    !FcPatternObjectAddString (font, FC_FILE_OBJECT, font_file) ||
+	    !FcFontSetAdd (set, font)) {
+	    if (font)
+		FcPatternDestroy (font);
+	    FcFontSetDestroy (set);
+	    set = NULL;
+	    break;
+	}
+    }
+    if (set && FcDebug() & FC_DBG_CACHE)
+	printf ("FcDirCacheCopyFonts \"%s\": copy of \"%s\"\n", file, source);
+bail1:
+    FcStrFree (source);
+bail:
+    /* the fonts hold references to cache as they need */
+    FcDirCacheUnload (cache);
+
+    return set;
+}
+
+typedef struct _FcContentsMatch {
+    FcDirScanFile *file;
+    FcChar8       *cache_file;
+    FcChar8       *name;
+} FcContentsMatch;
+
+/*
+ * Look up the files in query among those recorded by the caches,
+ * copying the fonts of any identical file; returns the number of
+ * files left in query for scanning
+ */
+int
+FcDirCacheFindCopies (FcConfig      *config,
+                      const FcChar8 *dir,
+                      FcDirScanFile *files,
+                      int           *query,
+                      int            nquery)
+{
+    const FcChar8   *sysroot = FcConfigGetSysRoot (config);
+    const size_t     suffix_len = strlen ("-" FC_ARCHITECTURE FC_CACHE_SUFFIX);
+    FcContentsMatch *matches = NULL;
+    FcStrList       *list;
+    FcChar8         *cache_dir;
+    int              i, j, n, nmatch, msize = 0, nfound = 0;
+
+    if (!nquery || FcConfigScanTestsFile (config))
+	return nquery;
+    for (i = n = 0; i < nquery; i++) {
+	if (files[query[i]].stat_ok)
+	    n++;
+    }
+
+    list = FcStrListCreate (config->cacheDirs);
+    if (!list)
+	return nquery;
+    while (nfound < n && (cache_dir = FcStrListNext (list))) {
+	FcContentsIndex *index;
+	FcChar8         *d;
+
+	if (sysroot)
+	    d = FcStrBuildFilename (sysroot, cache_dir, NULL);
+	else
+	    d = FcStrCopyFilename (cache_dir);
+	if (!d)
+	    break;
+
+	/* Pick the candidates with the index locked, then copy the fonts */
+	nmatch = 0;
+	lock_cache();
+	index = FcContentsIndexGet (d);
+	for (i = 0; index && index->nbucket && i < nquery; i++) {
+	    FcDirScanFile   *f = &files[query[i]];
+	    long long        size = f->statb.st_size;
+	    FcContentsEntry *e;
+
+	    if (!f->stat_ok || f->set)
+		continue;
+	    for (e = index->buckets[(unsigned long long)size % index->nbucket]; e; e = e->next) {
+		FcContentsMatch *m;
+
+		if (e->size != size ||
+		    strlen ((const char *)e->cache_base) != 32 + suffix_len ||
+		    strcmp ((const char *)e->cache_base + 32, "-" FC_ARCHITECTURE FC_CACHE_SUFFIX))
+		    continue;
+		if (nmatch == msize) {
+		    m = realloc (matches, (msize ? msize * 2 : 8) * sizeof (FcContentsMatch));
+		    if (!m)
+			break;
+		    matches = m;
+		    msize = msize ? msize * 2 : 8;
+		}
+		m = &matches[nmatch];
+		m->file = f;
+		m->cache_file = FcStrBuildFilename (d, e->cache_base, NULL);
+		m->name = FcStrCopy (e->name);
+		if (m->cache_file && m->name)
+		    nmatch++;
+		else {
+		    if (m->cache_file)
+			FcStrFree (m->cache_file);
+		    if (m->name)
+			FcStrFree (m->name);
+		}
+	    }
+	}
+	unlock_cache();
+
+	for (j = 0; j < nmatch; j++) {
+	    FcContentsMatch *m = &matches[j];
+	    FcChar8         *font_file;
+
+	    if (!m->file->set) {
+		font_file = FcStrBuildFilename (dir, m->file->name, NULL);
+		if (font_file) {
+		    m->file->set = FcDirCacheCopyFonts (config, m->cache_file, m->name,
+		                                        m->file->file, font_file);
+		    if (m->file->set)
+			nfound++;
+		    FcStrFree (font_file);
+		}
+	    }
+	    FcStrFree (m->cache_file);
+	    FcStrFree (m->name);
+	}
+	FcStrFree (d);
+    }
+    FcStrListDone (list);
+    free (matches);
+
+    for (i = n = 0; i < nquery; i++) {
+	if (!files[query[i]].set)
+	    query[n++] = query[i];
+    }
+
+    return n;
+}
+
+FcCache *
+FcDirCacheLoadFile (const FcChar8 *cache_file, struct stat *file_stat)
+{
+    int         fd;
+    FcCache    *cache = NULL;
+    struct stat my_file_stat;
+    FcConfig   *config;
+
+    if (!file_stat)
+	file_stat = &my_file_stat;
+    config = FcConfigReference (NULL);
+    if (!config)
+	return NULL;
+    fd = FcDirCacheOpenFile (cache_file, file_stat);
+    if (fd >= 0) {
+	cache = FcDirCacheMapFd (config, fd, file_stat, NULL, FcFalse);
+	close (fd);
+    }
+    FcConfigDestroy (config);
+
+    return cache;
+}
+
+static int
+FcDirChecksum (struct stat *statb)
+{
+    int                ret = (int)statb->st_mtime;
+    char              *endptr;
+    char              *source_date_epoch;
+    unsigned long long epoch;
+
+    source_date_epoch = getenv ("SOURCE_DATE_EPOCH");
+    if (source_date_epoch) {
+	errno = 0;
+	epoch = strtoull (source_date_epoch, &endptr, 10);
+
+	if (endptr == source_date_epoch)
+	    fprintf (stderr,
+	             "Fontconfig: SOURCE_DATE_EPOCH invalid\n");
+	else if ((errno == ERANGE && (epoch == ULLONG_MAX || epoch == 0)) || (errno != 0 && epoch == 0))
+	    fprintf (stderr,
+	             "Fontconfig: SOURCE_DATE_EPOCH: strtoull: %s: %" FC_UINT64_FORMAT "\n",
+	             strerror (errno), epoch);
+	else if (*endptr != '\0')
+	    fprintf (stderr,
+	             "Fontconfig: SOURCE_DATE_EPOCH has trailing garbage\n");
+	else if (epoch > ULONG_MAX)
+	    fprintf (stderr,
+	             "Fontconfig: SOURCE_DATE_EPOCH must be <= %lu but saw: %" FC_UINT64_FORMAT "\n",
+	             ULONG_MAX, epoch);
+	else if (epoch < ret)
+	    /* Only override if directory is newer */
+	    ret = (int)epoch;
+    }
+
+    return ret;
+}
+
+static int64_t
+FcDirChecksumNano (struct stat *statb)
+{
+#ifdef HAVE_STRUCT_STAT_ST_MTIM
+    /* No nanosecond component to parse */
+    if (getenv ("SOURCE_DATE_EPOCH"))
+	return 0;
+    return statb->st_mtim.tv_nsec;
+#else
+    return 0;
+#endif
+}
+
+/*
+ * Validate a cache file by reading the header and checking
+ * the magic number and the size field
+ */
+static FcBool
+FcDirCacheValidateHelper (FcConfig *config, int fd, struct stat *fd_stat, struct stat *dir_stat, struct timeval *latest_cache_mtime, void *closure FC_UNUSED)
+{
+    FcBool  ret = FcTrue;
+    FcCache c;
+
+    if (read (fd, &c, sizeof (FcCache)) != sizeof (FcCache))
+	ret = FcFalse;
+    else if (c.magic != FC_CACHE_MAGIC_MMAP)
+	ret = FcFalse;
+    else if (c.version < FC_CACHE_VERSION_NUMBER)
+	ret = FcFalse;
+    else if (fd_stat->st_size != c.size)
+	ret = FcFalse;
+    else if (c.checksum != FcDirChecksum (dir_stat))
+	ret = FcFalse;
+#ifdef HAVE_STRUCT_STAT_ST_MTIM
+    else if (c.checksum_nano != FcDirChecksumNano (dir_stat))
+	ret = FcFalse;
+#endif
+    return ret;
+}
+
+static FcBool
+FcDirCacheValidConfig (const FcChar8 *dir, FcConfig *config)
+{
+    return FcDirCacheProcess (config, dir,
+                              FcDirCacheValidateHelper,
+                              NULL, NULL);
+}
+
+FcBool
+FcDirCacheValid (const FcChar8 *dir)
+{
+    FcConfig *config;
+    FcBool    ret;
+
+    config = FcConfigReference (NULL);
+    if (!config)
+	return FcFalse;
+
+    ret = FcDirCacheValidConfig (dir, config);
+    FcConfigDestroy (config);
+
+    return ret;
+}
+
+/*
+ * Font files are left out of reproducible builds as they record
+ * inode numbers
+ */
+static FcDirFiles *
+FcDirCacheFilesToWrite (FcDirFiles *files)
+{
+    if (!files || !files->num || getenv ("SOURCE_DATE_EPOCH"))
+	return NULL;
+    return files;
+}
+
+/*
+ * Lay out the cache for the given contents
+ */
+static FcBool
+FcDirCacheLayout (FcSerialize *serialize, FcFontSet *set, const FcChar8 *dir, FcStrSet *dirs, FcDirFiles *files)
+{
+    int i;
+
+    /*
+     * Space for cache structure
+     */
+    FcSerializeReserve (serialize, sizeof (FcCache));
+    /*
+     * Directory name
+     */
+    if (!FcStrSerializeAlloc (serialize, dir))
+	return FcFalse;
+    /*
+     * Subdirs
+     */
+    FcSerializeAlloc (serialize, dirs, dirs->num * sizeof (FcChar8 *));
+    for (i = 0; i < dirs->num; i++)
+	if (!FcStrSerializeAlloc (serialize, dirs->strs[i]))
+	    return FcFalse;
+
+    /*
+     * Patterns
+     */
+    if (!FcFontSetSerializeAlloc (serialize, set))
+	return FcFalse;
+
+    /*
+     * Font files
+     */
+    if (files) {
+	if (!FcSerializeAlloc (serialize, files, files->num * sizeof (FcCacheFile)))
+	    return FcFalse;
+	for (i = 0; i < files->num; i++)
+	    if (!FcStrSerializeAlloc (serialize, files->names[i]))
+		return FcFalse;
+    }
+
+    return FcTrue;
+}
+
+/*
+ * Fill the laid out cache with the given header, in zeroed memory at
+ * serialize->linear; the magic, size and checksums are left to the
+ * caller
+ */
+static FcBool
+FcDirCacheFill (FcSerialize *serialize, FcCache *cache, FcFontSet *set, const FcChar8 *dir, FcStrSet *dirs, FcDirFiles *files)
+{
+    int          i;
+    FcChar8     *dir_serialize;
+    intptr_t    *dirs_serialize;
+    FcFontSet   *set_serialize;
+    FcCacheFile *files_serialize;
+
+    cache->version = FC_CACHE_VERSION_NUMBER;
+    cache->fc_version = (FC_VERSION_MAJOR << 24) +
+                        (FC_VERSION_MINOR << 12) +
+                        FC_VERSION_MICRO;
+
+    /*
+     * Serialize directory name
+     */
+    dir_serialize = FcStrSerialize (serialize, dir);
+    if (!dir_serialize)
+	return FcFalse;
+    cache->dir = FcPtrToOffset (cache, dir_serialize);
+
+    /*
+     * Serialize sub dirs
+     */
+    dirs_serialize = FcSerializePtr (serialize, dirs);
+    if (!dirs_serialize)
+	return FcFalse;
+    cache->dirs = FcPtrToOffset (cache, dirs_serialize);
+    cache->dirs_count = dirs->num;
+    for (i = 0; i < dirs->num; i++) {
+	FcChar8 *d_serialize = FcStrSerialize (serialize, dirs->strs[i]);
+	if (!d_serialize)
+	    return FcFalse;
+	dirs_serialize[i] = FcPtrToOffset (dirs_serialize, d_serialize);
+    }
+
+    /*
+     * Serialize font set
+     */
+    set_serialize = FcFontSetSerialize (serialize, set);
+    if (!set_serialize)
+	return FcFalse;
+    cache->set = FcPtrToOffset (cache, set_serialize);
+
+    /*
+     * Serialize font files
+     */
+    if (files) {
+	files_serialize = FcSerializePtr (serialize, files);
+	if (!files_serialize)
+	    return FcFalse;
+	cache->files = FcPtrToOffset (cache, files_serialize);
+	cache->files_count = files->num;
+	for (i = 0; i < files->num; i++) {
+	    FcChar8 *n_serialize = FcStrSerialize (serialize, files->names[i]);
+	    if (!n_serialize)
+		return FcFalse;
+	    files_serialize[i] = files->files[i];
+	    files_serialize[i].name = FcPtrToOffset (files_serialize, n_serialize);
+	}
+    }
+
+    return FcTrue;
+}
+
+/*
+ * Build a cache structure from the given contents
+ */
+FcCache *
+FcDirCacheBuild (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs, FcDirFiles *files)
+{
+    FcSerialize *serialize = FcSerializeCreate();
+    FcCache     *cache;
+
+    if (!serialize)
+	return NULL;
+    files = FcDirCacheFilesToWrite (files);
+    if (!FcDirCacheLayout (serialize, set, dir, dirs, files))
+	goto bail1;
 
     /* Serialize layout complete. Now allocate space and fill it */
     cache = malloc (serialize->size);
@@ -1312,104 +2403,698 @@ FcDirCacheBuild (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcSt
     /* shut up valgrind */
     memset (cache, 0, serialize->size);
 
-    serialize->linear = cache;
+    serialize->linear = cache;
+
+    cache->magic = FC_CACHE_MAGIC_ALLOC;
+    cache->size = serialize->size;
+    cache->checksum = FcDirChecksum (dir_stat);
+    cache->checksum_nano = FcDirChecksumNano (dir_stat);
+    if (!FcDirCacheFill (serialize, cache, set, dir, dirs, files))
+	goto bail2;
+
+    FcSerializeDestroy (serialize);
+
+    FcCacheInsert (cache, NULL);
+
+    return cache;
+
+bail2:
+    free (cache);
+bail1:
+    FcSerializeDestroy (serialize);
+    return NULL;
+}
+
+/*
+ * Point files at the file table of cache; files->names is to be freed
+ * by the caller
+ */
+static void
+FcDirFilesFromCache (FcCache *cache, FcDirFiles *files)
+{
+    int i;
+
+    files->num = files->size = cache->files_count;
+    files->files = cache->files ? FcCacheFiles (cache) : NULL;
+    files->names = NULL;
+    if (files->num) {
+	files->names = malloc (files->num * sizeof (FcChar8 *));
+	if (!files->names)
+	    files->num = 0;
+	for (i = 0; i < files->num; i++)
+	    files->names[i] = FcOffsetToPtr (files->files, files->files[i].name, FcChar8);
+    }
+}
+
+FcCache *
+FcDirCacheRebuild (FcCache *cache, struct stat *dir_stat, FcStrSet *dirs)
+{
+    FcCache       *newp;
+    FcFontSet     *set = FcFontSetDeserialize (FcCacheSet (cache));
+    const FcChar8 *dir = FcCacheDir (cache);
+    FcDirFiles     files;
+
+    /* The fonts are kept, so are the files they came from */
+    FcDirFilesFromCache (cache, &files);
+    newp = FcDirCacheBuild (set, dir, dir_stat, dirs, &files);
+    FcFontSetDestroy (set);
+    if (files.names)
+	free (files.names);
+
+    return newp;
+}
+
+/*
+ * A cache pack holds the caches of many directories in one file, so
+ * that they are all loaded with a single mmap.  The caches are
+ * serialized together: charsets, value lists and strings found in
+ * several directories are stored once and shared by their caches.  Its
+ * table of directories is sorted by name.
+ */
+#define FC_CACHE_PACK "pack-" FC_ARCHITECTURE "-" FC_CACHE_VERSION
+
+typedef struct _FcCachePackDir {
+    intptr_t dir;   /* offset to directory name */
+    intptr_t cache; /* offset to its cache */
+} FcCachePackDir;
+
+typedef struct _FcCachePack {
+    unsigned int magic;      /* FC_CACHE_PACK_MAGIC_MMAP or FC_CACHE_PACK_MAGIC_ALLOC */
+    int          version;    /* FC_CACHE_VERSION_NUMBER */
+    intptr_t     size;       /* size of file */
+    intptr_t     dirs;       /* offset to directory table */
+    int          dirs_count; /* number of directories */
+    int          pad;
+    int64_t      fc_version; /* fontconfig version */
+    uint64_t     generation; /* FcDirCacheGeneration when written */
+} FcCachePack;
+
+#define FcCachePackDirs(p)     FcOffsetMember (p, dirs, FcCachePackDir)
+#define FcCachePackDir(p, i)   FcOffsetToPtr (p, FcCachePackDirs (p)[i].dir, FcChar8)
+#define FcCachePackCache(p, i) FcOffsetToPtr (p, FcCachePackDirs (p)[i].cache, FcCache)
+
+static int64_t
+FcCacheVersion (void)
+{
+    return (FC_VERSION_MAJOR << 24) + (FC_VERSION_MINOR << 12) + FC_VERSION_MICRO;
+}
+
+static FcBool
+FcCachePackValid (FcCachePack *pack)
+{
+    char           *end = (char *)pack + pack->size;
+    FcCachePackDir *dirs;
+    const FcChar8  *prev = NULL;
+    int             i;
+
+    if (pack->dirs < (intptr_t)sizeof (FcCachePack) || pack->dirs > pack->size ||
+        pack->dirs_count < 0 ||
+        pack->dirs_count > (pack->size - pack->dirs) / sizeof (FcCachePackDir))
+	return FcFalse;
+
+    dirs = FcCachePackDirs (pack);
+    for (i = 0; i < pack->dirs_count; i++) {
+	const FcChar8 *dir;
+	FcCache       *cache;
+
+	if (dirs[i].dir < 0 || dirs[i].dir >= pack->size ||
+	    dirs[i].cache < (intptr_t)sizeof (FcCachePack) ||
+	    dirs[i].cache % (intptr_t)sizeof (FcAlign) ||
+	    dirs[i].cache > pack->size - (intptr_t)sizeof (FcCache))
+	    return FcFalse;
+	dir = FcCachePackDir (pack, i);
+	if (memchr (dir, '\0', end - (char *)dir) == NULL ||
+	    (prev && strcmp ((const char *)prev, (const char *)dir) >= 0))
+	    return FcFalse;
+	prev = dir;
+
+	cache = FcCachePackCache (pack, i);
+	if (cache->magic != FC_CACHE_MAGIC_MMAP ||
+	    cache->version != FC_CACHE_VERSION_NUMBER ||
+	    cache->size < (intptr_t)sizeof (FcCache) ||
+	    cache->size > end - (char *)cache ||
+	    !FcCacheOffsetsValid (cache, (char *)pack, end) ||
+	    strcmp ((const char *)FcCacheDir (cache), (const char *)dir) != 0)
+	    return FcFalse;
+    }
+
+    return FcTrue;
+}
+
+/*
+ * Map the cache pack in pack_file, unless a cache was written since
+ * the pack was, as the pack may then hold an older cache of the same
+ * directory
+ */
+static FcCachePack *
+FcCachePackMap (const FcChar8 *pack_file, uint64_t generation)
+{
+    FcCachePack *pack;
+    struct stat  pack_stat;
+    FcBool       allocated;
+    int          fd;
+
+    fd = FcDirCacheOpenFile (pack_file, &pack_stat);
+    if (fd < 0)
+	return NULL;
+    if (pack_stat.st_size > INTPTR_MAX ||
+        pack_stat.st_size < (int)sizeof (FcCachePack)) {
+	close (fd);
+	return NULL;
+    }
+    /* Already mapped for another configuration */
+    pack = (FcCachePack *)FcCacheFindByStat (&pack_stat);
+    if (pack) {
+	close (fd);
+	if (pack->generation == generation)
+	    return pack;
+	FcCacheObjectDereference (pack);
+	return NULL;
+    }
+
+    pack = FcCacheFileMap (fd, &pack_stat, &allocated);
+    close (fd);
+    if (!pack)
+	return NULL;
+    if (pack->magic != FC_CACHE_PACK_MAGIC_MMAP ||
+        pack->version != FC_CACHE_VERSION_NUMBER ||
+        pack->size != (intptr_t)pack_stat.st_size ||
+        pack->fc_version != FcCacheVersion() ||
+        !FcCachePackValid (pack) ||
+        !FcCacheInsert ((FcCache *)pack, &pack_stat)) {
+	if (FcDebug() & FC_DBG_CACHE)
+	    printf ("FcCachePackMap \"%s\": invalid cache pack\n", pack_file);
+	FcCacheFileUnmap (pack, pack_stat.st_size, allocated);
+	return NULL;
+    }
+    if (allocated)
+	pack->magic = FC_CACHE_PACK_MAGIC_ALLOC;
+    if (pack->generation != generation) {
+	if (FcDebug() & FC_DBG_CACHE)
+	    printf ("FcCachePackMap \"%s\": caches were written since\n", pack_file);
+	FcCacheObjectDereference (pack);
+	return NULL;
+    }
+
+    return pack;
+}
+
+static void
+FcCachePackUnmap (void *pack)
+{
+    FcCacheObjectDereference (pack);
+}
+
+static FcPtrList *
+FcConfigCachePacks (FcConfig *config)
+{
+    const FcChar8 *sysroot = FcConfigGetSysRoot (config);
+    FcPtrList     *packs;
+    FcPtrListIter  iter;
+    FcStrList     *list;
+    FcChar8       *cache_dir, *pack_file;
+    FcCachePack   *pack;
+    uint64_t       generation;
+
+    packs = fc_atomic_ptr_get (&config->cachePacks);
+    if (packs)
+	return packs;
+    generation = FcDirCacheGeneration (config);
+
+    packs = FcPtrListCreate (FcCachePackUnmap);
+    if (!packs)
+	return NULL;
+    list = FcStrListCreate (config->cacheDirs);
+    if (!list) {
+	FcPtrListDestroy (packs);
+	return NULL;
+    }
+    while ((cache_dir = FcStrListNext (list))) {
+	if (sysroot)
+	    pack_file = FcStrBuildFilename (sysroot, cache_dir, FC_CACHE_PACK, NULL);
+	else
+	    pack_file = FcStrBuildFilename (cache_dir, FC_CACHE_PACK, NULL);
+	if (!pack_file)
+	    break;
+	pack = FcCachePackMap (pack_file, generation);
+	if (pack) {
+	    FcPtrListIterInitAtLast (packs, &iter);
+	    if (!FcPtrListIterAdd (packs, &iter, pack))
+		FcCachePackUnmap (pack);
+	}
+	FcStrFree (pack_file);
+    }
+    FcStrListDone (list);
+
+    if (!fc_atomic_ptr_cmpexch (&config->cachePacks, NULL, packs)) {
+	FcPtrListDestroy (packs);
+	packs = fc_atomic_ptr_get (&config->cachePacks);
+    }
+
+    return packs;
+}
+
+/*
+ * Look for an up-to-date cache of dir in the cache packs of config
+ */
+FcCache *
+FcDirCacheLoadPacked (const FcChar8 *dir, FcConfig *config)
+{
+    FcPtrList    *packs = FcConfigCachePacks (config);
+    FcPtrListIter iter;
+
+    if (!packs)
+	return NULL;
+    FcPtrListIterInit (packs, &iter);
+    for (; FcPtrListIterIsValid (packs, &iter); FcPtrListIterNext (packs, &iter)) {
+	FcCachePack *pack = FcPtrListIterGetValue (packs, &iter);
+	int          low = 0, high = pack->dirs_count - 1;
+
+	while (low <= high) {
+	    int mid = (low + high) >> 1;
+	    int c = strcmp ((const char *)FcCachePackDir (pack, mid), (const char *)dir);
+
+	    if (c == 0) {
+		FcCache *cache = FcCachePackCache (pack, mid);
+
+		if (!FcCacheTimeValid (config, cache, NULL))
+		    break;
+		if (FcDebug() & FC_DBG_CACHE)
+		    printf ("FcDirCacheLoadPacked dir \"%s\": found in cache pack\n", dir);
+		FcCacheObjectReference (cache);
+		return cache;
+	    }
+	    if (c < 0)
+		low = mid + 1;
+	    else
+		high = mid - 1;
+	}
+    }
+
+    return NULL;
+}
+
+static int
+FcCacheCompareDir (const void *a, const void *b)
+{
+    return strcmp ((const char *)FcCacheDir (*(FcCache *const *)a),
+                   (const char *)FcCacheDir (*(FcCache *const *)b));
+}
+
+static FcBool
+FcCachePackWrite (int fd, const void *data, size_t len)
+{
+    return write (fd, data, len) == (ssize_t)len;
+}
+
+/*
+ * Whether the pack in pack_file is current and holds the same caches
+ */
+static FcBool
+FcCachePackHolds (const FcChar8 *pack_file, uint64_t generation, FcCache **caches, int ncache)
+{
+    FcCachePack *pack = FcCachePackMap (pack_file, generation);
+    FcBool       ret;
+    int          i;
+
+    if (!pack)
+	return FcFalse;
+    ret = pack->dirs_count == ncache;
+    for (i = 0; ret && i < ncache; i++) {
+	FcCache *cache = FcCachePackCache (pack, i);
+
+	ret = !strcmp ((const char *)FcCachePackDir (pack, i), (const char *)FcCacheDir (caches[i])) &&
+	      cache->checksum == caches[i]->checksum &&
+	      cache->checksum_nano == caches[i]->checksum_nano;
+    }
+    FcCacheObjectDereference (pack);
+
+    return ret;
+}
+
+/*
+ * Write the up-to-date caches of all the font directories of config
+ * into a cache pack in the first writable cache directory
+ */
+FcBool
+FcCacheCreatePackFile (FcConfig *config)
+{
+    const FcChar8  *sysroot;
+    FcStrSet       *dirs = NULL;
+    FcStrList      *list;
+    FcCache       **caches = NULL, *cache;
+    FcChar8        *dir, *cache_dir = NULL, *pack_file = NULL;
+    FcSerialize    *serialize = NULL;
+    FcFontSet     **sets = NULL;
+    FcStrSet      **subdirs = NULL;
+    FcDirFiles     *files = NULL;
+    intptr_t       *offsets = NULL, buf_size;
+    FcCachePackDir *entries = NULL;
+    FcCachePack    *pack;
+    void           *buf = NULL;
+    FcAtomic       *atomic = NULL;
+    uint64_t        generation;
+    int             ncache = 0, size = 0, i, j, fd;
+    FcBool          ret = FcFalse;
+
+    config = FcConfigReference (config);
+    if (!config)
+	return FcFalse;
+    sysroot = FcConfigGetSysRoot (config);
+
+    /*
+     * Collect the caches of the font directories and their subdirs
+     */
+    dirs = FcStrSetCreate();
+    if (!dirs)
+	goto bail;
+    list = FcConfigGetFontDirs (config);
+    if (!list)
+	goto bail;
+    while ((dir = FcStrListNext (list)))
+	FcStrSetAdd (dirs, dir);
+    FcStrListDone (list);
+    for (i = 0; i < dirs->num; i++) {
+	if (!FcConfigAcceptFilename (config, dirs->strs[i]))
+	    continue;
+	cache = FcDirCacheLoad (dirs->strs[i], config, NULL);
+	if (!cache)
+	    continue;
+	if (ncache == size) {
+	    FcCache **c = realloc (caches, (size + 64) * sizeof (FcCache *));
+
+	    if (!c) {
+		FcDirCacheUnload (cache);
+		goto bail;
+	    }
+	    caches = c;
+	    size += 64;
+	}
+	caches[ncache++] = cache;
+	for (j = 0; j < FcCacheNumSubdir (cache); j++)
+	    FcStrSetAdd (dirs, FcCacheSubdir (cache, j));
+    }
+    if (ncache)
+	qsort (caches, ncache, sizeof (FcCache *), FcCacheCompareDir);
+    for (i = j = 0; i < ncache; i++) {
+	if (j && !strcmp ((const char *)FcCacheDir (caches[j - 1]),
+	                  (const char *)FcCacheDir (caches[i])))
+	    FcDirCacheUnload (caches[i]);
+	else
+	    caches[j++] = caches[i];
+    }
+    ncache = j;
 
-    cache->magic = FC_CACHE_MAGIC_ALLOC;
-    cache->version = FC_CACHE_VERSION_NUMBER;
-    cache->size = serialize->size;
-    cache->checksum = FcDirChecksum (dir_stat);
-    cache->checksum_nano = FcDirChecksumNano (dir_stat);
-    cache->fc_version = (FC_VERSION_MAJOR << 24) +
-	               (FC_VERSION_MINOR << 12) +
-	               FC_VERSION_MICRO;
+    list = FcStrListCreate (config->cacheDirs);
+    if (!list)
+	goto bail;
+    while ((dir = FcStrListNext (list))) {
+	if (sysroot)
+	    cache_dir = FcStrBuildFilename (sysroot, dir, NULL);
+	else
+	    cache_dir = FcStrCopyFilename (dir);
+	if (cache_dir && access ((char *)cache_dir, W_OK) == 0)
+	    break;
+	if (cache_dir)
+	    FcStrFree (cache_dir);
+	cache_dir = NULL;
+    }
+    FcStrListDone (list);
+    if (!cache_dir)
+	goto bail;
+    pack_file = FcStrBuildFilename (cache_dir, FC_CACHE_PACK, NULL);
+    if (!pack_file)
+	goto bail;
+    if (!ncache) {
+	unlink ((char *)pack_file);
+	ret = FcTrue;
+	goto bail;
+    }
 
     /*
-     * Serialize directory name
+     * Nothing to do while the pack holds the caches we just loaded
      */
-    dir_serialize = FcStrSerialize (serialize, dir);
-    if (!dir_serialize)
-	goto bail2;
-    cache->dir = FcPtrToOffset (cache, dir_serialize);
+    generation = FcDirCacheGeneration (config);
+    if (FcCachePackHolds (pack_file, generation, caches, ncache)) {
+	ret = FcTrue;
+	goto bail;
+    }
 
     /*
-     * Serialize sub dirs
+     * Lay out the header, the caches and the directory table, all in
+     * one serialization
      */
-    dirs_serialize = FcSerializePtr (serialize, dirs);
-    if (!dirs_serialize)
-	goto bail2;
-    cache->dirs = FcPtrToOffset (cache, dirs_serialize);
-    cache->dirs_count = dirs->num;
-    for (i = 0; i < dirs->num; i++) {
-	FcChar8 *d_serialize = FcStrSerialize (serialize, dirs->strs[i]);
-	if (!d_serialize)
-	    goto bail2;
-	dirs_serialize[i] = FcPtrToOffset (dirs_serialize, d_serialize);
+    serialize = FcSerializeCreate();
+    sets = calloc (ncache, sizeof (FcFontSet *));
+    subdirs = calloc (ncache, sizeof (FcStrSet *));
+    files = calloc (ncache, sizeof (FcDirFiles));
+    offsets = calloc (ncache + 2, sizeof (intptr_t));
+    entries = calloc (ncache, sizeof (FcCachePackDir));
+    if (!serialize || !sets || !subdirs || !files || !offsets || !entries)
+	goto bail;
+    FcSerializeReserve (serialize, sizeof (FcCachePack));
+    for (i = 0; i < ncache; i++) {
+	sets[i] = FcFontSetDeserialize (FcCacheSet (caches[i]));
+	subdirs[i] = FcStrSetCreateEx (FCSS_GROW_BY_64);
+	if (!sets[i] || !subdirs[i])
+	    goto bail;
+	for (j = 0; j < FcCacheNumSubdir (caches[i]); j++)
+	    if (!FcStrSetAdd (subdirs[i], FcCacheSubdir (caches[i], j)))
+		goto bail;
+	FcDirFilesFromCache (caches[i], &files[i]);
+	offsets[i] = serialize->size;
+	if (!FcDirCacheLayout (serialize, sets[i], FcCacheDir (caches[i]), subdirs[i],
+	                       FcDirCacheFilesToWrite (&files[i])))
+	    goto bail;
     }
+    offsets[ncache] = FcSerializeReserve (serialize, ncache * sizeof (FcCachePackDir));
+    offsets[ncache + 1] = serialize->size;
 
     /*
-     * Serialize font set
+     * The pack is filled and written one cache at a time, so only the
+     * largest cache is held in memory
      */
-    set_serialize = FcFontSetSerialize (serialize, set);
-    if (!set_serialize)
-	goto bail2;
-    cache->set = FcPtrToOffset (cache, set_serialize);
+    buf_size = offsets[0];
+    for (i = 0; i <= ncache; i++)
+	if (offsets[i + 1] - offsets[i] > buf_size)
+	    buf_size = offsets[i + 1] - offsets[i];
+    buf = malloc (buf_size);
+    if (!buf)
+	goto bail;
 
-    FcSerializeDestroy (serialize);
+    if (FcDebug() & FC_DBG_CACHE)
+	printf ("FcCacheCreatePackFile \"%s\": %d caches\n", pack_file, ncache);
 
-    FcCacheInsert (cache, NULL);
+    atomic = FcAtomicCreate (pack_file);
+    if (!atomic)
+	goto bail;
+    if (!FcAtomicLock (atomic))
+	goto bail;
+    fd = FcOpen ((char *)FcAtomicNewFile (atomic), O_RDWR | O_CREAT | O_BINARY, 0666);
+    if (fd == -1)
+	goto bail_unlock;
+
+    memset (buf, 0, offsets[0]);
+    pack = buf;
+    pack->magic = FC_CACHE_PACK_MAGIC_MMAP;
+    pack->version = FC_CACHE_VERSION_NUMBER;
+    pack->size = offsets[ncache + 1];
+    pack->dirs = offsets[ncache];
+    pack->dirs_count = ncache;
+    pack->fc_version = FcCacheVersion();
+    pack->generation = generation;
+    if (!FcCachePackWrite (fd, buf, offsets[0]))
+	goto bail_write;
+    for (i = 0; i < ncache; i++) {
+	intptr_t size = offsets[i + 1] - offsets[i];
+
+	memset (buf, 0, size);
+	serialize->linear = (char *)buf - offsets[i];
+	serialize->written = offsets[i];
+	cache = buf;
+	cache->magic = FC_CACHE_MAGIC_MMAP;
+	cache->size = size;
+	cache->checksum = caches[i]->checksum;
+	cache->checksum_nano = caches[i]->checksum_nano;
+	if (!FcDirCacheFill (serialize, cache, sets[i], FcCacheDir (caches[i]), subdirs[i],
+	                     FcDirCacheFilesToWrite (&files[i])))
+	    goto bail_write;
+	entries[i].dir = offsets[i] + cache->dir;
+	entries[i].cache = offsets[i];
+	if (!FcCachePackWrite (fd, buf, size))
+	    goto bail_write;
+    }
+    memset (buf, 0, offsets[ncache + 1] - offsets[ncache]);
+    memcpy (buf, entries, ncache * sizeof (FcCachePackDir));
+    if (!FcCachePackWrite (fd, buf, offsets[ncache + 1] - offsets[ncache]))
+	goto bail_write;
+    close (fd);
+    ret = FcAtomicReplaceOrig (atomic);
+    goto bail_unlock;
 
-    return cache;
+bail_write:
+    close (fd);
+    FcAtomicDeleteNew (atomic);
+bail_unlock:
+    FcAtomicUnlock (atomic);
+bail:
+    if (atomic)
+	FcAtomicDestroy (atomic);
+    free (buf);
+    if (serialize)
+	FcSerializeDestroy (serialize);
+    for (i = 0; i < ncache; i++) {
+	if (sets && sets[i])
+	    FcFontSetDestroy (sets[i]);
+	if (subdirs && subdirs[i])
+	    FcStrSetDestroy (subdirs[i]);
+	if (files && files[i].names)
+	    free (files[i].names);
+    }
+    free (sets);
+    free (subdirs);
+    free (files);
+    free (offsets);
+    free (entries);
+    if (pack_file)
+	FcStrFree (pack_file);
+    if (cache_dir)
+	FcStrFree (cache_dir);
+    /* after the fonts, which share charsets with their caches */
+    for (i = 0; i < ncache; i++)
+	FcDirCacheUnload (caches[i]);
+    if (caches)
+	free (caches);
+    if (dirs)
+	FcStrSetDestroy (dirs);
+    FcConfigDestroy (config);
 
-bail2:
-    free (cache);
-bail1:
-    FcSerializeDestroy (serialize);
-    return NULL;
+    return ret;
 }
 
-FcCache *
-FcDirCacheRebuild (FcCache *cache, struct stat *dir_stat, FcStrSet *dirs)
+/*
+ * Every cache directory carries a generation file which is replaced
+ * each time a cache in there is written; its stat data is enough to
+ * tell whether any cache has changed since it was last looked at.
+ * Returns 0 when no generation file could be read at all.
+ */
+#define FC_CACHE_GENERATION "GENERATION"
+
+uint64_t
+FcDirCacheGeneration (FcConfig *config)
 {
-    FcCache       *newp;
-    FcFontSet     *set = FcFontSetDeserialize (FcCacheSet (cache));
-    const FcChar8 *dir = FcCacheDir (cache);
+    FcStrList     *list;
+    FcChar8       *cache_dir, *gen_file;
+    const FcChar8 *sysroot = FcConfigGetSysRoot (config);
+    struct stat    statb;
+    uint64_t       generation = 0;
+    FcBool         found = FcFalse;
 
-    newp = FcDirCacheBuild (set, dir, dir_stat, dirs);
-    FcFontSetDestroy (set);
+    list = FcStrListCreate (config->cacheDirs);
+    if (!list)
+	return 0;
+    while ((cache_dir = FcStrListNext (list))) {
+	if (sysroot)
+	    gen_file = FcStrBuildFilename (sysroot, cache_dir, FC_CACHE_GENERATION, NULL);
+	else
+	    gen_file = FcStrBuildFilename (cache_dir, FC_CACHE_GENERATION, NULL);
+	if (!gen_file)
+	    continue;
+	generation *= 31;
+	if (FcStat (gen_file, &statb) == 0) {
+	    found = FcTrue;
+	    generation = (generation + statb.st_ino) * 31;
+	    generation = (generation + statb.st_size) * 31;
+	    generation = (generation + statb.st_mtime) * 31;
+#ifdef HAVE_STRUCT_STAT_ST_MTIM
+	    generation += statb.st_mtim.tv_nsec;
+#endif
+	}
+	FcStrFree (gen_file);
+    }
+    FcStrListDone (list);
+    if (!found)
+	return 0;
 
-    return newp;
+    return generation ? generation : 1;
 }
 
-/* write serialized state to the cache file */
-FcBool
-FcDirCacheWrite (FcCache *cache, FcConfig *config)
+static FcBool
+FcDirCacheBumpGeneration (const FcChar8 *cache_dir)
+{
+    FcChar8      *gen_file, *tmp = NULL;
+    char          buf[32];
+    unsigned long generation = 0;
+    int           fd, len;
+    FcBool        ret = FcFalse;
+
+    gen_file = FcStrBuildFilename (cache_dir, FC_CACHE_GENERATION, NULL);
+    if (!gen_file)
+	return FcFalse;
+    fd = FcOpen ((char *)gen_file, O_RDONLY | O_BINARY);
+    if (fd != -1) {
+	len = read (fd, buf, sizeof (buf) - 1);
+	close (fd);
+	if (len > 0) {
+	    buf[len] = 0;
+	    generation = strtoul (buf, NULL, 10);
+	}
+    }
+    /* The counter is informative only; renaming a new file in place is
+     * what makes the change visible to FcDirCacheGeneration.
+     */
+    tmp = FcStrPlus (gen_file, (const FcChar8 *)"-XXXXXX");
+    if (!tmp)
+	goto bail;
+    fd = FcMakeTempfile ((char *)tmp);
+    if (fd == -1)
+	goto bail;
+    len = snprintf (buf, sizeof (buf), "%lu\n", generation + 1);
+    if (write (fd, buf, len) != len) {
+	close (fd);
+	unlink ((char *)tmp);
+	goto bail;
+    }
+#ifndef _WIN32
+    fchmod (fd, 0644);
+#endif
+    close (fd);
+#ifdef _WIN32
+    unlink ((char *)gen_file);
+#endif
+    if (rename ((char *)tmp, (char *)gen_file) < 0) {
+	unlink ((char *)tmp);
+	goto bail;
+    }
+    ret = FcTrue;
+bail:
+    if (tmp)
+	FcStrFree (tmp);
+    FcStrFree (gen_file);
+
+    return ret;
+}
+
+/*
+ * Find the first cache directory which is writable, creating it when
+ * needed
+ */
+static FcChar8 *
+FcDirCacheWritableDir (FcConfig *config)
 {
-    FcChar8       *dir = FcCacheDir (cache);
-    FcChar8        cache_base[CACHEBASE_LEN];
-    FcChar8       *cache_hashed;
-    int            fd;
-    FcAtomic      *atomic;
     FcStrList     *list;
     FcChar8       *cache_dir = NULL;
     FcChar8       *test_dir, *d = NULL;
-    FcCacheSkip   *skip;
-    struct stat    cache_stat;
-    unsigned int   magic;
-    int            written;
     const FcChar8 *sysroot = FcConfigGetSysRoot (config);
     FcStrSet      *cpath;
 
-    /*
-     * Write it to the first directory in the list which is writable
-     */
-
     cpath = FcStrSetCreateEx (FCSS_GROW_BY_64);
     if (!cpath)
-	return FcFalse;
+	return NULL;
     list = FcStrListCreate (config->cacheDirs);
     if (!list) {
 	FcStrSetDestroy (cpath);
-	return FcFalse;
+	return NULL;
     }
     while ((test_dir = FcStrListNext (list))) {
 	if (d)
@@ -1462,14 +3147,63 @@ FcDirCacheWrite (FcCache *cache, FcConfig *config)
 	FcStrFree (d);
     FcStrSetDestroy (cpath);
     FcStrListDone (list);
+
+    return cache_dir;
+}
+
+/*
+ * Put the new cache file written through atomic in place and let the
+ * cache directory record the change
+ */
+static FcBool
+FcDirCacheWriteDone (FcConfig      *config,
+                     FcAtomic      *atomic,
+                     const FcChar8 *cache_dir,
+                     const FcChar8 *cache_base,
+                     FcCache       *cache)
+{
+    uint64_t generation;
+
+    generation = FcDirCacheGeneration (config);
+    if (!FcAtomicReplaceOrig (atomic))
+	return FcFalse;
+    FcDirCacheBumpGeneration (cache_dir);
+    FcDirCacheAddContents (cache_dir, cache_base, cache);
+    /* Don't let config take its own write as a change made elsewhere */
+    if (config->cacheGeneration == generation)
+	config->cacheGeneration = FcDirCacheGeneration (config);
+
+    return FcTrue;
+}
+
+/* write serialized state to the cache file */
+FcBool
+FcDirCacheWrite (FcCache *cache, FcConfig *config)
+{
+    FcChar8     *dir = FcCacheDir (cache);
+    FcChar8      cache_base[CACHEBASE_LEN];
+    FcChar8     *cache_hashed;
+    int          fd;
+    FcAtomic    *atomic;
+    FcChar8     *cache_dir;
+    FcCacheSkip *skip;
+    struct stat  cache_stat;
+    unsigned int magic;
+    int          written;
+
+    /*
+     * Write it to the first directory in the list which is writable
+     */
+    cache_dir = FcDirCacheWritableDir (config);
     if (!cache_dir)
 	return FcFalse;
 
     FcDirCacheBasenameMD5 (config, dir, cache_base);
     cache_hashed = FcStrBuildFilename (cache_dir, cache_base, NULL);
-    FcStrFree (cache_dir);
-    if (!cache_hashed)
+    if (!cache_hashed) {
+	FcStrFree (cache_dir);
 	return FcFalse;
+    }
 
     if (FcDebug() & FC_DBG_CACHE)
 	printf ("FcDirCacheWriteDir dir \"%s\" file \"%s\"\n",
@@ -1506,7 +3240,7 @@ FcDirCacheWrite (FcCache *cache, FcConfig *config)
     }
 
     close (fd);
-    if (!FcAtomicReplaceOrig (atomic))
+    if (!FcDirCacheWriteDone (config, atomic, cache_dir, cache_base, cache))
 	goto bail4;
 
     /* If the file is small, update the cache chain entry such that the
@@ -1529,6 +3263,7 @@ FcDirCacheWrite (FcCache *cache, FcConfig *config)
     }
 
     FcStrFree (cache_hashed);
+    FcStrFree (cache_dir);
     FcAtomicUnlock (atomic);
     FcAtomicDestroy (atomic);
     return FcTrue;
@@ -1541,9 +3276,140 @@ bail3:
     FcAtomicDestroy (atomic);
 bail1:
     FcStrFree (cache_hashed);
+    FcStrFree (cache_dir);
     return FcFalse;
 }
 
+#if defined(HAVE_MMAP) || defined(__CYGWIN__)
+/*
+ * Serialize a large cache into a shared mapping of the new cache file
+ * rather than into a private buffer which is then written out, which
+ * avoids holding a second copy of the serialized cache in memory.  The
+ * scanned fonts are still all in memory, this is not a streaming
+ * writer.  Returns NULL when the cache is small or can't be written
+ * that way.
+ */
+static FcCache *
+FcDirCacheWriteMapped (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs, FcDirFiles *files, FcConfig *config)
+{
+    FcSerialize *serialize;
+    FcChar8      cache_base[CACHEBASE_LEN];
+    FcChar8     *cache_hashed = NULL;
+    FcChar8     *cache_dir = NULL;
+    FcAtomic    *atomic = NULL;
+    FcCache     *cache = NULL;
+    void        *data = MAP_FAILED;
+    struct stat  fd_stat;
+    int          fd = -1;
+
+    serialize = FcSerializeCreate();
+    if (!serialize)
+	return NULL;
+    files = FcDirCacheFilesToWrite (files);
+    if (!FcDirCacheLayout (serialize, set, dir, dirs, files) ||
+        serialize->size < FC_CACHE_MIN_MMAP)
+	goto bail;
+
+    cache_dir = FcDirCacheWritableDir (config);
+    if (!cache_dir)
+	goto bail;
+    FcDirCacheBasenameMD5 (config, dir, cache_base);
+    cache_hashed = FcStrBuildFilename (cache_dir, cache_base, NULL);
+    if (!cache_hashed)
+	goto bail;
+
+    if (FcDebug() & FC_DBG_CACHE)
+	printf ("FcDirCacheWriteMapped dir \"%s\" file \"%s\" size %ld\n",
+	        dir, cache_hashed, (long)serialize->size);
+
+    atomic = FcAtomicCreate (cache_hashed);
+    if (!atomic)
+	goto bail;
+    if (!FcAtomicLock (atomic)) {
+	FcAtomicDestroy (atomic);
+	atomic = NULL;
+	goto bail;
+    }
+    fd = FcOpen ((char *)FcAtomicNewFile (atomic), O_RDWR | O_CREAT | O_BINARY, 0666);
+    if (fd == -1 || !FcCacheIsMmapSafe (fd))
+	goto bail;
+    /*
+     * Reserve the blocks up front where possible, a full disk would
+     * otherwise only show up as a fault while filling the mapping
+     */
+#  ifdef HAVE_POSIX_FALLOCATE
+    if (posix_fallocate (fd, 0, serialize->size) != 0)
+	goto bail;
+#  else
+    if (ftruncate (fd, serialize->size) < 0)
+	goto bail;
+#  endif
+    data = mmap (0, serialize->size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (data == MAP_FAILED)
+	goto bail;
+
+    /* The file starts out zeroed, just like FcDirCacheBuild's buffer */
+    serialize->linear = data;
+    ((FcCache *)data)->magic = FC_CACHE_MAGIC_MMAP;
+    ((FcCache *)data)->size = serialize->size;
+    ((FcCache *)data)->checksum = FcDirChecksum (dir_stat);
+    ((FcCache *)data)->checksum_nano = FcDirChecksumNano (dir_stat);
+    if (!FcDirCacheFill (serialize, data, set, dir, dirs, files))
+	goto bail;
+    if (mprotect (data, serialize->size, PROT_READ) < 0 ||
+        fstat (fd, &fd_stat) < 0)
+	goto bail;
+    close (fd);
+    fd = -1;
+    if (!FcDirCacheWriteDone (config, atomic, cache_dir, cache_base, data))
+	goto bail;
+
+    cache = data;
+    data = MAP_FAILED;
+    FcCacheInsert (cache, &fd_stat);
+
+bail:
+    if (data != MAP_FAILED)
+	munmap (data, serialize->size);
+    if (fd != -1)
+	close (fd);
+    if (atomic) {
+	if (!cache)
+	    FcAtomicDeleteNew (atomic);
+	FcAtomicUnlock (atomic);
+	FcAtomicDestroy (atomic);
+    }
+    if (cache_hashed)
+	FcStrFree (cache_hashed);
+    if (cache_dir)
+	FcStrFree (cache_dir);
+    FcSerializeDestroy (serialize);
+
+    return cache;
+}
+#endif
+
+/*
+ * Build the cache for the given contents and write it out, ignoring
+ * any troubles writing it
+ */
+FcCache *
+FcDirCacheBuildWrite (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs, FcDirFiles *files, FcConfig *config)
+{
+    FcCache *cache = NULL;
+
+#if defined(HAVE_MMAP) || defined(__CYGWIN__)
+    cache = FcDirCacheWriteMapped (set, dir, dir_stat, dirs, files, config);
+#endif
+    if (!cache) {
+	cache = FcDirCacheBuild (set, dir, dir_stat, dirs, files);
+	if (cache)
+	    FcDirCacheWrite (cache, config);
+    }
+
+    return cache;
+}
+
 FcBool
 FcDirCacheClean (const FcChar8 *cache_dir, FcBool verbose)
 {
@@ -1636,6 +3502,7 @@ FcDirCacheClean (const FcChar8 *cache_dir, FcBool verbose)
     }
 
     closedir (d);
+    FcDirCacheCleanContents (dir);
 bail0:
     FcStrFree (dir);
 bail:
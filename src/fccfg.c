@@ -40,9 +40,33 @@
 #  define S_ISFIFO(m) 0
 #endif
 
+#ifdef _WIN32
+#  define FC_READER_YIELD() Sleep (0)
+#elif defined(HAVE_PTHREAD) || defined(HAVE_SCHED_YIELD)
+#  include <sched.h>
+#  define FC_READER_YIELD() sched_yield()
+#else
+#  define FC_READER_YIELD() ((void)0)
+#endif
+
 static FcConfig *_fcConfig; /* MT-safe */
 static FcMutex  *_lock;
 
+/*
+ * Threads using the current config publish it in one of these slots
+ * (hazard pointers) instead of counting up its reference count, so that
+ * concurrent readers don't write to a shared cache line.  A config which
+ * is no longer current is only released once no slot holds it.
+ */
+#define FC_CONFIG_READERS 64
+
+struct _FcConfigReader {
+    FcConfig *config;
+    char      pad[64 - sizeof (FcConfig *)];
+};
+
+static FcConfigReader _readers[FC_CONFIG_READERS];
+
 static void
 lock_config (void)
 {
@@ -85,6 +109,21 @@ free_lock (void)
     }
 }
 
+/*
+ * Wait until no thread reads config, which must not be current any more
+ */
+static void
+FcConfigWaitReaders (FcConfig *config)
+{
+    int i;
+
+    fc_atomic_barrier();
+    for (i = 0; i < FC_CONFIG_READERS; i++) {
+	while (fc_atomic_ptr_get (&_readers[i].config) == config)
+	    FC_READER_YIELD();
+    }
+}
+
 static FcConfig *
 FcConfigEnsure (void)
 {
@@ -169,6 +208,8 @@ FcConfigCreate (void)
     config->rejectGlobs = FcStrSetCreate();
     if (!config->rejectGlobs)
 	goto bail5;
+    config->acceptGlobSet = NULL;
+    config->rejectGlobSet = NULL;
 
     config->acceptPatterns = FcFontSetCreate();
     if (!config->acceptPatterns)
@@ -191,11 +232,17 @@ FcConfigCreate (void)
 	goto bail9;
 
     config->maxObjects = 0;
-    for (set = FcSetSystem; set <= FcSetApplication; set++)
+    config->fontsSerial = 0;
+    for (set = FcSetSystem; set <= FcSetApplication; set++) {
 	config->fonts[set] = 0;
+	config->listIndex[set] = NULL;
+	config->listQueries[set] = 0;
+    }
 
     config->rescanTime = time (0);
     config->rescanInterval = 30;
+    config->cacheGeneration = 0;
+    config->cachePacks = NULL;
 
     config->expr_pool = NULL;
 
@@ -207,6 +254,9 @@ FcConfigCreate (void)
     config->availConfigFiles = FcStrSetCreate();
     if (!config->availConfigFiles)
 	goto bail10;
+    config->configFontDirs = FcStrSetCreate();
+    if (!config->configFontDirs)
+	goto bail11;
 
     config->filter_func = NULL;
     config->filter_data = NULL;
@@ -224,6 +274,8 @@ FcConfigCreate (void)
 
     return config;
 
+bail11:
+    FcStrSetDestroy (config->availConfigFiles);
 bail10:
     FcPtrListDestroy (config->rulesetList);
 bail9:
@@ -282,6 +334,15 @@ FcConfigUptoDate (FcConfig *config)
     if (!config)
 	return FcFalse;
 
+    /*
+     * A cache rewritten since the fonts were loaded is a change we
+     * can notice without looking at every directory
+     */
+    if (config->fonts[FcSetSystem] &&
+        config->cacheGeneration != FcDirCacheGeneration (config)) {
+	ret = FcFalse;
+	goto bail;
+    }
     config_time = FcConfigNewestFile (config->configFiles);
     config_dir_time = FcConfigNewestFile (config->configDirs);
     font_time = FcConfigNewestFile (config->fontDirs);
@@ -308,22 +369,85 @@ bail:
     return ret;
 }
 
+/*
+ * Check only the configuration files and directories, leaving
+ * out the font directories
+ */
+FcBool
+FcConfigFilesUptoDate (FcConfig *config)
+{
+    FcFileTime config_time, config_dir_time;
+
+    config_time = FcConfigNewestFile (config->configFiles);
+    config_dir_time = FcConfigNewestFile (config->configDirs);
+    if ((config_time.set && (config_time.time - config->rescanTime) > 0) ||
+        (config_dir_time.set && (config_dir_time.time - config->rescanTime) > 0))
+	return FcFalse;
+
+    return FcTrue;
+}
+
+static FcExprPool *
+FcExprPoolCreate (FcExprPool *parent)
+{
+    FcExprPool *pool;
+
+    pool = malloc (sizeof (FcExprPool));
+    if (!pool)
+	return NULL;
+    /* pools without any page don't need to be kept alive */
+    while (parent && !parent->pages)
+	parent = parent->parent;
+    if (parent)
+	FcRefInc (&parent->ref);
+    FcRefInit (&pool->ref, 1);
+    pool->parent = parent;
+    pool->pages = NULL;
+
+    return pool;
+}
+
+static void
+FcExprPoolDestroy (FcExprPool *pool)
+{
+    while (pool && FcRefDec (&pool->ref) == 1) {
+	FcExprPool *parent = pool->parent;
+	FcExprPage *page = pool->pages;
+
+	while (page) {
+	    FcExprPage *next = page->next_page;
+	    free (page);
+	    page = next;
+	}
+	free (pool);
+	pool = parent;
+    }
+}
+
 FcExpr *
 FcConfigAllocExpr (FcConfig *config)
 {
-    if (!config->expr_pool || config->expr_pool->next == config->expr_pool->end) {
+    FcExprPool *pool = config->expr_pool;
+
+    if (!pool) {
+	pool = FcExprPoolCreate (NULL);
+	if (!pool)
+	    return 0;
+	config->expr_pool = pool;
+    }
+    if (!pool->pages || pool->pages->next == pool->pages->end) {
 	FcExprPage *new_page;
 
 	new_page = malloc (sizeof (FcExprPage));
 	if (!new_page)
 	    return 0;
 
-	new_page->next_page = config->expr_pool;
+	new_page->next_page = pool->pages;
 	new_page->next = new_page->exprs;
-	config->expr_pool = new_page;
+	pool->pages = new_page;
     }
 
-    return config->expr_pool->next++;
+    return pool->pages->next++;
 }
 
 FcConfig *
@@ -356,26 +480,87 @@ FcConfigReference (FcConfig *config)
     return config;
 }
 
+/*
+ * Like FcConfigReference, but for the duration of a single call: the
+ * current config is published in a reader slot rather than referenced,
+ * and a config passed in is owned by the caller already.  Release it
+ * with FcConfigRelease.
+ */
+FcConfig *
+FcConfigAcquire (FcConfig *config, FcConfigHazard *hazard)
+{
+    FcConfigReader *reader = NULL;
+    FcChar32        hash;
+    int             i;
+
+    hazard->reader = NULL;
+    hazard->config = NULL;
+    if (config)
+	return config;
+
+    /* Threads run on different stacks; start probing from a slot
+     * picked by the address of the hazard to spread them out. */
+    hash = (FcChar32)(((uintptr_t)hazard >> 4) ^ ((uintptr_t)hazard >> 20)) * 2654435761U;
+retry:
+    config = fc_atomic_ptr_get (&_fcConfig);
+    if (config) {
+	for (i = 0; i < FC_CONFIG_READERS; i++) {
+	    reader = &_readers[(hash + i) & (FC_CONFIG_READERS - 1)];
+	    if (!fc_atomic_ptr_get (&reader->config) &&
+	        fc_atomic_ptr_cmpexch (&reader->config, NULL, config))
+		break;
+	}
+	if (i < FC_CONFIG_READERS) {
+	    /* Pairs with the barrier in FcConfigWaitReaders */
+	    fc_atomic_barrier();
+	    if (fc_atomic_ptr_get (&_fcConfig) != config) {
+		(void)fc_atomic_ptr_cmpexch (&reader->config, config, NULL);
+		goto retry;
+	    }
+	    hazard->reader = reader;
+	    hazard->config = config;
+	    return config;
+	}
+    }
+    /* Nothing loaded yet or all the slots are in use */
+    hazard->config = FcConfigReference (NULL);
+
+    return hazard->config;
+}
+
+void
+FcConfigRelease (FcConfigHazard *hazard)
+{
+    if (hazard->reader)
+	(void)fc_atomic_ptr_cmpexch (&hazard->reader->config, hazard->config, NULL);
+    else if (hazard->config)
+	FcConfigDestroy (hazard->config);
+}
+
 void
 FcConfigDestroy (FcConfig *config)
 {
     FcSetName   set;
-    FcExprPage *page;
     FcMatchKind k;
 
     if (config) {
 	if (FcRefDec (&config->ref) != 1)
 	    return;
 
+	/* Readers hold no reference, let them finish with the object table too */
+	if (fc_atomic_ptr_cmpexch (&_fcConfig, config, NULL))
+	    FcConfigWaitReaders (config);
 	FcObjectFini();
-	(void)fc_atomic_ptr_cmpexch (&_fcConfig, config, NULL);
 
 	FcStrSetDestroy (config->configDirs);
 	FcStrSetDestroy (config->fontDirs);
+	FcStrSetDestroy (config->configFontDirs);
 	FcStrSetDestroy (config->cacheDirs);
 	FcStrSetDestroy (config->configFiles);
 	FcStrSetDestroy (config->acceptGlobs);
 	FcStrSetDestroy (config->rejectGlobs);
+	FcGlobSetDestroy (config->acceptGlobSet);
+	FcGlobSetDestroy (config->rejectGlobSet);
 	FcFontSetDestroy (config->acceptPatterns);
 	FcFontSetDestroy (config->rejectPatterns);
 
@@ -383,16 +568,15 @@ FcConfigDestroy (FcConfig *config)
 	    FcPtrListDestroy (config->subst[k]);
 	FcPtrListDestroy (config->rulesetList);
 	FcStrSetDestroy (config->availConfigFiles);
-	for (set = FcSetSystem; set <= FcSetApplication; set++)
+	for (set = FcSetSystem; set <= FcSetApplication; set++) {
+	    FcListIndexDestroy (config->listIndex[set]);
 	    if (config->fonts[set])
 		FcFontSetDestroy (config->fonts[set]);
-
-	page = config->expr_pool;
-	while (page) {
-	    FcExprPage *next = page->next_page;
-	    free (page);
-	    page = next;
 	}
+
+	FcExprPoolDestroy (config->expr_pool);
+	if (config->cachePacks)
+	    FcPtrListDestroy (config->cachePacks);
 	if (config->sysRoot)
 	    FcStrFree (config->sysRoot);
 
@@ -414,6 +598,144 @@ FcConfigDestroy (FcConfig *config)
     }
 }
 
+static FcBool
+FcConfigCopyStrs (FcStrSet *dst, FcStrSet *src, FcBool triple)
+{
+    int i;
+
+    for (i = 0; i < src->num; i++) {
+	FcChar8 *s = src->strs[i];
+
+	if (triple) {
+	    if (!FcStrSetAddTriple (dst, s, FcStrTripleSecond (s), FcStrTripleThird (s)))
+		return FcFalse;
+	} else if (!FcStrSetAdd (dst, s))
+	    return FcFalse;
+    }
+    return FcTrue;
+}
+
+static FcBool
+FcConfigCopyPatterns (FcFontSet *dst, FcFontSet *src)
+{
+    int i;
+
+    for (i = 0; i < src->nfont; i++) {
+	FcPatternReference (src->fonts[i]);
+	if (!FcFontSetAdd (dst, src->fonts[i])) {
+	    FcPatternDestroy (src->fonts[i]);
+	    return FcFalse;
+	}
+    }
+    return FcTrue;
+}
+
+static FcBool
+FcConfigCopyRuleSets (FcPtrList *dst, FcPtrList *src)
+{
+    FcPtrListIter siter, diter;
+
+    FcPtrListIterInit (src, &siter);
+    for (; FcPtrListIterIsValid (src, &siter); FcPtrListIterNext (src, &siter)) {
+	FcRuleSet *rs = (FcRuleSet *)FcPtrListIterGetValue (src, &siter);
+
+	FcPtrListIterInitAtLast (dst, &diter);
+	FcRuleSetReference (rs);
+	if (!FcPtrListIterAdd (dst, &diter, rs)) {
+	    FcRuleSetDestroy (rs);
+	    return FcFalse;
+	}
+    }
+    return FcTrue;
+}
+
+/*
+ * Create a new configuration with everything config got from its
+ * configuration files, but without any fonts.  The rule sets and
+ * the expressions they refer to are shared rather than copied.
+ */
+FcConfig *
+FcConfigCopyParsed (FcConfig *config)
+{
+    FcConfig   *copy;
+    FcMatchKind k;
+
+    copy = FcConfigCreate();
+    if (!copy)
+	return NULL;
+
+    if (config->expr_pool) {
+	copy->expr_pool = FcExprPoolCreate (config->expr_pool);
+	if (!copy->expr_pool)
+	    goto bail;
+    }
+    for (k = FcMatchKindBegin; k < FcMatchKindEnd; k++)
+	if (!FcConfigCopyRuleSets (copy->subst[k], config->subst[k]))
+	    goto bail;
+    if (!FcConfigCopyRuleSets (copy->rulesetList, config->rulesetList))
+	goto bail;
+    copy->maxObjects = config->maxObjects;
+    copy->rescanInterval = config->rescanInterval;
+
+    if (!FcConfigCopyStrs (copy->configDirs, config->configDirs, FcFalse) ||
+        !FcConfigCopyStrs (copy->configFiles, config->configFiles, FcFalse) ||
+        !FcConfigCopyStrs (copy->availConfigFiles, config->availConfigFiles, FcFalse) ||
+        !FcConfigCopyStrs (copy->cacheDirs, config->cacheDirs, FcFalse) ||
+        !FcConfigCopyStrs (copy->fontDirs, config->configFontDirs, FcTrue) ||
+        !FcConfigCopyStrs (copy->configFontDirs, config->configFontDirs, FcTrue) ||
+        !FcConfigCopyStrs (copy->acceptGlobs, config->acceptGlobs, FcFalse) ||
+        !FcConfigCopyStrs (copy->rejectGlobs, config->rejectGlobs, FcFalse) ||
+        !FcConfigCopyPatterns (copy->acceptPatterns, config->acceptPatterns) ||
+        !FcConfigCopyPatterns (copy->rejectPatterns, config->rejectPatterns))
+	goto bail;
+
+    if (copy->sysRoot)
+	FcStrFree (copy->sysRoot);
+    copy->sysRoot = NULL;
+    if (config->sysRoot) {
+	copy->sysRoot = FcStrCopy (config->sysRoot);
+	if (!copy->sysRoot)
+	    goto bail;
+    }
+
+    return copy;
+
+bail:
+    FcConfigDestroy (copy);
+
+    return NULL;
+}
+
+/*
+ * Whether some scan rule tests the file name; fonts found in one file
+ * can't stand for a copy of it elsewhere then.
+ */
+FcBool
+FcConfigScanTestsFile (FcConfig *config)
+{
+    FcPtrListIter iter, iter2;
+    FcRuleSet    *rs;
+    FcRule       *r;
+
+    FcPtrListIterInit (config->subst[FcMatchScan], &iter);
+    for (; FcPtrListIterIsValid (config->subst[FcMatchScan], &iter);
+         FcPtrListIterNext (config->subst[FcMatchScan], &iter)) {
+	rs = (FcRuleSet *)FcPtrListIterGetValue (config->subst[FcMatchScan], &iter);
+	FcPtrListIterInit (rs->subst[FcMatchScan], &iter2);
+	for (; FcPtrListIterIsValid (rs->subst[FcMatchScan], &iter2);
+	     FcPtrListIterNext (rs->subst[FcMatchScan], &iter2)) {
+	    r = (FcRule *)FcPtrListIterGetValue (rs->subst[FcMatchScan], &iter2);
+	    for (; r; r = r->next) {
+		if (r->type == FcRuleTest &&
+		    FC_OBJ_ID (r->u.test->object) == FC_FILE_OBJECT)
+		    return FcTrue;
+	    }
+	}
+    }
+
+    return FcFalse;
+}
+
 /*
  * Add cache to configuration, adding fonts and directories
  */
@@ -563,6 +885,7 @@ FcConfigBuildFonts (FcConfig *config)
 	ret = FcFalse;
 	goto bail;
     }
+    config->cacheGeneration = FcDirCacheGeneration (config);
     if (FcDebug() & FC_DBG_FONTSET)
 	FcFontSetPrint (fonts);
 bail:
@@ -597,8 +920,10 @@ retry:
     if (!fc_atomic_ptr_cmpexch (&_fcConfig, cfg, config))
 	goto retry;
     unlock_config();
-    if (cfg)
+    if (cfg) {
+	FcConfigWaitReaders (cfg);
 	FcConfigDestroy (cfg);
+    }
 
     return FcTrue;
 }
@@ -609,6 +934,15 @@ FcConfigGetCurrent (void)
     return FcConfigEnsure();
 }
 
+/*
+ * Whether config is the current configuration, without loading one
+ */
+FcBool
+FcConfigIsCurrent (const FcConfig *config)
+{
+    return config && config == fc_atomic_ptr_get (&_fcConfig);
+}
+
 FcBool
 FcConfigAddConfigDir (FcConfig      *config,
                       const FcChar8 *d)
@@ -643,7 +977,8 @@ FcConfigAddFontDir (FcConfig      *config,
 	    printf ("%s%s%s%s\n", d, salt ? " (salt: " : "", salt ? (const char *)salt : "", salt ? ")" : "");
 	}
     }
-    return FcStrSetAddFilenamePairWithSalt (config->fontDirs, d, m, salt);
+    return FcStrSetAddFilenamePairWithSalt (config->fontDirs, d, m, salt) &&
+           FcStrSetAddFilenamePairWithSalt (config->configFontDirs, d, m, salt);
 }
 
 FcBool
@@ -652,7 +987,8 @@ FcConfigResetFontDirs (FcConfig *config)
     if (FcDebug() & FC_DBG_CACHE) {
 	printf ("Reset font directories!\n");
     }
-    return FcStrSetDeleteAll (config->fontDirs);
+    return FcStrSetDeleteAll (config->fontDirs) &&
+           FcStrSetDeleteAll (config->configFontDirs);
 }
 
 FcStrList *
@@ -815,9 +1151,13 @@ FcConfigSetFonts (FcConfig  *config,
                   FcFontSet *fonts,
                   FcSetName  set)
 {
+    FcListIndexDestroy (config->listIndex[set]);
+    config->listIndex[set] = NULL;
+    config->listQueries[set] = 0;
     if (config->fonts[set])
 	FcFontSetDestroy (config->fonts[set]);
     config->fonts[set] = fonts;
+    config->fontsSerial++;
 }
 
 FcConfig *
@@ -1958,11 +2298,12 @@ FcConfigSubstituteWithPat (FcConfig   *config,
     FcTest       **tst = NULL;
     FamilyTable    data;
     FamilyTable   *table = &data;
+    FcConfigHazard hazard;
 
     if (kind < FcMatchKindBegin || kind >= FcMatchKindEnd)
 	return FcFalse;
 
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	return FcFalse;
 
@@ -2235,7 +2576,7 @@ bail1:
 	free (value);
     if (tst)
 	free (tst);
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return retval;
 }
@@ -2924,15 +3265,39 @@ FcConfigGlobAdd (FcConfig      *config,
     ret = FcStrSetAdd (set, s);
     FcStrFree (realglob);
     FcStrFree (cwd);
+    /* Globs are only added while loading; drop any stale compiled set */
+    if (ret) {
+	FcGlobSet **gs = accept ? &config->acceptGlobSet : &config->rejectGlobSet;
+
+	FcGlobSetDestroy (*gs);
+	*gs = NULL;
+    }
     return ret;
 }
 
 static FcBool
 FcConfigGlobsMatch (const FcStrSet *globs,
+                    FcGlobSet     **compiled,
                     const FcChar8  *string)
 {
-    int i;
+    FcGlobSet *gs;
+    int        i;
+
+    if (!globs->num)
+	return FcFalse;
+
+    gs = fc_atomic_ptr_get (compiled);
+    if (!gs) {
+	gs = FcGlobSetCreate (globs);
+	if (gs && !fc_atomic_ptr_cmpexch (compiled, NULL, gs)) {
+	    FcGlobSetDestroy (gs);
+	    gs = fc_atomic_ptr_get (compiled);
+	}
+    }
+    if (gs)
+	return FcGlobSetMatch (gs, string);
 
+    /* Out of memory; fall back to trying every glob */
     for (i = 0; i < globs->num; i++)
 	if (FcStrGlobMatch (globs->strs[i], string))
 	    return FcTrue;
@@ -2943,9 +3308,9 @@ FcBool
 FcConfigAcceptFilename (FcConfig      *config,
                         const FcChar8 *filename)
 {
-    if (FcConfigGlobsMatch (config->acceptGlobs, filename))
+    if (FcConfigGlobsMatch (config->acceptGlobs, &config->acceptGlobSet, filename))
 	return FcTrue;
-    if (FcConfigGlobsMatch (config->rejectGlobs, filename))
+    if (FcConfigGlobsMatch (config->rejectGlobs, &config->rejectGlobSet, filename))
 	return FcFalse;
     return FcTrue;
 }
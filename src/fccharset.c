@@ -270,6 +270,39 @@ FcCharSetAddChar (FcCharSet *fcs, FcChar32 ucs4)
     return FcTrue;
 }
 
+/*
+ * Add the chars from first to last, setting whole words of each leaf
+ */
+FcBool
+FcCharSetAddRange (FcCharSet *fcs, FcChar32 first, FcChar32 last)
+{
+    FcCharLeaf *leaf;
+    FcChar32    ucs4, leaf_last, lo, hi, i;
+
+    if (fcs == NULL || FcRefIsConst (&fcs->ref))
+	return FcFalse;
+    for (ucs4 = first; ucs4 <= last; ucs4 = leaf_last + 1) {
+	leaf_last = (ucs4 | 0xff) < last ? (ucs4 | 0xff) : last;
+	leaf = FcCharSetFindLeafCreate (fcs, ucs4);
+	if (!leaf)
+	    return FcFalse;
+	lo = ucs4 & 0xff;
+	hi = leaf_last & 0xff;
+	for (i = lo >> 5; i <= hi >> 5; i++) {
+	    FcChar32 mask = ~0U;
+
+	    if (i == lo >> 5)
+		mask &= ~0U << (lo & 0x1f);
+	    if (i == hi >> 5)
+		mask &= ~0U >> (31 - (hi & 0x1f));
+	    leaf->map[i] |= mask;
+	}
+	if (leaf_last == last)
+	    break;
+    }
+    return FcTrue;
+}
+
 FcBool
 FcCharSetDelChar (FcCharSet *fcs, FcChar32 ucs4)
 {
@@ -1215,17 +1248,20 @@ FcCharSetSerializeAlloc (FcSerialize *serialize, const FcCharSet *cs)
     FcChar16 *numbers;
     int       i;
 
-    if (!FcRefIsConst (&cs->ref)) {
-	if (!serialize->cs_freezer) {
-	    serialize->cs_freezer = FcCharSetFreezerCreate();
-	    if (!serialize->cs_freezer)
-		return FcFalse;
-	}
-	if (FcCharSetFindFrozen (serialize->cs_freezer, cs))
-	    return FcTrue;
-
-	cs = FcCharSetFreeze (serialize->cs_freezer, cs);
+    /* Charsets coming from other caches are frozen too, so that a
+     * cache holds a single copy of each whichever cache it came from
+     */
+    if (!serialize->cs_freezer) {
+	serialize->cs_freezer = FcCharSetFreezerCreate();
+	if (!serialize->cs_freezer)
+	    return FcFalse;
     }
+    if (FcCharSetFindFrozen (serialize->cs_freezer, cs))
+	return FcTrue;
+
+    cs = FcCharSetFreeze (serialize->cs_freezer, cs);
+    if (!cs)
+	return FcFalse;
 
     leaves = FcCharSetLeaves (cs);
     numbers = FcCharSetNumbers (cs);
@@ -1252,7 +1288,7 @@ FcCharSetSerialize (FcSerialize *serialize, const FcCharSet *cs)
     FcCharLeaf *leaf, *leaf_serialized;
     int         i;
 
-    if (!FcRefIsConst (&cs->ref) && serialize->cs_freezer) {
+    if (serialize->cs_freezer) {
 	cs = FcCharSetFindFrozen (serialize->cs_freezer, cs);
 	if (!cs)
 	    return NULL;
@@ -1261,6 +1297,8 @@ FcCharSetSerialize (FcSerialize *serialize, const FcCharSet *cs)
     cs_serialized = FcSerializePtr (serialize, cs);
     if (!cs_serialized)
 	return NULL;
+    if (FcSerializeWritten (serialize, cs))
+	return cs_serialized;
 
     FcRefSetConst (&cs_serialized->ref);
     cs_serialized->num = cs->num;
@@ -1287,7 +1325,9 @@ FcCharSetSerialize (FcSerialize *serialize, const FcCharSet *cs)
 	    leaf_serialized = FcSerializePtr (serialize, leaf);
 	    if (!leaf_serialized)
 		return NULL;
-	    *leaf_serialized = *leaf;
+	    /* leaves are shared between charsets */
+	    if (!FcSerializeWritten (serialize, leaf))
+		*leaf_serialized = *leaf;
 	    leaves_serialized[i] = FcPtrToOffset (leaves_serialized,
 	                                          leaf_serialized);
 	    numbers_serialized[i] = numbers[i];
@@ -41,6 +41,9 @@
 #  include <unistd.h>
 #endif
 #include <locale.h>
+#if !defined(FC_NO_MT) && defined(HAVE_PTHREAD)
+#  include <pthread.h>
+#endif
 #include <stdarg.h>
 #include <stdlib.h>
 #include <string.h>
@@ -396,6 +399,71 @@ FcLocaleDestroy (FcLocale locale)
 #endif
 }
 
+#if !defined(FC_NO_MT) && defined(HAVE_PTHREAD)
+typedef struct _FcJobs {
+    FcJobFunc       func;
+    void           *closure;
+    int             nitems;
+    fc_atomic_int_t next;
+} FcJobs;
+
+static void *
+FcJobsWorker (void *arg)
+{
+    FcJobs *jobs = arg;
+    int     i;
+
+    while ((i = fc_atomic_int_add (jobs->next, 1)) < jobs->nitems)
+	jobs->func (i, jobs->closure);
+
+    return NULL;
+}
+#endif
+
+/*
+ * Call func for every index in [0, nitems) using up to njobs threads,
+ * the calling thread included.  Items are handed out in increasing
+ * order but may complete in any order; it is up to the caller to
+ * store the results per index.  Falls back to a plain loop when
+ * threads aren't available or can't be created.
+ */
+void
+FcRunJobs (int njobs, int nitems, FcJobFunc func, void *closure)
+{
+#if !defined(FC_NO_MT) && defined(HAVE_PTHREAD)
+    FcJobs     jobs;
+    pthread_t *threads = NULL;
+    int        nthreads = 0, i;
+
+    if (njobs > nitems)
+	njobs = nitems;
+    if (njobs > 1)
+	threads = malloc (sizeof (pthread_t) * (njobs - 1));
+    jobs.func = func;
+    jobs.closure = closure;
+    jobs.nitems = nitems;
+    jobs.next = 0;
+    if (threads) {
+	for (i = 0; i < njobs - 1; i++) {
+	    if (pthread_create (&threads[nthreads], NULL, FcJobsWorker, &jobs) != 0)
+		break;
+	    nthreads++;
+	}
+    }
+    FcJobsWorker (&jobs);
+    for (i = 0; i < nthreads; i++)
+	pthread_join (threads[i], NULL);
+    if (threads)
+	free (threads);
+#else
+    int i;
+
+    (void)njobs;
+    for (i = 0; i < nitems; i++)
+	func (i, closure);
+#endif
+}
+
 #define __fccompat__
 #include "fcaliastail.h"
 #undef __fccompat__
@@ -48,12 +48,10 @@ static const struct {
 FcStrSet *
 FcConfigGetDefaultLangs (FcConfig *config)
 {
-    FcStrSet *result;
+    FcConfigHazard hazard;
+    FcStrSet      *result;
 
-    if (!config) {
-	config = FcConfigGetCurrent();
-    }
-    FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 retry:
     result = (FcStrSet *)fc_atomic_ptr_get (&config->default_langs);
     if (!result) {
@@ -89,7 +87,7 @@ retry:
 	    goto retry;
 	}
     }
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return result;
 }
@@ -103,12 +101,10 @@ FcGetDefaultLangs (void)
 FcChar8 *
 FcConfigGetDefaultLang (FcConfig *config)
 {
-    FcChar8 *lang;
+    FcConfigHazard hazard;
+    FcChar8       *lang;
 
-    if (!config) {
-	config = FcConfigGetCurrent();
-    }
-    FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 retry:
     lang = fc_atomic_ptr_get (&config->default_lang);
     if (!lang) {
@@ -120,7 +116,7 @@ retry:
 	    goto retry;
 	}
     }
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return lang;
 }
@@ -134,12 +130,10 @@ FcGetDefaultLang (void)
 FcChar8 *
 FcConfigGetPrgname (FcConfig *config)
 {
-    FcChar8 *prgname;
+    FcConfigHazard hazard;
+    FcChar8       *prgname;
 
-    if (!config) {
-	config = FcConfigGetCurrent();
-    }
-    FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 retry:
     prgname = fc_atomic_ptr_get (&config->prgname);
     if (!prgname) {
@@ -229,7 +223,7 @@ retry:
     if (prgname && !prgname[0]) {
 	prgname = NULL;
     }
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return prgname;
 }
@@ -243,12 +237,10 @@ FcGetPrgname (void)
 FcChar8 *
 FcConfigGetDesktopName (FcConfig *config)
 {
-    FcChar8 *desktop_name;
+    FcConfigHazard hazard;
+    FcChar8       *desktop_name;
 
-    if (!config) {
-	config = FcConfigGetCurrent();
-    }
-    FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 retry:
     desktop_name = fc_atomic_ptr_get (&config->desktop_name);
     if (!desktop_name) {
@@ -272,7 +264,7 @@ retry:
     if (desktop_name && !desktop_name[0]) {
 	desktop_name = NULL;
     }
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return desktop_name;
 }
@@ -287,12 +279,13 @@ void
 FcConfigSetDefaultSubstitute (FcConfig  *config,
                               FcPattern *pattern)
 {
-    FcPatternIter iter;
-    FcValue       v, namelang, v2;
-    int           i;
-    double        dpi, size, scale, pixelsize;
+    FcConfigHazard hazard;
+    FcPatternIter  iter;
+    FcValue        v, namelang, v2;
+    int            i;
+    double         dpi, size, scale, pixelsize;
 
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 
     if (!FcPatternFindObjectIter (pattern, &iter, FC_WEIGHT_OBJECT))
 	FcPatternObjectAddInteger (pattern, FC_WEIGHT_OBJECT, FC_WEIGHT_NORMAL);
@@ -391,7 +384,7 @@ FcConfigSetDefaultSubstitute (FcConfig  *config,
     if (!FcPatternFindObjectIter (pattern, &iter, FC_ORDER_OBJECT))
 	FcPatternObjectAddInteger (pattern, FC_ORDER_OBJECT, 0);
 
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 }
 
 void
@@ -201,24 +201,70 @@ cmpstringp (const void *p1, const void *p2)
     return strcmp (*(char **)p1, *(char **)p2);
 }
 
+/*
+ * Number of threads to query the files of a directory on
+ */
+static int
+FcDirScanJobs (void)
+{
+    const char *env = getenv ("FONTCONFIG_SCAN_JOBS");
+    int         jobs;
+
+    if (!env)
+	return 1;
+    jobs = atoi (env);
+    if (jobs < 1)
+	return 1;
+    if (jobs > 64)
+	jobs = 64;
+
+    return jobs;
+}
+
+typedef struct _FcDirScanFiles {
+    FcDirScanFile *files;
+    int           *query; /* indices of the files to query */
+    FcConfig      *config;
+} FcDirScanFiles;
+
+static void
+FcDirScanFileJob (int i, void *closure)
+{
+    FcDirScanFiles *scan = closure;
+    FcDirScanFile  *f = &scan->files[scan->query[i]];
+
+    f->set = FcFontSetCreate();
+    if (f->set)
+	FcFileScanFontConfig (f->set, f->file, scan->config);
+}
+
+/*
+ * Scan dir as FcDirScanConfig does, reusing the fonts of old (an
+ * outdated cache of dir) for the files which haven't changed since
+ * it was built, and with copies set, the fonts of identical files
+ * recorded by other caches.  The files which provided fonts are
+ * recorded in files when it is not NULL.
+ */
 FcBool
-FcDirScanConfig (FcFontSet     *set,
-                 FcStrSet      *dirs,
-                 const FcChar8 *dir,
-                 FcBool         force, /* XXX unused */
-                 FcConfig      *config)
+FcDirScanIncremental (FcFontSet     *set,
+                      FcStrSet      *dirs,
+                      const FcChar8 *dir,
+                      FcCache       *old,
+                      FcBool         copies,
+                      FcDirFiles    *files,
+                      FcConfig      *config)
 {
     DIR           *d;
     struct dirent *e;
-    FcStrSet      *files;
+    FcStrSet      *names;
     FcChar8       *file_prefix = NULL, *s_dir = NULL;
     FcChar8       *base;
     const FcChar8 *sysroot = FcConfigGetSysRoot (config);
     FcBool         ret = FcTrue;
-    int            i;
-
-    if (!force)
-	return FcFalse;
+    FcDirScanFiles scan;
+    FcFontSet     *old_set = old ? FcCacheSet (old) : NULL;
+    int            i, j, nquery = 0, jobs;
+    size_t         prefix_len;
 
     if (!set && !dirs)
 	return FcTrue;
@@ -241,6 +287,7 @@ FcDirScanConfig (FcFontSet     *set,
     strcpy ((char *)file_prefix, (char *)s_dir);
     strcat ((char *)file_prefix, FC_DIR_SEPARATOR_S);
     base = file_prefix + strlen ((char *)file_prefix);
+    prefix_len = base - file_prefix;
 
     if (FcDebug() & FC_DBG_SCAN)
 	printf ("\tScanning dir %s\n", s_dir);
@@ -253,8 +300,8 @@ FcDirScanConfig (FcFontSet     *set,
 	goto bail;
     }
 
-    files = FcStrSetCreateEx (FCSS_ALLOW_DUPLICATES | FCSS_GROW_BY_64);
-    if (!files) {
+    names = FcStrSetCreateEx (FCSS_ALLOW_DUPLICATES | FCSS_GROW_BY_64);
+    if (!names) {
 	ret = FcFalse;
 	goto bail1;
     }
@@ -266,7 +313,7 @@ FcDirScanConfig (FcFontSet     *set,
 	    continue;
 	if (strlen (e->d_name) < FC_MAX_FILE_LEN) {
 	    strcpy ((char *)base, (char *)e->d_name);
-	    if (!FcStrSetAdd (files, file_prefix)) {
+	    if (!FcStrSetAdd (names, file_prefix)) {
 		ret = FcFalse;
 		goto bail2;
 	    }
@@ -276,17 +323,106 @@ FcDirScanConfig (FcFontSet     *set,
     /*
      * Sort files to make things prettier
      */
-    if (files->num)
-	qsort (files->strs, files->num, sizeof (FcChar8 *), cmpstringp);
+    if (names->num)
+	qsort (names->strs, names->num, sizeof (FcChar8 *), cmpstringp);
+
+    scan.config = config;
+    scan.files = calloc (names->num ? names->num : 1, sizeof (FcDirScanFile));
+    scan.query = malloc ((names->num ? names->num : 1) * sizeof (int));
+    if (!scan.files || !scan.query) {
+	ret = FcFalse;
+	goto bail3;
+    }
 
     /*
-     * Scan file files to build font patterns
+     * Pick up the fonts of the files which didn't change since old
+     * was built, and list the others for querying
      */
-    for (i = 0; i < files->num; i++)
-	FcFileScanConfig (set, dirs, files->strs[i], config);
+    for (i = 0; i < names->num; i++) {
+	FcDirScanFile     *f = &scan.files[i];
+	const FcCacheFile *cf;
+
+	f->file = names->strs[i];
+	f->name = f->file + prefix_len;
+	f->stat_ok = FcStat (f->file, &f->statb) == 0;
+	f->is_dir = f->stat_ok && S_ISDIR (f->statb.st_mode);
+	if (f->is_dir || !set)
+	    continue;
+	if (old_set && f->stat_ok &&
+	    (cf = FcDirCacheFindFile (old, f->name, &f->statb))) {
+	    f->set = FcFontSetCreate();
+	    if (!f->set)
+		continue;
+	    for (j = 0; j < cf->nfont; j++) {
+		FcPattern *font = FcPatternDuplicate (FcFontSetFont (old_set, cf->first + j));
+
+		if (!font || !FcFontSetAdd (f->set, font)) {
+		    if (font)
+			FcPatternDestroy (font);
+		    FcFontSetDestroy (f->set);
+		    f->set = NULL;
+		    break;
+		}
+	    }
+	    if (f->set)
+		continue;
+	}
+	scan.query[nquery++] = i;
+    }
+    if (old && (FcDebug() & FC_DBG_CACHE))
+	printf ("FcDirScanIncremental dir \"%s\": %d of %d files unchanged\n",
+	        dir, names->num - nquery, names->num);
+    if (copies)
+	nquery = FcDirCacheFindCopies (config, dir, scan.files, scan.query, nquery);
+
+    /*
+     * Query the rest on several threads; keep it serial when
+     * debugging so that the output stays readable
+     */
+    jobs = FcDirScanJobs();
+    if (FcDebug() & (FC_DBG_SCAN | FC_DBG_SCANV))
+	jobs = 1;
+    FcRunJobs (jobs, nquery, FcDirScanFileJob, &scan);
 
+    /*
+     * Collect the results in the order of the files
+     */
+    for (i = 0; i < names->num; i++) {
+	FcDirScanFile *f = &scan.files[i];
+	int            first;
+
+	if (f->is_dir) {
+	    FcFileScanConfig (set, dirs, f->file, config);
+	    continue;
+	}
+	if (!f->set)
+	    continue;
+	first = set->nfont;
+	for (j = 0; j < f->set->nfont; j++) {
+	    if (!FcFontSetAdd (set, f->set->fonts[j]))
+		FcPatternDestroy (f->set->fonts[j]);
+	}
+	/* the patterns belong to set now */
+	f->set->nfont = 0;
+	FcFontSetDestroy (f->set);
+	f->set = NULL;
+	if (files && f->stat_ok &&
+	    !FcDirFilesAdd (files, f->name, &f->statb,
+	                    first, set->nfont - first))
+	    ret = FcFalse;
+    }
+
+bail3:
+    if (scan.files) {
+	for (i = 0; i < names->num; i++)
+	    if (scan.files[i].set)
+		FcFontSetDestroy (scan.files[i].set);
+	free (scan.files);
+    }
+    if (scan.query)
+	free (scan.query);
 bail2:
-    FcStrSetDestroy (files);
+    FcStrSetDestroy (names);
 bail1:
     closedir (d);
 bail:
@@ -298,6 +434,19 @@ bail:
     return ret;
 }
 
+FcBool
+FcDirScanConfig (FcFontSet     *set,
+                 FcStrSet      *dirs,
+                 const FcChar8 *dir,
+                 FcBool         force, /* XXX unused */
+                 FcConfig      *config)
+{
+    if (!force)
+	return FcFalse;
+
+    return FcDirScanIncremental (set, dirs, dir, NULL, FcFalse, NULL, config);
+}
+
 FcBool
 FcDirScan (FcFontSet     *set,
            FcStrSet      *dirs,
@@ -322,14 +471,17 @@ FcDirScan (FcFontSet     *set,
 }
 
 /*
- * Scan the specified directory and construct a cache of its contents
+ * Scan the specified directory and construct a cache of its contents;
+ * unless forced, fonts already in the caches are reused for the files
+ * which haven't changed and for copies of files scanned elsewhere
  */
 FcCache *
-FcDirCacheScan (const FcChar8 *dir, FcConfig *config)
+FcDirCacheScan (const FcChar8 *dir, FcBool force, FcConfig *config)
 {
     FcStrSet      *dirs;
     FcFontSet     *set;
-    FcCache       *cache = NULL;
+    FcCache       *cache = NULL, *old = NULL;
+    FcDirFiles    *files;
     struct stat    dir_stat;
     const FcChar8 *sysroot = FcConfigGetSysRoot (config);
     FcChar8       *d;
@@ -361,35 +513,39 @@ FcDirCacheScan (const FcChar8 *dir, FcConfig *config)
     if (!dirs)
 	goto bail1;
 
+    files = FcDirFilesCreate();
+    if (!files)
+	goto bail2;
+
 #ifndef _WIN32
     fd = FcDirCacheLock (dir, config);
 #endif
+    if (!force)
+	old = FcDirCacheLoadOutdated (dir, config);
     /*
      * Scan the dir
      */
-    /* Do not pass sysroot here. FcDirScanConfig() do take care of it */
-    if (!FcDirScanConfig (set, dirs, dir, FcTrue, config))
-	goto bail2;
+    /* Do not pass sysroot here. FcDirScanIncremental() do take care of it */
+    if (!FcDirScanIncremental (set, dirs, dir, old, !force, files, config))
+	goto bail3;
 
     /*
-     * Build the cache object
+     * Build the cache object and write out the cache file
      */
-    cache = FcDirCacheBuild (set, dir, &dir_stat, dirs);
-    if (!cache)
-	goto bail2;
-
-    /*
-     * Write out the cache file, ignoring any troubles
-     */
-    FcDirCacheWrite (cache, config);
+    cache = FcDirCacheBuildWrite (set, dir, &dir_stat, dirs, files, config);
 
-bail2:
+bail3:
 #ifndef _WIN32
     FcDirCacheUnlock (fd);
 #endif
+    FcDirFilesDestroy (files);
+bail2:
     FcStrSetDestroy (dirs);
 bail1:
     FcFontSetDestroy (set);
+    /* after the fonts, which may share its charsets */
+    if (old)
+	FcDirCacheUnload (old);
 bail:
     FcStrFree (d);
 
@@ -470,14 +626,16 @@ FcDirCacheRead (const FcChar8 *dir, FcBool force, FcConfig *config)
     FcCache *cache = NULL;
 
     config = FcConfigReference (config);
-    /* Try to use existing cache file */
+    /* Try to use a cache pack or an existing cache file */
     if (!force)
+	cache = FcDirCacheLoadPacked (dir, config);
+    if (!cache && !force)
 	cache = FcDirCacheLoad (dir, config, NULL);
 
     /* Not using existing cache file, construct new cache */
     if (!cache) {
 	FcDirCacheDeleteUUID (dir, config);
-	cache = FcDirCacheScan (dir, config);
+	cache = FcDirCacheScan (dir, force, config);
     }
     FcConfigDestroy (config);
 
@@ -24,6 +24,7 @@
 
 #include "fcint.h"
 
+#include <float.h>
 #include <stdarg.h>
 #include <stdlib.h>
 #include <string.h>
@@ -65,6 +66,7 @@
  * fclist	fc-list default
  * fccat	fc-cat default
  * pkgkit	PackageKit package tag format
+ * json	JSON object
  *
  *
  * Some ideas for future syntax extensions:
@@ -247,417 +249,612 @@ read_chars (FcFormatContext *c,
     return FcTrue;
 }
 
-static FcBool
-FcPatternFormatToBuf (FcPattern     *pat,
-                      const FcChar8 *format,
-                      FcStrBuf      *buf);
-
-static FcBool
-interpret_builtin (FcFormatContext *c,
-                   FcPattern       *pat,
-                   FcStrBuf        *buf)
+/*
+ * Return the length of the well-formed UTF-8 sequence at str, or 0
+ */
+static int
+json_utf8_len (const FcChar8 *str,
+               int            len)
 {
-    FcChar8 *new_str;
-    FcBool   ret;
-
-    if (!expect_char (c, '=') ||
-        !read_word (c))
-	return FcFalse;
-
-    /* try simple builtins first */
-    if (0) {
-    }
-#define BUILTIN(name, func)                                \
-    else if (0 == strcmp ((const char *)c->word, name)) do \
-    {                                                      \
-	new_str = func (pat);                              \
-	ret = FcTrue;                                      \
-    }                                                      \
-    while (0)
-    BUILTIN ("unparse", FcNameUnparse);
-    /* BUILTIN ("verbose",  FcPatternPrint); XXX */
-#undef BUILTIN
-    else ret = FcFalse;
+    static const FcChar32 min[] = { 0, 0, 0x80, 0x800, 0x10000 };
+    FcChar32              ucs4;
+    int                   n = FcUtf8ToUcs4 (str, &ucs4, len);
+
+    if (n <= 0 || n > 4 || ucs4 < min[n] || ucs4 > 0x10ffff ||
+        (ucs4 >= 0xd800 && ucs4 <= 0xdfff))
+	return 0;
+    return n;
+}
 
-    if (ret) {
-	if (new_str) {
-	    FcStrBufString (buf, new_str);
-	    FcStrFree (new_str);
-	    return FcTrue;
-	} else
-	    return FcFalse;
-    }
+/*
+ * Bytes which are not UTF-8 are written as U+FFFD
+ */
+static void
+json_string (FcStrBuf      *buf,
+             const FcChar8 *str)
+{
+    int len = strlen ((const char *)str), n;
 
-    /* now try our custom formats */
-    if (0) {
+    FcStrBufChar (buf, '"');
+    while (len > 0) {
+	n = 1;
+	if (*str == '"' || *str == '\\') {
+	    FcStrBufChar (buf, '\\');
+	    FcStrBufChar (buf, *str);
+	} else if (*str < 0x20)
+	    FcStrBufFormat (buf, "\\u%04x", *str);
+	else if (*str < 0x80)
+	    FcStrBufChar (buf, *str);
+	else if ((n = json_utf8_len (str, len)))
+	    FcStrBufData (buf, str, n);
+	else {
+	    FcStrBufString (buf, (const FcChar8 *)"\\ufffd");
+	    n = 1;
+	}
+	str += n;
+	len -= n;
     }
-#define BUILTIN(name, format)                           \
-    else if (0 == strcmp ((const char *)c->word, name)) \
-	ret = FcPatternFormatToBuf (pat, (const FcChar8 *)format, buf)
-    BUILTIN ("fccat", FCCAT_FORMAT);
-    BUILTIN ("fcmatch", FCMATCH_FORMAT);
-    BUILTIN ("fclist", FCLIST_FORMAT);
-    BUILTIN ("pkgkit", PKGKIT_FORMAT);
-#undef BUILTIN
-    else ret = FcFalse;
-
-    if (!ret)
-	message ("unknown builtin \"%s\"",
-	         c->word);
-
-    return ret;
+    FcStrBufChar (buf, '"');
 }
 
-static FcBool
-interpret_expr (FcFormatContext *c,
-                FcPattern       *pat,
-                FcStrBuf        *buf,
-                FcChar8          term);
-
-static FcBool
-interpret_subexpr (FcFormatContext *c,
-                   FcPattern       *pat,
-                   FcStrBuf        *buf)
+/*
+ * JSON has no infinities or NaNs, they are written as null.
+ * FcStrBufFormat formats in the C locale, so the decimal point is
+ * always a dot.
+ */
+static void
+json_number (FcStrBuf *buf,
+             double    d)
 {
-    return expect_char (c, '{') &&
-           interpret_expr (c, pat, buf, '}') &&
-           expect_char (c, '}');
+    if (d >= -DBL_MAX && d <= DBL_MAX)
+	FcStrBufFormat (buf, "%g", d);
+    else
+	FcStrBufString (buf, (const FcChar8 *)"null");
 }
 
-static FcBool
-maybe_interpret_subexpr (FcFormatContext *c,
-                         FcPattern       *pat,
-                         FcStrBuf        *buf)
+/*
+ * Charsets are written as the list of the [first, last] ranges of
+ * chars they hold
+ */
+static void
+json_charset (FcStrBuf        *buf,
+              const FcCharSet *cs)
 {
-    return (*c->format == '{') ? interpret_subexpr (c, pat, buf) : FcTrue;
+    FcChar32 map[FC_CHARSET_MAP_SIZE], next, ucs4;
+    FcChar32 first = 0, last = 0;
+    FcBool   in_range = FcFalse;
+    int      i, j;
+
+    FcStrBufChar (buf, '[');
+    for (ucs4 = FcCharSetFirstPage (cs, map, &next);
+         ucs4 != FC_CHARSET_DONE;
+         ucs4 = FcCharSetNextPage (cs, map, &next)) {
+	for (i = 0; i < FC_CHARSET_MAP_SIZE; i++) {
+	    for (j = 0; j < 32; j++) {
+		FcChar32 c = ucs4 + i * 32 + j;
+
+		if (!(map[i] & (1U << j)))
+		    continue;
+		if (in_range && c == last + 1) {
+		    last = c;
+		    continue;
+		}
+		if (in_range)
+		    FcStrBufFormat (buf, "[%u,%u],", first, last);
+		first = last = c;
+		in_range = FcTrue;
+	    }
+	}
+    }
+    if (in_range)
+	FcStrBufFormat (buf, "[%u,%u]", first, last);
+    FcStrBufChar (buf, ']');
 }
 
-static FcBool
-skip_subexpr (FcFormatContext *c);
-
-static FcBool
-skip_percent (FcFormatContext *c)
+static void
+json_value (FcStrBuf *buf,
+            FcValue  *v0)
 {
-    if (!expect_char (c, '%'))
-	return FcFalse;
-
-    /* skip an optional width specifier */
-    if (strtol ((const char *)c->format, (char **)&c->format, 10)) { /* don't care */
+    FcValue v = FcValueCanonicalize (v0);
+
+    switch (v.type) {
+    case FcTypeInteger:
+	FcStrBufFormat (buf, "%d", v.u.i);
+	break;
+    case FcTypeDouble:
+	json_number (buf, v.u.d);
+	break;
+    case FcTypeString:
+	json_string (buf, v.u.s);
+	break;
+    case FcTypeBool:
+	FcStrBufString (buf, (const FcChar8 *)(v.u.b == FcTrue ? "true" : v.u.b == FcFalse ? "false"
+	                                                                                   : "null"));
+	break;
+    case FcTypeMatrix:
+	FcStrBufChar (buf, '[');
+	json_number (buf, v.u.m->xx);
+	FcStrBufChar (buf, ',');
+	json_number (buf, v.u.m->xy);
+	FcStrBufChar (buf, ',');
+	json_number (buf, v.u.m->yx);
+	FcStrBufChar (buf, ',');
+	json_number (buf, v.u.m->yy);
+	FcStrBufChar (buf, ']');
+	break;
+    case FcTypeCharSet:
+	json_charset (buf, v.u.c);
+	break;
+    case FcTypeLangSet: {
+	FcStrSet  *langs = FcLangSetGetLangs (v.u.l);
+	FcStrList *list = langs ? FcStrListCreate (langs) : NULL;
+	FcChar8   *lang;
+	FcBool     first = FcTrue;
+
+	FcStrBufChar (buf, '[');
+	while (list && (lang = FcStrListNext (list))) {
+	    if (!first)
+		FcStrBufChar (buf, ',');
+	    json_string (buf, lang);
+	    first = FcFalse;
+	}
+	FcStrBufChar (buf, ']');
+	if (list)
+	    FcStrListDone (list);
+	if (langs)
+	    FcStrSetDestroy (langs);
+	break;
     }
+    case FcTypeRange:
+	FcStrBufChar (buf, '[');
+	json_number (buf, v.u.r->begin);
+	FcStrBufChar (buf, ',');
+	json_number (buf, v.u.r->end);
+	FcStrBufChar (buf, ']');
+	break;
+    default:
+	FcStrBufString (buf, (const FcChar8 *)"null");
+	break;
+    }
+}
 
-    if (!expect_char (c, '{'))
-	return FcFalse;
+/*
+ * Write the pattern as a JSON object mapping each element name to the
+ * list of its values
+ */
+static FcChar8 *
+FcPatternJson (FcPattern *pat)
+{
+    FcStrBuf       buf;
+    FcChar8        buf_static[8192];
+    FcPatternIter  iter;
+    FcValueListPtr l;
+    FcBool         first = FcTrue;
 
-    while (*c->format && *c->format != '}') {
-	switch (*c->format) {
-	case '\\':
-	    c->format++; /* skip over '\\' */
-	    if (*c->format)
-		c->format++;
-	    continue;
-	case '{':
-	    if (!skip_subexpr (c))
-		return FcFalse;
-	    continue;
-	}
-	c->format++;
+    FcStrBufInit (&buf, buf_static, sizeof (buf_static));
+    FcStrBufChar (&buf, '{');
+    FcPatternIterStart (pat, &iter);
+    if (FcPatternIterIsValid (pat, &iter)) {
+	do {
+	    if (!first)
+		FcStrBufChar (&buf, ',');
+	    first = FcFalse;
+	    json_string (&buf, (const FcChar8 *)FcPatternIterGetObject (pat, &iter));
+	    FcStrBufString (&buf, (const FcChar8 *)":[");
+	    for (l = FcPatternIterGetValues (pat, &iter); l; l = FcValueListNext (l)) {
+		json_value (&buf, &l->value);
+		if (FcValueListNext (l))
+		    FcStrBufChar (&buf, ',');
+	    }
+	    FcStrBufChar (&buf, ']');
+	} while (FcPatternIterNext (pat, &iter));
     }
+    FcStrBufChar (&buf, '}');
 
-    return expect_char (c, '}');
+    return FcStrBufDone (&buf);
 }
 
 static FcBool
-skip_expr (FcFormatContext *c)
+cescape (const FcChar8 *str,
+         FcStrBuf      *buf)
 {
-    while (*c->format && *c->format != '}') {
-	switch (*c->format) {
+    /* XXX escape \n etc? */
+
+    while (*str) {
+	switch (*str) {
 	case '\\':
-	    c->format++; /* skip over '\\' */
-	    if (*c->format)
-		c->format++;
-	    continue;
-	case '%':
-	    if (!skip_percent (c))
-		return FcFalse;
-	    continue;
+	case '"':
+	    FcStrBufChar (buf, '\\');
+	    break;
 	}
-	c->format++;
+	FcStrBufChar (buf, *str++);
     }
-
     return FcTrue;
 }
 
 static FcBool
-skip_subexpr (FcFormatContext *c)
+shescape (const FcChar8 *str,
+          FcStrBuf      *buf)
 {
-    return expect_char (c, '{') &&
-           skip_expr (c) &&
-           expect_char (c, '}');
+    FcStrBufChar (buf, '\'');
+    while (*str) {
+	if (*str == '\'')
+	    FcStrBufString (buf, (const FcChar8 *)"'\\''");
+	else
+	    FcStrBufChar (buf, *str);
+	str++;
+    }
+    FcStrBufChar (buf, '\'');
+    return FcTrue;
 }
 
 static FcBool
-maybe_skip_subexpr (FcFormatContext *c)
+xmlescape (const FcChar8 *str,
+           FcStrBuf      *buf)
 {
-    return (*c->format == '{') ? skip_subexpr (c) : FcTrue;
+    /* XXX escape \n etc? */
+
+    while (*str) {
+	switch (*str) {
+	case '&': FcStrBufString (buf, (const FcChar8 *)"&amp;"); break;
+	case '<': FcStrBufString (buf, (const FcChar8 *)"&lt;"); break;
+	case '>': FcStrBufString (buf, (const FcChar8 *)"&gt;"); break;
+	default: FcStrBufChar (buf, *str); break;
+	}
+	str++;
+    }
+    return FcTrue;
 }
 
 static FcBool
-interpret_filter_in (FcFormatContext *c,
-                     FcPattern       *pat,
-                     FcStrBuf        *buf)
+delete_chars (const FcChar8 *chars,
+              const FcChar8 *str,
+              FcStrBuf      *buf)
 {
-    FcObjectSet *os;
-    FcPattern   *subpat;
-
-    if (!expect_char (c, '+'))
-	return FcFalse;
+    /* XXX not UTF-8 aware */
 
-    os = FcObjectSetCreate();
-    if (!os)
-	return FcFalse;
+    while (*str) {
+	FcChar8 *p;
 
-    do {
-	/* XXX binding */
-	if (!read_word (c) ||
-	    !FcObjectSetAdd (os, (const char *)c->word)) {
-	    FcObjectSetDestroy (os);
-	    return FcFalse;
+	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)chars);
+	if (p) {
+	    FcStrBufData (buf, str, p - str);
+	    str = p + 1;
+	} else {
+	    FcStrBufString (buf, str);
+	    break;
 	}
-    } while (consume_char (c, ','));
-
-    subpat = FcPatternFilter (pat, os);
-    FcObjectSetDestroy (os);
-
-    if (!subpat ||
-        !interpret_subexpr (c, subpat, buf))
-	return FcFalse;
+    }
 
-    FcPatternDestroy (subpat);
     return FcTrue;
 }
 
 static FcBool
-interpret_filter_out (FcFormatContext *c,
-                      FcPattern       *pat,
-                      FcStrBuf        *buf)
+escape_chars (const FcChar8 *chars,
+              const FcChar8 *str,
+              FcStrBuf      *buf)
 {
-    FcPattern *subpat;
-
-    if (!expect_char (c, '-'))
-	return FcFalse;
+    /* XXX not UTF-8 aware */
 
-    subpat = FcPatternDuplicate (pat);
-    if (!subpat)
-	return FcFalse;
+    while (*str) {
+	FcChar8 *p;
 
-    do {
-	if (!read_word (c)) {
-	    FcPatternDestroy (subpat);
-	    return FcFalse;
+	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)chars);
+	if (p) {
+	    FcStrBufData (buf, str, p - str);
+	    FcStrBufChar (buf, chars[0]);
+	    FcStrBufChar (buf, *p);
+	    str = p + 1;
+	} else {
+	    FcStrBufString (buf, str);
+	    break;
 	}
+    }
 
-	FcPatternDel (subpat, (const char *)c->word);
-    } while (consume_char (c, ','));
-
-    if (!interpret_subexpr (c, subpat, buf))
-	return FcFalse;
-
-    FcPatternDestroy (subpat);
     return FcTrue;
 }
 
 static FcBool
-interpret_cond (FcFormatContext *c,
-                FcPattern       *pat,
-                FcStrBuf        *buf)
+translate_chars (const FcChar8 *from,
+                 const FcChar8 *to,
+                 const FcChar8 *str,
+                 FcStrBuf      *buf)
 {
-    FcBool pass;
-
-    if (!expect_char (c, '?'))
-	return FcFalse;
-
-    pass = FcTrue;
+    int     to_len;
+    FcChar8 repeat;
 
-    do {
-	FcBool  negate;
-	FcValue v;
-
-	negate = consume_char (c, '!');
+    /* XXX not UTF-8 aware */
 
-	if (!read_word (c))
-	    return FcFalse;
+    to_len = strlen ((const char *)to);
+    repeat = to[to_len - 1];
 
-	pass = pass &&
-	       (negate ^
-	        (FcResultMatch ==
-	         FcPatternGet (pat, (const char *)c->word, 0, &v)));
-    } while (consume_char (c, ','));
+    while (*str) {
+	FcChar8 *p;
 
-    if (pass) {
-	if (!interpret_subexpr (c, pat, buf) ||
-	    !maybe_skip_subexpr (c))
-	    return FcFalse;
-    } else {
-	if (!skip_subexpr (c) ||
-	    !maybe_interpret_subexpr (c, pat, buf))
-	    return FcFalse;
+	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)from);
+	if (p) {
+	    int i;
+	    FcStrBufData (buf, str, p - str);
+	    i = (FcChar8 *)strchr ((const char *)from, *p) - from;
+	    FcStrBufChar (buf, i < to_len ? to[i] : repeat);
+	    str = p + 1;
+	} else {
+	    FcStrBufString (buf, str);
+	    break;
+	}
     }
 
     return FcTrue;
 }
 
 static FcBool
-interpret_count (FcFormatContext *c,
-                 FcPattern       *pat,
-                 FcStrBuf        *buf)
+const_chars (const FcChar8 *elm,
+             const FcChar8 *str,
+             FcStrBuf      *buf)
 {
-    int           count;
-    FcPatternIter iter;
-    FcChar8       buf_static[64];
+    int            n;
+    char          *p = NULL;
+    const FcChar8 *con;
 
-    if (!expect_char (c, '#'))
+    n = strtoul ((const char *)str, &p, 10);
+    if (p && *p != 0)
 	return FcFalse;
-
-    if (!read_word (c))
+    con = FcNameGetConstantNameFrom ((const char *)elm, n);
+    if (!con)
 	return FcFalse;
 
-    count = 0;
-    if (FcPatternFindIter (pat, &iter, (const char *)c->word)) {
-	count = FcPatternIterValueCount (pat, &iter);
-    }
-
-    snprintf ((char *)buf_static, sizeof (buf_static), "%d", count);
-    FcStrBufString (buf, buf_static);
+    FcStrBufString (buf, con);
 
     return FcTrue;
 }
 
+/*
+ * A format is compiled once into a program: a list of nodes, each
+ * either literal text or a '%' directive, run against each pattern
+ */
+typedef enum _FcFormatOp {
+    FcFormatOpLiteral,
+    FcFormatOpBuiltin,   /* %{=unparse}, %{=json} */
+    FcFormatOpSubexpr,   /* %{{expr}} and the other builtins */
+    FcFormatOpFilterIn,  /* %{+elt1,elt2{expr}} */
+    FcFormatOpFilterOut, /* %{-elt1,elt2{expr}} */
+    FcFormatOpCond,      /* %{?elt1,!elt2{expr}{expr}} */
+    FcFormatOpCount,     /* %{#elt} */
+    FcFormatOpEnumerate, /* %{[]elt1,elt2{expr}} */
+    FcFormatOpSimple     /* %{:elt[idx]=:-default} */
+} FcFormatOp;
+
+typedef enum _FcFormatConv {
+    FcFormatConvDowncase,
+    FcFormatConvBasename,
+    FcFormatConvDirname,
+    FcFormatConvConst,
+    FcFormatConvCescape,
+    FcFormatConvShescape,
+    FcFormatConvXmlescape,
+    FcFormatConvDelete,
+    FcFormatConvEscape,
+    FcFormatConvTranslate
+} FcFormatConv;
+
+typedef struct _FcFormatConvert FcFormatConvert;
+
+struct _FcFormatConvert {
+    FcFormatConvert *next;
+    FcFormatConv     conv;
+    FcChar8         *arg; /* the element of const, the chars of the others */
+    FcChar8         *to;  /* the chars translate maps to */
+};
+
+typedef struct _FcFormatCond {
+    FcObject object;
+    FcBool   negate;
+} FcFormatCond;
+
+typedef struct _FcFormatNode FcFormatNode;
+
+struct _FcFormatNode {
+    FcFormatNode    *next;
+    FcFormatOp       op;
+    int              width;
+    FcFormatConvert *converts;
+    FcChar8         *text; /* literal text or element name */
+    int              len;
+    FcChar8         *else_string;
+    FcChar8 *(*func) (FcPattern *);
+    FcFormatNode *expr;
+    FcFormatNode *alt; /* run when a conditional fails */
+    FcObjectSet  *os;
+    FcFormatCond *conds;
+    int           nconds;
+    FcObject      object;
+    int           idx;
+    FcBool        add_colon;
+    FcBool        add_elt_name;
+};
+
+struct _FcPatternFormatter {
+    FcFormatNode *expr;
+};
+
+static const struct {
+    const char *name;
+    FcChar8 *(*func) (FcPattern *);
+    const char *format;
+} builtins[] = {
+    { "unparse", FcNameUnparse, NULL           },
+    { "json",    FcPatternJson, NULL           },
+    /* { "verbose", FcPatternPrint, NULL }, XXX */
+    { "fccat",   NULL,          FCCAT_FORMAT   },
+    { "fcmatch", NULL,          FCMATCH_FORMAT },
+    { "fclist",  NULL,          FCLIST_FORMAT  },
+    { "pkgkit",  NULL,          PKGKIT_FORMAT  },
+};
+
+static const struct {
+    const char  *name;
+    FcFormatConv conv;
+} converters[] = {
+    { "downcase",  FcFormatConvDowncase  },
+    { "basename",  FcFormatConvBasename  },
+    { "dirname",   FcFormatConvDirname   },
+    { "const",     FcFormatConvConst     },
+    { "cescape",   FcFormatConvCescape   },
+    { "shescape",  FcFormatConvShescape  },
+    { "xmlescape", FcFormatConvXmlescape },
+    { "delete",    FcFormatConvDelete    },
+    { "escape",    FcFormatConvEscape    },
+    { "translate", FcFormatConvTranslate },
+};
+
+#define NUM_BUILTINS   (int)(sizeof (builtins) / sizeof (builtins[0]))
+#define NUM_CONVERTERS (int)(sizeof (converters) / sizeof (converters[0]))
+
+static void
+FcFormatNodeDestroy (FcFormatNode *node)
+{
+    while (node) {
+	FcFormatNode    *next = node->next;
+	FcFormatConvert *conv, *cnext;
+
+	for (conv = node->converts; conv; conv = cnext) {
+	    cnext = conv->next;
+	    free (conv->arg);
+	    free (conv->to);
+	    free (conv);
+	}
+	free (node->text);
+	free (node->else_string);
+	FcFormatNodeDestroy (node->expr);
+	FcFormatNodeDestroy (node->alt);
+	if (node->os)
+	    FcObjectSetDestroy (node->os);
+	free (node->conds);
+	free (node);
+	node = next;
+    }
+}
+
 static FcBool
-interpret_enumerate (FcFormatContext *c,
-                     FcPattern       *pat,
-                     FcStrBuf        *buf)
+compile_expr (FcFormatContext *c,
+              FcChar8          term,
+              FcFormatNode   **expr);
+
+static FcBool
+compile_subexpr (FcFormatContext *c,
+                 FcFormatNode   **expr)
 {
-    FcObjectSet   *os;
-    FcPattern     *subpat;
-    const FcChar8 *format_save;
-    int            idx;
-    FcBool         ret, done;
-    FcStrList     *lang_strs;
-
-    if (!expect_char (c, '[') ||
-        !expect_char (c, ']'))
-	return FcFalse;
+    return expect_char (c, '{') &&
+           compile_expr (c, '}', expr) &&
+           expect_char (c, '}');
+}
 
-    os = FcObjectSetCreate();
-    if (!os)
+static FcBool
+compile_objects (FcFormatContext *c,
+                 FcObjectSet    **os)
+{
+    *os = FcObjectSetCreate();
+    if (!*os)
 	return FcFalse;
 
-    ret = FcTrue;
-
     do {
+	/* XXX binding */
 	if (!read_word (c) ||
-	    !FcObjectSetAdd (os, (const char *)c->word)) {
-	    FcObjectSetDestroy (os);
+	    !FcObjectSetAdd (*os, (const char *)c->word))
 	    return FcFalse;
-	}
     } while (consume_char (c, ','));
 
-    /* If we have one element and it's of type FcLangSet, we want
-     * to enumerate the languages in it. */
-    lang_strs = NULL;
-    if (os->nobjIds == 1) {
-	FcLangSet *langset;
-	if (FcResultMatch ==
-	    FcPatternObjectGetLangSet (pat, os->objIds[0], 0, &langset)) {
-	    FcStrSet *ss;
-	    if (!(ss = FcLangSetGetLangs (langset)) ||
-	        !(lang_strs = FcStrListCreate (ss)))
-		goto bail0;
-	}
-    }
+    return FcTrue;
+}
 
-    subpat = FcPatternDuplicate (pat);
-    if (!subpat)
-	goto bail0;
+static FcBool
+compile_builtin (FcFormatContext *c,
+                 FcFormatNode    *node)
+{
+    int i;
 
-    format_save = c->format;
-    idx = 0;
-    do {
-	int i;
+    if (!expect_char (c, '=') ||
+        !read_word (c))
+	return FcFalse;
 
-	done = FcTrue;
+    for (i = 0; i < NUM_BUILTINS; i++)
+	if (0 == strcmp ((const char *)c->word, builtins[i].name))
+	    break;
+    if (i == NUM_BUILTINS) {
+	message ("unknown builtin \"%s\"",
+	         c->word);
+	return FcFalse;
+    }
 
-	if (lang_strs) {
-	    FcChar8 *lang;
+    if (builtins[i].func) {
+	node->op = FcFormatOpBuiltin;
+	node->func = builtins[i].func;
+	return FcTrue;
+    } else {
+	FcFormatContext sub;
+	FcChar8         word_static[1024];
+	FcBool          ret;
 
-	    FcPatternObjectDel (subpat, os->objIds[0]);
-	    if ((lang = FcStrListNext (lang_strs))) {
-		/* XXX binding? */
-		FcPatternObjectAddString (subpat, os->objIds[0], lang);
-		done = FcFalse;
-	    }
-	} else {
-	    for (i = 0; i < os->nobjIds; i++) {
-		FcValue v;
+	node->op = FcFormatOpSubexpr;
+	if (!FcFormatContextInit (&sub, (const FcChar8 *)builtins[i].format,
+	                          word_static, sizeof (word_static)))
+	    return FcFalse;
+	ret = compile_expr (&sub, '\0', &node->expr);
+	FcFormatContextDone (&sub);
+	return ret;
+    }
+}
 
-		/* XXX this can be optimized by accessing valuelist linked lists
-		 * directly and remembering where we were.  Most (all) value lists
-		 * in normal uses are pretty short though (language tags are
-		 * stored as a LangSet, not separate values.). */
-		FcPatternObjectDel (subpat, os->objIds[i]);
-		if (FcResultMatch ==
-		    FcPatternObjectGet (pat, os->objIds[i], idx, &v)) {
-		    /* XXX binding */
-		    FcPatternObjectAdd (subpat, os->objIds[i], v, FcFalse);
-		    done = FcFalse;
-		}
-	    }
-	}
+static FcBool
+compile_cond (FcFormatContext *c,
+              FcFormatNode    *node)
+{
+    if (!expect_char (c, '?'))
+	return FcFalse;
 
-	if (!done) {
-	    c->format = format_save;
-	    ret = interpret_subexpr (c, subpat, buf);
-	    if (!ret)
-		goto bail;
-	}
+    node->op = FcFormatOpCond;
+    do {
+	FcFormatCond *conds;
+	FcBool        negate;
 
-	idx++;
-    } while (!done);
+	negate = consume_char (c, '!');
 
-    if (c->format == format_save)
-	skip_subexpr (c);
+	if (!read_word (c))
+	    return FcFalse;
 
-bail:
-    FcPatternDestroy (subpat);
-bail0:
-    if (lang_strs)
-	FcStrListDone (lang_strs);
-    FcObjectSetDestroy (os);
+	conds = realloc (node->conds, (node->nconds + 1) * sizeof (FcFormatCond));
+	if (!conds)
+	    return FcFalse;
+	node->conds = conds;
+	conds[node->nconds].object = FcObjectFromName ((const char *)c->word);
+	conds[node->nconds].negate = negate;
+	node->nconds++;
+    } while (consume_char (c, ','));
 
-    return ret;
+    return compile_subexpr (c, &node->expr) &&
+           (*c->format != '{' || compile_subexpr (c, &node->alt));
 }
 
 static FcBool
-interpret_simple (FcFormatContext *c,
-                  FcPattern       *pat,
-                  FcStrBuf        *buf)
+compile_simple (FcFormatContext *c,
+                FcFormatNode    *node)
 {
-    FcPatternIter iter;
-    FcBool        add_colon = FcFalse;
-    FcBool        add_elt_name = FcFalse;
-    int           idx;
-    FcChar8      *else_string;
+    node->op = FcFormatOpSimple;
 
     if (consume_char (c, ':'))
-	add_colon = FcTrue;
+	node->add_colon = FcTrue;
 
     if (!read_word (c))
 	return FcFalse;
+    node->text = FcStrCopy (c->word);
+    if (!node->text)
+	return FcFalse;
+    node->object = FcObjectFromName ((const char *)c->word);
 
-    idx = -1;
+    node->idx = -1;
     if (consume_char (c, '[')) {
-	idx = strtol ((const char *)c->format, (char **)&c->format, 10);
-	if (idx < 0) {
+	node->idx = strtol ((const char *)c->format, (char **)&c->format, 10);
+	if (node->idx < 0) {
 	    message ("expected non-negative number at %d",
 	             c->format - 1 - c->format_orig + 1);
 	    return FcFalse;
@@ -667,10 +864,9 @@ interpret_simple (FcFormatContext *c,
     }
 
     if (consume_char (c, '='))
-	add_elt_name = FcTrue;
+	node->add_elt_name = FcTrue;
 
     /* modifiers */
-    else_string = NULL;
     if (consume_char (c, ':')) {
 	FcChar8 *orig;
 	/* divert the c->word for now */
@@ -682,331 +878,421 @@ interpret_simple (FcFormatContext *c,
 	    c->word = orig;
 	    return FcFalse;
 	}
-	else_string = c->word;
+	node->else_string = FcStrCopy (c->word);
 	c->word = orig;
-    }
-
-    if (FcPatternFindIter (pat, &iter, (const char *)c->word) || else_string) {
-	FcValueListPtr l = NULL;
-
-	if (add_colon)
-	    FcStrBufChar (buf, ':');
-	if (add_elt_name) {
-	    FcStrBufString (buf, c->word);
-	    FcStrBufChar (buf, '=');
-	}
-
-	l = FcPatternIterGetValues (pat, &iter);
-
-	if (idx != -1) {
-	    while (l && idx > 0) {
-		l = FcValueListNext (l);
-		idx--;
-	    }
-	    if (l && idx == 0) {
-		if (!FcNameUnparseValue (buf, &l->value, NULL))
-		    return FcFalse;
-	    } else
-		goto notfound;
-	} else if (l) {
-	    FcNameUnparseValueList (buf, l, NULL);
-	} else {
-	notfound:
-	    if (else_string)
-		FcStrBufString (buf, else_string);
-	}
+	if (!node->else_string)
+	    return FcFalse;
     }
 
     return FcTrue;
 }
 
 static FcBool
-cescape (FcFormatContext *c FC_UNUSED,
-         const FcChar8   *str,
-         FcStrBuf        *buf)
+compile_convert (FcFormatContext  *c,
+                 FcFormatConvert **out)
 {
-    /* XXX escape \n etc? */
+    FcFormatConvert *conv;
+    FcChar8         *elm;
+    int              i;
 
-    while (*str) {
-	switch (*str) {
-	case '\\':
-	case '"':
-	    FcStrBufChar (buf, '\\');
-	    break;
-	}
-	FcStrBufChar (buf, *str++);
+    elm = FcStrCopy (c->word);
+    if (!elm)
+	return FcFalse;
+    if (!expect_char (c, '|') ||
+        !read_word (c)) {
+	FcStrFree (elm);
+	return FcFalse;
     }
-    return FcTrue;
-}
 
-static FcBool
-shescape (FcFormatContext *c FC_UNUSED,
-          const FcChar8   *str,
-          FcStrBuf        *buf)
-{
-    FcStrBufChar (buf, '\'');
-    while (*str) {
-	if (*str == '\'')
-	    FcStrBufString (buf, (const FcChar8 *)"'\\''");
-	else
-	    FcStrBufChar (buf, *str);
-	str++;
+    for (i = 0; i < NUM_CONVERTERS; i++)
+	if (0 == strcmp ((const char *)c->word, converters[i].name))
+	    break;
+    if (i == NUM_CONVERTERS) {
+	message ("unknown converter \"%s\"",
+	         c->word);
+	FcStrFree (elm);
+	return FcFalse;
+    }
+    conv = calloc (1, sizeof (FcFormatConvert));
+    if (!conv) {
+	FcStrFree (elm);
+	return FcFalse;
     }
-    FcStrBufChar (buf, '\'');
-    return FcTrue;
-}
+    *out = conv;
+    conv->conv = converters[i].conv;
 
-static FcBool
-xmlescape (FcFormatContext *c FC_UNUSED,
-           const FcChar8   *str,
-           FcStrBuf        *buf)
-{
-    /* XXX escape \n etc? */
+    switch (conv->conv) {
+    case FcFormatConvConst:
+	conv->arg = elm;
+	return FcTrue;
+    case FcFormatConvDelete:
+    case FcFormatConvEscape:
+	FcStrFree (elm);
+	if (!expect_char (c, '(') ||
+	    !read_chars (c, ')') ||
+	    !expect_char (c, ')'))
+	    return FcFalse;
+	conv->arg = FcStrCopy (c->word);
+	return conv->arg != NULL;
+    case FcFormatConvTranslate: {
+	FcChar8 *from;
+
+	FcStrFree (elm);
+	if (!expect_char (c, '(') ||
+	    !read_chars (c, ',') ||
+	    !expect_char (c, ','))
+	    return FcFalse;
 
-    while (*str) {
-	switch (*str) {
-	case '&': FcStrBufString (buf, (const FcChar8 *)"&amp;"); break;
-	case '<': FcStrBufString (buf, (const FcChar8 *)"&lt;"); break;
-	case '>': FcStrBufString (buf, (const FcChar8 *)"&gt;"); break;
-	default: FcStrBufChar (buf, *str); break;
+	from = c->word;
+	/* hack: we temporarily divert c->word */
+	c->word = from + strlen ((const char *)from) + 1;
+	if (!read_chars (c, ')')) {
+	    c->word = from;
+	    return FcFalse;
 	}
-	str++;
+	conv->to = FcStrCopy (c->word);
+	c->word = from;
+	conv->arg = FcStrCopy (from);
+
+	return conv->arg && conv->to && expect_char (c, ')');
+    }
+    default:
+	FcStrFree (elm);
+	return FcTrue;
     }
-    return FcTrue;
 }
 
 static FcBool
-delete_chars (FcFormatContext *c,
-              const FcChar8   *str,
-              FcStrBuf        *buf)
+compile_percent (FcFormatContext *c,
+                 FcFormatNode   **out)
 {
-    /* XXX not UTF-8 aware */
+    FcFormatNode     *node;
+    FcFormatConvert **tail;
+    FcBool            ret;
 
-    if (!expect_char (c, '(') ||
-        !read_chars (c, ')') ||
-        !expect_char (c, ')'))
+    if (!expect_char (c, '%'))
 	return FcFalse;
 
-    while (*str) {
-	FcChar8 *p;
+    node = calloc (1, sizeof (FcFormatNode));
+    if (!node)
+	return FcFalse;
+    *out = node;
 
-	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)c->word);
-	if (p) {
-	    FcStrBufData (buf, str, p - str);
-	    str = p + 1;
-	} else {
-	    FcStrBufString (buf, str);
-	    break;
-	}
+    /* parse an optional width specifier */
+    node->width = strtol ((const char *)c->format, (char **)&c->format, 10);
+
+    if (!expect_char (c, '{'))
+	return FcFalse;
+
+    switch (*c->format) {
+    case '=': ret = compile_builtin (c, node); break;
+    case '{':
+	node->op = FcFormatOpSubexpr;
+	ret = compile_subexpr (c, &node->expr);
+	break;
+    case '+':
+	node->op = FcFormatOpFilterIn;
+	ret = expect_char (c, '+') &&
+	      compile_objects (c, &node->os) &&
+	      compile_subexpr (c, &node->expr);
+	break;
+    case '-':
+	node->op = FcFormatOpFilterOut;
+	ret = expect_char (c, '-') &&
+	      compile_objects (c, &node->os) &&
+	      compile_subexpr (c, &node->expr);
+	break;
+    case '?': ret = compile_cond (c, node); break;
+    case '#':
+	node->op = FcFormatOpCount;
+	ret = expect_char (c, '#') &&
+	      read_word (c);
+	if (ret)
+	    node->object = FcObjectFromName ((const char *)c->word);
+	break;
+    case '[':
+	node->op = FcFormatOpEnumerate;
+	ret = expect_char (c, '[') &&
+	      expect_char (c, ']') &&
+	      compile_objects (c, &node->os) &&
+	      compile_subexpr (c, &node->expr);
+	break;
+    default: ret = compile_simple (c, node); break;
     }
 
-    return FcTrue;
+    for (tail = &node->converts; ret && *c->format == '|'; tail = &(*tail)->next)
+	ret = compile_convert (c, tail);
+
+    return ret && expect_char (c, '}');
 }
 
+/*
+ * Turn the text collected so far into a literal node
+ */
 static FcBool
-escape_chars (FcFormatContext *c,
-              const FcChar8   *str,
-              FcStrBuf        *buf)
+compile_literal (FcStrBuf       *text,
+                 FcFormatNode ***tail)
 {
-    /* XXX not UTF-8 aware */
+    FcFormatNode *node;
 
-    if (!expect_char (c, '(') ||
-        !read_chars (c, ')') ||
-        !expect_char (c, ')'))
+    if (text->failed)
 	return FcFalse;
+    if (!text->len)
+	return FcTrue;
+    node = calloc (1, sizeof (FcFormatNode));
+    if (!node)
+	return FcFalse;
+    node->op = FcFormatOpLiteral;
+    node->text = malloc (text->len);
+    if (!node->text) {
+	free (node);
+	return FcFalse;
+    }
+    memcpy (node->text, text->buf, text->len);
+    node->len = text->len;
+    text->len = 0;
+    **tail = node;
+    *tail = &node->next;
 
-    while (*str) {
-	FcChar8 *p;
+    return FcTrue;
+}
 
-	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)c->word);
-	if (p) {
-	    FcStrBufData (buf, str, p - str);
-	    FcStrBufChar (buf, c->word[0]);
-	    FcStrBufChar (buf, *p);
-	    str = p + 1;
-	} else {
-	    FcStrBufString (buf, str);
-	    break;
+static FcBool
+compile_expr (FcFormatContext *c,
+              FcChar8          term,
+              FcFormatNode   **expr)
+{
+    FcFormatNode **tail = expr;
+    FcStrBuf       text;
+    FcChar8        text_static[1024];
+
+    FcStrBufInit (&text, text_static, sizeof (text_static));
+    while (*c->format && *c->format != term) {
+	switch (*c->format) {
+	case '\\':
+	    c->format++; /* skip over '\\' */
+	    if (*c->format)
+		FcStrBufChar (&text, escaped_char (*c->format++));
+	    continue;
+	case '%':
+	    if (c->format[1] == '%') { /* "%%" */
+		FcStrBufChar (&text, '%');
+		c->format += 2;
+		continue;
+	    }
+	    if (!compile_literal (&text, &tail) ||
+	        !compile_percent (c, tail))
+		goto bail;
+	    tail = &(*tail)->next;
+	    continue;
 	}
+	FcStrBufChar (&text, *c->format++);
     }
+    if (!compile_literal (&text, &tail))
+	goto bail;
+    FcStrBufDestroy (&text);
 
     return FcTrue;
+
+bail:
+    FcStrBufDestroy (&text);
+    return FcFalse;
 }
 
 static FcBool
-translate_chars (FcFormatContext *c,
-                 const FcChar8   *str,
-                 FcStrBuf        *buf)
-{
-    char *from, *to, repeat;
-    int   from_len, to_len;
+run_expr (const FcFormatNode *node,
+          FcPattern          *pat,
+          FcStrBuf           *buf);
 
-    /* XXX not UTF-8 aware */
-
-    if (!expect_char (c, '(') ||
-        !read_chars (c, ',') ||
-        !expect_char (c, ','))
-	return FcFalse;
+static FcBool
+run_enumerate (const FcFormatNode *node,
+               FcPattern          *pat,
+               FcStrBuf           *buf)
+{
+    FcObjectSet *os = node->os;
+    FcPattern   *subpat;
+    int          idx;
+    FcBool       ret, done;
+    FcStrList   *lang_strs;
 
-    from = (char *)c->word;
-    from_len = strlen (from);
-    to = from + from_len + 1;
+    ret = FcTrue;
 
-    /* hack: we temporarily divert c->word */
-    c->word = (FcChar8 *)to;
-    if (!read_chars (c, ')')) {
-	c->word = (FcChar8 *)from;
-	return FcFalse;
+    /* If we have one element and it's of type FcLangSet, we want
+     * to enumerate the languages in it. */
+    lang_strs = NULL;
+    if (os->nobjIds == 1) {
+	FcLangSet *langset;
+	if (FcResultMatch ==
+	    FcPatternObjectGetLangSet (pat, os->objIds[0], 0, &langset)) {
+	    FcStrSet *ss = FcLangSetGetLangs (langset);
+
+	    if (!ss)
+		return FcTrue;
+	    lang_strs = FcStrListCreate (ss);
+	    FcStrSetDestroy (ss);
+	    if (!lang_strs)
+		return FcTrue;
+	}
     }
-    c->word = (FcChar8 *)from;
 
-    to_len = strlen (to);
-    repeat = to[to_len - 1];
+    subpat = FcPatternDuplicate (pat);
+    if (!subpat)
+	goto bail0;
 
-    if (!expect_char (c, ')'))
-	return FcFalse;
+    idx = 0;
+    do {
+	int i;
 
-    while (*str) {
-	FcChar8 *p;
+	done = FcTrue;
 
-	p = (FcChar8 *)strpbrk ((const char *)str, (const char *)from);
-	if (p) {
-	    int i;
-	    FcStrBufData (buf, str, p - str);
-	    i = strchr (from, *p) - from;
-	    FcStrBufChar (buf, i < to_len ? to[i] : repeat);
-	    str = p + 1;
+	if (lang_strs) {
+	    FcChar8 *lang;
+
+	    FcPatternObjectDel (subpat, os->objIds[0]);
+	    if ((lang = FcStrListNext (lang_strs))) {
+		/* XXX binding? */
+		FcPatternObjectAddString (subpat, os->objIds[0], lang);
+		done = FcFalse;
+	    }
 	} else {
-	    FcStrBufString (buf, str);
-	    break;
+	    for (i = 0; i < os->nobjIds; i++) {
+		FcValue v;
+
+		/* XXX this can be optimized by accessing valuelist linked lists
+		 * directly and remembering where we were.  Most (all) value lists
+		 * in normal uses are pretty short though (language tags are
+		 * stored as a LangSet, not separate values.). */
+		FcPatternObjectDel (subpat, os->objIds[i]);
+		if (FcResultMatch ==
+		    FcPatternObjectGet (pat, os->objIds[i], idx, &v)) {
+		    /* XXX binding */
+		    FcPatternObjectAdd (subpat, os->objIds[i], v, FcFalse);
+		    done = FcFalse;
+		}
+	    }
 	}
-    }
 
-    return FcTrue;
+	if (!done) {
+	    ret = run_expr (node->expr, subpat, buf);
+	    if (!ret)
+		break;
+	}
+
+	idx++;
+    } while (!done);
+
+    FcPatternDestroy (subpat);
+bail0:
+    if (lang_strs)
+	FcStrListDone (lang_strs);
+
+    return ret;
 }
 
 static FcBool
-const_chars (FcFormatContext *c,
-             const FcChar8   *elm,
-             const FcChar8   *str,
-             FcStrBuf        *buf)
+run_simple (const FcFormatNode *node,
+            FcPattern          *pat,
+            FcStrBuf           *buf)
 {
-    int            n;
-    char          *p = NULL;
-    const FcChar8 *con;
+    FcPatternElt  *e = FcPatternObjectFindElt (pat, node->object);
+    FcValueListPtr l;
+    int            idx = node->idx;
 
-    n = strtoul ((const char *)str, &p, 10);
-    if (p && *p != 0)
-        return FcFalse;
-    con = FcNameGetConstantNameFrom ((const char *)elm, n);
-    if (!con)
-        return FcFalse;
+    if (!e && !node->else_string)
+	return FcTrue;
 
-    FcStrBufString (buf, con);
+    if (node->add_colon)
+	FcStrBufChar (buf, ':');
+    if (node->add_elt_name) {
+	FcStrBufString (buf, node->text);
+	FcStrBufChar (buf, '=');
+    }
+
+    l = e ? FcPatternEltValues (e) : NULL;
+
+    if (idx != -1) {
+	while (l && idx > 0) {
+	    l = FcValueListNext (l);
+	    idx--;
+	}
+	if (l && idx == 0) {
+	    if (!FcNameUnparseValue (buf, &l->value, NULL))
+		return FcFalse;
+	} else
+	    goto notfound;
+    } else if (l) {
+	FcNameUnparseValueList (buf, l, NULL);
+    } else {
+    notfound:
+	if (node->else_string)
+	    FcStrBufString (buf, node->else_string);
+    }
 
     return FcTrue;
 }
 
 static FcBool
-interpret_convert (FcFormatContext *c,
-                   FcStrBuf        *buf,
-                   int              start)
+run_convert (const FcFormatConvert *conv,
+             FcStrBuf              *buf,
+             int                    start)
 {
     const FcChar8 *str;
-    FcChar8       *new_str, *elm;
+    FcChar8       *new_str;
     FcStrBuf       new_buf;
     FcChar8        buf_static[8192];
     FcBool         ret;
 
-    elm = FcStrCopy (c->word);
-    if (!expect_char (c, '|') ||
-        !read_word (c)) {
-        ret = FcFalse;
-        goto bail;
-    }
-
     /* prepare the buffer */
     FcStrBufChar (buf, '\0');
-    if (buf->failed) {
-        ret = FcFalse;
-        goto bail;
-    }
+    if (buf->failed)
+	return FcFalse;
     str = buf->buf + start;
     buf->len = start;
 
     /* try simple converters first */
-    if (0) {
-    }
-#define CONVERTER(name, func)                              \
-    else if (0 == strcmp ((const char *)c->word, name)) do \
-    {                                                      \
-	new_str = func (str);                              \
-	ret = FcTrue;                                      \
-    }                                                      \
-    while (0)
-    CONVERTER ("downcase", FcStrDowncase);
-    CONVERTER ("basename", FcStrBasename);
-    CONVERTER ("dirname", FcStrDirname);
-#undef CONVERTER
-    else ret = FcFalse;
-
-    if (ret) {
-	if (new_str) {
-	    FcStrBufString (buf, new_str);
-	    FcStrFree (new_str);
-            ret = FcTrue;
-            goto bail;
-	} else {
-            ret = FcFalse;
-            goto bail;
-        }
+    switch (conv->conv) {
+    case FcFormatConvDowncase:
+    case FcFormatConvBasename:
+    case FcFormatConvDirname:
+	if (conv->conv == FcFormatConvDowncase)
+	    new_str = FcStrDowncase (str);
+	else if (conv->conv == FcFormatConvBasename)
+	    new_str = FcStrBasename (str);
+	else
+	    new_str = FcStrDirname (str);
+	if (!new_str)
+	    return FcFalse;
+	FcStrBufString (buf, new_str);
+	FcStrFree (new_str);
+	return FcTrue;
+    default:
+	break;
     }
 
     FcStrBufInit (&new_buf, buf_static, sizeof (buf_static));
 
     /* now try our custom converters */
-    if (0) {
+    switch (conv->conv) {
+    case FcFormatConvConst: ret = const_chars (conv->arg, str, &new_buf); break;
+    case FcFormatConvCescape: ret = cescape (str, &new_buf); break;
+    case FcFormatConvShescape: ret = shescape (str, &new_buf); break;
+    case FcFormatConvXmlescape: ret = xmlescape (str, &new_buf); break;
+    case FcFormatConvDelete: ret = delete_chars (conv->arg, str, &new_buf); break;
+    case FcFormatConvEscape: ret = escape_chars (conv->arg, str, &new_buf); break;
+    case FcFormatConvTranslate: ret = translate_chars (conv->arg, conv->to, str, &new_buf); break;
+    default: ret = FcFalse; break;
     }
-    else if (strcmp ((const char *)c->word, "const") == 0)
-        ret = const_chars(c, elm, str, &new_buf);
-#define CONVERTER(name, func)                           \
-    else if (0 == strcmp ((const char *)c->word, name)) \
-	ret = func (c, str, &new_buf)
-    CONVERTER ("cescape", cescape);
-    CONVERTER ("shescape", shescape);
-    CONVERTER ("xmlescape", xmlescape);
-    CONVERTER ("delete", delete_chars);
-    CONVERTER ("escape", escape_chars);
-    CONVERTER ("translate", translate_chars);
-#undef CONVERTER
-    else ret = FcFalse;
 
     if (ret) {
 	FcStrBufChar (&new_buf, '\0');
 	FcStrBufString (buf, new_buf.buf);
-    } else
-	message ("unknown converter \"%s\"",
-	         c->word);
+    }
 
     FcStrBufDestroy (&new_buf);
- bail:
-    FcStrFree (elm);
 
     return ret;
 }
 
-static FcBool
-maybe_interpret_converts (FcFormatContext *c,
-                          FcStrBuf        *buf,
-                          int              start)
-{
-    while (*c->format == '|')
-	if (!interpret_convert (c, buf, start))
-	    return FcFalse;
-
-    return FcTrue;
-}
-
 static FcBool
 align_to_width (FcStrBuf *buf,
                 int       start,
@@ -1041,108 +1327,209 @@ align_to_width (FcStrBuf *buf,
 
     return !buf->failed;
 }
+
 static FcBool
-interpret_percent (FcFormatContext *c,
-                   FcPattern       *pat,
-                   FcStrBuf        *buf)
+run_percent (const FcFormatNode *node,
+             FcPattern          *pat,
+             FcStrBuf           *buf)
 {
-    int    width, start;
-    FcBool ret;
+    const FcFormatConvert *conv;
+    FcPattern             *subpat;
+    int                    start = buf->len;
+    int                    i;
+    FcBool                 ret = FcTrue;
 
-    if (!expect_char (c, '%'))
-	return FcFalse;
+    switch (node->op) {
+    case FcFormatOpBuiltin: {
+	FcChar8 *new_str = node->func (pat);
 
-    if (consume_char (c, '%')) /* "%%" */
-    {
-	FcStrBufChar (buf, '%');
-	return FcTrue;
+	if (!new_str)
+	    return FcFalse;
+	FcStrBufString (buf, new_str);
+	FcStrFree (new_str);
+	break;
     }
+    case FcFormatOpSubexpr:
+	ret = run_expr (node->expr, pat, buf);
+	break;
+    case FcFormatOpFilterIn:
+    case FcFormatOpFilterOut:
+	if (node->op == FcFormatOpFilterIn)
+	    subpat = FcPatternFilter (pat, node->os);
+	else {
+	    subpat = FcPatternDuplicate (pat);
+	    for (i = 0; subpat && i < node->os->nobjIds; i++)
+		FcPatternObjectDel (subpat, node->os->objIds[i]);
+	}
+	if (!subpat)
+	    return FcFalse;
+	ret = run_expr (node->expr, subpat, buf);
+	FcPatternDestroy (subpat);
+	break;
+    case FcFormatOpCond: {
+	FcBool pass = FcTrue;
 
-    /* parse an optional width specifier */
-    width = strtol ((const char *)c->format, (char **)&c->format, 10);
-
-    if (!expect_char (c, '{'))
-	return FcFalse;
-
-    start = buf->len;
+	for (i = 0; i < node->nconds && pass; i++) {
+	    FcValue v;
 
-    switch (*c->format) {
-    case '=': ret = interpret_builtin (c, pat, buf); break;
-    case '{': ret = interpret_subexpr (c, pat, buf); break;
-    case '+': ret = interpret_filter_in (c, pat, buf); break;
-    case '-': ret = interpret_filter_out (c, pat, buf); break;
-    case '?': ret = interpret_cond (c, pat, buf); break;
-    case '#': ret = interpret_count (c, pat, buf); break;
-    case '[': ret = interpret_enumerate (c, pat, buf); break;
-    default: ret = interpret_simple (c, pat, buf); break;
+	    pass = node->conds[i].negate ^
+	           (FcResultMatch == FcPatternObjectGet (pat, node->conds[i].object, 0, &v));
+	}
+	ret = run_expr (pass ? node->expr : node->alt, pat, buf);
+	break;
+    }
+    case FcFormatOpCount: {
+	FcPatternElt  *e = FcPatternObjectFindElt (pat, node->object);
+	FcValueListPtr l;
+	int            count = 0;
+	FcChar8        buf_static[64];
+
+	for (l = e ? FcPatternEltValues (e) : NULL; l; l = FcValueListNext (l))
+	    count++;
+	snprintf ((char *)buf_static, sizeof (buf_static), "%d", count);
+	FcStrBufString (buf, buf_static);
+	break;
+    }
+    case FcFormatOpEnumerate:
+	ret = run_enumerate (node, pat, buf);
+	break;
+    case FcFormatOpSimple:
+	ret = run_simple (node, pat, buf);
+	break;
+    default:
+	break;
     }
 
-    return ret &&
-           maybe_interpret_converts (c, buf, start) &&
-           align_to_width (buf, start, width) &&
-           expect_char (c, '}');
+    for (conv = node->converts; ret && conv; conv = conv->next)
+	ret = run_convert (conv, buf, start);
+
+    return ret && align_to_width (buf, start, node->width);
 }
 
 static FcBool
-interpret_expr (FcFormatContext *c,
-                FcPattern       *pat,
-                FcStrBuf        *buf,
-                FcChar8          term)
+run_expr (const FcFormatNode *node,
+          FcPattern          *pat,
+          FcStrBuf           *buf)
 {
-    while (*c->format && *c->format != term) {
-	switch (*c->format) {
-	case '\\':
-	    c->format++; /* skip over '\\' */
-	    if (*c->format)
-		FcStrBufChar (buf, escaped_char (*c->format++));
-	    continue;
-	case '%':
-	    if (!interpret_percent (c, pat, buf))
-		return FcFalse;
-	    continue;
-	}
-	FcStrBufChar (buf, *c->format++);
+    for (; node; node = node->next) {
+	if (node->op == FcFormatOpLiteral)
+	    FcStrBufData (buf, node->text, node->len);
+	else if (!run_percent (node, pat, buf))
+	    return FcFalse;
     }
-    return FcTrue;
+    return !buf->failed;
 }
 
-static FcBool
-FcPatternFormatToBuf (FcPattern     *pat,
-                      const FcChar8 *format,
-                      FcStrBuf      *buf)
+FcPatternFormatter *
+FcPatternFormatterCreate (const FcChar8 *format)
 {
-    FcFormatContext c;
-    FcChar8         word_static[1024];
-    FcBool          ret;
+    FcPatternFormatter *formatter;
+    FcFormatContext     c;
+    FcChar8             word_static[1024];
+    FcBool              ret;
 
-    if (!FcFormatContextInit (&c, format, word_static, sizeof (word_static)))
-	return FcFalse;
+    formatter = calloc (1, sizeof (FcPatternFormatter));
+    if (!formatter)
+	return NULL;
+    if (!FcFormatContextInit (&c, format, word_static, sizeof (word_static))) {
+	free (formatter);
+	return NULL;
+    }
 
-    ret = interpret_expr (&c, pat, buf, '\0');
+    ret = compile_expr (&c, '\0', &formatter->expr);
 
     FcFormatContextDone (&c);
 
-    return ret;
+    if (!ret) {
+	FcPatternFormatterDestroy (formatter);
+	return NULL;
+    }
+    return formatter;
+}
+
+int
+FcPatternFormatterFormat (const FcPatternFormatter *formatter,
+                          FcPattern                *pat,
+                          FcChar8                 **buf,
+                          int                      *size)
+{
+    FcStrBuf   sbuf;
+    FcPattern *alloced = NULL;
+    FcBool     ret;
+
+    if (!pat)
+	alloced = pat = FcPatternCreate();
+
+    /* Write straight into the buffer of the caller, growing it as needed */
+    if (*buf && *size <= 0) {
+	free (*buf);
+	*buf = NULL;
+    }
+    if (*buf) {
+	FcStrBufInit (&sbuf, *buf, *size);
+	sbuf.allocated = FcTrue;
+    } else
+	FcStrBufInit (&sbuf, NULL, 0);
+
+    ret = pat && run_expr (formatter->expr, pat, &sbuf);
+    FcStrBufChar (&sbuf, '\0');
+    if (!sbuf.allocated && !sbuf.failed) {
+	FcChar8 *copy = malloc (sbuf.len);
+
+	if (copy) {
+	    memcpy (copy, sbuf.buf, sbuf.len);
+	    FcStrBufInit (&sbuf, copy, sbuf.len);
+	    sbuf.allocated = FcTrue;
+	    sbuf.len = sbuf.size;
+	} else
+	    sbuf.failed = FcTrue;
+    }
+    if (sbuf.allocated) {
+	*buf = sbuf.buf;
+	*size = sbuf.size;
+    }
+
+    if (alloced)
+	FcPatternDestroy (alloced);
+
+    if (!ret || sbuf.failed)
+	return -1;
+    return sbuf.len - 1;
+}
+
+void
+FcPatternFormatterDestroy (FcPatternFormatter *formatter)
+{
+    if (!formatter)
+	return;
+    FcFormatNodeDestroy (formatter->expr);
+    free (formatter);
 }
 
 FcChar8 *
 FcPatternFormat (FcPattern     *pat,
                  const FcChar8 *format)
 {
-    FcStrBuf   buf;
-    FcChar8    buf_static[8192 - 1024];
-    FcPattern *alloced = NULL;
-    FcBool     ret;
+    FcPatternFormatter *formatter;
+    FcStrBuf            buf;
+    FcChar8             buf_static[8192 - 1024];
+    FcPattern          *alloced = NULL;
+    FcBool              ret;
+
+    formatter = FcPatternFormatterCreate (format);
+    if (!formatter)
+	return NULL;
 
     if (!pat)
 	alloced = pat = FcPatternCreate();
 
     FcStrBufInit (&buf, buf_static, sizeof (buf_static));
 
-    ret = FcPatternFormatToBuf (pat, format, &buf);
+    ret = pat && run_expr (formatter->expr, pat, &buf);
 
     if (alloced)
 	FcPatternDestroy (alloced);
+    FcPatternFormatterDestroy (formatter);
 
     if (ret)
 	return FcStrBufDone (&buf);
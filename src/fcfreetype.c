@@ -1080,6 +1080,20 @@ typedef struct
     unsigned int idx;
 } FcNameMapping;
 
+/*
+ * The coverage computed for a face, shared with the named instances of
+ * the face and with the other faces of a collection which use the same
+ * cmap and glyphs
+ */
+typedef struct
+{
+    FT_ULong       tables[3]; /* offsets of the cmap, maxp and outlines tables */
+    FT_Encoding    encoding;
+    FcCharSet     *cs;
+    const FcChar8 *exclusive_lang;
+    FcLangSet     *ls;
+} FcCoverageShare;
+
 static FcBool
 _is_english (int platform, int language)
 {
@@ -1153,12 +1167,11 @@ FcFreeTypeGetFirstName (const FT_Face  face,
 }
 
 static FcPattern *
-FcFreeTypeQueryFaceInternal (const FT_Face   face,
-                             const FcChar8  *file,
-                             unsigned int    id,
-                             FcCharSet     **cs_share,
-                             FcLangSet     **ls_share,
-                             FcNameMapping **nm_share)
+FcFreeTypeQueryFaceInternal (const FT_Face    face,
+                             const FcChar8   *file,
+                             unsigned int     id,
+                             FcCoverageShare *cov_share,
+                             FcNameMapping  **nm_share)
 {
     FcPattern     *pat;
     int            slant = -1;
@@ -1951,12 +1964,16 @@ FcFreeTypeQueryFaceInternal (const FT_Face   face,
     /*
      * Compute the unicode coverage for the font
      */
-    if (cs_share && *cs_share)
-	cs = FcCharSetCopy (*cs_share);
-    else {
+    if (cov_share && cov_share->cs) {
+	cs = FcCharSetCopy (cov_share->cs);
+	if (cov_share->encoding != FT_ENCODING_NONE)
+	    FT_Select_Charmap (face, cov_share->encoding);
+    } else {
 	cs = FcFreeTypeCharSet (face, NULL);
-	if (cs_share)
-	    *cs_share = FcCharSetCopy (cs);
+	if (cov_share && cs) {
+	    cov_share->cs = FcCharSetCopy (cs);
+	    cov_share->encoding = face->charmap ? face->charmap->encoding : FT_ENCODING_NONE;
+	}
     }
     if (!cs)
 	goto bail1;
@@ -1999,12 +2016,15 @@ FcFreeTypeQueryFaceInternal (const FT_Face   face,
 	goto bail2;
 
     if (!symbol) {
-	if (ls_share && *ls_share)
-	    ls = FcLangSetCopy (*ls_share);
+	if (cov_share && cov_share->ls && cov_share->exclusive_lang == exclusiveLang)
+	    ls = FcLangSetCopy (cov_share->ls);
 	else {
 	    ls = FcLangSetFromCharSet (cs, exclusiveLang);
-	    if (ls_share)
-		*ls_share = FcLangSetCopy (ls);
+	    if (cov_share && ls) {
+		FcLangSetDestroy (cov_share->ls);
+		cov_share->ls = FcLangSetCopy (ls);
+		cov_share->exclusive_lang = exclusiveLang;
+	    }
 	}
 	if (!ls)
 	    goto bail2;
@@ -2177,7 +2197,7 @@ FcFreeTypeQueryFace (const FT_Face  face,
                      unsigned int   id,
                      FcBlanks      *blanks FC_UNUSED)
 {
-    return FcFreeTypeQueryFaceInternal (face, file, id, NULL, NULL, NULL);
+    return FcFreeTypeQueryFaceInternal (face, file, id, NULL, NULL);
 }
 
 FcPattern *
@@ -2199,7 +2219,7 @@ FcFreeTypeQuery (const FcChar8 *file,
     if (count)
 	*count = face->num_faces;
 
-    pat = FcFreeTypeQueryFaceInternal (face, file, id, NULL, NULL, NULL);
+    pat = FcFreeTypeQueryFaceInternal (face, file, id, NULL, NULL);
 
     FT_Done_Face (face);
 bail:
@@ -2207,6 +2227,100 @@ bail:
     return pat;
 }
 
+#define FcSfntU16(p) ((FT_UInt)(p)[0] << 8 | (FT_UInt)(p)[1])
+#define FcSfntU32(p) ((FT_ULong)FcSfntU16 (p) << 16 | FcSfntU16 ((p) + 2))
+
+static FcBool
+FcSfntRead (FT_Face face, FT_ULong offset, FT_Byte *buf, FT_ULong len)
+{
+    FT_ULong read = len;
+
+    return !FT_Load_Sfnt_Table (face, 0, offset, buf, &read) && read == len;
+}
+
+/*
+ * Find where the tables the coverage of a face in a collection is
+ * computed from are stored in the file.  Faces whose tables are at the
+ * same offsets have the same coverage.
+ */
+static FcBool
+FcFreeTypeCoverageTables (FT_Face face, unsigned int face_num, FT_ULong tables[3])
+{
+    FT_Byte  header[12], *records;
+    FT_ULong dir;
+    FT_UInt  num_tables, i;
+
+    if (!FT_IS_SFNT (face) ||
+        !FcSfntRead (face, 0, header, 12) ||
+        memcmp (header, "ttcf", 4) != 0 ||
+        face_num >= FcSfntU32 (header + 8) ||
+        !FcSfntRead (face, 12 + face_num * 4, header, 4))
+	return FcFalse;
+    dir = FcSfntU32 (header);
+    if (!FcSfntRead (face, dir, header, 12))
+	return FcFalse;
+    num_tables = FcSfntU16 (header + 4);
+    records = malloc (num_tables * 16);
+    if (!records)
+	return FcFalse;
+    if (!FcSfntRead (face, dir + 12, records, num_tables * 16)) {
+	free (records);
+	return FcFalse;
+    }
+    tables[0] = tables[1] = tables[2] = 0;
+    for (i = 0; i < num_tables; i++) {
+	const FT_Byte *record = records + i * 16;
+	FT_ULong       offset = FcSfntU32 (record + 8);
+
+	if (!memcmp (record, "cmap", 4))
+	    tables[0] = offset;
+	else if (!memcmp (record, "maxp", 4))
+	    tables[1] = offset;
+	else if (!memcmp (record, "glyf", 4) ||
+	         !memcmp (record, "CFF ", 4) ||
+	         !memcmp (record, "CFF2", 4))
+	    tables[2] = offset;
+    }
+    free (records);
+
+    return tables[0] && tables[1] && tables[2];
+}
+
+/*
+ * Find the coverage shared with the faces queried before, or add an
+ * empty one for this face
+ */
+static FcCoverageShare *
+FcFreeTypeCoverageShare (FT_Face           face,
+                         unsigned int      face_num,
+                         FcCoverageShare **shares,
+                         int              *nshares)
+{
+    FcCoverageShare *share;
+    FT_ULong         tables[3];
+    FcBool           shared;
+    int              i;
+
+    shared = FcFreeTypeCoverageTables (face, face_num, tables);
+    if (shared) {
+	for (i = 0; i < *nshares; i++) {
+	    share = &(*shares)[i];
+	    if (!memcmp (share->tables, tables, sizeof (tables)))
+		return share;
+	}
+    }
+    share = realloc (*shares, (*nshares + 1) * sizeof (FcCoverageShare));
+    if (!share)
+	return NULL;
+    *shares = share;
+    share = &share[(*nshares)++];
+    memset (share, 0, sizeof (*share));
+    if (shared)
+	memcpy (share->tables, tables, sizeof (tables));
+
+    return share;
+}
+
 unsigned int
 FcFreeTypeQueryAll (const FcChar8 *file,
                     unsigned int   id,
@@ -2214,21 +2328,21 @@ FcFreeTypeQueryAll (const FcChar8 *file,
                     int           *count,
                     FcFontSet     *set)
 {
-    FT_Face        face = NULL;
-    FT_Library     ftLibrary = NULL;
-    FcCharSet     *cs = NULL;
-    FcLangSet     *ls = NULL;
-    FcNameMapping *nm = NULL;
-    FT_MM_Var     *mm_var = NULL;
-    FcBool         index_set = id != (unsigned int)-1;
-    unsigned int   set_face_num = index_set ? id & 0xFFFF : 0;
-    unsigned int   set_instance_num = index_set ? id >> 16 : 0;
-    unsigned int   face_num = set_face_num;
-    unsigned int   instance_num = set_instance_num;
-    unsigned int   num_faces = 0;
-    unsigned int   num_instances = 0;
-    unsigned int   ret = 0;
-    int            err = 0;
+    FT_Face          face = NULL;
+    FT_Library       ftLibrary = NULL;
+    FcCoverageShare *shares = NULL, *cov = NULL;
+    int              nshares = 0, i;
+    FcNameMapping   *nm = NULL;
+    FT_MM_Var       *mm_var = NULL;
+    FcBool           index_set = id != (unsigned int)-1;
+    unsigned int     set_face_num = index_set ? id & 0xFFFF : 0;
+    unsigned int     set_instance_num = index_set ? id >> 16 : 0;
+    unsigned int     face_num = set_face_num;
+    unsigned int     instance_num = set_instance_num;
+    unsigned int     num_faces = 0;
+    unsigned int     num_instances = 0;
+    unsigned int     ret = 0;
+    int              err = 0;
 
     if (count)
 	*count = 0;
@@ -2250,6 +2364,8 @@ FcFreeTypeQueryAll (const FcChar8 *file,
     if (count)
 	*count = num_faces;
 
+    cov = FcFreeTypeCoverageShare (face, face_num, &shares, &nshares);
+
     do {
 	FcPattern *pat = NULL;
 
@@ -2275,7 +2391,7 @@ FcFreeTypeQueryAll (const FcChar8 *file,
 	}
 
 	id = ((instance_num << 16) + face_num);
-	pat = FcFreeTypeQueryFaceInternal (face, (const FcChar8 *)file, id, &cs, &ls, &nm);
+	pat = FcFreeTypeQueryFaceInternal (face, (const FcChar8 *)file, id, cov, &nm);
 
 	if (pat) {
 	    ret++;
@@ -2292,10 +2408,6 @@ FcFreeTypeQueryAll (const FcChar8 *file,
 	else {
 	    free (nm);
 	    nm = NULL;
-	    FcLangSetDestroy (ls);
-	    ls = NULL;
-	    FcCharSetDestroy (cs);
-	    cs = NULL;
 	    FT_Done_Face (face);
 	    face = NULL;
 #ifdef HAVE_FT_DONE_MM_VAR
@@ -2317,6 +2429,7 @@ FcFreeTypeQueryAll (const FcChar8 *file,
 		if (!mm_var)
 		    num_instances = 0;
 	    }
+	    cov = FcFreeTypeCoverageShare (face, face_num, &shares, &nshares);
 	}
     } while (!err && (!index_set || face_num == set_face_num) && face_num < num_faces);
 
@@ -2326,8 +2439,11 @@ bail:
 #else
     free (mm_var);
 #endif
-    FcLangSetDestroy (ls);
-    FcCharSetDestroy (cs);
+    for (i = 0; i < nshares; i++) {
+	FcLangSetDestroy (shares[i].ls);
+	FcCharSetDestroy (shares[i].cs);
+    }
+    free (shares);
     if (face)
 	FT_Done_Face (face);
     FT_Done_FreeType (ftLibrary);
@@ -2473,12 +2589,217 @@ FcFreeTypeSpacing (FT_Face face)
 	return FC_SPACING_PROPORTIONAL;
 }
 
+/*
+ * CID fonts built by Adobe used to map ASCII control chars to cid1
+ * (space glyph). As such, always check contour for those characters.
+ */
+static FcBool
+FcFreeTypeControlCharGood (FT_Face face, FT_UInt glyph)
+{
+    const FT_Int load_flags = FT_LOAD_IGNORE_GLOBAL_ADVANCE_WIDTH | FT_LOAD_NO_SCALE | FT_LOAD_NO_HINTING;
+
+    return !(FT_Load_Glyph (face, glyph, load_flags) ||
+             (face->glyph->format == FT_GLYPH_FORMAT_OUTLINE &&
+              face->glyph->outline.n_contours == 0));
+}
+
+#define FcCmapU16(p) ((FT_UInt)(p)[0] << 8 | (FT_UInt)(p)[1])
+#define FcCmapU32(p) ((FT_ULong)FcCmapU16 (p) << 16 | FcCmapU16 ((p) + 2))
+
+/*
+ * Add the chars from first to last, which all map to glyphs
+ */
+static FcBool
+FcFreeTypeCmapAdd (FT_Face face, FcCharSet *fcs, FT_ULong first, FT_ULong last)
+{
+    for (; first <= last && first <= 0x1f; first++)
+	if (FcFreeTypeControlCharGood (face, FT_Get_Char_Index (face, first)) &&
+	    !FcCharSetAddChar (fcs, first))
+	    return FcFalse;
+    if (first > last)
+	return FcTrue;
+    return FcCharSetAddRange (fcs, first, last);
+}
+
+/*
+ * Add the chars of a format 4 subtable, segment by segment; the
+ * segments mapped through the glyph array are added in runs of chars
+ * with a glyph
+ */
+static FcBool
+FcFreeTypeCmap4 (FT_Face face, FcCharSet *fcs, const FT_Byte *table, const FT_Byte *limit)
+{
+    FT_UInt        seg_count, i;
+    const FT_Byte *ends, *starts, *deltas, *offsets;
+
+    if (limit - table < 14)
+	return FcFalse;
+    seg_count = FcCmapU16 (table + 6) / 2;
+    ends = table + 14;
+    starts = ends + seg_count * 2 + 2;
+    deltas = starts + seg_count * 2;
+    offsets = deltas + seg_count * 2;
+    if (offsets + seg_count * 2 > limit)
+	return FcFalse;
+
+    for (i = 0; i < seg_count; i++) {
+	FT_UInt        start = FcCmapU16 (starts + i * 2);
+	FT_UInt        end = FcCmapU16 (ends + i * 2);
+	FT_UInt        delta = FcCmapU16 (deltas + i * 2);
+	FT_UInt        offset = FcCmapU16 (offsets + i * 2);
+	const FT_Byte *glyphs = offsets + i * 2 + offset;
+	FT_UInt        c, run = 0, in_run = 0;
+
+	if (start > end || offset == 0xffff)
+	    continue;
+	for (c = start; c <= end; c++) {
+	    FT_UInt glyph;
+
+	    if (!offset)
+		glyph = (c + delta) & 0xffff;
+	    else {
+		const FT_Byte *g = glyphs + (c - start) * 2;
+
+		glyph = g + 2 <= limit ? FcCmapU16 (g) : 0;
+		if (glyph)
+		    glyph = (glyph + delta) & 0xffff;
+	    }
+	    if (glyph && glyph < (FT_UInt)face->num_glyphs) {
+		if (!in_run) {
+		    run = c;
+		    in_run = 1;
+		}
+	    } else if (in_run) {
+		if (!FcFreeTypeCmapAdd (face, fcs, run, c - 1))
+		    return FcFalse;
+		in_run = 0;
+	    }
+	}
+	if (in_run && !FcFreeTypeCmapAdd (face, fcs, run, end))
+	    return FcFalse;
+    }
+    return FcTrue;
+}
+
+/*
+ * Add the chars of a format 12 or 13 subtable, group by group
+ */
+static FcBool
+FcFreeTypeCmap12 (FT_Face face, FcCharSet *fcs, const FT_Byte *table, const FT_Byte *limit, int format)
+{
+    FT_ULong       num_groups, i;
+    FT_ULong       num_glyphs = face->num_glyphs;
+    const FT_Byte *group;
+
+    if (limit - table < 16)
+	return FcFalse;
+    num_groups = FcCmapU32 (table + 12);
+    if (num_groups > (FT_ULong)(limit - table - 16) / 12)
+	return FcFalse;
+
+    for (i = 0, group = table + 16; i < num_groups; i++, group += 12) {
+	FT_ULong start = FcCmapU32 (group);
+	FT_ULong end = FcCmapU32 (group + 4);
+	FT_ULong glyph = FcCmapU32 (group + 8);
+
+	if (end > 0x10ffff)
+	    end = 0x10ffff;
+	if (start > end || glyph >= num_glyphs)
+	    continue;
+	if (format == 13) {
+	    if (!glyph)
+		continue;
+	} else {
+	    /* The first char of the group may be mapped to .notdef */
+	    if (!glyph) {
+		if (start == end)
+		    continue;
+		start++;
+		glyph++;
+		if (glyph >= num_glyphs)
+		    continue;
+	    }
+	    if (end - start > num_glyphs - 1 - glyph)
+		end = start + (num_glyphs - 1 - glyph);
+	}
+	if (!FcFreeTypeCmapAdd (face, fcs, start, end))
+	    return FcFalse;
+    }
+    return FcTrue;
+}
+
+/*
+ * Build the charset straight from the segments of the cmap subtable
+ * FreeType selected, when it has one of the segmented formats, instead
+ * of looking up each char on its own
+ */
+static FcCharSet *
+FcFreeTypeCmapCharSet (FT_Face face)
+{
+    FT_CharMap     charmap = face->charmap;
+    FT_Long        format;
+    FT_ULong       len = 0;
+    FT_Byte       *cmap = NULL;
+    const FT_Byte *table = NULL, *limit;
+    FcCharSet     *fcs = NULL;
+    FT_UInt        num_tables, i;
+    FcBool         ok;
+
+    if (!charmap || !FT_IS_SFNT (face))
+	return NULL;
+    format = FT_Get_CMap_Format (charmap);
+    if (format != 4 && format != 12 && format != 13)
+	return NULL;
+    if (FT_Load_Sfnt_Table (face, TTAG_cmap, 0, NULL, &len) || len < 4)
+	return NULL;
+    cmap = malloc (len);
+    if (!cmap)
+	return NULL;
+    if (FT_Load_Sfnt_Table (face, TTAG_cmap, 0, cmap, &len))
+	goto bail;
+    limit = cmap + len;
+
+    /* Only go by a subtable which is alone with its format and ids */
+    num_tables = FcCmapU16 (cmap + 2);
+    if (4 + num_tables * 8 > len)
+	goto bail;
+    for (i = 0; i < num_tables; i++) {
+	const FT_Byte *record = cmap + 4 + i * 8;
+	FT_ULong       offset = FcCmapU32 (record + 4);
+
+	if (FcCmapU16 (record) != charmap->platform_id ||
+	    FcCmapU16 (record + 2) != charmap->encoding_id ||
+	    offset > len - 2 ||
+	    FcCmapU16 (cmap + offset) != format)
+	    continue;
+	if (table)
+	    goto bail;
+	table = cmap + offset;
+    }
+    if (!table)
+	goto bail;
+
+    fcs = FcCharSetCreate();
+    if (!fcs)
+	goto bail;
+    if (format == 4)
+	ok = FcFreeTypeCmap4 (face, fcs, table, limit);
+    else
+	ok = FcFreeTypeCmap12 (face, fcs, table, limit, format);
+    if (!ok) {
+	FcCharSetDestroy (fcs);
+	fcs = NULL;
+    }
+bail:
+    free (cmap);
+    return fcs;
+}
+
 FcCharSet *
 FcFreeTypeCharSet (FT_Face face, FcBlanks *blanks FC_UNUSED)
 {
-    const FT_Int load_flags = FT_LOAD_IGNORE_GLOBAL_ADVANCE_WIDTH | FT_LOAD_NO_SCALE | FT_LOAD_NO_HINTING;
-    FcCharSet   *fcs;
-    int          o;
+    FcCharSet *fcs, *cmap_fcs;
+    int        o;
 
     fcs = FcCharSetCreate();
     if (!fcs)
@@ -2494,23 +2815,18 @@ FcFreeTypeCharSet (FT_Face face, FcBlanks *blanks FC_UNUSED)
 	if (FT_Select_Charmap (face, fcFontEncodings[o]) != 0)
 	    continue;
 
-	ucs4 = FT_Get_First_Char (face, &glyph);
-	while (glyph != 0) {
-	    FcBool good = FcTrue;
-
-	    /* CID fonts built by Adobe used to make ASCII control chars to cid1
-	     * (space glyph). As such, always check contour for those characters. */
-	    if (ucs4 <= 0x001F) {
-		if (FT_Load_Glyph (face, glyph, load_flags) ||
-		    (face->glyph->format == FT_GLYPH_FORMAT_OUTLINE &&
-		     face->glyph->outline.n_contours == 0))
-		    good = FcFalse;
-	    }
-
-	    if (good)
-		FcCharSetAddChar (fcs, ucs4);
+	cmap_fcs = FcFreeTypeCmapCharSet (face);
+	if (cmap_fcs) {
+	    FcCharSetDestroy (fcs);
+	    fcs = cmap_fcs;
+	} else {
+	    ucs4 = FT_Get_First_Char (face, &glyph);
+	    while (glyph != 0) {
+		if (ucs4 > 0x001F || FcFreeTypeControlCharGood (face, glyph))
+		    FcCharSetAddChar (fcs, ucs4);
 
-	    ucs4 = FT_Get_Next_Char (face, ucs4, &glyph);
+		ucs4 = FT_Get_Next_Char (face, ucs4, &glyph);
+	    }
 	}
 	if (fcFontEncodings[o] == FT_ENCODING_MS_SYMBOL) {
 	    /* For symbol-encoded OpenType fonts, we duplicate the
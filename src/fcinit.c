@@ -238,32 +238,74 @@ FcInitReinitialize (void)
     return ret;
 }
 
+/*
+ * Rescan the font directories of config while keeping what was read
+ * from the configuration files, none of which have changed
+ */
+static FcBool
+FcInitRescanFonts (FcConfig *config)
+{
+    FcConfig *rescanned;
+    FcBool    ret;
+
+    rescanned = FcConfigCopyParsed (config);
+    if (!rescanned)
+	return FcFalse;
+    if (!FcConfigBuildFonts (rescanned)) {
+	FcConfigDestroy (rescanned);
+	return FcFalse;
+    }
+    ret = FcConfigSetCurrent (rescanned);
+    FcConfigDestroy (rescanned);
+
+    return ret;
+}
+
 FcBool
 FcInitBringUptoDate (void)
 {
-    FcConfig *config = FcConfigReference (NULL);
-    FcBool    ret = FcTrue;
-    time_t    now;
+    FcConfigHazard hazard;
+    FcConfig      *config;
+    FcBool         ret = FcTrue;
+    time_t         now;
 
+    config = FcConfigAcquire (NULL, &hazard);
     if (!config)
 	return FcFalse;
     /*
      * rescanInterval == 0 disables automatic up to date
      */
-    if (config->rescanInterval == 0)
-	goto bail;
+    if (config->rescanInterval == 0) {
+	FcConfigRelease (&hazard);
+	return FcTrue;
+    }
     /*
      * Check no more often than rescanInterval seconds
      */
     now = time (0);
-    if (config->rescanTime + config->rescanInterval - now > 0)
-	goto bail;
+    if (config->rescanTime + config->rescanInterval - now > 0) {
+	FcConfigRelease (&hazard);
+	return FcTrue;
+    }
+    /*
+     * Reinitializing replaces the current config, which waits for its
+     * readers; keep a reference rather than reading it from here on.
+     */
+    config = FcConfigReference (config);
+    FcConfigRelease (&hazard);
     /*
      * If up to date, don't reload configuration
      */
     if (FcConfigUptoDate (0))
 	goto bail;
-    ret = FcInitReinitialize();
+    /*
+     * Only fonts were added or removed; there is no need to parse
+     * the configuration again
+     */
+    if (FcConfigFilesUptoDate (config))
+	ret = FcInitRescanFonts (config);
+    else
+	ret = FcInitReinitialize();
 bail:
     FcConfigDestroy (config);
 
@@ -116,6 +116,7 @@ extern pfnSHGetFolderPathA          pSHGetFolderPathA;
 #define FC_DBG_PARSE                     64
 #define FC_DBG_SCAN                      128
 #define FC_DBG_SCANV                     256
+#define FC_DBG_MEMORY                    512
 #define FC_DBG_CONFIG                    1024
 #define FC_DBG_LANGSET                   2048
 #define FC_DBG_MATCH2                    4096
@@ -342,6 +343,19 @@ struct _FcExprPage {
     FcExpr      end[FLEXIBLE_ARRAY_MEMBER];
 };
 
+typedef struct _FcExprPool FcExprPool;
+
+/*
+ * The expressions referenced by a config's rules.  A config that
+ * reuses the rules of another one keeps the other's pool alive
+ * through parent.
+ */
+struct _FcExprPool {
+    FcRef       ref;
+    FcExprPool *parent;
+    FcExprPage *pages;
+};
+
 typedef enum _FcQual {
     FcQualAny,
     FcQualAll,
@@ -366,6 +380,20 @@ typedef struct _FcEdit {
     FcValueBinding binding;
 } FcEdit;
 
+typedef struct _FcArenaChunk FcArenaChunk;
+
+/*
+ * Scratch memory handed out from a caller-provided block, typically on
+ * the stack, and then from heap chunks; all of it is freed at once.
+ */
+typedef struct _FcArena {
+    char         *next;
+    char         *end;
+    FcArenaChunk *chunks;
+    size_t        size;   /* bytes handed out */
+    int           nchunk; /* heap allocations */
+} FcArena;
+
 typedef struct _FcPtrList FcPtrList;
 /* need to sync with FcConfigFileInfoIter at fontconfig.h */
 typedef struct _FcPtrListIter {
@@ -446,10 +474,38 @@ typedef struct _FcStrBuf {
 
 typedef struct _FcHashTable FcHashTable;
 
+typedef struct _FcGlobSet FcGlobSet;
+
+typedef struct _FcListIndex FcListIndex;
+
+typedef struct _FcConfigReader FcConfigReader;
+
+/*
+ * Keeps the config used by a call alive; see FcConfigAcquire
+ */
+typedef struct _FcConfigHazard {
+    FcConfigReader *reader; /* slot publishing the current config */
+    FcConfig       *config;
+} FcConfigHazard;
+
 typedef FcChar32 (*FcHashFunc) (const FcChar8 *data);
 typedef int (*FcCompareFunc) (const FcChar8 *v1, const FcChar8 *v2);
 typedef FcBool (*FcCopyFunc) (const void *src, void **dest);
 
+/*
+ * A file of a cached directory with the state it had when scanned,
+ * so that rescans can tell whether it changed since
+ */
+typedef struct _FcCacheFile {
+    intptr_t name;  /* offset to file name, relative to the table */
+    int      first; /* index of its first font in the set */
+    int      nfont; /* number of fonts from this file */
+    int64_t  size;
+    int64_t  mtime;
+    int64_t  mtime_nano;
+    int64_t  ino;
+} FcCacheFile;
+
 struct _FcCache {
     unsigned int magic;      /* FC_CACHE_MAGIC_MMAP or FC_CACHE_ALLOC */
     int          version;    /* FC_CACHE_VERSION_NUMBER */
@@ -457,10 +513,10 @@ struct _FcCache {
     intptr_t     dir;        /* offset to dir name */
     intptr_t     dirs;       /* offset to subdirs */
     int          dirs_count; /* number of subdir strings */
-    int          pad1;
+    int          files;      /* offset to font files, 0 if none */
     intptr_t     set;      /* offset to font set */
     int          checksum; /* checksum of directory state */
-    int          pad2;
+    int          files_count;   /* number of font files */
     int64_t      checksum_nano; /* checksum of directory state */
     int64_t      fc_version;    /* fontconfig version */
 };
@@ -470,6 +526,7 @@ struct _FcCache {
 #define FcCacheDir(c)       FcOffsetMember (c, dir, FcChar8)
 #define FcCacheDirs(c)      FcOffsetMember (c, dirs, intptr_t)
 #define FcCacheSet(c)       FcOffsetMember (c, set, FcFontSet)
+#define FcCacheFiles(c)     FcOffsetMember (c, files, FcCacheFile)
 #define FcCacheSubdir(c, i) FcOffsetToPtr (FcCacheDirs (c),    \
                                            FcCacheDirs (c)[i], \
                                            FcChar8)
@@ -478,6 +535,25 @@ struct _FcCache {
  * Used while constructing a directory cache object
  */
 
+typedef struct _FcDirFiles {
+    int          num;
+    int          size;
+    FcChar8    **names;
+    FcCacheFile *files; /* name isn't used until serialized */
+} FcDirFiles;
+
+/*
+ * A file found while scanning a directory, with the fonts it provides
+ */
+typedef struct _FcDirScanFile {
+    const FcChar8 *file;
+    const FcChar8 *name; /* file name, without the directory */
+    FcFontSet     *set;
+    struct stat    statb;
+    FcBool         stat_ok;
+    FcBool         is_dir;
+} FcDirScanFile;
+
 typedef union _FcAlign {
     double   d;
     int      i;
@@ -494,14 +570,21 @@ typedef struct _FcSerializeBucket {
 
 typedef struct _FcCharSetFreezer FcCharSetFreezer;
 
+typedef struct _FcValueListFreezer FcValueListFreezer;
+
 typedef struct _FcSerialize {
-    intptr_t           size;
-    FcCharSetFreezer  *cs_freezer;
-    void              *linear;
-    FcSerializeBucket *buckets;
-    size_t             buckets_count;
-    size_t             buckets_used;
-    size_t             buckets_used_max;
+    intptr_t            size;
+    FcCharSetFreezer   *cs_freezer;
+    FcValueListFreezer *vl_freezer;
+    void               *linear;
+    FcSerializeBucket  *buckets;
+    size_t              buckets_count;
+    size_t              buckets_used;
+    size_t              buckets_used_max;
+    FcSerializeBucket  *strings; /* strings by contents */
+    size_t              strings_count;
+    size_t              strings_used;
+    intptr_t            written; /* the output before this is written out */
 } FcSerialize;
 
 /*
@@ -550,6 +633,9 @@ typedef struct _FcCaseFold {
 #define FC_CACHE_MAGIC_MMAP  0xFC02FC04
 #define FC_CACHE_MAGIC_ALLOC 0xFC02FC05
 
+#define FC_CACHE_PACK_MAGIC_MMAP  0xFC02FC06
+#define FC_CACHE_PACK_MAGIC_ALLOC 0xFC02FC07
+
 struct _FcAtomic {
     FcChar8 *file; /* original file name */
     FcChar8 *new;  /* temp file name -- write data here */
@@ -570,6 +656,7 @@ struct _FcConfig {
      * of configured directories
      */
     FcStrSet *fontDirs;
+    FcStrSet *configFontDirs; /* fontDirs as given by the configuration */
     /*
      * List of directories containing cache files.
      */
@@ -595,6 +682,8 @@ struct _FcConfig {
      */
     FcStrSet  *acceptGlobs;
     FcStrSet  *rejectGlobs;
+    FcGlobSet *acceptGlobSet; /* acceptGlobs compiled on first use */
+    FcGlobSet *rejectGlobSet; /* rejectGlobs compiled on first use */
     FcFontSet *acceptPatterns;
     FcFontSet *rejectPatterns;
     /*
@@ -604,18 +693,27 @@ struct _FcConfig {
      * match preferrentially
      */
     FcFontSet *fonts[FcSetApplication + 1];
+    int        fontsSerial; /* bumped each time a set is replaced */
+    /*
+     * Indexes of the fonts for listing, built when a set is queried
+     * a second time so that one-shot listings don't pay for them
+     */
+    FcListIndex    *listIndex[FcSetApplication + 1];
+    fc_atomic_int_t listQueries[FcSetApplication + 1];
     /*
      * Fontconfig can periodically rescan the system configuration
      * and font directories.  This rescanning occurs when font
      * listing requests are made, but no more often than rescanInterval
      * seconds apart.
      */
-    time_t rescanTime;     /* last time information was scanned */
-    int    rescanInterval; /* interval between scans */
+    time_t     rescanTime;      /* last time information was scanned */
+    int        rescanInterval;  /* interval between scans */
+    uint64_t   cacheGeneration; /* cache directory generation at rescanTime */
+    FcPtrList *cachePacks;      /* cache packs, mapped when first needed */
 
     FcRef ref; /* reference count */
 
-    FcExprPage *expr_pool; /* pool of FcExpr's */
+    FcExprPool *expr_pool; /* pool of FcExpr's */
 
     FcChar8   *sysRoot;          /* override the system root directory */
     FcStrSet  *availConfigFiles; /* config files available */
@@ -721,13 +819,24 @@ typedef enum _FcLocaleMask {
 } FcLocaleMask;
 #endif
 
+/* fcarena.c */
+
+FcPrivate void
+FcArenaInit (FcArena *arena, void *block, size_t size);
+
+FcPrivate void *
+FcArenaAlloc (FcArena *arena, size_t size);
+
+FcPrivate void
+FcArenaFini (FcArena *arena);
+
 /* fccache.c */
 
 FcPrivate FcCache *
-FcDirCacheScan (const FcChar8 *dir, FcConfig *config);
+FcDirCacheScan (const FcChar8 *dir, FcBool force, FcConfig *config);
 
 FcPrivate FcCache *
-FcDirCacheBuild (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs);
+FcDirCacheBuild (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs, FcDirFiles *files);
 
 FcPrivate FcCache *
 FcDirCacheRebuild (FcCache *cache, struct stat *dir_stat, FcStrSet *dirs);
@@ -735,6 +844,37 @@ FcDirCacheRebuild (FcCache *cache, struct stat *dir_stat, FcStrSet *dirs);
 FcPrivate FcBool
 FcDirCacheWrite (FcCache *cache, FcConfig *config);
 
+FcPrivate FcCache *
+FcDirCacheBuildWrite (FcFontSet *set, const FcChar8 *dir, struct stat *dir_stat, FcStrSet *dirs, FcDirFiles *files, FcConfig *config);
+
+FcPrivate FcCache *
+FcDirCacheLoadOutdated (const FcChar8 *dir, FcConfig *config);
+
+FcPrivate FcCache *
+FcDirCacheLoadPacked (const FcChar8 *dir, FcConfig *config);
+
+FcPrivate const FcCacheFile *
+FcDirCacheFindFile (FcCache *cache, const FcChar8 *name, struct stat *statb);
+
+FcPrivate int
+FcDirCacheFindCopies (FcConfig      *config,
+                      const FcChar8 *dir,
+                      FcDirScanFile *files,
+                      int           *query,
+                      int            nquery);
+
+FcPrivate FcDirFiles *
+FcDirFilesCreate (void);
+
+FcPrivate FcBool
+FcDirFilesAdd (FcDirFiles *files, const FcChar8 *name, struct stat *statb, int first, int nfont);
+
+FcPrivate void
+FcDirFilesDestroy (FcDirFiles *files);
+
+FcPrivate uint64_t
+FcDirCacheGeneration (FcConfig *config);
+
 FcPrivate FcBool
 FcDirCacheCreateTagFile (const FcChar8 *cache_dir);
 
@@ -768,6 +908,15 @@ FcConfigInit (void);
 FcPrivate void
 FcConfigFini (void);
 
+FcPrivate FcConfig *
+FcConfigAcquire (FcConfig *config, FcConfigHazard *hazard);
+
+FcPrivate void
+FcConfigRelease (FcConfigHazard *hazard);
+
+FcPrivate FcBool
+FcConfigIsCurrent (const FcConfig *config);
+
 FcPrivate FcChar8 *
 FcConfigXdgCacheHome (void);
 
@@ -783,6 +932,15 @@ FcConfigXdgDataDirs (void);
 FcPrivate FcExpr *
 FcConfigAllocExpr (FcConfig *config);
 
+FcPrivate FcBool
+FcConfigFilesUptoDate (FcConfig *config);
+
+FcPrivate FcConfig *
+FcConfigCopyParsed (FcConfig *config);
+
+FcPrivate FcBool
+FcConfigScanTestsFile (FcConfig *config);
+
 FcPrivate FcBool
 FcConfigAddConfigDir (FcConfig      *config,
                       const FcChar8 *d);
@@ -893,6 +1051,9 @@ FcSerializeOffset (FcSerialize *serialize, const void *object);
 FcPrivate void *
 FcSerializePtr (FcSerialize *serialize, const void *object);
 
+FcPrivate FcBool
+FcSerializeWritten (FcSerialize *serialize, const void *object);
+
 FcPrivate FcBool
 FcLangSetSerializeAlloc (FcSerialize *serialize, const FcLangSet *l);
 
@@ -940,6 +1101,9 @@ FcNameUnparseValueList (FcStrBuf      *buf,
 FcPrivate FcCharLeaf *
 FcCharSetFindLeafCreate (FcCharSet *fcs, FcChar32 ucs4);
 
+FcPrivate FcBool
+FcCharSetAddRange (FcCharSet *fcs, FcChar32 first, FcChar32 last);
+
 FcPrivate FcBool
 FcCharSetSerializeAlloc (FcSerialize *serialize, const FcCharSet *cs);
 
@@ -978,6 +1142,11 @@ FcLocaleSetCurrent (FcLocale loc);
 FcPrivate void
 FcLocaleDestroy (FcLocale locale);
 
+typedef void (*FcJobFunc) (int index, void *closure);
+
+FcPrivate void
+FcRunJobs (int njobs, int nitems, FcJobFunc func, void *closure);
+
 /* fcconffile.c */
 #if HAVE_VASPRINTF_L
 #  define FcStrDupVapFormat(__ret__, __format__, __va__)               \
@@ -1220,6 +1389,15 @@ FcDirScanConfig (FcFontSet     *set,
                  FcBool         force,
                  FcConfig      *config);
 
+FcPrivate FcBool
+FcDirScanIncremental (FcFontSet     *set,
+                      FcStrSet      *dirs,
+                      const FcChar8 *dir,
+                      FcCache       *old,
+                      FcBool         copies,
+                      FcDirFiles    *files,
+                      FcConfig      *config);
+
 /* fcfont.c */
 FcPrivate int
 FcFontDebug (void);
@@ -1321,6 +1499,12 @@ FcLangSetFromCharSet (const FcCharSet *charset,
 FcPrivate FcLangResult
 FcLangCompare (const FcChar8 *s1, const FcChar8 *s2);
 
+FcPrivate FcChar32
+FcLangHash (const FcChar8 *lang);
+
+FcPrivate int
+FcLangSetBitmapHashes (const FcLangSet *ls, FcChar32 hashes[NUM_LANG_SET_MAP * 32]);
+
 FcPrivate FcLangSet *
 FcLangSetPromote (const FcChar8 *lang, FcValuePromotionBuffer *buf);
 
@@ -1348,6 +1532,9 @@ FcPrivate FcBool
 FcListPatternMatchAny (const FcPattern *p,
                        const FcPattern *font);
 
+FcPrivate void
+FcListIndexDestroy (FcListIndex *index);
+
 /* fcmatch.c */
 
 /* fcname.c */
@@ -1520,6 +1707,15 @@ FcPatternSerializeAlloc (FcSerialize *serialize, const FcPattern *pat);
 FcPrivate FcPattern *
 FcPatternSerialize (FcSerialize *serialize, const FcPattern *pat);
 
+FcPrivate FcValueListFreezer *
+FcValueListFreezerCreate (void);
+
+FcPrivate const FcValueList *
+FcValueListFreeze (FcValueListFreezer *freezer, const FcValueList *vl);
+
+FcPrivate void
+FcValueListFreezerDestroy (FcValueListFreezer *freezer);
+
 FcPrivate FcBool
 FcValueListSerializeAlloc (FcSerialize *serialize, const FcValueList *pat);
 
@@ -1555,6 +1751,11 @@ FcRangeSerializeAlloc (FcSerialize *serialize, const FcRange *r);
 FcPrivate FcRange *
 FcRangeSerialize (FcSerialize *serialize, const FcRange *r);
 
+/* fcserver.c */
+
+FcPrivate FcChar8 *
+FcServerReply (FcConfig *config, const FcChar8 *request);
+
 /* fcstat.c */
 
 FcPrivate int
@@ -1658,6 +1859,15 @@ FcPrivate FcBool
 FcStrGlobMatch (const FcChar8 *glob,
                 const FcChar8 *string);
 
+FcPrivate FcGlobSet *
+FcGlobSetCreate (const FcStrSet *globs);
+
+FcPrivate void
+FcGlobSetDestroy (FcGlobSet *gs);
+
+FcPrivate FcBool
+FcGlobSetMatch (const FcGlobSet *gs, const FcChar8 *string);
+
 FcPrivate FcBool
 FcStrUsesHome (const FcChar8 *s);
 
@@ -394,6 +394,42 @@ FcLangContains (const FcChar8 *super, const FcChar8 *sub)
     }
 }
 
+/*
+ * Hash the language of lang, ignoring any territory; a language
+ * contains lang only when it has the same hash
+ */
+FcChar32
+FcLangHash (const FcChar8 *lang)
+{
+    FcChar32 h = 0;
+
+    for (; !FcLangEnd (*lang); lang++)
+	h = ((h << 3) ^ (h >> 3)) ^ FcToLower (*lang);
+    return h;
+}
+
+/*
+ * Store the FcLangHash of each language in the bitmap of ls,
+ * returning how many were stored; the bits past the known languages,
+ * which only a corrupt cache sets, are ignored
+ */
+int
+FcLangSetBitmapHashes (const FcLangSet *ls, FcChar32 hashes[NUM_LANG_SET_MAP * 32])
+{
+    unsigned int i, j, count;
+    int          n = 0;
+
+    count = FC_MIN (ls->map_size, NUM_LANG_SET_MAP);
+    for (i = 0; i < count; i++) {
+	if (!ls->map[i])
+	    continue;
+	for (j = 0; j < 32 && i * 32 + j < NUM_LANG_CHAR_SET; j++)
+	    if (ls->map[i] & (1U << j))
+		hashes[n++] = FcLangHash (fcLangCharSets[fcLangCharSetIndicesInv[i * 32 + j]].lang);
+    }
+    return n;
+}
+
 const FcCharSet *
 FcLangGetCharSet (const FcChar8 *lang)
 {
@@ -368,38 +368,28 @@ FcGetDefaultObjectLangIndex (FcPattern *font, FcObject object, const FcChar8 *la
                                           : 0;
 }
 
-static FcBool
-FcListAppend (FcListHashTable *table,
-              FcPattern       *font,
-              FcObjectSet     *os,
-              const FcChar8   *lang)
+/*
+ * Build the pattern listing the objects in os of font, the value in
+ * lang of family, fullname and style coming first
+ */
+static FcPattern *
+FcListProject (FcPattern     *font,
+               FcObjectSet   *os,
+               const FcChar8 *lang)
 {
     int            o;
     FcPatternElt  *e;
     FcValueListPtr v;
-    FcChar32       hash;
-    FcListBucket **prev, *bucket;
+    FcPattern     *pattern;
     int            familyidx = -1;
     int            fullnameidx = -1;
     int            styleidx = -1;
     int            defidx = 0;
     int            idx;
 
-    hash = FcListPatternHash (font, os);
-    for (prev = &table->buckets[hash % FC_LIST_HASH_SIZE];
-         (bucket = *prev); prev = &(bucket->next)) {
-	if (bucket->hash == hash &&
-	    FcListPatternEqual (bucket->pattern, font, os))
-	    return FcTrue;
-    }
-    bucket = (FcListBucket *)malloc (sizeof (FcListBucket));
-    if (!bucket)
-	goto bail0;
-    bucket->next = 0;
-    bucket->hash = hash;
-    bucket->pattern = FcPatternCreate();
-    if (!bucket->pattern)
-	goto bail1;
+    pattern = FcPatternCreate();
+    if (!pattern)
+	return NULL;
 
     for (o = 0; o < os->nobjIds; o++) {
 	if (os->objIds[o] == FC_FAMILY_OBJECT || os->objIds[o] == FC_FAMILYLANG_OBJECT) {
@@ -421,26 +411,556 @@ FcListAppend (FcListHashTable *table,
 	if (e) {
 	    for (v = FcPatternEltValues (e), idx = 0; v;
 	         v = FcValueListNext (v), ++idx) {
-		if (!FcPatternObjectAdd (bucket->pattern,
+		if (!FcPatternObjectAdd (pattern,
 		                         os->objIds[o],
-		                         FcValueCanonicalize (&v->value), defidx != idx))
-		    goto bail2;
+		                         FcValueCanonicalize (&v->value), defidx != idx)) {
+		    FcPatternDestroy (pattern);
+		    return NULL;
+		}
 	    }
 	}
     }
+
+    return pattern;
+}
+
+static FcBool
+FcListAppend (FcListHashTable *table,
+              FcPattern       *font,
+              FcObjectSet     *os,
+              const FcChar8   *lang)
+{
+    FcChar32       hash;
+    FcListBucket **prev, *bucket;
+
+    hash = FcListPatternHash (font, os);
+    for (prev = &table->buckets[hash % FC_LIST_HASH_SIZE];
+         (bucket = *prev); prev = &(bucket->next)) {
+	if (bucket->hash == hash &&
+	    FcListPatternEqual (bucket->pattern, font, os))
+	    return FcTrue;
+    }
+    bucket = (FcListBucket *)malloc (sizeof (FcListBucket));
+    if (!bucket)
+	return FcFalse;
+    bucket->next = 0;
+    bucket->hash = hash;
+    bucket->pattern = FcListProject (font, os, lang);
+    if (!bucket->pattern) {
+	free (bucket);
+	return FcFalse;
+    }
     *prev = bucket;
     ++table->entries;
 
     return FcTrue;
+}
 
-bail2:
-    FcPatternDestroy (bucket->pattern);
-bail1:
-    free (bucket);
-bail0:
+/*
+ * Fonts are indexed for listing by keys of their values of a few
+ * objects queries commonly select on.  Values which may match each
+ * other under FcOpListing have equal keys, so the fonts found through
+ * the keys of a pattern are a superset of those listed, and
+ * FcListPatternMatchAny still checks each of them.  Fonts with values
+ * which can't be keyed are candidates for any value.
+ */
+static const struct {
+    FcObject object;
+    FcType   type;
+} fcListIndexObjects[] = {
+    { FC_FAMILY_OBJECT,     FcTypeString  },
+    { FC_STYLE_OBJECT,      FcTypeString  },
+    { FC_LANG_OBJECT,       FcTypeLangSet },
+    { FC_SPACING_OBJECT,    FcTypeInteger },
+    { FC_FONTFORMAT_OBJECT, FcTypeString  },
+    { FC_FILE_OBJECT,       FcTypeString  },
+};
+
+#define NUM_LIST_INDEX_OBJECTS (int)(sizeof (fcListIndexObjects) / sizeof (fcListIndexObjects[0]))
+
+typedef struct _FcListKeySlot {
+    FcChar32 key;
+    int      last;  /* the font seen last, as a font may repeat a key */
+    int      start; /* the fonts with the key in FcListIndexObject.fonts */
+    int      count;
+} FcListKeySlot;
+
+typedef struct _FcListIndexObject {
+    FcListKeySlot *slots;
+    int            nslot;
+    int            sslot; /* a power of two */
+    int           *fonts;
+    int           *any; /* fonts with values which can't be keyed */
+    int            nany;
+} FcListIndexObject;
+
+struct _FcListIndex {
+    int               nfont; /* fonts added to the set later are scanned */
+    FcListIndexObject objects[NUM_LIST_INDEX_OBJECTS];
+};
+
+typedef struct _FcListKeys {
+    FcChar32 *keys;
+    int       nkey;
+    int       skey;
+} FcListKeys;
+
+static FcBool
+FcListKeysAdd (FcListKeys *keys, FcChar32 key)
+{
+    if (keys->nkey == keys->skey) {
+	int       size = keys->skey ? keys->skey * 2 : NUM_LANG_SET_MAP * 32;
+	FcChar32 *k = realloc (keys->keys, size * sizeof (FcChar32));
+
+	if (!k)
+	    return FcFalse;
+	keys->keys = k;
+	keys->skey = size;
+    }
+    keys->keys[keys->nkey++] = key;
+    return FcTrue;
+}
+
+/*
+ * Append the keys of v to keys, clearing *keyed when v may match
+ * values of any key; a langset has the key of each of its languages
+ */
+static FcBool
+FcListValueKeys (FcType type, const FcValue *v, FcListKeys *keys, FcBool *keyed)
+{
+    *keyed = FcFalse;
+    switch (type) {
+    case FcTypeString:
+	if (v->type != FcTypeString)
+	    return FcTrue;
+	*keyed = FcTrue;
+	return FcListKeysAdd (keys, FcStrHashIgnoreBlanksAndCase (v->u.s));
+    case FcTypeInteger: {
+	double   d;
+	uint64_t bits;
+
+	if (v->type == FcTypeInteger)
+	    d = v->u.i;
+	else if (v->type == FcTypeDouble)
+	    d = v->u.d + 0.0; /* no negative zero */
+	else
+	    return FcTrue;
+	memcpy (&bits, &d, sizeof (bits));
+	*keyed = FcTrue;
+	return FcListKeysAdd (keys, (FcChar32)(bits ^ (bits >> 32)));
+    }
+    case FcTypeLangSet: {
+	const FcLangSet *ls = v->u.l;
+	FcChar32         hashes[NUM_LANG_SET_MAP * 32];
+	int              i, n;
+
+	/* Languages beyond a shorter bitmap aren't compared */
+	if (v->type != FcTypeLangSet || ls->map_size < NUM_LANG_SET_MAP)
+	    return FcTrue;
+	*keyed = FcTrue;
+	n = FcLangSetBitmapHashes (ls, hashes);
+	for (i = 0; i < n; i++)
+	    if (!FcListKeysAdd (keys, hashes[i]))
+		return FcFalse;
+	if (ls->extra) {
+	    FcStrList     *list = FcStrListCreate (ls->extra);
+	    const FcChar8 *extra;
+
+	    if (!list)
+		return FcFalse;
+	    while ((extra = FcStrListNext (list)))
+		if (!FcListKeysAdd (keys, FcLangHash (extra)))
+		    break;
+	    FcStrListDone (list);
+	    if (extra)
+		return FcFalse;
+	}
+	return FcTrue;
+    }
+    default:
+	return FcTrue;
+    }
+}
+
+static FcListKeySlot *
+FcListIndexSlot (const FcListIndexObject *io, FcChar32 key)
+{
+    int i;
+
+    if (!io->sslot)
+	return NULL;
+    for (i = key & (io->sslot - 1); io->slots[i].count; i = (i + 1) & (io->sslot - 1))
+	if (io->slots[i].key == key)
+	    return &io->slots[i];
+    return NULL;
+}
+
+/*
+ * Count font under key, growing the slots at three quarters load
+ */
+static FcBool
+FcListIndexCount (FcListIndexObject *io, FcChar32 key, int font)
+{
+    FcListKeySlot *slot;
+    int            i;
+
+    if ((io->nslot + 1) * 4 > io->sslot * 3) {
+	int            size = io->sslot ? io->sslot * 2 : 64;
+	FcListKeySlot *slots = calloc (size, sizeof (FcListKeySlot));
+
+	if (!slots)
+	    return FcFalse;
+	for (i = 0; i < io->sslot; i++) {
+	    int j;
+
+	    if (!io->slots[i].count)
+		continue;
+	    for (j = io->slots[i].key & (size - 1); slots[j].count; j = (j + 1) & (size - 1))
+		;
+	    slots[j] = io->slots[i];
+	}
+	free (io->slots);
+	io->slots = slots;
+	io->sslot = size;
+    }
+    slot = FcListIndexSlot (io, key);
+    if (!slot) {
+	for (i = key & (io->sslot - 1); io->slots[i].count; i = (i + 1) & (io->sslot - 1))
+	    ;
+	slot = &io->slots[i];
+	slot->key = key;
+	slot->last = -1;
+	io->nslot++;
+    }
+    if (slot->last != font) {
+	slot->last = font;
+	slot->count++;
+    }
+    return FcTrue;
+}
+
+static FcBool
+FcListIndexObjectBuild (FcListIndexObject *io,
+                        FcType             type,
+                        FcObject           object,
+                        const FcFontSet   *set,
+                        int                nfont)
+{
+    FcListKeys keys = { 0 };
+    int       *fonts = NULL, nkeyed = 0, skeyed = 0;
+    int        f, i, k, total;
+    FcBool     ret = FcFalse;
+
+    io->any = malloc ((nfont + 1) * sizeof (int));
+    if (!io->any)
+	return FcFalse;
+    /*
+     * Collect the keys of every font and count the fonts of each key,
+     * remembering where the keys of each font end
+     */
+    for (f = 0; f < nfont; f++) {
+	FcPatternElt  *e = FcPatternObjectFindElt (set->fonts[f], object);
+	FcValueListPtr v;
+	FcBool         keyed = FcTrue;
+	int            start = keys.nkey;
+
+	if (e) {
+	    for (v = FcPatternEltValues (e); v && keyed; v = FcValueListNext (v)) {
+		FcValue value = FcValueCanonicalize (&v->value);
+
+		if (!FcListValueKeys (type, &value, &keys, &keyed))
+		    goto bail;
+	    }
+	}
+	if (!keyed) {
+	    keys.nkey = start;
+	    io->any[io->nany++] = f;
+	}
+	if (keys.nkey == start)
+	    continue;
+	if (nkeyed == skeyed) {
+	    int  size = skeyed ? skeyed * 2 : 64;
+	    int *n = realloc (fonts, size * 2 * sizeof (int));
+
+	    if (!n)
+		goto bail;
+	    fonts = n;
+	    skeyed = size;
+	}
+	fonts[nkeyed * 2] = f;
+	fonts[nkeyed * 2 + 1] = keys.nkey;
+	nkeyed++;
+	for (k = start; k < keys.nkey; k++)
+	    if (!FcListIndexCount (io, keys.keys[k], f))
+		goto bail;
+    }
+    /*
+     * Lay the fonts of the keys out one after the other, each in font
+     * order
+     */
+    total = 0;
+    for (i = 0; i < io->sslot; i++) {
+	io->slots[i].start = total;
+	io->slots[i].last = -1;
+	total += io->slots[i].count;
+    }
+    io->fonts = malloc ((total + 1) * sizeof (int));
+    if (!io->fonts)
+	goto bail;
+    for (i = 0, k = 0; i < nkeyed; i++) {
+	f = fonts[i * 2];
+	for (; k < fonts[i * 2 + 1]; k++) {
+	    FcListKeySlot *slot = FcListIndexSlot (io, keys.keys[k]);
+
+	    if (slot->last != f) {
+		slot->last = f;
+		io->fonts[slot->start++] = f;
+	    }
+	}
+    }
+    for (i = 0; i < io->sslot; i++)
+	io->slots[i].start -= io->slots[i].count;
+    ret = FcTrue;
+bail:
+    free (keys.keys);
+    free (fonts);
+    return ret;
+}
+
+static FcListIndex *
+FcListIndexCreate (const FcFontSet *set)
+{
+    FcListIndex *index = calloc (1, sizeof (FcListIndex));
+    int          i;
+
+    if (!index)
+	return NULL;
+    index->nfont = set->nfont;
+    for (i = 0; i < NUM_LIST_INDEX_OBJECTS; i++) {
+	if (!FcListIndexObjectBuild (&index->objects[i],
+	                             fcListIndexObjects[i].type,
+	                             fcListIndexObjects[i].object,
+	                             set, index->nfont)) {
+	    FcListIndexDestroy (index);
+	    return NULL;
+	}
+    }
+    return index;
+}
+
+void
+FcListIndexDestroy (FcListIndex *index)
+{
+    int i;
+
+    if (!index)
+	return;
+    for (i = 0; i < NUM_LIST_INDEX_OBJECTS; i++) {
+	free (index->objects[i].slots);
+	free (index->objects[i].fonts);
+	free (index->objects[i].any);
+    }
+    free (index);
+}
+
+static int
+FcListIndexObjectFind (FcObject object)
+{
+    int i;
+
+    for (i = 0; i < NUM_LIST_INDEX_OBJECTS; i++)
+	if (fcListIndexObjects[i].object == object)
+	    return i;
+    return -1;
+}
+
+/*
+ * Find the index of set, building it when the set is queried a second
+ * time with a pattern selecting on an indexed object
+ */
+static FcListIndex *
+FcListIndexGet (FcConfig *config, const FcFontSet *set, const FcPattern *p)
+{
+    FcListIndex *index;
+    int          s, i;
+
+    for (s = FcSetSystem; s <= FcSetApplication; s++)
+	if (config->fonts[s] == set)
+	    break;
+    if (s > FcSetApplication || !p)
+	return NULL;
+    for (i = 0; i < p->num; i++)
+	if (FcListIndexObjectFind (FcPatternElts (p)[i].object) >= 0)
+	    break;
+    if (i == p->num)
+	return NULL;
+
+    index = fc_atomic_ptr_get (&config->listIndex[s]);
+    if (!index) {
+	if (fc_atomic_int_add (config->listQueries[s], 1) < 1)
+	    return NULL;
+	index = FcListIndexCreate (set);
+	if (index && !fc_atomic_ptr_cmpexch (&config->listIndex[s], NULL, index)) {
+	    FcListIndexDestroy (index);
+	    index = fc_atomic_ptr_get (&config->listIndex[s]);
+	}
+    }
+    return index;
+}
+
+/*
+ * Keep the fonts of cand which are among fonts or any, or when cand
+ * is still empty, take them all; returns the number of fonts kept
+ */
+static int
+FcListIndexRestrict (int       *cand,
+                     int        ncand,
+                     FcBool     first,
+                     const int *fonts,
+                     int        nfont,
+                     const int *any,
+                     int        nany)
+{
+    int i = 0, j = 0, k = 0, n = 0;
+
+    if (first) {
+	while (j < nfont || k < nany) {
+	    if (k == nany || (j < nfont && fonts[j] < any[k]))
+		cand[n++] = fonts[j++];
+	    else if (j == nfont || any[k] < fonts[j])
+		cand[n++] = any[k++];
+	    else {
+		cand[n++] = fonts[j++];
+		k++;
+	    }
+	}
+	return n;
+    }
+    for (; i < ncand; i++) {
+	while (j < nfont && fonts[j] < cand[i])
+	    j++;
+	while (k < nany && any[k] < cand[i])
+	    k++;
+	if ((j < nfont && fonts[j] == cand[i]) || (k < nany && any[k] == cand[i]))
+	    cand[n++] = cand[i];
+    }
+    return n;
+}
+
+/*
+ * Intersect the fonts of the keys of each value of the indexed objects
+ * of p, in font order; returns FcFalse when p doesn't select on any
+ * indexed object or when out of memory, leaving every font to check
+ */
+static FcBool
+FcListIndexPlan (const FcListIndex *index,
+                 const FcPattern   *p,
+                 int              **fonts,
+                 int               *nfont)
+{
+    FcListKeys keys = { 0 };
+    int       *cand = NULL;
+    int        ncand = 0;
+    int        i, k;
+
+    for (i = 0; i < p->num; i++) {
+	FcPatternElt            *pe = &FcPatternElts (p)[i];
+	int                      o = FcListIndexObjectFind (pe->object);
+	const FcListIndexObject *io;
+	FcValueListPtr           v;
+
+	if (o < 0)
+	    continue;
+	io = &index->objects[o];
+	for (v = FcPatternEltValues (pe); v; v = FcValueListNext (v)) {
+	    FcValue value = FcValueCanonicalize (&v->value);
+	    FcBool  keyed;
+
+	    keys.nkey = 0;
+	    if (!FcListValueKeys (fcListIndexObjects[o].type, &value, &keys, &keyed))
+		goto bail;
+	    if (!keyed)
+		continue;
+	    for (k = 0; k < keys.nkey; k++) {
+		FcListKeySlot *slot = FcListIndexSlot (io, keys.keys[k]);
+		FcBool         first = !cand;
+
+		if (first) {
+		    cand = malloc ((index->nfont + 1) * sizeof (int));
+		    if (!cand)
+			goto bail;
+		}
+		ncand = FcListIndexRestrict (cand, ncand, first,
+		                             slot ? io->fonts + slot->start : NULL,
+		                             slot ? slot->count : 0,
+		                             io->any, io->nany);
+	    }
+	}
+    }
+    free (keys.keys);
+    *fonts = cand;
+    *nfont = ncand;
+    return cand != NULL;
+
+bail:
+    free (keys.keys);
+    free (cand);
     return FcFalse;
 }
 
+/*
+ * A walk through the fonts of a set which may match a pattern: the
+ * candidates from the index, if any, then the fonts added since
+ */
+typedef struct _FcListScan {
+    FcFontSet *set;
+    int       *cand;
+    int        ncand;
+    int        start; /* the first font not indexed */
+    int        next;
+} FcListScan;
+
+static void
+FcListScanInit (FcListScan      *scan,
+                FcConfig        *config,
+                FcFontSet       *set,
+                const FcPattern *p)
+{
+    FcListIndex *index = FcListIndexGet (config, set, p);
+
+    scan->set = set;
+    scan->cand = NULL;
+    scan->ncand = 0;
+    scan->start = 0;
+    scan->next = 0;
+    if (index && FcListIndexPlan (index, p, &scan->cand, &scan->ncand))
+	scan->start = index->nfont;
+}
+
+static FcPattern *
+FcListScanNext (FcListScan *scan, const FcPattern *p)
+{
+    while (scan->next < scan->ncand + scan->set->nfont - scan->start) {
+	FcPattern *font;
+
+	if (scan->next < scan->ncand)
+	    font = scan->set->fonts[scan->cand[scan->next]];
+	else
+	    font = scan->set->fonts[scan->start + scan->next - scan->ncand];
+	scan->next++;
+	if (FcListPatternMatchAny (p, font))
+	    return font;
+    }
+    return NULL;
+}
+
+static void
+FcListScanFini (FcListScan *scan)
+{
+    free (scan->cand);
+    scan->cand = NULL;
+}
+
 FcFontSet *
 FcFontSetList (FcConfig    *config,
                FcFontSet  **sets,
@@ -448,9 +968,11 @@ FcFontSetList (FcConfig    *config,
                FcPattern   *p,
                FcObjectSet *os)
 {
+    FcConfigHazard  hazard;
     FcFontSet      *ret;
     FcFontSet      *s;
-    int             f;
+    FcListScan      scan;
+    FcPattern      *font;
     int             set;
     FcListHashTable table;
     int             i;
@@ -461,7 +983,7 @@ FcFontSetList (FcConfig    *config,
 	if (!FcInitBringUptoDate())
 	    goto bail0;
     }
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	goto bail0;
     FcListHashTableInit (&table);
@@ -479,18 +1001,19 @@ FcFontSetList (FcConfig    *config,
 	s = sets[set];
 	if (!s)
 	    continue;
-	for (f = 0; f < s->nfont; f++)
-	    if (FcListPatternMatchAny (p,            /* pattern */
-	                               s->fonts[f])) /* font */
-	    {
-		FcChar8 *lang;
+	FcListScanInit (&scan, config, s, p);
+	while ((font = FcListScanNext (&scan, p))) {
+	    FcChar8 *lang;
 
-		if (FcPatternObjectGetString (p, FC_NAMELANG_OBJECT, 0, &lang) != FcResultMatch) {
-		    lang = FcConfigGetDefaultLang (config);
-		}
-		if (!FcListAppend (&table, s->fonts[f], os, lang))
-		    goto bail1;
+	    if (FcPatternObjectGetString (p, FC_NAMELANG_OBJECT, 0, &lang) != FcResultMatch) {
+		lang = FcConfigGetDefaultLang (config);
+	    }
+	    if (!FcListAppend (&table, font, os, lang)) {
+		FcListScanFini (&scan);
+		goto bail1;
 	    }
+	}
+	FcListScanFini (&scan);
     }
 #if 0
     {
@@ -534,7 +1057,7 @@ FcFontSetList (FcConfig    *config,
 
     if (destroy_os)
 	FcObjectSetDestroy (os);
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 
@@ -542,7 +1065,7 @@ bail2:
     FcFontSetDestroy (ret);
 bail1:
     FcListHashTableCleanup (&table);
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 bail0:
     if (destroy_os)
 	FcObjectSetDestroy (os);
@@ -554,14 +1077,15 @@ FcFontList (FcConfig    *config,
             FcPattern   *p,
             FcObjectSet *os)
 {
-    FcFontSet *sets[2], *ret;
-    int        nsets;
+    FcConfigHazard hazard;
+    FcFontSet     *sets[2], *ret;
+    int            nsets;
 
     if (!config) {
 	if (!FcInitBringUptoDate())
 	    return 0;
     }
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	return NULL;
     nsets = 0;
@@ -570,10 +1094,204 @@ FcFontList (FcConfig    *config,
     if (config->fonts[FcSetApplication])
 	sets[nsets++] = config->fonts[FcSetApplication];
     ret = FcFontSetList (config, sets, nsets, p, os);
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 }
+/*
+ * The fonts already listed by an iterator are remembered in an open
+ * addressing hash set holding references to the fonts themselves,
+ * rather than a copy of their listed objects, so that they outlive a
+ * font set replaced during the listing.
+ */
+typedef struct _FcListSeen {
+    FcChar32   hash;
+    FcPattern *font;
+} FcListSeen;
+
+struct _FcFontListIter {
+    FcConfig    *config;
+    int          serial; /* config->fontsSerial when the listing started */
+    int          set;    /* the set scanned */
+    FcListScan   scan;
+    FcPattern   *p;
+    FcObjectSet *os;
+    FcChar8     *lang;
+    FcListSeen  *seen;
+    int          nseen;
+    int          sseen; /* a power of two */
+};
+
+static FcObjectSet *
+FcListObjectSetCopy (const FcObjectSet *os)
+{
+    FcObjectSet *copy = FcObjectSetCreate();
+
+    if (!copy)
+	return NULL;
+    if (os->nobjIds) {
+	copy->objIds = malloc (os->nobjIds * sizeof (FcObject));
+	if (!copy->objIds) {
+	    FcObjectSetDestroy (copy);
+	    return NULL;
+	}
+	memcpy (copy->objIds, os->objIds, os->nobjIds * sizeof (FcObject));
+	copy->nobjIds = copy->sobject = os->nobjIds;
+    }
+    return copy;
+}
+
+/*
+ * Remember font as listed, setting *added unless an equal one was
+ * listed before; returns FcFalse when out of memory
+ */
+static FcBool
+FcListSeenAdd (FcFontListIter *iter, FcPattern *font, FcBool *added)
+{
+    FcChar32 hash = FcListPatternHash (font, iter->os);
+    int      i;
+
+    *added = FcFalse;
+    if ((iter->nseen + 1) * 4 > iter->sseen * 3) {
+	int         size = iter->sseen ? iter->sseen * 2 : 64;
+	FcListSeen *seen = calloc (size, sizeof (FcListSeen));
+
+	if (!seen)
+	    return FcFalse;
+	for (i = 0; i < iter->sseen; i++) {
+	    FcListSeen *s = &iter->seen[i];
+	    int         j;
+
+	    if (!s->font)
+		continue;
+	    for (j = s->hash & (size - 1); seen[j].font; j = (j + 1) & (size - 1))
+		;
+	    seen[j] = *s;
+	}
+	free (iter->seen);
+	iter->seen = seen;
+	iter->sseen = size;
+    }
+    for (i = hash & (iter->sseen - 1); iter->seen[i].font; i = (i + 1) & (iter->sseen - 1)) {
+	if (iter->seen[i].hash == hash &&
+	    FcListPatternEqual (iter->seen[i].font, font, iter->os))
+	    return FcTrue;
+    }
+    FcPatternReference (font);
+    iter->seen[i].hash = hash;
+    iter->seen[i].font = font;
+    iter->nseen++;
+    *added = FcTrue;
+
+    return FcTrue;
+}
+
+FcFontListIter *
+FcFontListIterCreate (FcConfig    *config,
+                      FcPattern   *p,
+                      FcObjectSet *os)
+{
+    FcFontListIter *iter;
+    FcChar8        *lang;
+
+    if (!config) {
+	if (!FcInitBringUptoDate())
+	    return NULL;
+    }
+    iter = calloc (1, sizeof (FcFontListIter));
+    if (!iter)
+	return NULL;
+    iter->config = FcConfigReference (config);
+    if (!iter->config)
+	goto bail;
+    iter->serial = iter->config->fontsSerial;
+    iter->set = FcSetSystem;
+    iter->p = p ? FcPatternDuplicate (p) : FcPatternCreate();
+    if (!iter->p)
+	goto bail;
+    iter->os = os ? FcListObjectSetCopy (os) : FcObjectGetSet();
+    if (!iter->os)
+	goto bail;
+    if (FcPatternObjectGetString (iter->p, FC_NAMELANG_OBJECT, 0, &lang) != FcResultMatch)
+	lang = FcConfigGetDefaultLang (iter->config);
+    iter->lang = FcStrCopy (lang);
+    if (!iter->lang)
+	goto bail;
+
+    return iter;
+
+bail:
+    FcFontListIterDestroy (iter);
+    return NULL;
+}
+
+FcPattern *
+FcFontListIterNext (FcFontListIter *iter, FcResult *result)
+{
+    *result = FcResultNoMatch;
+    if (!iter)
+	return NULL;
+    /*
+     * The sets are looked up on each call.  When one was replaced, the
+     * listing starts over on the new sets, skipping the fonts listed
+     * before as usual.
+     */
+    if (iter->serial != iter->config->fontsSerial) {
+	FcListScanFini (&iter->scan);
+	iter->scan.set = NULL;
+	iter->set = FcSetSystem;
+	iter->serial = iter->config->fontsSerial;
+    }
+    for (; iter->set <= FcSetApplication; iter->set++) {
+	FcFontSet *set = iter->config->fonts[iter->set];
+	FcPattern *font;
+
+	if (!set)
+	    continue;
+	if (!iter->scan.set)
+	    FcListScanInit (&iter->scan, iter->config, set, iter->p);
+	while ((font = FcListScanNext (&iter->scan, iter->p))) {
+	    FcBool added;
+
+	    if (!FcListSeenAdd (iter, font, &added)) {
+		*result = FcResultOutOfMemory;
+		return NULL;
+	    }
+	    if (added) {
+		font = FcListProject (font, iter->os, iter->lang);
+		*result = font ? FcResultMatch : FcResultOutOfMemory;
+		return font;
+	    }
+	}
+	FcListScanFini (&iter->scan);
+	iter->scan.set = NULL;
+    }
+    return NULL;
+}
+
+void
+FcFontListIterDestroy (FcFontListIter *iter)
+{
+    int i;
+
+    if (!iter)
+	return;
+    if (iter->config)
+	FcConfigDestroy (iter->config);
+    if (iter->p)
+	FcPatternDestroy (iter->p);
+    if (iter->os)
+	FcObjectSetDestroy (iter->os);
+    if (iter->lang)
+	FcStrFree (iter->lang);
+    FcListScanFini (&iter->scan);
+    for (i = 0; i < iter->sseen; i++)
+	if (iter->seen[i].font)
+	    FcPatternDestroy (iter->seen[i].font);
+    free (iter->seen);
+    free (iter);
+}
+
 #define __fclist__
 #include "fcaliastail.h"
 #undef __fclist__
@@ -513,52 +513,82 @@ done:
 
 /* The bulk of the time in FcFontMatch and FcFontSort goes to
  * walking long lists of family names. We speed this up with a
- * hash table.
+ * hash table.  The table and the other scratch memory of a call
+ * come from an arena which normally fits on the stack.
  */
-typedef struct
-{
-    double strong_value;
-    double weak_value;
+#define FC_FAMILY_HASH_SIZE 64
+#define FC_SCRATCH_SIZE     4096
+
+typedef struct _FamilyEntry {
+    struct _FamilyEntry *next;
+    const FcChar8       *family;
+    FcChar32             hash;
+    double               strong_value;
+    double               weak_value;
 } FamilyEntry;
 
 typedef struct
 {
-    FcHashTable *family_hash;
+    FamilyEntry *family_hash[FC_FAMILY_HASH_SIZE];
+    FcArena      arena;
+    double       scratch[FC_SCRATCH_SIZE / sizeof (double)];
 } FcCompareData;
 
+static FamilyEntry *
+FcCompareDataFindFamily (FcCompareData *data,
+                         const FcChar8 *family,
+                         FcChar32       hash)
+{
+    FamilyEntry *e;
+
+    for (e = data->family_hash[hash % FC_FAMILY_HASH_SIZE]; e; e = e->next) {
+	if (e->hash == hash && !FcStrCmpIgnoreBlanksAndCase (e->family, family))
+	    return e;
+    }
+    return NULL;
+}
+
 static void
 FcCompareDataClear (FcCompareData *data)
 {
-    FcHashTableDestroy (data->family_hash);
+    if (FcDebug() & FC_DBG_MEMORY)
+	printf ("Scratch memory: %lu bytes, %d heap allocation(s)\n",
+	        (unsigned long)data->arena.size, data->arena.nchunk);
+    FcArenaFini (&data->arena);
 }
 
-static void
+static FcBool
 FcCompareDataInit (FcPattern     *pat,
                    FcCompareData *data)
 {
-    FcHashTable   *table;
     FcPatternElt  *elt;
     FcValueListPtr l;
     int            i;
-    const void    *key;
+    const FcChar8 *key;
+    FcChar32       hash;
     FamilyEntry   *e;
 
-    table = FcHashTableCreate ((FcHashFunc)FcStrHashIgnoreBlanksAndCase,
-                               (FcCompareFunc)FcStrCmpIgnoreBlanksAndCase,
-                               NULL,
-                               NULL,
-                               NULL,
-                               free);
+    memset (data->family_hash, 0, sizeof (data->family_hash));
+    FcArenaInit (&data->arena, data->scratch, sizeof (data->scratch));
 
     elt = FcPatternObjectFindElt (pat, FC_FAMILY_OBJECT);
     if (elt) {
 	for (l = FcPatternEltValues (elt), i = 0; l; l = FcValueListNext (l), i++) {
 	    key = FcValueString (&l->value);
-	    if (!FcHashTableFind (table, key, (void **)&e)) {
-		e = malloc (sizeof (FamilyEntry));
+	    hash = FcStrHashIgnoreBlanksAndCase (key);
+	    e = FcCompareDataFindFamily (data, key, hash);
+	    if (!e) {
+		e = FcArenaAlloc (&data->arena, sizeof (FamilyEntry));
+		if (!e) {
+		    FcCompareDataClear (data);
+		    return FcFalse;
+		}
+		e->family = key;
+		e->hash = hash;
 		e->strong_value = 1e99;
 		e->weak_value = 1e99;
-		FcHashTableAdd (table, (void *)key, e);
+		e->next = data->family_hash[hash % FC_FAMILY_HASH_SIZE];
+		data->family_hash[hash % FC_FAMILY_HASH_SIZE] = e;
 	    }
 	    if (l->binding == FcValueBindingWeak) {
 		if (i < e->weak_value)
@@ -570,7 +600,7 @@ FcCompareDataInit (FcPattern     *pat,
 	}
     }
 
-    data->family_hash = table;
+    return FcTrue;
 }
 
 static FcBool
@@ -580,22 +610,21 @@ FcCompareFamilies (FcPattern     *pat,
                    FcValueListPtr v2orig,
                    double        *value,
                    FcResult      *result,
-                   FcHashTable   *table)
+                   FcCompareData *data)
 {
     FcValueListPtr v2;
     double         strong_value;
     double         weak_value;
-    const void    *key;
+    const FcChar8 *key;
     FamilyEntry   *e;
 
-    assert (table != NULL);
-
     strong_value = 1e99;
     weak_value = 1e99;
 
     for (v2 = v2orig; v2; v2 = FcValueListNext (v2)) {
 	key = FcValueString (&v2->value);
-	if (FcHashTableFind (table, key, (void **)&e)) {
+	e = FcCompareDataFindFamily (data, key, FcStrHashIgnoreBlanksAndCase (key));
+	if (e) {
 	    if (e->strong_value < strong_value)
 		strong_value = e->strong_value;
 	    if (e->weak_value < weak_value)
@@ -644,11 +673,10 @@ FcCompare (FcPattern     *pat,
 	    i2++;
 	else if (i < 0)
 	    i1++;
-	else if (elt_i1->object == FC_FAMILY_OBJECT && data->family_hash) {
+	else if (elt_i1->object == FC_FAMILY_OBJECT) {
 	    if (!FcCompareFamilies (pat, FcPatternEltValues (elt_i1),
 	                            fnt, FcPatternEltValues (elt_i2),
-	                            value, result,
-	                            data->family_hash))
+	                            value, result, data))
 		return FcFalse;
 	    i1++;
 	    i2++;
@@ -867,7 +895,8 @@ FcFontSetMatchInternal (FcFontSet **sets,
 	FcPatternPrint (p);
     }
 
-    FcCompareDataInit (p, &data);
+    if (!FcCompareDataInit (p, &data))
+	return NULL;
 
     for (set = 0; set < nsets; set++) {
 	s = sets[set];
@@ -998,7 +1027,8 @@ FcFontSetMatch (FcConfig   *config,
                 FcPattern  *p,
                 FcResult   *result)
 {
-    FcPattern *best, *ret = NULL;
+    FcConfigHazard hazard;
+    FcPattern     *best, *ret = NULL;
 
     assert (sets != NULL);
     assert (p != NULL);
@@ -1006,7 +1036,7 @@ FcFontSetMatch (FcConfig   *config,
 
     *result = FcResultNoMatch;
 
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	return NULL;
     best = FcFontSetMatchInternal (sets, nsets, p, result);
@@ -1015,7 +1045,7 @@ FcFontSetMatch (FcConfig   *config,
 	FcPatternDestroy (best);
     }
 
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 }
@@ -1025,16 +1055,17 @@ FcFontMatch (FcConfig  *config,
              FcPattern *p,
              FcResult  *result)
 {
-    FcFontSet *sets[2];
-    int        nsets;
-    FcPattern *best, *ret = NULL;
+    FcConfigHazard hazard;
+    FcFontSet     *sets[2];
+    int            nsets;
+    FcPattern     *best, *ret = NULL;
 
     assert (p != NULL);
     assert (result != NULL);
 
     *result = FcResultNoMatch;
 
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	return NULL;
     nsets = 0;
@@ -1049,7 +1080,7 @@ FcFontMatch (FcConfig  *config,
 	FcPatternDestroy (best);
     }
 
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 }
@@ -1153,19 +1184,20 @@ FcFontSetSort (FcConfig   *config,
                FcCharSet **csp,
                FcResult   *result)
 {
-    FcFontSet    *ret;
-    FcFontSet    *s;
-    FcSortNode   *nodes;
-    FcSortNode  **nodeps, **nodep;
-    int           nnodes;
-    FcSortNode   *newp;
-    int           set;
-    int           f;
-    int           i;
-    int           nPatternLang;
-    FcBool       *patternLangSat;
-    FcValue       patternLang;
-    FcCompareData data;
+    FcConfigHazard hazard;
+    FcFontSet     *ret;
+    FcFontSet     *s;
+    FcSortNode    *nodes;
+    FcSortNode   **nodeps, **nodep;
+    int            nnodes;
+    FcSortNode    *newp;
+    int            set;
+    int            f;
+    int            i;
+    int            nPatternLang;
+    FcBool        *patternLangSat;
+    FcValue        patternLang;
+    FcCompareData  data;
 
     assert (sets != NULL);
     assert (p != NULL);
@@ -1194,26 +1226,25 @@ FcFontSetSort (FcConfig   *config,
     if (!nnodes)
 	return FcFontSetCreate();
 
-    if (!config)
-	config = FcConfigGetCurrent();
-    FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
 
     for (nPatternLang = 0;
          FcPatternGet (p, FC_LANG, nPatternLang, &patternLang) == FcResultMatch;
          nPatternLang++)
 	;
 
+    if (!FcCompareDataInit (p, &data))
+	goto bail0;
     /* freed below */
-    nodes = malloc (nnodes * sizeof (FcSortNode) +
-                    nnodes * sizeof (FcSortNode *) +
-                    nPatternLang * sizeof (FcBool));
+    nodes = FcArenaAlloc (&data.arena,
+                          nnodes * sizeof (FcSortNode) +
+                              nnodes * sizeof (FcSortNode *) +
+                              nPatternLang * sizeof (FcBool));
     if (!nodes)
-	goto bail0;
+	goto bail1;
     nodeps = (FcSortNode **)(nodes + nnodes);
     patternLangSat = (FcBool *)(nodeps + nnodes);
 
-    FcCompareDataInit (p, &data);
-
     newp = nodes;
     nodep = nodeps;
     for (set = 0; set < nsets; set++) {
@@ -1248,8 +1279,6 @@ FcFontSetSort (FcConfig   *config,
 	}
     }
 
-    FcCompareDataClear (&data);
-
     nnodes = newp - nodes;
 
     qsort (nodeps, nnodes, sizeof (FcSortNode *),
@@ -1307,7 +1336,7 @@ FcFontSetSort (FcConfig   *config,
     if (!FcSortWalk (nodeps, nnodes, ret, csp, trim))
 	goto bail2;
 
-    free (nodes);
+    FcCompareDataClear (&data);
 
     if (ret->nfont > 0) {
 	*result = FcResultMatch;
@@ -1316,18 +1345,16 @@ FcFontSetSort (FcConfig   *config,
 	    FcPatternPrint (ret->fonts[0]);
 	}
     }
-    if (config)
-	FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 
 bail2:
     FcFontSetDestroy (ret);
 bail1:
-    free (nodes);
+    FcCompareDataClear (&data);
 bail0:
-    if (config)
-	FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
     return 0;
 }
 
@@ -1338,15 +1365,16 @@ FcFontSort (FcConfig   *config,
             FcCharSet **csp,
             FcResult   *result)
 {
-    FcFontSet *sets[2], *ret;
-    int        nsets;
+    FcConfigHazard hazard;
+    FcFontSet     *sets[2], *ret;
+    int            nsets;
 
     assert (p != NULL);
     assert (result != NULL);
 
     *result = FcResultNoMatch;
 
-    config = FcConfigReference (config);
+    config = FcConfigAcquire (config, &hazard);
     if (!config)
 	return NULL;
     nsets = 0;
@@ -1355,7 +1383,7 @@ FcFontSort (FcConfig   *config,
     if (config->fonts[FcSetApplication])
 	sets[nsets++] = config->fonts[FcSetApplication];
     ret = FcFontSetSort (config, sets, nsets, p, trim, csp, result);
-    FcConfigDestroy (config);
+    FcConfigRelease (&hazard);
 
     return ret;
 }
@@ -1419,6 +1419,140 @@ FcPatternIterGetValue (const FcPattern *pat, FcPatternIter *iter, int id, FcValu
     return FcResultNoId;
 }
 
+/*
+ * Value lists with identical contents are laid out only once in a
+ * cache; the named instances of a variable font, and the faces of a
+ * family, carry the same family names, file, languages and so on, so
+ * their patterns end up sharing most of their values.
+ */
+typedef struct _FcValueListFrozen {
+    FcChar32           hash;
+    const FcValueList *list;
+} FcValueListFrozen;
+
+struct _FcValueListFreezer {
+    FcValueListFrozen *frozen;
+    size_t             count;
+    size_t             used;
+};
+
+/* Bindings aren't serialized, so they don't tell lists apart */
+static FcBool
+FcValueListIdentical (const FcValueList *la, const FcValueList *lb)
+{
+    for (; la && lb; la = FcValueListNext (la), lb = FcValueListNext (lb)) {
+	if (la->value.type != lb->value.type)
+	    return FcFalse;
+	switch ((int)la->value.type) {
+	case FcTypeString:
+	    if (strcmp ((const char *)la->value.u.s, (const char *)lb->value.u.s) != 0)
+		return FcFalse;
+	    break;
+	case FcTypeRange:
+	    if (!FcRangeIsInRange (la->value.u.r, lb->value.u.r) ||
+	        !FcRangeIsInRange (lb->value.u.r, la->value.u.r))
+		return FcFalse;
+	    break;
+	default:
+	    if (!FcValueEqual (la->value, lb->value))
+		return FcFalse;
+	    break;
+	}
+    }
+    return !la && !lb;
+}
+
+FcValueListFreezer *
+FcValueListFreezerCreate (void)
+{
+    FcValueListFreezer *freezer;
+
+    freezer = calloc (1, sizeof (FcValueListFreezer));
+    return freezer;
+}
+
+void
+FcValueListFreezerDestroy (FcValueListFreezer *freezer)
+{
+    free (freezer->frozen);
+    free (freezer);
+}
+
+static FcValueListFrozen *
+FcValueListFreezerFind (FcValueListFreezer *freezer, const FcValueList *vl, FcChar32 hash)
+{
+    size_t i;
+
+    if (!freezer->count)
+	return NULL;
+    for (i = hash & (freezer->count - 1);; i = (i + 1) & (freezer->count - 1)) {
+	FcValueListFrozen *f = &freezer->frozen[i];
+
+	if (!f->list ||
+	    (f->hash == hash && FcValueListIdentical (f->list, vl)))
+	    return f;
+    }
+}
+
+static FcBool
+FcValueListFreezerResize (FcValueListFreezer *freezer)
+{
+    FcValueListFrozen *old = freezer->frozen;
+    size_t             old_count = freezer->count, i;
+
+    freezer->count = old_count ? old_count * 2 : 64;
+    freezer->frozen = calloc (freezer->count, sizeof (FcValueListFrozen));
+    if (!freezer->frozen) {
+	freezer->frozen = old;
+	freezer->count = old_count;
+	return FcFalse;
+    }
+    for (i = 0; i < old_count; i++) {
+	size_t j;
+
+	if (!old[i].list)
+	    continue;
+	for (j = old[i].hash & (freezer->count - 1);
+	     freezer->frozen[j].list;
+	     j = (j + 1) & (freezer->count - 1))
+	    ;
+	freezer->frozen[j] = old[i];
+    }
+    free (old);
+    return FcTrue;
+}
+
+/*
+ * Return the first list seen with the same contents as vl, recording
+ * vl itself when there is none
+ */
+const FcValueList *
+FcValueListFreeze (FcValueListFreezer *freezer, const FcValueList *vl)
+{
+    FcChar32           hash = FcValueListHash ((FcValueListPtr)vl);
+    FcValueListFrozen *f;
+
+    if (freezer->used >= freezer->count / 4 * 3 &&
+        !FcValueListFreezerResize (freezer))
+	return NULL;
+    f = FcValueListFreezerFind (freezer, vl, hash);
+    if (!f->list) {
+	f->hash = hash;
+	f->list = vl;
+	freezer->used++;
+    }
+    return f->list;
+}
+
+static const FcValueList *
+FcValueListFindFrozen (FcValueListFreezer *freezer, const FcValueList *vl)
+{
+    FcValueListFrozen *f;
+
+    f = FcValueListFreezerFind (freezer, vl, FcValueListHash ((FcValueListPtr)vl));
+    return f ? f->list : NULL;
+}
+
 FcBool
 FcPatternSerializeAlloc (FcSerialize *serialize, const FcPattern *pat)
 {
@@ -1480,6 +1614,21 @@ FcPatternSerialize (FcSerialize *serialize, const FcPattern *pat)
 FcBool
 FcValueListSerializeAlloc (FcSerialize *serialize, const FcValueList *vl)
 {
+    const FcValueList *frozen;
+
+    if (vl) {
+	if (!serialize->vl_freezer) {
+	    serialize->vl_freezer = FcValueListFreezerCreate();
+	    if (!serialize->vl_freezer)
+		return FcFalse;
+	}
+	frozen = FcValueListFreeze (serialize->vl_freezer, vl);
+	if (!frozen)
+	    return FcFalse;
+	/* Already laid out for an earlier pattern */
+	if (frozen != vl)
+	    return FcTrue;
+    }
     while (vl) {
 	if (!FcSerializeAlloc (serialize, vl, sizeof (FcValueList)))
 	    return FcFalse;
@@ -1511,14 +1660,20 @@ FcValueListSerializeAlloc (FcSerialize *serialize, const FcValueList *vl)
 FcValueList *
 FcValueListSerialize (FcSerialize *serialize, const FcValueList *vl)
 {
-    FcValueList *vl_serialized;
-    FcChar8     *s_serialized;
-    FcCharSet   *c_serialized;
-    FcLangSet   *l_serialized;
-    FcRange     *r_serialized;
-    FcValueList *head_serialized = NULL;
-    FcValueList *prev_serialized = NULL;
-
+    FcValueList       *vl_serialized;
+    FcChar8           *s_serialized;
+    FcCharSet         *c_serialized;
+    FcLangSet         *l_serialized;
+    FcRange           *r_serialized;
+    FcValueList       *head_serialized = NULL;
+    FcValueList       *prev_serialized = NULL;
+    const FcValueList *frozen;
+
+    if (vl && serialize->vl_freezer) {
+	frozen = FcValueListFindFrozen (serialize->vl_freezer, vl);
+	if (frozen && frozen != vl)
+	    return FcSerializePtr (serialize, frozen);
+    }
     while (vl) {
 	vl_serialized = FcSerializePtr (serialize, vl);
 	if (!vl_serialized)
@@ -47,10 +47,15 @@ FcSerializeCreate (void)
     serialize->size = 0;
     serialize->linear = NULL;
     serialize->cs_freezer = NULL;
+    serialize->vl_freezer = NULL;
+    serialize->strings = NULL;
+    serialize->strings_count = 0;
+    serialize->strings_used = 0;
     serialize->buckets = NULL;
     serialize->buckets_count = 0;
     serialize->buckets_used = 0;
     serialize->buckets_used_max = 0;
+    serialize->written = 0;
     return serialize;
 }
 
@@ -58,8 +63,11 @@ void
 FcSerializeDestroy (FcSerialize *serialize)
 {
     free (serialize->buckets);
+    free (serialize->strings);
     if (serialize->cs_freezer)
 	FcCharSetFreezerDestroy (serialize->cs_freezer);
+    if (serialize->vl_freezer)
+	FcValueListFreezerDestroy (serialize->vl_freezer);
     free (serialize);
 }
 
@@ -266,19 +274,100 @@ FcSerializePtr (FcSerialize *serialize, const void *object)
     return (void *)((char *)serialize->linear + offset);
 }
 
+/*
+ * When the output is filled and written out a part at a time, objects
+ * shared with an earlier part are already written and out of reach
+ */
+FcBool
+FcSerializeWritten (FcSerialize *serialize, const void *object)
+{
+    return FcSerializeOffset (serialize, object) < serialize->written;
+}
+
+/*
+ * Strings are interned by contents, so that each distinct string is
+ * laid out once whichever copies of it the serialized objects hold.
+ * A string may then lie before the object using it, which readers of
+ * cache versions before 13 reject.
+ */
+static FcSerializeBucket *
+FcStrSerializeFind (const FcSerialize *serialize, const FcChar8 *str, uintptr_t hash)
+{
+    size_t count = serialize->strings_count;
+    size_t index;
+
+    if (!count)
+	return NULL;
+    for (index = hash & (count - 1);; index = (index + 1) & (count - 1)) {
+	FcSerializeBucket *bucket = &serialize->strings[index];
+
+	if (!bucket->object ||
+	    (bucket->hash == hash && !strcmp ((const char *)bucket->object, (const char *)str)))
+	    return bucket;
+    }
+}
+
+static FcBool
+FcStrSerializeResize (FcSerialize *serialize)
+{
+    FcSerializeBucket *old = serialize->strings;
+    size_t             old_count = serialize->strings_count;
+    size_t             count = old_count ? old_count * 2 : 64;
+    size_t             i, index;
+
+    serialize->strings = calloc (count, sizeof (FcSerializeBucket));
+    if (!serialize->strings) {
+	serialize->strings = old;
+	return FcFalse;
+    }
+    serialize->strings_count = count;
+    for (i = 0; i < old_count; i++) {
+	if (!old[i].object)
+	    continue;
+	for (index = old[i].hash & (count - 1);
+	     serialize->strings[index].object;
+	     index = (index + 1) & (count - 1))
+	    ;
+	serialize->strings[index] = old[i];
+    }
+    free (old);
+    return FcTrue;
+}
+
 FcBool
 FcStrSerializeAlloc (FcSerialize *serialize, const FcChar8 *str)
 {
-    return FcSerializeAlloc (serialize, str, strlen ((const char *)str) + 1);
+    uintptr_t          hash = FcStringHash (str);
+    FcSerializeBucket *bucket;
+
+    if (serialize->strings_used >= serialize->strings_count / 4 * 3 &&
+        !FcStrSerializeResize (serialize))
+	return FcFalse;
+    bucket = FcStrSerializeFind (serialize, str, hash);
+    if (bucket->object)
+	return FcTrue;
+    if (!FcSerializeAlloc (serialize, str, strlen ((const char *)str) + 1))
+	return FcFalse;
+    bucket->object = str;
+    bucket->hash = hash;
+    serialize->strings_used++;
+    return FcTrue;
 }
 
 FcChar8 *
 FcStrSerialize (FcSerialize *serialize, const FcChar8 *str)
 {
-    FcChar8 *str_serialize = FcSerializePtr (serialize, str);
+    FcSerializeBucket *bucket;
+    FcChar8           *str_serialize;
+
+    bucket = FcStrSerializeFind (serialize, str, FcStringHash (str));
+    if (!bucket || !bucket->object)
+	return NULL;
+    str_serialize = FcSerializePtr (serialize, bucket->object);
     if (!str_serialize)
 	return NULL;
-    strcpy ((char *)str_serialize, (const char *)str);
+    if (!FcSerializeWritten (serialize, bucket->object))
+	strcpy ((char *)str_serialize, (const char *)str);
     return str_serialize;
 }
 #include "fcaliastail.h"
@@ -0,0 +1,641 @@
+/*
+ * fontconfig/src/fcserver.c
+ *
+ * Copyright © 2002 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+
+#include "fcint.h"
+
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef HAVE_SYS_UN_H
+#  include <fcntl.h>
+#  include <sys/socket.h>
+#  include <sys/time.h>
+#  include <sys/un.h>
+#  include <unistd.h>
+#endif
+
+/*
+ * Requests to fc-matchd are lines holding the name of the request and
+ * the pattern.  Each font of the reply is a line starting with '='
+ * followed by the font, and the reply ends with a line holding a single
+ * '.', or with a line starting with '!' holding an error message.
+ *
+ * Patterns are written as space separated values, each one being the
+ * object name, '=', the binding ('w'eak, 's'trong or s'a'me), the type
+ * and the value, the numbers being written in the C locale with enough
+ * digits to read back the same double.  Bytes which are not printable,
+ * spaces, '%' and '=' are written as '%' and two hex digits.
+ */
+static const char *FcServerRequestNames[] = {
+    "match",
+    "sort",
+    "all",
+    "list",
+    "substitute",
+};
+
+#define NUM_SERVER_REQUESTS (int)(sizeof (FcServerRequestNames) / sizeof (FcServerRequestNames[0]))
+
+static const char FcServerBindings[] = "wsa";
+
+#define FC_SERVER_TIMEOUT  5         /* seconds */
+#define FC_SERVER_LINE_MAX (1 << 20) /* bytes */
+
+static FcBool
+FcServerEscape (FcStrBuf *buf, const FcChar8 *s)
+{
+    static const char hex[] = "0123456789abcdef";
+
+    for (; *s; s++) {
+	if (*s <= ' ' || *s >= 0x7f || *s == '%' || *s == '=') {
+	    FcStrBufChar (buf, '%');
+	    FcStrBufChar (buf, hex[*s >> 4]);
+	    FcStrBufChar (buf, hex[*s & 0xf]);
+	} else
+	    FcStrBufChar (buf, *s);
+    }
+    return !buf->failed;
+}
+
+static int
+FcServerHexDigit (FcChar8 c)
+{
+    if (c >= '0' && c <= '9')
+	return c - '0';
+    if (c >= 'a' && c <= 'f')
+	return c - 'a' + 10;
+    if (c >= 'A' && c <= 'F')
+	return c - 'A' + 10;
+    return -1;
+}
+
+/*
+ * Undo FcServerEscape in place
+ */
+static FcBool
+FcServerUnescape (FcChar8 *s)
+{
+    FcChar8 *d = s;
+
+    while (*s) {
+	if (*s == '%') {
+	    int hi = FcServerHexDigit (s[1]), lo = hi < 0 ? -1 : FcServerHexDigit (s[2]);
+
+	    if (lo < 0 || (hi == 0 && lo == 0))
+		return FcFalse;
+	    *d++ = hi << 4 | lo;
+	    s += 3;
+	} else
+	    *d++ = *s++;
+    }
+    *d = '\0';
+    return FcTrue;
+}
+
+static FcBool
+FcServerEncodeValue (FcStrBuf *buf, const FcValue *v)
+{
+    FcChar8  buf_static[8192];
+    FcStrBuf tmp;
+    FcBool   ret;
+
+    switch (v->type) {
+    case FcTypeInteger:
+	return FcStrBufFormat (buf, "i%d", v->u.i);
+    case FcTypeDouble:
+	return FcStrBufFormat (buf, "d%.17g", v->u.d);
+    case FcTypeString:
+	FcStrBufChar (buf, 's');
+	return FcServerEscape (buf, v->u.s);
+    case FcTypeBool:
+	return FcStrBufFormat (buf, "b%d", v->u.b);
+    case FcTypeMatrix:
+	return FcStrBufFormat (buf, "m%.17g,%.17g,%.17g,%.17g",
+	                       v->u.m->xx, v->u.m->xy, v->u.m->yx, v->u.m->yy);
+    case FcTypeRange:
+	return FcStrBufFormat (buf, "r%.17g,%.17g", v->u.r->begin, v->u.r->end);
+    case FcTypeCharSet:
+    case FcTypeLangSet:
+	FcStrBufInit (&tmp, buf_static, sizeof (buf_static));
+	if (v->type == FcTypeCharSet) {
+	    FcStrBufChar (buf, 'c');
+	    FcNameUnparseCharSet (&tmp, v->u.c);
+	} else {
+	    FcStrBufChar (buf, 'l');
+	    FcNameUnparseLangSet (&tmp, v->u.l);
+	}
+	ret = !tmp.failed && FcServerEscape (buf, FcStrBufDoneStatic (&tmp));
+	FcStrBufDestroy (&tmp);
+	return ret;
+    default:
+	/* Void and FreeType faces can't be sent */
+	return FcFalse;
+    }
+}
+
+static FcBool
+FcServerEncodePattern (FcStrBuf *buf, const FcPattern *p)
+{
+    FcPatternIter  iter;
+    FcValue        v;
+    FcValueBinding binding;
+    int            i, n;
+
+    FcPatternIterStart (p, &iter);
+    if (!FcPatternIterIsValid (p, &iter))
+	return !buf->failed;
+    do {
+	n = FcPatternIterValueCount (p, &iter);
+	for (i = 0; i < n; i++) {
+	    size_t len = buf->len;
+
+	    if (FcPatternIterGetValue (p, &iter, i, &v, &binding) != FcResultMatch)
+		continue;
+	    FcStrBufChar (buf, ' ');
+	    FcServerEscape (buf, (const FcChar8 *)FcPatternIterGetObject (p, &iter));
+	    FcStrBufChar (buf, '=');
+	    FcStrBufChar (buf, FcServerBindings[binding]);
+	    if (!FcServerEncodeValue (buf, &v) && !buf->failed)
+		buf->len = len;
+	}
+    } while (FcPatternIterNext (p, &iter));
+
+    return !buf->failed;
+}
+
+static FcBool
+FcServerDecodeDoubles (FcChar8 *s, double *d, int n)
+{
+    char *end;
+    int   i;
+
+    for (i = 0; i < n; i++) {
+	d[i] = FcStrtod ((char *)s, &end);
+	if (end == (char *)s || *end != (i == n - 1 ? '\0' : ','))
+	    return FcFalse;
+	s = (FcChar8 *)end + 1;
+    }
+    return FcTrue;
+}
+
+static FcLangSet *
+FcServerDecodeLangSet (FcChar8 *s)
+{
+    FcLangSet *ls = FcLangSetCreate();
+    FcChar8   *bar;
+
+    while (ls && *s) {
+	bar = (FcChar8 *)strchr ((const char *)s, '|');
+	if (bar)
+	    *bar = '\0';
+	if (!FcLangSetAdd (ls, s)) {
+	    FcLangSetDestroy (ls);
+	    return NULL;
+	}
+	s = bar ? bar + 1 : s + strlen ((const char *)s);
+    }
+    return ls;
+}
+
+/*
+ * Add the value written by FcServerEncodeValue in s to p
+ */
+static FcBool
+FcServerDecodeValue (FcPattern *p, FcChar8 *s)
+{
+    FcChar8 *eq, *binding;
+    FcValue  v;
+    FcMatrix m;
+    FcRange *r = NULL;
+    FcObject object;
+    double   d[4];
+    char    *end;
+    FcBool   ret = FcFalse;
+
+    eq = (FcChar8 *)strchr ((const char *)s, '=');
+    if (!eq || !eq[1] || !eq[2])
+	return FcFalse;
+    *eq = '\0';
+    binding = (FcChar8 *)strchr (FcServerBindings, eq[1]);
+    if (!binding || !FcServerUnescape (s) || !FcServerUnescape (eq + 3))
+	return FcFalse;
+    object = FcObjectFromName ((const char *)s);
+    if (!object)
+	return FcFalse;
+
+    s = eq + 3;
+    memset (&v, 0, sizeof (v));
+    switch (eq[2]) {
+    case 'i':
+	v.type = FcTypeInteger;
+	v.u.i = strtol ((const char *)s, &end, 10);
+	if (end == (char *)s || *end)
+	    return FcFalse;
+	break;
+    case 'd':
+	v.type = FcTypeDouble;
+	if (!FcServerDecodeDoubles (s, &v.u.d, 1))
+	    return FcFalse;
+	break;
+    case 's':
+	v.type = FcTypeString;
+	v.u.s = s;
+	break;
+    case 'b':
+	v.type = FcTypeBool;
+	v.u.b = *s - '0';
+	if (v.u.b < FcFalse || v.u.b > FcDontCare || s[1])
+	    return FcFalse;
+	break;
+    case 'm':
+	if (!FcServerDecodeDoubles (s, d, 4))
+	    return FcFalse;
+	m.xx = d[0];
+	m.xy = d[1];
+	m.yx = d[2];
+	m.yy = d[3];
+	v.type = FcTypeMatrix;
+	v.u.m = &m;
+	break;
+    case 'r':
+	if (!FcServerDecodeDoubles (s, d, 2))
+	    return FcFalse;
+	r = FcRangeCreateDouble (d[0], d[1]);
+	v.type = FcTypeRange;
+	v.u.r = r;
+	break;
+    case 'c':
+	v.type = FcTypeCharSet;
+	v.u.c = FcNameParseCharSet (s);
+	break;
+    case 'l':
+	v.type = FcTypeLangSet;
+	v.u.l = FcServerDecodeLangSet (s);
+	break;
+    default:
+	return FcFalse;
+    }
+    if ((v.type != FcTypeRange || r) &&
+        (v.type != FcTypeCharSet || v.u.c) &&
+        (v.type != FcTypeLangSet || v.u.l))
+	ret = FcPatternObjectAddWithBinding (p, object, v, binding - (FcChar8 *)FcServerBindings, FcTrue);
+    if (r)
+	FcRangeDestroy (r);
+    if (v.type == FcTypeCharSet && v.u.c)
+	FcCharSetDestroy ((FcCharSet *)v.u.c);
+    if (v.type == FcTypeLangSet && v.u.l)
+	FcLangSetDestroy ((FcLangSet *)v.u.l);
+
+    return ret;
+}
+
+/*
+ * Read the values written by FcServerEncodePattern, modifying s
+ */
+static FcPattern *
+FcServerDecodePattern (FcChar8 *s)
+{
+    FcPattern *p = FcPatternCreate();
+    FcChar8   *space;
+
+    while (p && *s) {
+	space = (FcChar8 *)strchr ((const char *)s, ' ');
+	if (space)
+	    *space = '\0';
+	if (*s && !FcServerDecodeValue (p, s)) {
+	    FcPatternDestroy (p);
+	    return NULL;
+	}
+	s = space ? space + 1 : s + strlen ((const char *)s);
+    }
+    return p;
+}
+
+/*
+ * Handle the request with config in this process
+ */
+static FcFontSet *
+FcServerLocalQuery (FcConfig       *config,
+                    FcServerRequest request,
+                    FcPattern      *p)
+{
+    FcFontSet *set, *fonts;
+    FcPattern *pat, *font;
+    FcResult   result;
+    int        i;
+
+    if (request == FcServerList)
+	return FcFontList (config, p, NULL);
+
+    set = FcFontSetCreate();
+    if (!set)
+	return NULL;
+    pat = FcPatternDuplicate (p);
+    if (!pat)
+	goto bail;
+    if (!FcConfigSubstitute (config, pat, FcMatchPattern))
+	goto bail;
+    FcConfigSetDefaultSubstitute (config, pat);
+
+    switch (request) {
+    case FcServerMatch:
+	font = FcFontMatch (config, pat, &result);
+	if (font && !FcFontSetAdd (set, font)) {
+	    FcPatternDestroy (font);
+	    goto bail;
+	}
+	break;
+    case FcServerSort:
+    case FcServerSortAll:
+	fonts = FcFontSort (config, pat, request == FcServerSort, NULL, &result);
+	for (i = 0; fonts && i < fonts->nfont; i++) {
+	    font = FcFontRenderPrepare (config, pat, fonts->fonts[i]);
+	    if (font && !FcFontSetAdd (set, font))
+		FcPatternDestroy (font);
+	}
+	if (fonts)
+	    FcFontSetSortDestroy (fonts);
+	break;
+    case FcServerSubstitute:
+	if (!FcFontSetAdd (set, pat))
+	    goto bail;
+	pat = NULL;
+	break;
+    default:
+	goto bail;
+    }
+    if (pat)
+	FcPatternDestroy (pat);
+
+    return set;
+
+bail:
+    if (pat)
+	FcPatternDestroy (pat);
+    FcFontSetDestroy (set);
+    return NULL;
+}
+
+#ifdef HAVE_SYS_UN_H
+static FcBool
+FcServerSend (int fd, const FcChar8 *data, size_t len)
+{
+    int flags = 0;
+
+#  ifdef MSG_NOSIGNAL
+    flags = MSG_NOSIGNAL;
+#  endif
+    while (len) {
+	ssize_t n = send (fd, data, len, flags);
+
+	if (n < 0) {
+	    if (errno == EINTR)
+		continue;
+	    return FcFalse;
+	}
+	data += n;
+	len -= n;
+    }
+    return FcTrue;
+}
+
+/*
+ * Whether the reply in buf is complete, the start of its last line
+ * being at *line
+ */
+static FcBool
+FcServerReplyDone (const FcChar8 *buf, size_t len, size_t *line)
+{
+    size_t i;
+
+    for (i = *line; i < len; i++) {
+	if (buf[i] != '\n')
+	    continue;
+	if (buf[*line] == '!' || (i == *line + 1 && buf[*line] == '.'))
+	    return FcTrue;
+	*line = i + 1;
+    }
+    return FcFalse;
+}
+
+/*
+ * Send the request to the server listening on path, returning NULL when
+ * there is no server or it can't handle the request
+ */
+static FcFontSet *
+FcServerRemoteQuery (const FcChar8  *path,
+                     FcServerRequest request,
+                     FcPattern      *p)
+{
+    struct sockaddr_un addr;
+    struct timeval     timeout = { FC_SERVER_TIMEOUT, 0 };
+    FcStrBuf           buf;
+    FcChar8            buf_static[8192];
+    FcChar8           *reply = NULL, *line, *end;
+    FcFontSet         *set = NULL;
+    size_t             last = 0;
+    int                fd = -1;
+    char               chunk[4096];
+
+    if (strlen ((const char *)path) >= sizeof (addr.sun_path))
+	return NULL;
+    memset (&addr, 0, sizeof (addr));
+    addr.sun_family = AF_UNIX;
+    strcpy (addr.sun_path, (const char *)path);
+
+    FcStrBufInit (&buf, buf_static, sizeof (buf_static));
+    FcStrBufString (&buf, (const FcChar8 *)FcServerRequestNames[request]);
+    FcServerEncodePattern (&buf, p);
+    FcStrBufChar (&buf, '\n');
+    if (buf.failed || buf.len > FC_SERVER_LINE_MAX)
+	goto bail;
+    fd = socket (AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0)
+	goto bail;
+#  ifdef FD_CLOEXEC
+    fcntl (fd, F_SETFD, FD_CLOEXEC);
+#  endif
+    setsockopt (fd, SOL_SOCKET, SO_RCVTIMEO, &timeout, sizeof (timeout));
+    setsockopt (fd, SOL_SOCKET, SO_SNDTIMEO, &timeout, sizeof (timeout));
+    if (connect (fd, (struct sockaddr *)&addr, sizeof (addr)) < 0)
+	goto bail;
+    if (!FcServerSend (fd, buf.buf, buf.len))
+	goto bail;
+
+    FcStrBufDestroy (&buf);
+    FcStrBufInit (&buf, buf_static, sizeof (buf_static));
+    for (;;) {
+	ssize_t n = recv (fd, chunk, sizeof (chunk), 0);
+
+	if (n < 0 && errno == EINTR)
+	    continue;
+	if (n <= 0 || !FcStrBufData (&buf, (const FcChar8 *)chunk, n))
+	    goto bail;
+	if (FcServerReplyDone (buf.buf, buf.len, &last))
+	    break;
+	if (buf.len - last > FC_SERVER_LINE_MAX)
+	    goto bail;
+    }
+    reply = FcStrBufDone (&buf);
+    if (!reply)
+	goto bail;
+
+    set = FcFontSetCreate();
+    if (!set)
+	goto bail;
+    for (line = reply; *line == '='; line = end + 1) {
+	FcPattern *font;
+
+	end = (FcChar8 *)strchr ((const char *)line, '\n');
+	*end = '\0';
+	font = FcServerDecodePattern (line + 1);
+	if (!font)
+	    goto bail_set;
+	if (!FcFontSetAdd (set, font)) {
+	    FcPatternDestroy (font);
+	    goto bail_set;
+	}
+    }
+    if (*line != '.')
+	goto bail_set;
+    goto bail;
+
+bail_set:
+    FcFontSetDestroy (set);
+    set = NULL;
+bail:
+    if (reply)
+	free (reply);
+    else
+	FcStrBufDestroy (&buf);
+    if (fd >= 0)
+	close (fd);
+    return set;
+}
+#endif
+
+FcFontSet *
+FcServerQuery (FcConfig       *config,
+               const FcChar8  *socket_path,
+               FcServerRequest request,
+               FcPattern      *p)
+{
+    FcChar8   *path = NULL;
+    FcFontSet *set = NULL;
+
+    if ((int)request < 0 || (int)request >= NUM_SERVER_REQUESTS || !p)
+	return NULL;
+
+#ifdef HAVE_SYS_UN_H
+    /*
+     * The server only knows about its own current configuration.
+     * Don't load one here, that is what asking the server saves.
+     */
+    if (!config || FcConfigIsCurrent (config)) {
+	if (socket_path)
+	    path = FcStrCopy (socket_path);
+	else {
+	    const char *env = getenv ("FONTCONFIG_MATCHD_SOCKET");
+
+	    if (env)
+		path = FcStrCopy ((const FcChar8 *)env);
+	    else {
+		env = getenv ("XDG_RUNTIME_DIR");
+		if (env && *env)
+		    path = FcStrBuildFilename ((const FcChar8 *)env, "fontconfig-matchd", NULL);
+	    }
+	}
+    }
+    if (path && *path)
+	set = FcServerRemoteQuery (path, request, p);
+    if (path)
+	FcStrFree (path);
+#else
+    (void)socket_path;
+    (void)path;
+#endif
+
+    if (!set)
+	set = FcServerLocalQuery (config, request, p);
+
+    return set;
+}
+
+/*
+ * Answer request, one line sent by FcServerQuery without its newline.
+ * Returns the lines of the reply, each one ending with a newline, or
+ * an error message for an invalid request.
+ */
+FcChar8 *
+FcServerReply (FcConfig *config, const FcChar8 *request)
+{
+    FcStrBuf   buf;
+    FcChar8   *line, *pattern;
+    FcPattern *pat;
+    FcFontSet *set;
+    int        r, i;
+
+    line = FcStrCopy (request);
+    if (!line)
+	return NULL;
+    FcStrBufInit (&buf, NULL, 0);
+    pattern = (FcChar8 *)strchr ((const char *)line, ' ');
+    if (pattern)
+	*pattern++ = '\0';
+    else
+	pattern = line + strlen ((const char *)line);
+    for (r = 0; r < NUM_SERVER_REQUESTS; r++)
+	if (!strcmp ((const char *)line, FcServerRequestNames[r]))
+	    break;
+    if (r == NUM_SERVER_REQUESTS) {
+	FcStrBufString (&buf, (const FcChar8 *)"!unknown request\n");
+	goto bail;
+    }
+    pat = FcServerDecodePattern (pattern);
+    if (!pat) {
+	FcStrBufString (&buf, (const FcChar8 *)"!unable to parse the pattern\n");
+	goto bail;
+    }
+    set = FcServerLocalQuery (config, (FcServerRequest)r, pat);
+    FcPatternDestroy (pat);
+    if (!set) {
+	FcStrBufString (&buf, (const FcChar8 *)"!out of memory\n");
+	goto bail;
+    }
+    for (i = 0; i < set->nfont; i++) {
+	FcStrBufChar (&buf, '=');
+	FcServerEncodePattern (&buf, set->fonts[i]);
+	FcStrBufChar (&buf, '\n');
+    }
+    FcStrBufString (&buf, (const FcChar8 *)".\n");
+    FcFontSetDestroy (set);
+bail:
+    FcStrFree (line);
+
+    return FcStrBufDone (&buf);
+}
+
+#define __fcserver__
+#include "fcaliastail.h"
+#undef __fcserver__
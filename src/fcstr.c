@@ -610,6 +610,210 @@ FcStrGlobMatch (const FcChar8 *glob,
     return *string == '\0';
 }
 
+/*
+ * A set of globs compiled for matching many strings against all of
+ * them at once.  The common shapes found in <acceptfont>/<rejectfont>
+ * are handled by two byte tries walked once per string:
+ *
+ *   "literal"   exact match, flagged on the prefix trie
+ *   "literal*"  prefix match, flagged on the prefix trie
+ *   "*literal"  suffix match, kept in a trie of reversed suffixes
+ *
+ * Anything else is kept in a residual list and handed to
+ * FcStrGlobMatch, after a quick check of its leading literal part.
+ */
+
+#define FC_GLOB_NODE_EXACT  1
+#define FC_GLOB_NODE_PREFIX 2
+
+typedef struct _FcGlobNode {
+    int     child; /* index of the first child, 0 if none */
+    int     next;  /* index of the next sibling, 0 if none */
+    FcChar8 c;
+    FcChar8 flags;
+} FcGlobNode;
+
+typedef struct _FcGlobResidual {
+    const FcChar8 *glob;
+    size_t         literal_len; /* length of the leading literal part */
+} FcGlobResidual;
+
+struct _FcGlobSet {
+    FcGlobNode     *nodes;
+    int             nnodes;
+    int             size;
+    int             prefix_root;
+    int             suffix_root;
+    FcGlobResidual *residuals;
+    int             nresiduals;
+    FcStrSet       *globs; /* owns the strings the residuals point to */
+};
+
+static int
+FcGlobSetNewNode (FcGlobSet *gs, FcChar8 c)
+{
+    if (gs->nnodes == gs->size) {
+	int         size = gs->size ? gs->size * 2 : 64;
+	FcGlobNode *nodes = realloc (gs->nodes, size * sizeof (FcGlobNode));
+
+	if (!nodes)
+	    return -1;
+	gs->nodes = nodes;
+	gs->size = size;
+    }
+    gs->nodes[gs->nnodes].child = 0;
+    gs->nodes[gs->nnodes].next = 0;
+    gs->nodes[gs->nnodes].c = c;
+    gs->nodes[gs->nnodes].flags = 0;
+
+    return gs->nnodes++;
+}
+
+static FcBool
+FcGlobSetInsert (FcGlobSet     *gs,
+                 int            root,
+                 const FcChar8 *s,
+                 size_t         len,
+                 FcBool         reverse,
+                 FcChar8        flags)
+{
+    int    node = root;
+    size_t i;
+
+    for (i = 0; i < len; i++) {
+	FcChar8 c = reverse ? s[len - 1 - i] : s[i];
+	int     child;
+
+	for (child = gs->nodes[node].child; child; child = gs->nodes[child].next)
+	    if (gs->nodes[child].c == c)
+		break;
+	if (!child) {
+	    child = FcGlobSetNewNode (gs, c);
+	    if (child < 0)
+		return FcFalse;
+	    gs->nodes[child].next = gs->nodes[node].child;
+	    gs->nodes[node].child = child;
+	}
+	node = child;
+    }
+    gs->nodes[node].flags |= flags;
+
+    return FcTrue;
+}
+
+FcGlobSet *
+FcGlobSetCreate (const FcStrSet *globs)
+{
+    FcGlobSet *gs;
+    int        i;
+
+    gs = calloc (1, sizeof (FcGlobSet));
+    if (!gs)
+	return NULL;
+    gs->globs = FcStrSetCreate();
+    if (!gs->globs)
+	goto bail;
+    if ((gs->prefix_root = FcGlobSetNewNode (gs, 0)) < 0 ||
+        (gs->suffix_root = FcGlobSetNewNode (gs, 0)) < 0)
+	goto bail;
+    if (globs->num) {
+	gs->residuals = malloc (globs->num * sizeof (FcGlobResidual));
+	if (!gs->residuals)
+	    goto bail;
+    }
+
+    for (i = 0; i < globs->num; i++) {
+	const FcChar8 *glob = globs->strs[i];
+	size_t         len = strlen ((const char *)glob);
+	size_t         literal = strcspn ((const char *)glob, "*?");
+	FcBool         ret;
+
+	if (literal == len)
+	    ret = FcGlobSetInsert (gs, gs->prefix_root, glob, len, FcFalse, FC_GLOB_NODE_EXACT);
+	else if (literal == len - 1 && glob[literal] == '*')
+	    ret = FcGlobSetInsert (gs, gs->prefix_root, glob, literal, FcFalse, FC_GLOB_NODE_PREFIX);
+	else if (glob[0] == '*' && strcspn ((const char *)glob + 1, "*?") == len - 1)
+	    ret = FcGlobSetInsert (gs, gs->suffix_root, glob + 1, len - 1, FcTrue, FC_GLOB_NODE_PREFIX);
+	else {
+	    ret = FcStrSetAdd (gs->globs, glob);
+	    if (ret) {
+		gs->residuals[gs->nresiduals].glob = gs->globs->strs[gs->globs->num - 1];
+		gs->residuals[gs->nresiduals].literal_len = literal;
+		gs->nresiduals++;
+	    }
+	}
+	if (!ret)
+	    goto bail;
+    }
+    return gs;
+
+bail:
+    FcGlobSetDestroy (gs);
+    return NULL;
+}
+
+void
+FcGlobSetDestroy (FcGlobSet *gs)
+{
+    if (!gs)
+	return;
+    if (gs->globs)
+	FcStrSetDestroy (gs->globs);
+    free (gs->residuals);
+    free (gs->nodes);
+    free (gs);
+}
+
+FcBool
+FcGlobSetMatch (const FcGlobSet *gs, const FcChar8 *string)
+{
+    const FcGlobNode *nodes = gs->nodes;
+    const FcChar8    *s;
+    size_t            len;
+    int               node, i;
+
+    node = gs->prefix_root;
+    for (s = string;; s++) {
+	if (nodes[node].flags & FC_GLOB_NODE_PREFIX)
+	    return FcTrue;
+	if (!*s) {
+	    if (nodes[node].flags & FC_GLOB_NODE_EXACT)
+		return FcTrue;
+	    break;
+	}
+	for (node = nodes[node].child; node; node = nodes[node].next)
+	    if (nodes[node].c == *s)
+		break;
+	if (!node)
+	    break;
+    }
+
+    len = strlen ((const char *)string);
+    node = gs->suffix_root;
+    for (s = string + len;; s--) {
+	if (nodes[node].flags & FC_GLOB_NODE_PREFIX)
+	    return FcTrue;
+	if (s == string)
+	    break;
+	for (node = nodes[node].child; node; node = nodes[node].next)
+	    if (nodes[node].c == s[-1])
+		break;
+	if (!node)
+	    break;
+    }
+
+    for (i = 0; i < gs->nresiduals; i++) {
+	const FcGlobResidual *r = &gs->residuals[i];
+
+	if (r->literal_len && strncmp ((const char *)r->glob, (const char *)string, r->literal_len) != 0)
+	    continue;
+	if (FcStrGlobMatch (r->glob, string))
+	    return FcTrue;
+    }
+
+    return FcFalse;
+}
+
 const FcChar8 *
 FcStrStrIgnoreCase (const FcChar8 *s1, const FcChar8 *s2)
 {
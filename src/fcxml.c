@@ -73,6 +73,12 @@ _FcConfigParse (FcConfig      *config,
                 const FcChar8 *name,
                 FcBool         complain,
                 FcBool         load);
+static FcBool
+FcConfigParseFile (FcConfig      *config,
+                   const FcChar8 *name,
+                   FcStrBuf      *prefetched,
+                   FcBool         complain,
+                   FcBool         load);
 
 void
 FcTestDestroy (FcTest *test)
@@ -3053,6 +3059,73 @@ FcSortCmpStr (const void *a, const void *b)
     return FcStrCmp (as, bs);
 }
 
+/*
+ * Read the whole content of an opened config file into sbuf and
+ * close it.  This does no parsing and touches no shared state, so it
+ * may run on any thread.  On failure, errno is preserved for the caller.
+ */
+static FcBool
+FcConfigReadFd (int fd, FcStrBuf *sbuf)
+{
+    int  len;
+    char buf[BUFSIZ];
+
+    do {
+	len = read (fd, buf, BUFSIZ);
+	if (len < 0) {
+	    int errno_ = errno;
+
+	    close (fd);
+	    errno = errno_;
+	    return FcFalse;
+	}
+	FcStrBufData (sbuf, (const FcChar8 *)buf, len);
+    } while (len != 0);
+    close (fd);
+
+    return FcTrue;
+}
+
+/*
+ * Number of threads used to read the files of a config directory
+ * ahead of parsing them.  Controlled by FONTCONFIG_PARSE_JOBS;
+ * anything below 2 keeps the plain serial path.
+ */
+static int
+FcConfigParseJobs (void)
+{
+    const char *env = getenv ("FONTCONFIG_PARSE_JOBS");
+    int         jobs;
+
+    if (!env)
+	return 1;
+    jobs = atoi (env);
+    if (jobs < 1)
+	return 1;
+    if (jobs > 64)
+	jobs = 64;
+
+    return jobs;
+}
+
+typedef struct _FcConfigPrefetch {
+    const FcChar8 *file;
+    FcStrBuf       sbuf;
+    FcBool         ok;
+} FcConfigPrefetch;
+
+static void
+FcConfigPrefetchFile (int i, void *closure)
+{
+    FcConfigPrefetch *prefetch = closure;
+    int               fd;
+
+    FcStrBufInit (&prefetch[i].sbuf, NULL, 0);
+    fd = FcOpen ((char *)prefetch[i].file, O_RDONLY);
+    if (fd != -1)
+	prefetch[i].ok = FcConfigReadFd (fd, &prefetch[i].sbuf);
+}
+
 static FcBool
 FcConfigParseAndLoadDir (FcConfig      *config,
                          const FcChar8 *name,
@@ -3117,11 +3190,38 @@ FcConfigParseAndLoadDir (FcConfig      *config,
 	}
     }
     if (ret && files->num > 0) {
-	int i;
+	FcConfigPrefetch *prefetch = NULL;
+	int               i, jobs;
+
 	qsort (files->strs, files->num, sizeof (FcChar8 *),
 	       (int (*) (const void *, const void *))FcSortCmpStr);
+	/*
+	 * Parsing updates the configuration as it goes (dirs, globs,
+	 * includes, rules), so it has to happen in filename order on this
+	 * thread.  What can be done concurrently is pulling the files in,
+	 * which is what dominates on slow or remote storage.  Anything
+	 * that fails to be prefetched is simply read again by the serial
+	 * path so that errors are reported exactly as before.
+	 */
+	jobs = FcConfigParseJobs();
+	if (jobs > 1 && files->num > 1)
+	    prefetch = calloc (files->num, sizeof (FcConfigPrefetch));
+	if (prefetch) {
+	    for (i = 0; i < files->num; i++)
+		prefetch[i].file = files->strs[i];
+	    if (FcDebug() & FC_DBG_CONFIG)
+		printf ("\tReading %d config files with %d jobs\n", files->num, jobs);
+	    FcRunJobs (jobs, files->num, FcConfigPrefetchFile, prefetch);
+	}
 	for (i = 0; ret && i < files->num; i++)
-	    ret = _FcConfigParse (config, files->strs[i], complain, load);
+	    ret = FcConfigParseFile (config, files->strs[i],
+	                             prefetch && prefetch[i].ok ? &prefetch[i].sbuf : NULL,
+	                             complain, load);
+	if (prefetch) {
+	    for (i = 0; i < files->num; i++)
+		FcStrBufDestroy (&prefetch[i].sbuf);
+	    free (prefetch);
+	}
     }
 bail3:
     FcStrSetDestroy (files);
@@ -3256,16 +3356,15 @@ bail1:
 }
 
 static FcBool
-_FcConfigParse (FcConfig      *config,
-                const FcChar8 *name,
-                FcBool         complain,
-                FcBool         load)
+FcConfigParseFile (FcConfig      *config,
+                   const FcChar8 *name,
+                   FcStrBuf      *prefetched,
+                   FcBool         complain,
+                   FcBool         load)
 {
     FcChar8 *filename = NULL, *realfilename = NULL;
     int      fd;
-    int      len;
     FcStrBuf sbuf;
-    char     buf[BUFSIZ];
     FcBool   ret = FcFalse, complain_again = complain;
     FcStrBuf reason;
 
@@ -3317,6 +3416,12 @@ _FcConfigParse (FcConfig      *config,
 
     FcStrBufInit (&sbuf, NULL, 0);
 
+    if (prefetched) {
+	ret = FcConfigParseAndLoadFromMemoryInternal (config, filename, FcStrBufDoneStatic (prefetched), complain, load);
+	complain_again = FcFalse;
+	goto bail1;
+    }
+
     fd = FcOpen ((char *)realfilename, O_RDONLY);
     if (fd == -1) {
 	FcStrBufString (&reason, (FcChar8 *)"Unable to open ");
@@ -3324,29 +3429,23 @@ _FcConfigParse (FcConfig      *config,
 	goto bail1;
     }
 
-    do {
-	len = read (fd, buf, BUFSIZ);
-	if (len < 0) {
-	    int  errno_ = errno;
-	    char ebuf[BUFSIZ + 1];
+    if (!FcConfigReadFd (fd, &sbuf)) {
+	int  errno_ = errno;
+	char ebuf[BUFSIZ + 1];
 
 #if HAVE_STRERROR_R
-	    strerror_r (errno_, ebuf, BUFSIZ);
+	strerror_r (errno_, ebuf, BUFSIZ);
 #elif HAVE_STRERROR
-	    char  *tmp = strerror (errno_);
-	    size_t len = strlen (tmp);
-	    memcpy (ebuf, tmp, FC_MIN (BUFSIZ, len));
-	    ebuf[FC_MIN (BUFSIZ, len)] = 0;
+	char  *tmp = strerror (errno_);
+	size_t len = strlen (tmp);
+	memcpy (ebuf, tmp, FC_MIN (BUFSIZ, len));
+	ebuf[FC_MIN (BUFSIZ, len)] = 0;
 #else
-	    ebuf[0] = 0;
+	ebuf[0] = 0;
 #endif
-	    FcConfigMessage (0, FcSevereError, "failed reading config file: %s: %s (errno %d)", realfilename, ebuf, errno_);
-	    close (fd);
-	    goto bail1;
-	}
-	FcStrBufData (&sbuf, (const FcChar8 *)buf, len);
-    } while (len != 0);
-    close (fd);
+	FcConfigMessage (0, FcSevereError, "failed reading config file: %s: %s (errno %d)", realfilename, ebuf, errno_);
+	goto bail1;
+    }
 
     ret = FcConfigParseAndLoadFromMemoryInternal (config, filename, FcStrBufDoneStatic (&sbuf), complain, load);
     complain_again = FcFalse; /* no need to reclaim here */
@@ -3373,6 +3472,15 @@ bail0:
     return ret;
 }
 
+static FcBool
+_FcConfigParse (FcConfig      *config,
+                const FcChar8 *name,
+                FcBool         complain,
+                FcBool         load)
+{
+    return FcConfigParseFile (config, name, NULL, complain, load);
+}
+
 FcBool
 FcConfigParseOnly (FcConfig      *config,
                    const FcChar8 *name,
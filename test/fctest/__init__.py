@@ -96,6 +96,7 @@ class FcTest:
         self._fcgenconf = bin_path("fc-genconf")
         self._fclist = bin_path("fc-list")
         self._fcmatch = bin_path("fc-match")
+        self._fcmatchd = bin_path("fc-matchd")
         self._fcpattern = bin_path("fc-pattern")
         self._fcquery = bin_path("fc-query")
         self._fcscan = bin_path("fc-scan")
@@ -272,7 +273,7 @@ class FcTest:
             self.__bind = None
             self._env["FONTCONFIG_FILE"] = self._conffile.name
 
-    def run(self, binary, args=[], debug=False) -> Iterator[[int, str, str]]:
+    def run(self, binary, args=[], debug=False, input=None) -> Iterator[[int, str, str]]:
         cmd = []
         if self._exewrapper:
             cmd += [self._exewrapper]
@@ -308,7 +309,8 @@ class FcTest:
                 boxed += ["--setenv", "FC_FONTATIONS", "1"]
             boxed += cmd
             self.logger.info(boxed)
-            res = subprocess.run(boxed, capture_output=True, env=self._env)
+            res = subprocess.run(boxed, capture_output=True, env=self._env,
+                                 input=input.encode("utf-8") if input is not None else None)
         else:
             origdebug = self._env.get("FC_DEBUG")
             if debug:
@@ -317,7 +319,8 @@ class FcTest:
             if self.with_fontations:
                 self._env["FC_FONTATIONS"] = "1"
             self.logger.info(cmd)
-            res = subprocess.run(cmd, capture_output=True, env=self._env)
+            res = subprocess.run(cmd, capture_output=True, env=self._env,
+                                 input=input.encode("utf-8") if input is not None else None)
             if debug:
                 if origdebug:
                     self._env["FC_DEBUG"] = origdebug
@@ -330,9 +333,27 @@ class FcTest:
                     del self._env["FC_FONTATIONS"]
         yield res.returncode, res.stdout.decode("utf-8"), res.stderr.decode("utf-8")
 
+    def spawn(self, binary, args=[]) -> subprocess.Popen:
+        cmd = []
+        if self._exewrapper:
+            cmd += [self._exewrapper]
+        cmd += [str(binary)]
+        cmd += args
+        self.logger.info(cmd)
+        return subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self._env,
+            text=True,
+        )
+
     def run_cache(self, args, debug=False) -> Iterator[[int, str, str]]:
         return self.run(self._fccache, args, debug)
 
+    def spawn_cache(self, args) -> subprocess.Popen:
+        return self.spawn(self._fccache, args)
+
     def run_cat(self, args, debug=False) -> Iterator[[int, str, str]]:
         return self.run(self._fccat, args, debug)
 
@@ -342,11 +363,14 @@ class FcTest:
     def run_list(self, args, debug=False) -> Iterator[[int, str, str]]:
         return self.run(self._fclist, args, debug)
 
-    def run_match(self, args, debug=False) -> Iterator[[int, str, str]]:
-        return self.run(self._fcmatch, args, debug)
+    def run_match(self, args, debug=False, input=None) -> Iterator[[int, str, str]]:
+        return self.run(self._fcmatch, args, debug, input)
+
+    def spawn_matchd(self, args) -> subprocess.Popen:
+        return self.spawn(self._fcmatchd, args)
 
-    def run_pattern(self, args, debug=False) -> Iterator[[int, str, str]]:
-        return self.run(self._fcpattern, args, debug)
+    def run_pattern(self, args, debug=False, input=None) -> Iterator[[int, str, str]]:
+        return self.run(self._fcpattern, args, debug, input)
 
     def run_query(self, args, debug=False) -> Iterator[[int, str, str]]:
         return self.run(self._fcquery, args, debug)
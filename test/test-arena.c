@@ -0,0 +1,65 @@
+/* Copyright (C) 2026 fontconfig Authors */
+/* SPDX-License-Identifier: HPND */
+
+/* Internal API test case */
+#include "fcint.h"
+
+#include <stdio.h>
+#include <string.h>
+
+#define ALIGNED(p) (((uintptr_t)(p) & (sizeof (double) - 1)) == 0)
+
+int
+main (void)
+{
+    FcArena arena;
+    char    block[1024];
+    char   *p, *q;
+    int     i, ret = 0;
+
+    /* Small allocations come from the block until it is used up */
+    FcArenaInit (&arena, block + 1, sizeof (block) - 1);
+    for (i = 0; i < 16; i++) {
+	p = FcArenaAlloc (&arena, 24);
+	if (!p || !ALIGNED (p) || p < block || p + 24 > block + sizeof (block)) {
+	    fprintf (stderr, "E: allocation %d is not in the block\n", i);
+	    ret = 1;
+	}
+	memset (p, i, 24);
+    }
+    if (arena.nchunk != 0 || arena.size < 16 * 24) {
+	fprintf (stderr, "E: %d heap allocation(s) for %lu bytes\n", arena.nchunk, (unsigned long)arena.size);
+	ret = 1;
+    }
+    /* Then from heap chunks shared by the following allocations */
+    for (i = 0; i < 64; i++) {
+	p = FcArenaAlloc (&arena, 24);
+	if (!p || !ALIGNED (p)) {
+	    fprintf (stderr, "E: failed to allocate from a chunk\n");
+	    ret = 1;
+	}
+    }
+    if (arena.nchunk != 1) {
+	fprintf (stderr, "E: expected 1 heap allocation, got %d\n", arena.nchunk);
+	ret = 1;
+    }
+    /* Large blocks get a chunk of their own */
+    p = FcArenaAlloc (&arena, 100000);
+    q = FcArenaAlloc (&arena, 8);
+    if (!p || !q || arena.nchunk != 2 || (q >= p && q < p + 100000)) {
+	fprintf (stderr, "E: a large block was not allocated on its own\n");
+	ret = 1;
+    }
+    memset (p, 0, 100000);
+    FcArenaFini (&arena);
+
+    /* An arena without a block only uses the heap */
+    FcArenaInit (&arena, NULL, 0);
+    if (!FcArenaAlloc (&arena, 1) || arena.nchunk != 1) {
+	fprintf (stderr, "E: failed to allocate without a block\n");
+	ret = 1;
+    }
+    FcArenaFini (&arena);
+
+    return ret;
+}
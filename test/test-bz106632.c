@@ -166,7 +166,18 @@ main (void)
 	"  <dir>%s</dir>\n"
 	"  <cachedir>%s</cachedir>\n"
 	"</fontconfig>\n";
+    const FcChar8 *tconf_rescan = (const FcChar8 *)
+	"<fontconfig>\n"
+	"  <dir>%s</dir>\n"
+	"  <cachedir>%s</cachedir>\n"
+	"  <config><rescan><int>1</int></rescan></config>\n"
+	"  <match>\n"
+	"    <test name=\"family\"><string>bz106632</string></test>\n"
+	"    <edit name=\"family\" mode=\"assign\"><string>rescanned</string></edit>\n"
+	"  </match>\n"
+	"</fontconfig>\n";
     char       conf[1024];
+    FcChar8   *family;
     int        ret = 0;
     FcFontSet *fs;
     FcPattern *pat;
@@ -297,6 +308,55 @@ main (void)
     FcFontSetDestroy (fs);
     FcConfigDestroy (config);
 
+    fprintf (stderr, "D: Loading a config with a rescan interval\n");
+    snprintf (conf, 1024, (const char *)tconf_rescan, fontdir, cachedir);
+    config = FcConfigCreate();
+    if (!FcConfigParseAndLoadFromMemory (config, (const FcChar8 *)conf, FcTrue)) {
+	printf ("E: Unable to load config\n");
+	ret = 4;
+	goto bail;
+    }
+    if (!FcConfigSetCurrent (config)) {
+	printf ("E: Unable to set the current config\n");
+	ret = 5;
+	goto bail;
+    }
+    fprintf (stderr, "D: Removing %s\n", fontdir);
+    snprintf (cmd, 512, "sleep 1; rm -f %s%s*; sleep 1", fontdir, FC_DIR_SEPARATOR_S);
+    (void)system (cmd);
+    fprintf (stderr, "D: Bringing up to date\n");
+    if (!FcInitBringUptoDate()) {
+	fprintf (stderr, "E: Unable to bring up to date\n");
+	ret = 2;
+	goto bail;
+    }
+    if (FcConfigGetCurrent() == config) {
+	fprintf (stderr, "E: config wasn't reloaded\n");
+	ret = 3;
+	goto bail;
+    }
+    FcConfigDestroy (config);
+    pat = FcPatternCreate();
+    fs = FcFontList (NULL, pat, NULL);
+    FcPatternDestroy (pat);
+    if (!fs || fs->nfont != 0) {
+	printf ("E: Unexpected the number of fonts: %d\n", !fs ? -1 : fs->nfont);
+	ret = 1;
+	goto bail;
+    }
+    FcFontSetDestroy (fs);
+    /* the rules must have been kept while rescanning the fonts */
+    pat = FcPatternBuild (NULL, FC_FAMILY, FcTypeString, "bz106632", NULL);
+    FcConfigSubstitute (NULL, pat, FcMatchPattern);
+    if (FcPatternGetString (pat, FC_FAMILY, 0, &family) != FcResultMatch ||
+        strcmp ((const char *)family, "rescanned") != 0) {
+	printf ("E: Rules were lost while rescanning\n");
+	FcPatternDestroy (pat);
+	ret = 6;
+	goto bail;
+    }
+    FcPatternDestroy (pat);
+
 bail:
     fprintf (stderr, "Cleaning up\n");
     if (basedir)
@@ -0,0 +1,85 @@
+/*
+ * fontconfig/test/test-cmap-charset.c
+ *
+ * Copyright © 2000 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+#include <fontconfig/fontconfig.h>
+#include <fontconfig/fcfreetype.h>
+
+#include <stdio.h>
+
+/*
+ * The charset built from the cmap segments must hold exactly the chars
+ * FreeType maps to a glyph
+ */
+static int
+test_font (FT_Library ftLibrary, const char *file)
+{
+    FT_Face    face;
+    FcCharSet *fcs;
+    FcChar32   ucs4;
+    int        ret = 0;
+
+    if (FT_New_Face (ftLibrary, file, 0, &face)) {
+	fprintf (stderr, "E: unable to open %s\n", file);
+	return 1;
+    }
+    fcs = FcFreeTypeCharSet (face, NULL);
+    if (!fcs) {
+	fprintf (stderr, "E: no charset for %s\n", file);
+	ret = 1;
+	goto bail;
+    }
+    for (ucs4 = 0x20; ucs4 <= 0x10ffff; ucs4++) {
+	FcBool mapped = FT_Get_Char_Index (face, ucs4) != 0;
+
+	if (mapped != FcCharSetHasChar (fcs, ucs4)) {
+	    fprintf (stderr, "E: %s: U+%04X %s\n", file, ucs4,
+	             mapped ? "missing from the charset" : "not in the font");
+	    ret = 1;
+	    break;
+	}
+    }
+    FcCharSetDestroy (fcs);
+bail:
+    FT_Done_Face (face);
+
+    return ret;
+}
+
+int
+main (void)
+{
+    static const char *files[] = {
+	SRCDIR "/no_family_name.ttf",
+	SRCDIR "/no_family_name_serif.ttf",
+    };
+    FT_Library ftLibrary;
+    int        i, ret = 0;
+
+    if (FT_Init_FreeType (&ftLibrary))
+	return 1;
+    for (i = 0; i < (int)(sizeof (files) / sizeof (files[0])); i++)
+	ret |= test_font (ftLibrary, files[i]);
+    FT_Done_FreeType (ftLibrary);
+
+    return ret;
+}
@@ -0,0 +1,109 @@
+/*
+ * fontconfig/test/test-formatter.c
+ *
+ * Copyright © 2000 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+#ifdef HAVE_CONFIG_H
+#  include "config.h"
+#endif
+#include <fontconfig/fontconfig.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static const char *formats[] = {
+    "%{family}",
+    "%{=unparse}",
+    "%{=fcmatch}",
+    "%-20{family}|%5{weight}",
+    "%{family[1]}:%{family[0]|downcase}",
+    "%{?style{%{style}}{none}}",
+    "%{[]family,familylang{%{family} (%{familylang})\n}}",
+    "%{file|basename|cescape}",
+    "%{family|translate( ,_)|delete(o)}",
+    "%{-family,file{%{=unparse}}}",
+    "%{+family{%{=unparse}}}",
+    "%{weight|const}",
+};
+
+#define NUM_FORMATS (int)(sizeof (formats) / sizeof (formats[0]))
+
+static int
+test_format (FcPattern *pat, const char *format)
+{
+    FcPatternFormatter *formatter;
+    FcChar8            *expected, *buf = NULL;
+    int                 size = 0, len, i, ret = 0;
+
+    expected = FcPatternFormat (pat, (const FcChar8 *)format);
+    formatter = FcPatternFormatterCreate ((const FcChar8 *)format);
+    if (!expected || !formatter) {
+	fprintf (stderr, "E: failed to compile %s\n", format);
+	return 1;
+    }
+    /* The buffer is allocated on the first call and reused afterwards */
+    for (i = 0; i < 2; i++) {
+	len = FcPatternFormatterFormat (formatter, pat, &buf, &size);
+	if (len < 0 || len != (int)strlen ((const char *)buf) ||
+	    size <= len || strcmp ((const char *)buf, (const char *)expected) != 0) {
+	    fprintf (stderr, "E: %s: got \"%s\", expected \"%s\"\n",
+	             format, buf ? (const char *)buf : "(null)", expected);
+	    ret = 1;
+	}
+    }
+    free (buf);
+    /* A buffer too small for the result grows */
+    size = 1;
+    buf = malloc (size);
+    len = FcPatternFormatterFormat (formatter, pat, &buf, &size);
+    if (len < 0 || strcmp ((const char *)buf, (const char *)expected) != 0) {
+	fprintf (stderr, "E: %s: a small buffer was not grown\n", format);
+	ret = 1;
+    }
+    free (buf);
+    FcPatternFormatterDestroy (formatter);
+    FcStrFree (expected);
+
+    return ret;
+}
+
+int
+main (void)
+{
+    FcPattern *pat;
+    int        i, ret = 0;
+
+    pat = FcNameParse ((const FcChar8 *)"Foo Sans,Foo:style=Bold:weight=200:familylang=en,de:file=/tmp/fonts/foo.ttf");
+    for (i = 0; i < NUM_FORMATS; i++)
+	ret |= test_format (pat, formats[i]);
+
+    /* Syntax errors are reported when compiling */
+    if (FcPatternFormatterCreate ((const FcChar8 *)"%{family") ||
+        FcPatternFormatterCreate ((const FcChar8 *)"%{family|nosuch}")) {
+	fprintf (stderr, "E: invalid formats were compiled\n");
+	ret = 1;
+    }
+    FcPatternDestroy (pat);
+    FcFini();
+
+    return ret;
+}
@@ -25,7 +25,7 @@ main (int argc, char **argv)
 	goto bail;
     if (!FcDirScanConfig (fs, dirs, (const FcChar8 *)argv[1], FcTrue, config))
 	goto bail2;
-    cache = FcDirCacheBuild (fs, (const FcChar8 *)argv[1], &st, dirs);
+    cache = FcDirCacheBuild (fs, (const FcChar8 *)argv[1], &st, dirs, NULL);
     if (!cache)
 	goto bail2;
     cache->fc_version = ((FC_VERSION_MAJOR + 1) << 24) +
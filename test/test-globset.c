@@ -0,0 +1,89 @@
+/* Copyright (C) 2026 fontconfig Authors */
+/* SPDX-License-Identifier: HPND */
+
+/* Internal API test case */
+#include "fcint.h"
+
+#include <stdio.h>
+
+static const char *globs[] = {
+    "/usr/share/fonts/X11/*",
+    "*.pcf.gz",
+    "/opt/fonts/exact.ttf",
+    "/home/*/fonts/*.otf",
+    "/srv/font?.ttf",
+    "*",
+    "",
+    "*/",
+    "/a*b*c",
+};
+
+static const char *strings[] = {
+    "",
+    "/",
+    "/usr/share/fonts/X11/misc/6x13.pcf.gz",
+    "/usr/share/fonts/X11",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/foo.pcf.gz",
+    "/usr/share/fonts/foo.pcf",
+    "/opt/fonts/exact.ttf",
+    "/opt/fonts/exact.ttf2",
+    "/opt/fonts/exact.tt",
+    "/home/user/fonts/a.otf",
+    "/home/user/fonts/a.ttf",
+    "/srv/font1.ttf",
+    "/srv/font12.ttf",
+    "/a/b/c",
+    "/abc",
+    "/acb",
+    "pcf.gz",
+};
+
+#define N_ELEMENTS(a) (sizeof (a) / sizeof (a[0]))
+
+static FcBool
+naive_match (FcStrSet *set, const FcChar8 *s)
+{
+    int i;
+
+    for (i = 0; i < set->num; i++)
+	if (FcStrGlobMatch (set->strs[i], s))
+	    return FcTrue;
+    return FcFalse;
+}
+
+int
+main (void)
+{
+    unsigned int mask, i;
+    int          ret = 0;
+
+    /* Check every subset of the globs against the naive matcher */
+    for (mask = 0; mask < (1U << N_ELEMENTS (globs)); mask++) {
+	FcStrSet  *set = FcStrSetCreate();
+	FcGlobSet *gs;
+
+	for (i = 0; i < N_ELEMENTS (globs); i++)
+	    if (mask & (1U << i))
+		FcStrSetAdd (set, (const FcChar8 *)globs[i]);
+	gs = FcGlobSetCreate (set);
+	if (!gs) {
+	    printf ("failed to compile globs\n");
+	    return 1;
+	}
+	for (i = 0; i < N_ELEMENTS (strings); i++) {
+	    FcBool expected = naive_match (set, (const FcChar8 *)strings[i]);
+	    FcBool result = FcGlobSetMatch (gs, (const FcChar8 *)strings[i]);
+
+	    if (expected != result) {
+		printf ("mismatch for \"%s\" with glob mask %x: expected %d, got %d\n",
+		        strings[i], mask, expected, result);
+		ret = 1;
+	    }
+	}
+	FcGlobSetDestroy (gs);
+	FcStrSetDestroy (set);
+    }
+
+    return ret;
+}
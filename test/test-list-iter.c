@@ -0,0 +1,273 @@
+/*
+ * fontconfig/test/test-list-iter.c
+ *
+ * Copyright © 2000 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+#include <fontconfig/fontconfig.h>
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static const char *fonts[] = {
+    SRCDIR "/4x6.pcf",
+    SRCDIR "/8x16.pcf",
+    SRCDIR "/no_family_name.ttf",
+    SRCDIR "/no_family_name_serif.ttf",
+};
+
+static int
+compare (const void *a, const void *b)
+{
+    return strcmp (*(const char *const *)a, *(const char *const *)b);
+}
+
+/*
+ * The names of the fonts, sorted, in a single string
+ */
+static char *
+names (FcPattern **fonts, int nfont)
+{
+    char **s = malloc (nfont * sizeof (char *) + 1);
+    char  *ret;
+    size_t len = 1;
+    int    i;
+
+    for (i = 0; i < nfont; i++) {
+	s[i] = (char *)FcNameUnparse (fonts[i]);
+	len += strlen (s[i]) + 1;
+    }
+    qsort (s, nfont, sizeof (char *), compare);
+    ret = malloc (len);
+    *ret = '\0';
+    for (i = 0; i < nfont; i++) {
+	strcat (ret, s[i]);
+	strcat (ret, "\n");
+	free (s[i]);
+    }
+    free (s);
+
+    return ret;
+}
+
+/*
+ * The iterator must yield the fonts FcFontList returns
+ */
+static int
+test_list (FcConfig *config, const char *pattern, FcObjectSet *os)
+{
+    FcPattern      *p = FcNameParse ((const FcChar8 *)pattern);
+    FcFontSet      *fs = FcFontList (config, p, os);
+    FcFontListIter *iter = FcFontListIterCreate (config, p, os);
+    FcPattern     **listed = NULL, *font;
+    FcResult        result;
+    int             nlisted = 0, i, ret = 0;
+    char           *expected, *got;
+
+    FcPatternDestroy (p);
+    if (!fs || !iter || (!*pattern && !fs->nfont)) {
+	fprintf (stderr, "E: unable to list %s\n", pattern);
+	return 1;
+    }
+    while ((font = FcFontListIterNext (iter, &result))) {
+	listed = realloc (listed, (nlisted + 1) * sizeof (FcPattern *));
+	listed[nlisted++] = font;
+    }
+    FcFontListIterDestroy (iter);
+    if (result != FcResultNoMatch) {
+	fprintf (stderr, "E: %s: listing failed\n", pattern);
+	ret = 1;
+    }
+
+    expected = names (fs->fonts, fs->nfont);
+    got = names (listed, nlisted);
+    if (strcmp (expected, got) != 0) {
+	fprintf (stderr, "E: %s: got\n%sexpected\n%s", pattern, got, expected);
+	ret = 1;
+    }
+    free (expected);
+    free (got);
+    for (i = 0; i < nlisted; i++)
+	FcPatternDestroy (listed[i]);
+    free (listed);
+    FcFontSetDestroy (fs);
+
+    return ret;
+}
+
+/*
+ * The application fonts replaced in the middle of the listing must be
+ * listed from the new set, without the fonts listed before again
+ */
+static int
+test_replaced (FcConfig *config)
+{
+    FcPattern      *p = FcPatternCreate();
+    FcFontSet      *fs = FcFontList (config, p, NULL);
+    FcFontListIter *iter = FcFontListIterCreate (config, p, NULL);
+    FcPattern     **listed = NULL, *font;
+    FcResult        result;
+    int             nlisted = 0, i, ret = 0;
+    char           *expected, *got;
+
+    FcPatternDestroy (p);
+    if (!fs || !iter || fs->nfont < 2) {
+	fprintf (stderr, "E: unable to list the fonts\n");
+	return 1;
+    }
+    while ((font = FcFontListIterNext (iter, &result))) {
+	listed = realloc (listed, (nlisted + 1) * sizeof (FcPattern *));
+	listed[nlisted++] = font;
+	if (nlisted == 1) {
+	    FcConfigAppFontClear (config);
+	    for (i = sizeof (fonts) / sizeof (fonts[0]) - 1; i >= 0; i--)
+		FcConfigAppFontAddFile (config, (const FcChar8 *)fonts[i]);
+	}
+    }
+    FcFontListIterDestroy (iter);
+    if (result != FcResultNoMatch) {
+	fprintf (stderr, "E: listing failed\n");
+	ret = 1;
+    }
+
+    expected = names (fs->fonts, fs->nfont);
+    got = names (listed, nlisted);
+    if (strcmp (expected, got) != 0) {
+	fprintf (stderr, "E: replaced fonts: got\n%sexpected\n%s", got, expected);
+	ret = 1;
+    }
+    free (expected);
+    free (got);
+    for (i = 0; i < nlisted; i++)
+	FcPatternDestroy (listed[i]);
+    free (listed);
+    FcFontSetDestroy (fs);
+
+    return ret;
+}
+
+/*
+ * Listing the fonts of the configuration, which are indexed once queried
+ * twice, must find the fonts listing an unindexed copy of them finds
+ */
+static int
+test_index (FcConfig *config, const char *pattern, FcObjectSet *os)
+{
+    FcPattern *p = FcNameParse ((const FcChar8 *)pattern);
+    FcFontSet *app = FcConfigGetFonts (config, FcSetApplication);
+    FcFontSet *copy = FcFontSetCreate();
+    FcFontSet *fs[3];
+    char      *expected, *got;
+    int        i, ret = 0;
+
+    for (i = 0; i < app->nfont; i++) {
+	FcPatternReference (app->fonts[i]);
+	FcFontSetAdd (copy, app->fonts[i]);
+    }
+    fs[0] = FcFontSetList (config, &copy, 1, p, os);
+    fs[1] = FcFontList (config, p, os);
+    fs[2] = FcFontList (config, p, os);
+    FcPatternDestroy (p);
+    FcFontSetDestroy (copy);
+    if (!fs[0] || !fs[1] || !fs[2]) {
+	fprintf (stderr, "E: unable to list %s\n", pattern);
+	return 1;
+    }
+    expected = names (fs[0]->fonts, fs[0]->nfont);
+    for (i = 1; i < 3; i++) {
+	got = names (fs[i]->fonts, fs[i]->nfont);
+	if (strcmp (expected, got) != 0) {
+	    fprintf (stderr, "E: %s: got\n%sexpected\n%s", pattern, got, expected);
+	    ret = 1;
+	}
+	free (got);
+    }
+    free (expected);
+    for (i = 0; i < 3; i++)
+	FcFontSetDestroy (fs[i]);
+
+    return ret;
+}
+
+static const char *selective[] = {
+    ":family=Fixed",
+    ":family=fixed:style=Regular",
+    ":family=Fixed:family=Misc Fixed",
+    ":style=Bold",
+    ":lang=en",
+    ":lang=en-us",
+    ":lang=ja",
+    ":lang=en|ru",
+    ":spacing=mono",
+    ":spacing=100.0",
+    ":spacing=proportional",
+    ":fontformat=TrueType",
+    ":fontformat=PCF:lang=en",
+    ":file=" SRCDIR "/4x6.pcf",
+    ":file=" SRCDIR "/no_family_name_serif.ttf",
+    ":pixelsize=6:family=Fixed",
+};
+
+#define NUM_SELECTIVE (int)(sizeof (selective) / sizeof (selective[0]))
+
+int
+main (void)
+{
+    FcConfig    *config = FcConfigCreate();
+    FcObjectSet *family = FcObjectSetBuild (FC_FAMILY, (char *)0);
+    FcObjectSet *fsf = FcObjectSetBuild (FC_FAMILY, FC_STYLE, FC_FILE, (char *)0);
+    FcObjectSet *empty = FcObjectSetCreate();
+    unsigned int i;
+    int          j, ret = 0;
+
+    for (i = 0; i < sizeof (fonts) / sizeof (fonts[0]) - 1; i++) {
+	if (!FcConfigAppFontAddFile (config, (const FcChar8 *)fonts[i])) {
+	    fprintf (stderr, "E: unable to add %s\n", fonts[i]);
+	    return 1;
+	}
+    }
+    for (j = 0; j < NUM_SELECTIVE; j++)
+	ret |= test_index (config, selective[j], fsf);
+    /* Fonts added once indexed are found too */
+    FcConfigAppFontAddFile (config, (const FcChar8 *)fonts[i]);
+    for (j = 0; j < NUM_SELECTIVE; j++)
+	ret |= test_index (config, selective[j], fsf);
+    /* Again, so that fonts are listed once when they are equal */
+    FcConfigAppFontAddFile (config, (const FcChar8 *)fonts[0]);
+
+    ret |= test_list (config, "", NULL);
+    ret |= test_list (config, "", family);
+    ret |= test_list (config, "", fsf);
+    ret |= test_list (config, "", empty);
+    ret |= test_list (config, ":spacing=mono", fsf);
+    ret |= test_list (config, "Fixed", family);
+    ret |= test_list (config, ":lang=ja", fsf);
+    ret |= test_list (config, ":namelang=ja", family);
+    ret |= test_replaced (config);
+
+    FcObjectSetDestroy (family);
+    FcObjectSetDestroy (fsf);
+    FcObjectSetDestroy (empty);
+    FcConfigDestroy (config);
+    FcFini();
+
+    return ret;
+}
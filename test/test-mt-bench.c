@@ -0,0 +1,378 @@
+/* Copyright (C) 2026 fontconfig Authors */
+/* SPDX-License-Identifier: HPND */
+
+/*
+ * Throughput and latency of concurrent FcFontMatch, FcFontSort,
+ * FcFontList and FcConfigSubstitute calls on the current config.
+ * Every result is checked against the one obtained before the threads
+ * are started, so this doubles as a stress test.
+ */
+#ifdef HAVE_CONFIG_H
+#  include "config.h"
+#endif
+
+#include <fontconfig/fontconfig.h>
+
+#include <pthread.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define MAX_THREADS 256
+
+typedef enum {
+    OP_MATCH,
+    OP_SORT,
+    OP_LIST,
+    OP_SUBSTITUTE,
+    OP_END
+} Op;
+
+static const char *op_names[OP_END] = {
+    "match",
+    "sort",
+    "list",
+    "substitute",
+};
+
+static const char *default_patterns[] = {
+    "sans-serif",
+    "serif:bold",
+    "monospace:lang=ja",
+    ":pixelsize=16",
+};
+
+typedef struct {
+    FcPattern *pattern;  /* as given */
+    FcPattern *prepared; /* substituted, for matching and sorting */
+    FcChar8   *match;    /* the file of the best match */
+    int        nsort;
+    int        nlist;
+} Query;
+
+typedef struct {
+    Op      ops[OP_END];
+    int     nop;
+    Query  *queries;
+    int     nquery;
+    int     nrun; /* operations per thread */
+    double *latency;
+    int     errors;
+} Thread;
+
+static double
+now (void)
+{
+#if defined(HAVE_CLOCK_GETTIME) && defined(CLOCK_MONOTONIC)
+    struct timespec ts;
+
+    if (clock_gettime (CLOCK_MONOTONIC, &ts) == 0)
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+#endif
+    return (double)clock() / CLOCKS_PER_SEC;
+}
+
+static FcPattern *
+substitute (FcPattern *pattern)
+{
+    FcPattern *pat = FcPatternDuplicate (pattern);
+
+    FcConfigSubstitute (NULL, pat, FcMatchPattern);
+    FcDefaultSubstitute (pat);
+
+    return pat;
+}
+
+static FcChar8 *
+match_file (FcPattern *pat)
+{
+    FcPattern *m;
+    FcResult   result;
+    FcChar8   *file = NULL, *ret = NULL;
+
+    m = FcFontMatch (NULL, pat, &result);
+    if (m) {
+	if (FcPatternGetString (m, FC_FILE, 0, &file) == FcResultMatch)
+	    ret = FcStrCopy (file);
+	else
+	    ret = FcStrCopy ((const FcChar8 *)"");
+	FcPatternDestroy (m);
+    }
+    return ret;
+}
+
+static int
+sort_count (FcPattern *pat)
+{
+    FcFontSet *fs;
+    FcResult   result;
+    int        n = -1;
+
+    fs = FcFontSort (NULL, pat, FcTrue, NULL, &result);
+    if (fs) {
+	n = fs->nfont;
+	FcFontSetDestroy (fs);
+    }
+    return n;
+}
+
+static int
+list_count (FcPattern *pat)
+{
+    FcFontSet *fs;
+    int        n = -1;
+
+    fs = FcFontList (NULL, pat, NULL);
+    if (fs) {
+	n = fs->nfont;
+	FcFontSetDestroy (fs);
+    }
+    return n;
+}
+
+/*
+ * Run one operation, returning whether it gave the expected result
+ */
+static FcBool
+run_op (Op op, Query *q)
+{
+    FcChar8   *file;
+    FcPattern *pat;
+    FcBool     ret = FcTrue;
+
+    switch (op) {
+    case OP_MATCH:
+	file = match_file (q->prepared);
+	ret = (!file && !q->match) ||
+	      (file && q->match && !strcmp ((const char *)file, (const char *)q->match));
+	FcStrFree (file);
+	break;
+    case OP_SORT:
+	ret = sort_count (q->prepared) == q->nsort;
+	break;
+    case OP_LIST:
+	ret = list_count (q->pattern) == q->nlist;
+	break;
+    case OP_SUBSTITUTE:
+	pat = substitute (q->pattern);
+	ret = pat != NULL;
+	FcPatternDestroy (pat);
+	break;
+    default:
+	break;
+    }
+    return ret;
+}
+
+static void *
+run_thread (void *arg)
+{
+    Thread *t = arg;
+    double  start;
+    int     i;
+
+    for (i = 0; i < t->nrun; i++) {
+	start = now();
+	if (!run_op (t->ops[i % t->nop], &t->queries[(i / t->nop) % t->nquery]))
+	    t->errors++;
+	t->latency[i] = now() - start;
+    }
+    return NULL;
+}
+
+static int
+compare_double (const void *a, const void *b)
+{
+    double x = *(const double *)a, y = *(const double *)b;
+
+    return x < y ? -1 : x > y;
+}
+
+/*
+ * Run nthread threads at once and report their throughput and latency.
+ * Returns the throughput, or a negative value on failure.
+ */
+static double
+run (Thread *proto, int nthread, double base, int nbase)
+{
+    pthread_t threads[MAX_THREADS];
+    Thread    args[MAX_THREADS];
+    double   *latency, elapsed, ops;
+    int       i, n, total, errors = 0;
+
+    total = nthread * proto->nrun;
+    latency = malloc (total * sizeof (double));
+    if (!latency)
+	return -1;
+    elapsed = now();
+    for (n = 0; n < nthread; n++) {
+	args[n] = *proto;
+	args[n].latency = latency + n * proto->nrun;
+	if (pthread_create (&threads[n], NULL, run_thread, &args[n]) != 0) {
+	    fprintf (stderr, "E: cannot create thread %d\n", n);
+	    break;
+	}
+    }
+    for (i = 0; i < n; i++) {
+	pthread_join (threads[i], NULL);
+	errors += args[i].errors;
+    }
+    elapsed = now() - elapsed;
+    if (n < nthread || errors) {
+	if (errors)
+	    fprintf (stderr, "E: %d unexpected result(s) with %d thread(s)\n", errors, nthread);
+	free (latency);
+	return -1;
+    }
+    ops = total / (elapsed > 0 ? elapsed : 1e-9);
+    qsort (latency, total, sizeof (double), compare_double);
+    printf ("%7d %10.0f %10.1f %10.1f %10.1f%%\n",
+            nthread, ops,
+            latency[total / 2] * 1e6,
+            latency[(int)(total * 0.99)] * 1e6,
+            base > 0 ? 100 * (ops / nthread) / (base / nbase) : 100.0);
+    free (latency);
+
+    return ops;
+}
+
+static void
+usage (const char *program, int error)
+{
+    FILE *file = error ? stderr : stdout;
+
+    fprintf (file, "usage: %s [-t THREADS] [-n OPS] [-m OPS] [-d DIR] [pattern ...]\n", program);
+    fprintf (file, "Measure concurrent font matching on the current configuration\n");
+    fprintf (file, "\n");
+    fprintf (file, "  -t THREADS  comma-separated thread counts to run (default 1,2,4,8)\n");
+    fprintf (file, "  -n OPS      operations per thread (default 1000)\n");
+    fprintf (file, "  -m OPS      comma-separated mix of match, sort, list and substitute\n");
+    fprintf (file, "              (default all of them)\n");
+    fprintf (file, "  -d DIR      add the fonts in DIR as application fonts\n");
+    fprintf (file, "  -h          display this help and exit\n");
+    exit (error);
+}
+
+int
+main (int argc, char **argv)
+{
+    const char *threads = "1,2,4,8", *mix = NULL;
+    char       *list, *s, *tok;
+    Thread      proto;
+    FcFontSet  *fonts;
+    double      ops, base = 0;
+    int         nbase = 0, nthread, nfont = 0, i, c, ret = 0;
+
+    memset (&proto, 0, sizeof (proto));
+    proto.nrun = 1000;
+    while ((c = getopt (argc, argv, "t:n:m:d:h")) != -1) {
+	switch (c) {
+	case 't':
+	    threads = optarg;
+	    break;
+	case 'n':
+	    proto.nrun = atoi (optarg);
+	    break;
+	case 'm':
+	    mix = optarg;
+	    break;
+	case 'd':
+	    if (!FcConfigAppFontAddDir (NULL, (const FcChar8 *)optarg)) {
+		fprintf (stderr, "E: cannot add fonts from %s\n", optarg);
+		return 1;
+	    }
+	    break;
+	case 'h':
+	    usage (argv[0], 0);
+	default:
+	    usage (argv[0], 1);
+	}
+    }
+    if (proto.nrun <= 0)
+	usage (argv[0], 1);
+
+    if (mix) {
+	list = strdup (mix);
+	for (s = list; (tok = strtok (s, ",")); s = NULL) {
+	    for (i = 0; i < OP_END; i++)
+		if (!strcmp (tok, op_names[i]))
+		    break;
+	    if (i == OP_END || proto.nop == OP_END) {
+		fprintf (stderr, "E: unknown operation %s\n", tok);
+		return 1;
+	    }
+	    proto.ops[proto.nop++] = i;
+	}
+	free (list);
+    } else {
+	for (i = 0; i < OP_END; i++)
+	    proto.ops[proto.nop++] = i;
+    }
+    if (!proto.nop)
+	usage (argv[0], 1);
+
+    /* The expected results, from a single thread */
+    if (optind < argc) {
+	proto.nquery = argc - optind;
+	argv += optind;
+    } else {
+	proto.nquery = sizeof (default_patterns) / sizeof (default_patterns[0]);
+	argv = (char **)default_patterns;
+    }
+    proto.queries = calloc (proto.nquery, sizeof (Query));
+    for (i = 0; i < proto.nquery; i++) {
+	Query *q = &proto.queries[i];
+
+	q->pattern = FcNameParse ((const FcChar8 *)argv[i]);
+	if (!q->pattern) {
+	    fprintf (stderr, "E: unable to parse %s\n", argv[i]);
+	    return 1;
+	}
+	q->prepared = substitute (q->pattern);
+	q->match = match_file (q->prepared);
+	q->nsort = sort_count (q->prepared);
+	q->nlist = list_count (q->pattern);
+    }
+    for (i = FcSetSystem; i <= FcSetApplication; i++) {
+	fonts = FcConfigGetFonts (NULL, i);
+	if (fonts)
+	    nfont += fonts->nfont;
+    }
+
+    printf ("# %d font(s), %d pattern(s), %d operation(s) per thread:", nfont, proto.nquery, proto.nrun);
+    for (i = 0; i < proto.nop; i++)
+	printf ("%s%s", i ? "," : " ", op_names[proto.ops[i]]);
+    printf ("\n%7s %10s %10s %10s %11s\n", "threads", "ops/s", "p50 (us)", "p99 (us)", "efficiency");
+
+    list = strdup (threads);
+    for (s = list; (tok = strtok (s, ",")); s = NULL) {
+	nthread = atoi (tok);
+	if (nthread <= 0 || nthread > MAX_THREADS) {
+	    fprintf (stderr, "E: invalid thread count %s\n", tok);
+	    ret = 1;
+	    break;
+	}
+	ops = run (&proto, nthread, base, nbase);
+	if (ops < 0) {
+	    ret = 1;
+	    break;
+	}
+	if (!nbase) {
+	    base = ops;
+	    nbase = nthread;
+	}
+    }
+    free (list);
+
+    for (i = 0; i < proto.nquery; i++) {
+	FcPatternDestroy (proto.queries[i].pattern);
+	FcPatternDestroy (proto.queries[i].prepared);
+	FcStrFree (proto.queries[i].match);
+    }
+    free (proto.queries);
+    FcFini();
+
+    return ret;
+}
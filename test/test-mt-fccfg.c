@@ -6,11 +6,14 @@
 
 #include <fontconfig/fontconfig.h>
 
-#include <stdio.h>
 #include <pthread.h>
+#include <stdio.h>
 #include <stdlib.h>
+#include <sys/time.h>
 
-#define NTHR 100
+#define NTHR     100
+#define NREADERS 8
+#define NMATCHES 200
 
 struct thr_arg_s {
     int thr_num;
@@ -49,6 +52,99 @@ run_test_in_thread (void *arg)
     return NULL;
 }
 
+static pthread_mutex_t readers_lock = PTHREAD_MUTEX_INITIALIZER;
+static int             readers_done;
+
+static double
+now (void)
+{
+    struct timeval tv;
+
+    gettimeofday (&tv, NULL);
+    return tv.tv_sec + tv.tv_usec / 1000000.;
+}
+
+static void *
+run_matches_in_thread (void *arg)
+{
+    FcPattern *pat, *m;
+    FcResult   result;
+    int        i;
+
+    for (i = 0; i < NMATCHES; i++) {
+	pat = FcNameParse ((const FcChar8 *)"sans-serif");
+	FcConfigSubstitute (NULL, pat, FcMatchPattern);
+	FcConfigSetDefaultSubstitute (NULL, pat);
+	m = FcFontMatch (NULL, pat, &result);
+	FcPatternDestroy (pat);
+	if (m)
+	    FcPatternDestroy (m);
+    }
+    pthread_mutex_lock (&readers_lock);
+    readers_done++;
+    pthread_mutex_unlock (&readers_lock);
+
+    return NULL;
+}
+
+/*
+ * Match against the current config from several threads while swapping
+ * it, and report the throughput
+ */
+static int
+run_readers (int nreaders, FcConfig **configs, int *nswaps)
+{
+    pthread_t threads[NREADERS];
+    double    start, elapsed;
+    int       i, n, done = 0;
+
+    readers_done = 0;
+    start = now();
+    for (i = 0; i < nreaders; i++) {
+	if (pthread_create (&threads[i], NULL, run_matches_in_thread, NULL) != 0) {
+	    fprintf (stderr, "Cannot create thread %d\n", i);
+	    break;
+	}
+    }
+    n = i;
+    *nswaps = 0;
+    while (configs && done < n) {
+	if (!FcConfigSetCurrent (configs[*nswaps % 2]))
+	    return 1;
+	(*nswaps)++;
+	pthread_mutex_lock (&readers_lock);
+	done = readers_done;
+	pthread_mutex_unlock (&readers_lock);
+    }
+    for (i = 0; i < n; i++)
+	pthread_join (threads[i], NULL);
+    elapsed = now() - start;
+    printf ("%d thread(s): %.0f matches/s\n", n, n * NMATCHES / (elapsed > 0 ? elapsed : 1e-6));
+
+    return n != nreaders;
+}
+
+int
+test_swap (void)
+{
+    FcConfig *configs[2];
+    int       nswaps, ret = 0;
+
+    configs[0] = FcInitLoadConfigAndFonts();
+    configs[1] = FcInitLoadConfigAndFonts();
+    if (!configs[0] || !configs[1] || !FcConfigSetCurrent (configs[0]))
+	return 1;
+    ret |= run_readers (1, NULL, &nswaps);
+    ret |= run_readers (NREADERS, NULL, &nswaps);
+    ret |= run_readers (NREADERS, configs, &nswaps);
+    printf ("swapped the current config %d times\n", nswaps);
+    FcConfigDestroy (configs[0]);
+    FcConfigDestroy (configs[1]);
+    FcFini();
+
+    return ret;
+}
+
 int
 test (void)
 {
@@ -88,5 +184,5 @@ test (void)
 int
 main (int argc, char **argv)
 {
-    return test();
+    return test_swap() || test();
 }
@@ -0,0 +1,215 @@
+/*
+ * fontconfig/test/test-server.c
+ *
+ * Copyright © 2000 Keith Packard
+ *
+ * Permission to use, copy, modify, distribute, and sell this software and its
+ * documentation for any purpose is hereby granted without fee, provided that
+ * the above copyright notice appear in all copies and that both that
+ * copyright notice and this permission notice appear in supporting
+ * documentation, and that the name of the author(s) not be used in
+ * advertising or publicity pertaining to distribution of the software without
+ * specific, written prior permission.  The authors make no
+ * representations about the suitability of this software for any purpose.  It
+ * is provided "as is" without express or implied warranty.
+ *
+ * THE AUTHOR(S) DISCLAIMS ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+ * INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS, IN NO
+ * EVENT SHALL THE AUTHOR(S) BE LIABLE FOR ANY SPECIAL, INDIRECT OR
+ * CONSEQUENTIAL DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE,
+ * DATA OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+ * TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+ * PERFORMANCE OF THIS SOFTWARE.
+ */
+#ifdef HAVE_CONFIG_H
+#  include "config.h"
+#endif
+#include "fcint.h"
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static const char *replies[] = {
+    "= family=ssFoo file=ss/a:b.ttf\n= family=ssBar-Baz weight=sd200\n.\n",
+    "!no fonts\n",
+    "= family=ssFoo\n",
+    NULL, /* answered with FcServerReply */
+};
+
+#define NUM_REPLIES (int)(sizeof (replies) / sizeof (replies[0]))
+
+/*
+ * Answer one connection with each reply in turn, checking the request
+ */
+static int
+serve (int fd)
+{
+    char buf[1024];
+    int  i;
+
+    for (i = 0; i < NUM_REPLIES; i++) {
+	int     c = accept (fd, NULL, NULL);
+	ssize_t n;
+
+	if (c < 0)
+	    return 1;
+	n = recv (c, buf, sizeof (buf) - 1, 0);
+	if (n <= 0)
+	    return 1;
+	buf[n] = '\0';
+	if ((replies[i] && strncmp (buf, "sort ", 5) != 0) || buf[n - 1] != '\n') {
+	    fprintf (stderr, "E: bad request %s", buf);
+	    return 1;
+	}
+	if (replies[i]) {
+	    if (send (c, replies[i], strlen (replies[i]), 0) < 0)
+		return 1;
+	} else {
+	    FcChar8 *reply;
+
+	    buf[n - 1] = '\0';
+	    reply = FcServerReply (NULL, (const FcChar8 *)buf);
+	    if (!reply || send (c, reply, strlen ((const char *)reply), 0) < 0)
+		return 1;
+	    FcStrFree (reply);
+	}
+	close (c);
+    }
+    return 0;
+}
+
+static int
+check (FcFontSet *set, const char *expected, int nfont)
+{
+    FcChar8 *s;
+    int      i, ret = 0;
+
+    if (!set) {
+	fprintf (stderr, "E: no fonts\n");
+	return 1;
+    }
+    if (expected) {
+	char got[1024] = "";
+
+	for (i = 0; i < set->nfont; i++) {
+	    s = FcNameUnparse (set->fonts[i]);
+	    strcat (got, (const char *)s);
+	    strcat (got, "\n");
+	    FcStrFree (s);
+	}
+	if (strcmp (got, expected) != 0) {
+	    fprintf (stderr, "E: got\n%s, expected\n%s", got, expected);
+	    ret = 1;
+	}
+    } else if (set->nfont != nfont) {
+	fprintf (stderr, "E: the fallback found %d fonts, expected %d\n", set->nfont, nfont);
+	ret = 1;
+    }
+    FcFontSetDestroy (set);
+
+    return ret;
+}
+
+static int
+check_round_trip (const char *path)
+{
+    FcPattern     *pat;
+    FcFontSet     *local, *remote;
+    FcMatrix       m = { 1. / 3, 0.1, -0.2, 1e-300 };
+    FcValue        v;
+    FcValueBinding binding;
+    int            i, ret = 0;
+
+    pat = FcNameParse ((const FcChar8 *)"A b=c\\:d %= e:style=bold:lang=en|x-frobnicate");
+    FcPatternAddDouble (pat, FC_PIXEL_SIZE, 0.1 + 0.2);
+    FcPatternAddMatrix (pat, FC_MATRIX, &m);
+    v.type = FcTypeString;
+    v.u.s = (const FcChar8 *)"weak";
+    FcPatternAddWeak (pat, FC_FAMILY, v, FcTrue);
+    local = FcServerQuery (NULL, (const FcChar8 *)"", FcServerSubstitute, pat);
+    remote = FcServerQuery (NULL, (const FcChar8 *)path, FcServerSubstitute, pat);
+    if (!local || !remote || local->nfont != 1 || remote->nfont != 1 ||
+        !FcPatternEqual (local->fonts[0], remote->fonts[0])) {
+	fprintf (stderr, "E: the server changed the pattern\n");
+	ret = 1;
+    } else {
+	for (i = 0; FcPatternGetWithBinding (remote->fonts[0], FC_FAMILY, i, &v, &binding) == FcResultMatch; i++)
+	    if (!strcmp ((const char *)v.u.s, "weak"))
+		break;
+	if (v.type != FcTypeString || strcmp ((const char *)v.u.s, "weak") || binding != FcValueBindingWeak) {
+	    fprintf (stderr, "E: the server lost the binding\n");
+	    ret = 1;
+	}
+    }
+    if (local)
+	FcFontSetDestroy (local);
+    if (remote)
+	FcFontSetDestroy (remote);
+    FcPatternDestroy (pat);
+
+    return ret;
+}
+
+int
+main (void)
+{
+    struct sockaddr_un addr;
+    char               dir[] = "/tmp/fontconfig.XXXXXX";
+    FcPattern         *pat;
+    FcFontSet         *local;
+    pid_t              pid;
+    int                fd, status, nfont, ret = 0;
+
+    if (!mkdtemp (dir))
+	return 1;
+    memset (&addr, 0, sizeof (addr));
+    addr.sun_family = AF_UNIX;
+    snprintf (addr.sun_path, sizeof (addr.sun_path), "%s/socket", dir);
+    fd = socket (AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0 ||
+        bind (fd, (struct sockaddr *)&addr, sizeof (addr)) < 0 ||
+        listen (fd, 1) < 0) {
+	perror (addr.sun_path);
+	return 1;
+    }
+    pid = fork();
+    if (pid < 0)
+	return 1;
+    if (pid == 0)
+	_exit (serve (fd));
+    close (fd);
+
+    pat = FcNameParse ((const FcChar8 *)"sans");
+    local = FcServerQuery (NULL, (const FcChar8 *)"", FcServerSort, pat);
+    if (!local)
+	return 1;
+    nfont = local->nfont;
+    FcFontSetDestroy (local);
+    /* The fonts of the reply are parsed */
+    ret |= check (FcServerQuery (NULL, (const FcChar8 *)addr.sun_path, FcServerSort, pat),
+                  "Foo:file=/a\\:b.ttf\nBar\\-Baz:weight=200\n", 0);
+    /* Errors and truncated replies fall back to matching in process */
+    ret |= check (FcServerQuery (NULL, (const FcChar8 *)addr.sun_path, FcServerSort, pat), NULL, nfont);
+    ret |= check (FcServerQuery (NULL, (const FcChar8 *)addr.sun_path, FcServerSort, pat), NULL, nfont);
+    /* Values, bindings and doubles make it through the server unchanged */
+    ret |= check_round_trip (addr.sun_path);
+
+    if (waitpid (pid, &status, 0) < 0 || !WIFEXITED (status) || WEXITSTATUS (status) != 0) {
+	fprintf (stderr, "E: the server failed\n");
+	ret = 1;
+    }
+    /* So does a missing server */
+    ret |= check (FcServerQuery (NULL, (const FcChar8 *)addr.sun_path, FcServerSort, pat), NULL, nfont);
+    FcPatternDestroy (pat);
+
+    unlink (addr.sun_path);
+    rmdir (dir);
+    FcFini();
+
+    return ret;
+}
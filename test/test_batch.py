@@ -0,0 +1,164 @@
+#! /usr/bin/env python3
+# Copyright (C) 2025 fontconfig Authors
+# SPDX-License-Identifier: HPND
+
+from fctest import FcTest, FcTestFont
+from pathlib import Path
+import json
+import re
+import pytest
+
+
+@pytest.fixture
+def fctest():
+    return FcTest()
+
+
+@pytest.fixture
+def fcfont():
+    return FcTestFont(srcdir=Path(__file__).parents[1])
+
+
+def run(fctest, tool, args):
+    runner = fctest.run_query if tool == 'query' else fctest.run_scan
+    for ret, stdout, stderr in runner(args):
+        assert ret == 0, stderr
+        return stdout
+
+
+@pytest.mark.parametrize('tool', ['query', 'scan'])
+def test_files_from_jobs(fctest, fcfont, tool, tmp_path):
+    """Files listed in a file and scanned on threads print as the arguments do"""
+    files = [str(f) for f in fcfont.fonts] * 4
+    expected = run(fctest, tool, files)
+    listing = tmp_path / 'files'
+    listing.write_text('\n'.join(files[1:]) + '\n')
+    assert run(fctest, tool, ['-j', '4', '-F', str(listing), files[0]]) == expected
+    unordered = run(fctest, tool, ['-j', '4', '-u', '-F', str(listing), files[0]])
+    assert sorted(unordered.splitlines()) == sorted(expected.splitlines())
+
+
+@pytest.mark.parametrize('tool', ['query', 'scan'])
+def test_json(fctest, fcfont, tool):
+    """Each font is printed as a JSON object on a line of its own"""
+    files = [str(f) for f in fcfont.fonts]
+    families = run(fctest, tool, ['-f', '%{family}\n'] + files).splitlines()
+    fonts = [json.loads(line) for line in run(fctest, tool, ['--json'] + files).splitlines()]
+    assert [','.join(f['family']) for f in fonts] == families
+    for f in fonts:
+        assert isinstance(f['index'][0], int)
+        assert all(first <= last for first, last in f.get('charset', [[]])[0])
+
+
+@pytest.mark.parametrize('tool', ['query', 'scan'])
+def test_invalid_format(fctest, fcfont, tool):
+    """An invalid format is reported once, before any font is read"""
+    runner = fctest.run_query if tool == 'query' else fctest.run_scan
+    for ret, stdout, stderr in runner(['-f', '%{family'] + [str(f) for f in fcfont.fonts]):
+        assert ret == 1
+        assert stdout == ''
+        assert stderr.count('Pattern format error') == 1
+
+
+def test_json_escapes(fctest):
+    """Invalid UTF-8 and numbers JSON can't hold give a valid object"""
+    fctest.setup()
+    pattern = 'a\udcffb\u00e9:size=inf:pixelsize=nan:matrix=1 0.5 0 1'
+    for ret, stdout, stderr in fctest.run_pattern(['-f', '%{=json}\n', pattern]):
+        assert ret == 0, stderr
+        font = json.loads(stdout)
+        assert font['family'] == ['a\ufffdb\u00e9']
+        assert font['size'] == [None]
+        assert font['pixelsize'] == [None]
+        assert font['matrix'] == [[1, 0.5, 0, 1]]
+
+
+def test_match_batch(fctest, fcfont):
+    """Patterns matched in a batch give the fonts they give one at a time"""
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, '.')
+    patterns = ['Fixed:pixelsize=6', 'Fixed:pixelsize=16', 'sans:bold', ':pixelsize=13']
+    expected = ''
+    for pattern in patterns:
+        for ret, stdout, stderr in fctest.run_match(['-f', '%{family}:%{pixelsize}\n', pattern]):
+            assert ret == 0, stderr
+            expected += stdout
+    for ret, stdout, stderr in fctest.run_match(['--batch', '-f', '%{family}:%{pixelsize}\n'],
+                                                input='\n'.join(patterns) + '\n'):
+        assert ret == 0, stderr
+        assert stdout == expected
+    for ret, stdout, stderr in fctest.run_match(['--batch', '--sort', '-f', '%{pixelsize}\n'],
+                                                input='Fixed:pixelsize=6\nFixed:pixelsize=16\n'):
+        assert ret == 0, stderr
+        assert stdout == '6\n16\n\n16\n6\n\n'
+    # each font is a line whatever the format
+    for ret, stdout, stderr in fctest.run_match(['--batch', '-f', '%{pixelsize}'],
+                                                input='Fixed:pixelsize=6\nFixed:pixelsize=16\n'):
+        assert ret == 0, stderr
+        assert stdout == '6\n16\n'
+
+
+def test_match_batch_format_error(fctest, fcfont):
+    """Fonts which can't be formatted leave a sorted reply empty"""
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, '.')
+    for ret, stdout, stderr in fctest.run_match(['--batch', '--sort', '-f', '%{family|const}\n'],
+                                                input='Fixed:pixelsize=6\nFixed:pixelsize=16\n'):
+        assert ret == 1
+        assert stdout == '\n\n'
+
+
+def test_match_batch_no_font(fctest):
+    """A pattern matching no font is answered with an empty line"""
+    fctest.setup()
+    for ret, stdout, stderr in fctest.run_match(['--batch'], input='sans\n:size=big\nserif\n'):
+        assert ret == 1
+        assert stdout == '\n\n\n'
+
+
+def test_pattern_batch(fctest, fcfont):
+    """Patterns substituted in a batch print as they do one at a time"""
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, '.')
+    patterns = ['Fixed:pixelsize=6', 'sans:bold', ':lang=ja']
+    args = ['-c', '-d', '-f', '%{family}:%{weight}:%{lang}\n']
+    expected = ''
+    for pattern in patterns:
+        for ret, stdout, stderr in fctest.run_pattern(args + [pattern]):
+            assert ret == 0, stderr
+            expected += stdout
+    for ret, stdout, stderr in fctest.run_pattern(['--batch', '--timing'] + args,
+                                                  input='\n'.join(patterns) + '\n'):
+        assert ret == 0, stderr
+        assert stdout == expected
+        timings = stderr.splitlines()
+        assert [t.split(None, 2)[2] for t in timings[:-1]] == patterns
+        assert timings[-1].startswith('3 patterns in ')
+    for ret, stdout, stderr in fctest.run_pattern(['--batch', 'family'],
+                                                  input='sans:bold\n:size=big\nserif\n'):
+        assert ret == 1
+        assert stdout.count('Pattern has 1 elts') == 2
+        assert '"sans"(s)\n\n\nPattern has 1 elts' in stdout
+
+
+def test_validate_matrix(fctest, fcfont):
+    """The coverage matrix counts what each face misses for each language"""
+    files = [str(f) for f in fcfont.fonts]
+    langs = ['en', 'ja', 'zh-tw']
+    expected = {}
+    for f in files:
+        for lang in langs:
+            for ret, stdout, stderr in fctest.run_validate(['-l', lang, f]):
+                for line in stdout.splitlines():
+                    face, _, rest = line.partition(' ')
+                    m = re.match(r'Missing (\d+) glyph', rest)
+                    expected.setdefault(face, []).append(m.group(1) if m else '0')
+    for jobs in ['1', '4']:
+        for ret, stdout, stderr in fctest.run_validate(['-m', '-j', jobs, '-l', ','.join(langs)] + files):
+            lines = stdout.splitlines()
+            assert lines[0].split('\t') == ['font'] + langs
+            assert {line.split('\t')[0]: line.split('\t')[1:] for line in lines[1:]} == expected
+            assert [line.split('\t')[0] for line in lines[1:]] == list(expected)
+    for ret, stdout, stderr in fctest.run_validate(['-m', '-l', 'all', files[0]]):
+        langs = stdout.splitlines()[0].split('\t')[1:]
+        assert 'en' in langs and len(langs) > 200
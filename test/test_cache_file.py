@@ -4,6 +4,9 @@
 from fctest import FcTest, FcTestFont
 from pathlib import Path
 import pytest
+import shutil
+import sys
+import time
 
 
 @pytest.fixture
@@ -36,3 +39,179 @@ def test_cache_suffix(fctest, fcfont):
     fctest.logger.info([f.name for f in Path(fctest.cachedir.name).glob('*cache*')])
     cache_files = [f.name for f in Path(fctest.cachedir.name).glob(f"*{cachesuffix}")]
     assert len(cache_files) > 0
+
+
+def test_cache_generation(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    genfile = Path(fctest.cachedir.name) / "GENERATION"
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert genfile.exists()
+    generation = int(genfile.read_text())
+    assert generation > 0
+    stat = genfile.stat()
+    for ret, stdout, stderr in fctest.run_cache(["-f", fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert int(genfile.read_text()) > generation
+    assert genfile.stat().st_ino != stat.st_ino
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs inotify")
+def test_cache_watch(fctest, fcfont):
+    fctest.setup()
+    genfile = Path(fctest.cachedir.name) / "GENERATION"
+    proc = fctest.spawn_cache(["-v", "--watch", fctest.fontdir.name])
+    try:
+        for line in proc.stdout:
+            if line.startswith("watching"):
+                break
+        generation = int(genfile.read_text())
+        fctest.install_font(fcfont.fonts, "sub")
+        # wait for the new directory to be cached and things to settle
+        last = generation
+        for _ in range(100):
+            time.sleep(0.2)
+            current = int(genfile.read_text())
+            if current >= generation + 2 and current == last:
+                break
+            last = current
+        assert int(genfile.read_text()) >= generation + 2
+    finally:
+        proc.terminate()
+        out, err = proc.communicate(timeout=10)
+    assert proc.returncode == 0, err
+    for ret, stdout, stderr in fctest.run_cache(["-v", fctest.fontdir.name]):
+        assert ret == 0, stderr
+        assert "caching" not in stdout, stdout
+    for ret, stdout, stderr in fctest.run_list(["-f", "%{file}\\n"]):
+        assert ret == 0, stderr
+        assert len(stdout.splitlines()) == len(fcfont.fonts)
+
+
+def test_cache_jobs(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    fctest.install_font(fcfont.fonts, "sub")
+
+    def caches():
+        return {c.name: c.read_bytes() for c in fctest.cache_files()}
+
+    for ret, stdout, stderr in fctest.run_cache(["-f", fctest.fontdir.name]):
+        assert ret == 0, stderr
+    serial = caches()
+    assert len(serial) == 2
+    for ret, stdout, stderr in fctest.run_cache(["-f", "-j", "4", fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert caches() == serial
+
+
+def test_cache_incremental(fctest, fcfont):
+    # the file table is left out of reproducible caches
+    fctest.env.pop("SOURCE_DATE_EPOCH", None)
+    fctest.setup()
+    now = int(time.time())
+    fctest.install_font(fcfont.fonts[0], ".", time=now - 10)
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    fctest.install_font(fcfont.fonts[1], ".", time=now)
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name], debug=16):
+        assert ret == 0, stderr
+        assert "1 of 2 files unchanged" in stdout
+    incremental = {c.name: c.read_bytes() for c in fctest.cache_files()}
+    for ret, stdout, stderr in fctest.run_cache(["-f", fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert {c.name: c.read_bytes() for c in fctest.cache_files()} == incremental
+
+
+def test_cache_copies(fctest, fcfont):
+    fctest.env.pop("SOURCE_DATE_EPOCH", None)
+    fctest.setup()
+    now = int(time.time())
+    fctest.install_font(fcfont.fonts, "a", time=now - 10)
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert (Path(fctest.cachedir.name) / "CONTENTS").exists()
+    fctest.install_font(fcfont.fonts, "b", time=now)
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name], debug=16):
+        assert ret == 0, stderr
+        assert stdout.count("copy of") == len(fcfont.fonts)
+    copied = {c.name: c.read_bytes() for c in fctest.cache_files()}
+    for ret, stdout, stderr in fctest.run_cache(["-f", fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert {c.name: c.read_bytes() for c in fctest.cache_files()} == copied
+
+
+def test_cache_contents_compact(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    contents = Path(fctest.cachedir.name) / "CONTENTS"
+    for i in range(5):
+        for ret, stdout, stderr in fctest.run_cache(["-f", fctest.fontdir.name]):
+            assert ret == 0, stderr
+    # the lines written for the earlier caches are dropped once they are most of the file
+    lines = contents.read_text().splitlines()
+    assert len(fcfont.fonts) <= len(lines) < 3 * len(fcfont.fonts)
+
+
+def test_cache_pack(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    fctest.install_font(fcfont.fonts, "sub")
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    packs = list(Path(fctest.cachedir.name).glob("pack-*"))
+    assert len(packs) == 1
+    # the charsets and strings of the fonts in both directories are shared
+    caches = sum(c.stat().st_size for c in fctest.cache_files())
+    assert packs[0].stat().st_size < caches * 0.9
+    # nothing changed, so the pack is not written again
+    inode = packs[0].stat().st_ino
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    assert packs[0].stat().st_ino == inode
+    for ret, stdout, stderr in fctest.run_list(["--format", "%{file}\n"], debug=16):
+        assert ret == 0, stderr
+        assert stdout.count("found in cache pack") == 2
+        packed = sorted(line for line in stdout.splitlines() if line.endswith(".pcf"))
+    assert len(packed) == 2 * len(fcfont.fonts)
+    # a cache written after the pack, as the generation file tells, wins over it
+    genfile = Path(fctest.cachedir.name) / "GENERATION"
+    newgen = genfile.with_name("GENERATION.new")
+    newgen.write_text("0\n")
+    newgen.replace(genfile)
+    for ret, stdout, stderr in fctest.run_list(["--format", "%{file}\n"], debug=16):
+        assert ret == 0, stderr
+        assert "found in cache pack" not in stdout
+        assert sorted(line for line in stdout.splitlines() if line.endswith(".pcf")) == packed
+    packs[0].unlink()
+    for ret, stdout, stderr in fctest.run_list(["--format", "%{file}\n"]):
+        assert ret == 0, stderr
+        assert sorted(stdout.splitlines()) == packed
+
+
+def test_cache_write_mapped(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name], debug=16):
+        assert ret == 0, stderr
+        assert "FcDirCacheWriteMapped" in stdout
+        assert "FcDirCacheWriteDir" not in stdout
+    caches = fctest.cache_files()
+    assert len(list(caches)) == 1
+    for ret, stdout, stderr in fctest.run_list(["--format", "%{file}\n"]):
+        assert ret == 0, stderr
+        assert len(stdout.splitlines()) == len(fcfont.fonts)
+
+
+def test_cache_shared_values(fctest, fcfont):
+    fctest.setup()
+    fctest.install_font(fcfont.fonts[0], "one")
+    fctest.install_font(fcfont.fonts[0], "two")
+    font = Path(fctest.fontdir.name) / "two" / Path(fcfont.fonts[0]).name
+    shutil.copy2(font, font.with_name("copy-" + font.name))
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    # the second font differs from the first in its file name only
+    one, two = sorted(c.stat().st_size for c in fctest.cache_files())[-2:]
+    assert two - one < one / 2
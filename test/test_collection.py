@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+# Copyright (C) 2025 fontconfig Authors
+# SPDX-License-Identifier: HPND
+
+from fctest import FcTest
+from pathlib import Path
+import pytest
+import struct
+
+
+@pytest.fixture
+def fctest():
+    return FcTest()
+
+
+def sfnt_tables(path):
+    data = path.read_bytes()
+    num_tables = struct.unpack('>H', data[4:6])[0]
+    tables = []
+    for i in range(num_tables):
+        tag, checksum, offset, length = struct.unpack('>4sIII', data[12 + i * 16:28 + i * 16])
+        tables.append((tag, checksum, data[offset:offset + length]))
+    return data[:4], tables
+
+
+def write_collection(path, fonts):
+    """Write a collection of fonts, storing tables which are the same in
+    several fonts only once"""
+    header = 12 + 4 * len(fonts)
+    offset = header + sum(12 + 16 * len(tables) for version, tables in fonts)
+    blobs = {}
+    out = b'ttcf' + struct.pack('>II', 0x00010000, len(fonts))
+    dirs = b''
+    for version, tables in fonts:
+        out += struct.pack('>I', header + len(dirs))
+        dirs += version + struct.pack('>HHHH', len(tables), 0, 0, 0)
+        for tag, checksum, data in tables:
+            if data not in blobs:
+                blobs[data] = offset
+                offset += len(data) + -len(data) % 4
+            dirs += struct.pack('>4sIII', tag, checksum, blobs[data], len(data))
+    out += dirs
+    for data in blobs:
+        out += data + b'\0' * (-len(data) % 4)
+    path.write_bytes(out)
+
+
+def with_glyphs(font, num_glyphs):
+    version, tables = font
+    return version, [(tag, checksum, data[:4] + struct.pack('>H', num_glyphs) + data[6:] if tag == b'maxp' else data)
+                     for tag, checksum, data in tables]
+
+
+def query(fctest, path):
+    for ret, stdout, stderr in fctest.run_query(['-f', '%{charset}|%{lang}\n', str(path)]):
+        assert ret == 0, stderr
+        return stdout.splitlines()
+
+
+def test_collection_shared_coverage(fctest, tmp_path):
+    """Faces get the coverage of the fonts they come from, whether or not
+    they share their cmap"""
+    srcdir = Path(fctest.srcdir) / 'test'
+    sans = sfnt_tables(srcdir / 'no_family_name.ttf')
+    serif = sfnt_tables(srcdir / 'no_family_name_serif.ttf')
+    fewer = with_glyphs(sans, 1)
+    expected = []
+    for n, font in enumerate([sans, serif, fewer]):
+        single = tmp_path / f'single{n}.ttc'
+        write_collection(single, [font])
+        expected += query(fctest, single)
+    assert expected[0] != expected[2]
+    ttc = tmp_path / 'collection.ttc'
+    write_collection(ttc, [sans, serif, fewer, sans, fewer])
+    assert query(fctest, ttc) == expected + [expected[0], expected[2]]
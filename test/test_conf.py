@@ -70,3 +70,41 @@ def test_json(fctest, json):
     for ret, stdout, stderr in fctest.run(testexe, [harmlessconf, json]):
         assert ret == 0, f'stdout:\n{stdout}\nstderr:\n{stderr}'
         fctest.logger.info(stdout)
+
+
+def test_parse_jobs(fctest, tmp_path):
+    confdir = tmp_path / 'conf.d'
+    confdir.mkdir()
+    for i in range(32):
+        with open(confdir / f'{i:02d}-test.conf', 'w') as f:
+            f.write(f'''<fontconfig>
+  <match>
+    <edit name="family" mode="append"><string>family{i}</string></edit>
+  </match>
+</fontconfig>
+''')
+    (confdir / '99-broken.conf').write_text('<fontconfig><match>')
+
+    def custom_config(self):
+        return f'''<fontconfig>
+  <include ignore_missing="yes">{self.convert_path(str(confdir))}</include>
+  <dir>{self.convert_path(self.fontdir.name)}</dir>
+  <cachedir>{self.convert_path(self.cachedir.name)}</cachedir>
+</fontconfig>
+'''
+
+    fctest.config = types.MethodType(custom_config, fctest)
+    fctest.setup()
+
+    results = []
+    for jobs in [None, '4']:
+        if jobs:
+            fctest.env['FONTCONFIG_PARSE_JOBS'] = jobs
+        for ret, stdout, stderr in fctest.run_pattern(['-c', ':', 'family']):
+            results.append((ret, stdout, stderr))
+    fctest.env.pop('FONTCONFIG_PARSE_JOBS', None)
+
+    assert results[0] == results[1]
+    assert 'family0' in results[0][1]
+    assert results[0][1].index('family0') < results[0][1].index('family31')
+    assert '99-broken.conf' in results[0][2]
@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+# Copyright (C) 2025 fontconfig Authors
+# SPDX-License-Identifier: HPND
+
+from fctest import FcTest, FcTestFont
+from pathlib import Path
+from urllib.parse import unquote
+import socket
+import sys
+import time
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="needs Unix domain sockets")
+
+
+@pytest.fixture
+def fctest():
+    return FcTest()
+
+
+@pytest.fixture
+def fcfont():
+    return FcTestFont(srcdir=Path(__file__).parents[1])
+
+
+@pytest.fixture
+def matchd(fctest, fcfont, tmp_path):
+    fctest._extra.append("<config><rescan><int>1</int></rescan></config>")
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    path = tmp_path / "socket"
+    proc = fctest.spawn_matchd(["-v", "-s", str(path)])
+    try:
+        for line in proc.stdout:
+            if line.startswith("listening"):
+                break
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(path))
+        sock.settimeout(10)
+        yield sock.makefile("rw", encoding="utf-8", newline="\n")
+        sock.close()
+    finally:
+        proc.terminate()
+        out, err = proc.communicate(timeout=10)
+    assert proc.returncode == 0, err
+    assert not path.exists()
+
+
+def request(conn, line):
+    conn.write(line + "\n")
+    conn.flush()
+    return reply(conn)
+
+
+def reply(conn):
+    fonts = []
+    for reply in conn:
+        if reply.startswith("="):
+            fonts.append(reply[1:].rstrip("\n"))
+        else:
+            assert reply == ".\n", reply
+            return fonts
+
+
+def element(font, name):
+    for value in font.split():
+        key, _, value = value.partition("=")
+        if unquote(key) == name:
+            return unquote(value[2:])
+    return None
+
+
+def match(fctest, args):
+    for ret, stdout, stderr in fctest.run_match(["-f", "%{file}\n"] + args):
+        assert ret == 0, stderr
+        return stdout.splitlines()
+
+
+@pytest.mark.parametrize(
+    "pattern,encoded",
+    [
+        ("Fixed:pixelsize=16", "family=ssFixed pixelsize=sd16"),
+        ("sans:bold", "family=sssans weight=sd200"),
+        (":pixelsize=13", "pixelsize=si13"),
+    ],
+)
+def test_matchd_requests(fctest, matchd, pattern, encoded):
+    """The server answers as fc-match and fc-list do"""
+    assert [element(f, "file") for f in request(matchd, "match " + encoded)] == match(fctest, [pattern])
+    assert [element(f, "file") for f in request(matchd, "sort " + encoded)] == match(fctest, ["-s", pattern])
+    assert [element(f, "file") for f in request(matchd, "all " + encoded)] == match(fctest, ["-a", pattern])
+    for ret, stdout, stderr in fctest.run_list(["-f", "%{file}\n", pattern]):
+        assert ret == 0, stderr
+        listed = [element(f, "file") for f in request(matchd, "list " + encoded)]
+        assert sorted(listed) == sorted(stdout.splitlines())
+    substituted = request(matchd, "substitute " + encoded)
+    assert len(substituted) == 1
+    assert element(substituted[0], "lang") is not None
+
+
+def test_matchd_errors(matchd):
+    """A bad request gets an error line and the connection stays usable"""
+    matchd.write("frobnicate\nmatch size=sdbig\n")
+    matchd.flush()
+    assert matchd.readline().startswith("!")
+    assert matchd.readline().startswith("!")
+    assert len(request(matchd, "match")) == 1
+
+
+def test_matchd_pipelined(matchd):
+    """Requests sent at once are answered in order"""
+    matchd.write("list\n" * 50 + "match\n")
+    matchd.flush()
+    count = len(reply(matchd))
+    assert count > 1
+    for i in range(49):
+        assert len(reply(matchd)) == count
+    assert len(reply(matchd)) == 1
+
+
+def test_matchd_long_line(matchd):
+    """A request line longer than the limit closes the connection"""
+    try:
+        matchd.write("match family=ss" + "a" * (2 << 20))
+        matchd.flush()
+    except BrokenPipeError:
+        pass
+    # The error may be lost as the rest of the request is never read
+    try:
+        assert matchd.readline().startswith("!")
+        assert matchd.readline() == ""
+    except ConnectionResetError:
+        pass
+
+
+def test_matchd_reload(fctest, fcfont, matchd):
+    """Fonts added while the server runs are picked up"""
+    count = len(request(matchd, "list"))
+    time.sleep(1.1)
+    fctest.install_font(fcfont.fonts, "sub")
+    for ret, stdout, stderr in fctest.run_cache([fctest.fontdir.name]):
+        assert ret == 0, stderr
+    time.sleep(1.1)
+    assert len(request(matchd, "list")) == 2 * count
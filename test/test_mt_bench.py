@@ -0,0 +1,74 @@
+# Copyright (C) 2026 fontconfig Authors
+# SPDX-License-Identifier: HPND
+
+from fctest import FcTest, FcTestFont
+from pathlib import Path
+import os
+import pytest
+
+
+@pytest.fixture
+def fctest():
+    return FcTest()
+
+
+@pytest.fixture
+def fcfont():
+    return FcTestFont(srcdir=Path(__file__).parents[1])
+
+
+def bench_exe(fctest):
+    for name in ["test-mt-bench", "test_mt_bench"]:
+        exe = Path(fctest.builddir) / "test" / (name + fctest._exeext)
+        if exe.exists():
+            return exe
+    pytest.skip("No benchmark driver built")
+
+
+def parse(stdout):
+    rows = {}
+    for line in stdout.splitlines():
+        if line.startswith("#") or line.startswith("threads"):
+            continue
+        threads, ops, p50, p99, efficiency = line.split()
+        rows[int(threads)] = (float(ops), float(p50), float(p99), float(efficiency.rstrip("%")))
+    return rows
+
+
+@pytest.mark.skipif(not not os.getenv("EXEEXT"), reason="not working on Win32")
+@pytest.mark.parametrize("mix", ["match,sort,list,substitute", "match", "list"])
+def test_mt_bench(fctest, fcfont, mix):
+    """Concurrent queries give the single-threaded results and report numbers"""
+    fctest.setup()
+    fctest.install_font(fcfont.fonts, ".")
+    for ret, stdout, stderr in fctest.run(
+        bench_exe(fctest), ["-t", "1,2,4", "-n", "50", "-m", mix, "sans", "Fixed:pixelsize=16"]
+    ):
+        assert ret == 0, stderr
+        fctest.logger.info(stdout)
+        assert mix in stdout.splitlines()[0]
+        rows = parse(stdout)
+        assert sorted(rows) == [1, 2, 4]
+        for ops, p50, p99, efficiency in rows.values():
+            assert ops > 0
+            assert 0 <= p50 <= p99
+        assert rows[1][3] == 100.0
+
+
+@pytest.mark.skipif(not not os.getenv("EXEEXT"), reason="not working on Win32")
+def test_mt_bench_fontdir(fctest, fcfont):
+    """Fonts can be added from a directory of choice"""
+    fctest.setup()
+    fontdir = Path(fcfont.fonts[0]).parent
+    for ret, stdout, stderr in fctest.run(bench_exe(fctest), ["-t", "2", "-n", "10", "-d", str(fontdir)]):
+        assert ret == 0, stderr
+        nfont = int(stdout.split()[1])
+        assert nfont >= len(fcfont.fonts)
+
+
+@pytest.mark.skipif(not not os.getenv("EXEEXT"), reason="not working on Win32")
+@pytest.mark.parametrize("args", [["-m", "nosuch"], ["-t", "0"], ["-n", "0"]])
+def test_mt_bench_errors(fctest, args):
+    fctest.setup()
+    for ret, stdout, stderr in fctest.run(bench_exe(fctest), args):
+        assert ret != 0